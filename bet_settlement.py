@@ -0,0 +1,296 @@
+"""
+馬券の精算エンジン（全券種共通）
+
+払戻データ（JSONの {券種: {'馬番': [...], '払戻金': [...]}} 形式、
+fetch_actual_payouts の {券種: [{'馬番': '3-5', '払戻': 1230}, ...]} 形式のどちらでも可）を
+(race_id, 券種, 組番) をキーとする払戻テーブルに正規化し、
+買い目の一覧をまとめて1回で精算する。
+
+使い方:
+    engine = SettlementEngine.from_json(payout_json_path)
+    tickets = pd.DataFrame([
+        {'race_id': '202406010101', 'bet_type': 'ワイド', 'numbers': (3, 5), 'stake': 100},
+        ...
+    ])
+    settled = engine.settle(tickets)   # payout / hit / return / available 列を追加
+
+    # PayoutStore から対象レースの払戻だけを読み込む場合
+    engine = SettlementEngine.from_store(store, race_ids=race_ids)
+"""
+import json
+import re
+import numpy as np
+import pandas as pd
+
+# 券種ごとの馬番の数
+BET_TYPE_SIZES = {
+    '単勝': 1,
+    '複勝': 1,
+    '枠連': 2,
+    '馬連': 2,
+    'ワイド': 2,
+    '馬単': 2,
+    '3連複': 3,
+    '3連単': 3,
+}
+
+# 着順どおりの並びが必要な券種
+ORDERED_BET_TYPES = {'馬単', '3連単'}
+
+# 表記ゆれ
+BET_TYPE_ALIASES = {
+    '三連複': '3連複',
+    '三連単': '3連単',
+}
+
+BET_TYPE_CODES = {bet_type: code for code, bet_type in enumerate(BET_TYPE_SIZES)}
+
+_MAX_NUMBERS = 3
+
+
+def normalize_bet_type(bet_type):
+    """券種名の表記ゆれを統一（'三連単' -> '3連単'）"""
+    return BET_TYPE_ALIASES.get(bet_type, bet_type)
+
+
+def _to_yen(value):
+    """払戻金を整数に変換（'1,230円' なども可、変換できなければNone）"""
+    if value is None:
+        return None
+    try:
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    try:
+        return int(str(value).replace(',', '').replace('円', '').strip())
+    except ValueError:
+        return None
+
+
+def _normalize_race_ids(race_ids):
+    """race_id を文字列キーに統一（202401010101.0 -> '202401010101'）"""
+    s = pd.Series(race_ids)
+    if pd.api.types.is_float_dtype(s):
+        return s.astype('Int64').astype(str).to_numpy(dtype=object)
+    return s.astype(str).str.split('.').str[0].to_numpy(dtype=object)
+
+
+def iter_payout_entries(payout_item):
+    """
+    1レース分の払戻データを (券種, 馬番リスト, 払戻金) に展開
+
+    '馬番' が1頭ずつのフラットなリスト（ワイドなら [a, b, c, d, e, f]）の場合は
+    券種の頭数ごとに区切って組番にする。
+    """
+    for raw_type, data in payout_item.items():
+        if raw_type == 'race_id':
+            continue
+        bet_type = normalize_bet_type(raw_type)
+        size = BET_TYPE_SIZES.get(bet_type)
+        if size is None:
+            continue
+
+        # fetch_actual_payouts 形式
+        if isinstance(data, list):
+            for entry in data:
+                if not isinstance(entry, dict):
+                    continue
+                numbers = [int(n) for n in re.findall(r'\d+', str(entry.get('馬番', '')))]
+                payout = _to_yen(entry.get('払戻'))
+                if len(numbers) == size and payout is not None:
+                    yield bet_type, numbers, payout
+            continue
+
+        if not isinstance(data, dict):
+            continue
+
+        entries = [[int(n) for n in re.findall(r'\d+', str(x))] for x in data.get('馬番', [])]
+        payouts = data.get('払戻金', [])
+        if not entries or not payouts:
+            continue
+
+        if size > 1 and all(len(e) == 1 for e in entries):
+            # フラットな馬番リストを組番に区切る
+            flat = [e[0] for e in entries]
+            groups = [flat[i:i + size] for i in range(0, len(flat) - size + 1, size)]
+            for g, numbers in enumerate(groups):
+                if len(payouts) == len(groups):
+                    payout = _to_yen(payouts[g])
+                elif len(payouts) == len(flat):
+                    payout = _to_yen(payouts[g * size])   # 馬番ごとに払戻金が複製されている形式
+                elif len(payouts) == 1:
+                    payout = _to_yen(payouts[0])
+                else:
+                    payout = None
+                if payout is not None:
+                    yield bet_type, numbers, payout
+        else:
+            for idx, numbers in enumerate(entries):
+                if len(numbers) != size or idx >= len(payouts):
+                    continue
+                payout = _to_yen(payouts[idx])
+                if payout is not None:
+                    yield bet_type, numbers, payout
+
+
+def encode_combinations(bet_types, numbers):
+    """
+    券種と馬番から組番キー（整数）を作る
+
+    馬番は右詰めで (n, 3) 行列にし、順不同の券種は昇順に並べてから
+    n1 * 10000 + n2 * 100 + n3 にまとめる。
+
+    Args:
+        bet_types: 券種名の配列（正規化済み）
+        numbers: 馬番タプルの配列
+
+    Returns:
+        組番キーの int64 配列
+    """
+    matrix = np.zeros((len(numbers), _MAX_NUMBERS), dtype=np.int64)
+    for i, nums in enumerate(numbers):
+        nums = list(nums)[-_MAX_NUMBERS:]
+        if nums:
+            matrix[i, _MAX_NUMBERS - len(nums):] = [int(n) for n in nums]
+
+    unordered = ~pd.Series(bet_types).isin(ORDERED_BET_TYPES).to_numpy()
+    matrix[unordered] = np.sort(matrix[unordered], axis=1)
+    return matrix @ np.array([10000, 100, 1], dtype=np.int64)
+
+
+def find_payout(payout_item, bet_type, numbers):
+    """
+    1レース分の払戻データから買い目1点の払戻金を探す
+
+    Returns:
+        100円あたりの払戻金（不的中は0）
+    """
+    bet_type = normalize_bet_type(bet_type)
+    target = encode_combinations([bet_type], [numbers])[0]
+    for entry_type, entry_numbers, payout in iter_payout_entries(payout_item):
+        if entry_type == bet_type and encode_combinations([bet_type], [entry_numbers])[0] == target:
+            return payout
+    return 0
+
+
+class SettlementEngine:
+    """
+    (race_id, 券種, 組番) -> 払戻金 のテーブルによる一括精算
+    """
+
+    def __init__(self, payout_items):
+        race_ids, bet_types, numbers, payouts = [], [], [], []
+        for item in payout_items:
+            race_id = item.get('race_id')
+            if race_id is None:
+                continue
+            for bet_type, nums, payout in iter_payout_entries(item):
+                race_ids.append(race_id)
+                bet_types.append(bet_type)
+                numbers.append(nums)
+                payouts.append(payout)
+
+        table = pd.DataFrame({
+            'race_key': _normalize_race_ids(race_ids) if race_ids else np.array([], dtype=object),
+            'type_code': np.array([BET_TYPE_CODES[t] for t in bet_types], dtype=np.int64),
+            'combo_key': encode_combinations(bet_types, numbers),
+            'payout': np.array(payouts, dtype=np.int64),
+        })
+        self._set_table(table)
+
+    def _set_table(self, table):
+        # 同着などで同じ組番が重複した場合は先頭を採用
+        self.table = table.drop_duplicates(['race_key', 'type_code', 'combo_key'], keep='first')
+        self.available = self.table[['race_key', 'type_code']].drop_duplicates()
+
+    @classmethod
+    def from_payout_list(cls, payout_list):
+        """JSONから読み込んだ払戻データのリストから作成"""
+        return cls(payout_list)
+
+    @classmethod
+    def from_payout_dict(cls, payout_dict):
+        """{race_id: 払戻データ} の辞書から作成"""
+        return cls({**item, 'race_id': item.get('race_id', race_id)} for race_id, item in payout_dict.items())
+
+    @classmethod
+    def from_json(cls, json_path):
+        """netkeiba_data_payouts_*.json から作成"""
+        with open(json_path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    @classmethod
+    def from_store(cls, store, race_ids=None, start_date=None, end_date=None):
+        """
+        PayoutStore から必要なレース・期間の払戻だけを読み込んで作成
+
+        Args:
+            store: payout_store.PayoutStore
+            race_ids: 対象レース（省略時は日付範囲、どちらもなければ全レース）
+            start_date, end_date: 対象期間
+        """
+        engine = cls([])
+        engine._set_table(store.table(race_ids=race_ids, start_date=start_date, end_date=end_date))
+        return engine
+
+    def __len__(self):
+        return len(self.table)
+
+    def settle(self, tickets):
+        """
+        買い目をまとめて精算
+
+        Args:
+            tickets: race_id, bet_type, numbers（馬番タプル）, stake（省略時100円）列を持つDataFrame
+
+        Returns:
+            tickets に以下の列を追加したDataFrame
+              payout: 100円あたりの払戻金（不的中は0）
+              hit: 的中したか
+              return: 払戻額（payout × stake / 100）
+              available: そのレース・券種の払戻データがあるか
+        """
+        result = tickets.copy()
+        if 'stake' not in result.columns:
+            result['stake'] = 100
+
+        bet_types = result['bet_type'].map(normalize_bet_type)
+        keys = pd.DataFrame({
+            'race_key': _normalize_race_ids(result['race_id'].to_numpy()),
+            'type_code': bet_types.map(BET_TYPE_CODES).fillna(-1).astype(np.int64).to_numpy(),
+            'combo_key': encode_combinations(bet_types.to_numpy(), result['numbers'].tolist()),
+        })
+
+        matched = keys.merge(self.table, on=['race_key', 'type_code', 'combo_key'], how='left')
+        avail = keys.merge(self.available.assign(available=True), on=['race_key', 'type_code'], how='left')
+
+        payout = matched['payout'].fillna(0).astype(np.int64).to_numpy()
+        result['payout'] = payout
+        result['hit'] = payout > 0
+        result['return'] = payout * result['stake'].to_numpy() // 100
+        result['available'] = avail['available'].fillna(False).astype(bool).to_numpy()
+        return result
+
+    def summarize(self, settled, by='strategy'):
+        """
+        精算結果を戦略ごとに集計（レース単位で的中を数える）
+
+        Args:
+            settled: settle() の結果（by 列を持つこと）
+            by: 集計キーの列名
+
+        Returns:
+            {戦略: {'total', 'hit', 'return', 'cost'}}（払戻データのあるレースのみ）
+        """
+        rows = settled[settled['available']]
+        per_race = rows.groupby([by, 'race_id'], sort=False).agg(
+            hit=('hit', 'any'), ret=('return', 'sum'), cost=('stake', 'sum')
+        )
+        per_strategy = per_race.groupby(level=0, sort=False).agg(
+            total=('hit', 'size'), hit=('hit', 'sum'), ret=('ret', 'sum'), cost=('cost', 'sum')
+        )
+        return {
+            name: {'total': int(r.total), 'hit': int(r.hit), 'return': int(r.ret), 'cost': int(r.cost)}
+            for name, r in per_strategy.iterrows()
+        }
@@ -0,0 +1,191 @@
+"""
+期間収集の逐次書き出し（再開可能なチェックポイント）
+
+collect_race_data_for_period はレース結果と払戻をメモリのリストに溜め、最後にまとめて
+保存していたため、途中で落ちると収集済みのデータが失われていた。
+このジャーナルは数レースごとに結果をディスクへ書き出し、メモリには書き出し前の
+数レース分しか持たない。
+
+    journal_dir/
+        results/YYYYMM/part-00001.pkl      レース結果（DataFrame）
+        payouts/YYYYMM/part-00001.jsonl    払戻（1行1レース）
+        done/part-00001.json               書き出し完了の印（含まれる race_id の一覧）
+
+- 各ファイルは一時ファイル経由で置き換え、最後に done の印を書く。印のない部品は
+  書き出し途中で落ちたものとして開いたときに削除する
+- completed_race_ids() は印のある部品に含まれる race_id。これを処理済みとして扱えば、
+  中断した収集を同じジャーナルで再開できる
+
+使い方:
+    journal = CollectionJournal(os.path.join(save_dir, 'collection_journal', '202401_202412'))
+    for race_id in race_ids:
+        if race_id in journal.completed_race_ids():
+            continue
+        committed = journal.add(race_id, date_str, results_df, payout_dict)
+    journal.flush()
+    for results_df, payouts in journal.iter_parts():   # 部品ごとに保存先へ流し込む
+        ...
+"""
+import glob
+import json
+import os
+import pickle
+import shutil
+
+import pandas as pd
+
+
+class CollectionJournal:
+    """
+    レース単位の収集結果を月別パーティションの部品ファイルに書き出すジャーナル
+    """
+
+    def __init__(self, journal_dir, flush_every=20):
+        """
+        Args:
+            journal_dir: 保存先フォルダ（期間ごとに分ける）
+            flush_every: 何レースごとにディスクへ書き出すか
+        """
+        self.journal_dir = journal_dir
+        self.flush_every = max(1, int(flush_every))
+        self._buffer = []
+        self._completed = set()
+        self._parts = []
+        for sub in ('results', 'payouts', 'done'):
+            os.makedirs(os.path.join(journal_dir, sub), exist_ok=True)
+        self._recover()
+
+    def _part_paths(self, part, month):
+        return (os.path.join(self.journal_dir, 'results', month, f'{part}.pkl'),
+                os.path.join(self.journal_dir, 'payouts', month, f'{part}.jsonl'))
+
+    def _recover(self):
+        """完了した部品を読み込み、印のない書きかけの部品を削除"""
+        done = {}
+        for path in glob.glob(os.path.join(self.journal_dir, 'done', 'part-*.json')):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    done[os.path.splitext(os.path.basename(path))[0]] = json.load(f)
+            except (OSError, ValueError):
+                os.remove(path)
+
+        for sub in ('results', 'payouts'):
+            for path in glob.glob(os.path.join(self.journal_dir, sub, '*', 'part-*')):
+                part = os.path.basename(path).split('.')[0]
+                if part not in done or path.endswith('.tmp'):
+                    os.remove(path)
+
+        for part in sorted(done):
+            self._parts.append((part, done[part]['months']))
+            self._completed.update(done[part]['race_ids'])
+
+        if self._completed:
+            print(f"[INFO] 収集ジャーナルから再開: {len(self._completed)}レース ({self.journal_dir})")
+
+    def completed_race_ids(self):
+        """ディスクに書き出し済みの race_id"""
+        return self._completed
+
+    def add(self, race_id, date_str, results_df, payout_dict):
+        """
+        1レース分の結果を追加（flush_every 件溜まったら書き出す）
+
+        Returns:
+            今回ディスクに書き出した race_id のリスト（書き出していなければ空）
+        """
+        self._buffer.append((str(race_id), str(date_str)[:6], results_df, payout_dict))
+        if len(self._buffer) >= self.flush_every:
+            return self.flush()
+        return []
+
+    def flush(self):
+        """溜まっているレースを部品ファイルとして書き出す"""
+        if not self._buffer:
+            return []
+
+        part = f'part-{len(self._parts) + 1:05d}'
+        by_month = {}
+        for race_id, month, results_df, payout_dict in self._buffer:
+            by_month.setdefault(month, []).append((results_df, payout_dict))
+
+        for month, races in by_month.items():
+            results_path, payouts_path = self._part_paths(part, month)
+            os.makedirs(os.path.dirname(results_path), exist_ok=True)
+            os.makedirs(os.path.dirname(payouts_path), exist_ok=True)
+
+            frames = [df for df, _ in races if df is not None and not df.empty]
+            if frames:
+                with open(results_path + '.tmp', 'wb') as f:
+                    pickle.dump(pd.concat(frames, ignore_index=True), f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(results_path + '.tmp', results_path)
+
+            payouts = [p for _, p in races if p and len(p) > 1]
+            if payouts:
+                with open(payouts_path + '.tmp', 'w', encoding='utf-8') as f:
+                    for payout in payouts:
+                        f.write(json.dumps(payout, ensure_ascii=False, default=str) + '\n')
+                os.replace(payouts_path + '.tmp', payouts_path)
+
+        race_ids = [race_id for race_id, _, _, _ in self._buffer]
+        done_path = os.path.join(self.journal_dir, 'done', f'{part}.json')
+        with open(done_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'race_ids': race_ids, 'months': sorted(by_month)}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(done_path + '.tmp', done_path)
+
+        self._parts.append((part, sorted(by_month)))
+        self._completed.update(race_ids)
+        self._buffer = []
+        return race_ids
+
+    def iter_parts(self):
+        """
+        書き出し済みの部品を (レース結果DataFrame, 払戻のリスト) で1つずつ返す
+
+        期間全体を1つのDataFrameにまとめずに保存先へ流し込むためのもの（結果のない部品は None）。
+        """
+        for part, months in self._parts:
+            for month in months:
+                results_path, payouts_path = self._part_paths(part, month)
+                results_df = None
+                if os.path.exists(results_path):
+                    with open(results_path, 'rb') as f:
+                        results_df = pickle.load(f)
+                payouts = []
+                if os.path.exists(payouts_path):
+                    with open(payouts_path, 'r', encoding='utf-8') as f:
+                        payouts = [json.loads(line) for line in f if line.strip()]
+                yield results_df, payouts
+
+    def iter_results(self):
+        """書き出し済みのレース結果を部品ごとに返す（全体をメモリに載せずに処理する場合）"""
+        for part, months in self._parts:
+            for month in months:
+                results_path, _ = self._part_paths(part, month)
+                if os.path.exists(results_path):
+                    with open(results_path, 'rb') as f:
+                        yield pickle.load(f)
+
+    def load_results(self):
+        """書き出し済みのレース結果を1つのDataFrameにまとめる"""
+        frames = list(self.iter_results())
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    def load_payouts(self):
+        """書き出し済みの払戻をリストで返す"""
+        payouts = []
+        for part, months in self._parts:
+            for month in months:
+                _, payouts_path = self._part_paths(part, month)
+                if os.path.exists(payouts_path):
+                    with open(payouts_path, 'r', encoding='utf-8') as f:
+                        payouts.extend(json.loads(line) for line in f if line.strip())
+        return payouts
+
+    def clear(self):
+        """保存が済んだジャーナルを削除"""
+        self._buffer = []
+        self._parts = []
+        self._completed = set()
+        shutil.rmtree(self.journal_dir, ignore_errors=True)
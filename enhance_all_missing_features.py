@@ -5,48 +5,21 @@ father/mother_father等が欠損している全ての馬の情報を取得
 """
 import pandas as pd
 import numpy as np
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from bs4 import BeautifulSoup
-import time
 import re
 from datetime import datetime
 
-CSV_PATH = 'data/main/netkeiba_data_2020_2025_complete.csv'
+from fetch_pool import FetchPool
+from netkeiba_pages import fetch_horse_soup
 
-def get_driver():
-    """Seleniumドライバーを初期化（画像・CSS無効化でリクエスト削減）"""
-    options = Options()
-    options.add_argument('--headless')
-    options.add_argument('--no-sandbox')
-    options.add_argument('--disable-dev-shm-usage')
-    options.add_argument('--disable-gpu')
-    options.add_argument('--log-level=3')
-    options.add_argument('user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36')
-    options.add_experimental_option('excludeSwitches', ['enable-logging'])
-
-    # 画像・CSS等の不要なリソースを無効化（JavaScriptは有効のまま）
-    prefs = {
-        'profile.default_content_setting_values': {
-            'images': 2,        # 画像を読み込まない
-            'plugins': 2,       # プラグイン無効
-            'popups': 2,        # ポップアップ無効
-            'geolocation': 2,   # 位置情報無効
-            'notifications': 2, # 通知無効
-            'media_stream': 2,  # メディア無効
-        },
-        'profile.managed_default_content_settings': {
-            'images': 2
-        }
-    }
-    options.add_experimental_option('prefs', prefs)
-    options.add_argument('--blink-settings=imagesEnabled=false')
+CSV_PATH = 'data/main/netkeiba_data_2020_2025_complete.csv'
 
-    return webdriver.Chrome(options=options)
+# 馬ページ取得用のプール（安全優先で3秒に1リクエスト）
+REQUEST_INTERVAL = 3.0
+fetch_pool = FetchPool(rate=1.0 / REQUEST_INTERVAL, max_in_flight=2)
 
 def scrape_horse_details(horse_id):
     """
-    馬の詳細ページから血統と過去成績を取得（Selenium使用）
+    馬の詳細ページから血統と過去成績を取得
 
     Returns:
         dict: {
@@ -57,17 +30,11 @@ def scrape_horse_details(horse_id):
             'dirt_results': {勝, 2着, 3着, 総数}
         }
     """
-    url = f"https://db.netkeiba.com/horse/{horse_id}/"
-
-    driver = None
     try:
-        # Seleniumでページ取得
-        driver = get_driver()
-        driver.get(url)
-        time.sleep(2)
-
-        # BeautifulSoupで解析
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
+        # ブラウザを起動せずに取得（戦績テーブルはajax断片を直接取得）
+        soup = fetch_horse_soup(horse_id, pool=fetch_pool)
+        if soup is None:
+            return None
 
         result = {
             'father': None,
@@ -167,9 +134,6 @@ def scrape_horse_details(horse_id):
     except Exception as e:
         print(f"    Error scraping horse {horse_id}: {e}")
         return None
-    finally:
-        if driver:
-            driver.quit()
 
 def calculate_horse_statistics(horse_details):
     """馬の統計情報を計算"""
@@ -261,17 +225,18 @@ def main():
     # ユニークなhorse_idを取得
     unique_horses = missing_features['horse_id'].dropna().unique()
     print(f"ユニークな馬: {len(unique_horses):,}頭")
-    print(f"\n推定所要時間: 約{len(unique_horses) * 2 / 3600:.1f}時間")
+    print(f"\n推定所要時間: 約{len(unique_horses) * REQUEST_INTERVAL / 3600:.1f}時間")
 
     # 馬ごとに詳細情報を取得
     print(f"\n拡張情報を取得中...")
     horse_data_cache = {}
 
-    for i, horse_id in enumerate(unique_horses, 1):
-        horse_id_str = str(int(horse_id))
+    horse_id_strs = [str(int(horse_id)) for horse_id in unique_horses]
+    fetched_details = fetch_pool.imap(scrape_horse_details, horse_id_strs)
+
+    for i, (horse_id, horse_id_str, details) in enumerate(zip(unique_horses, horse_id_strs, fetched_details), 1):
         print(f"\r[{i}/{len(unique_horses)}] 馬ID: {horse_id_str} を処理中...", end='', flush=True)
 
-        details = scrape_horse_details(horse_id_str)
         # 血統データが実際に取得できた場合のみキャッシュに追加
         if details and (details.get('father') or details.get('mother_father')):
             stats = calculate_horse_statistics(details)
@@ -281,8 +246,6 @@ def main():
                 **stats
             }
 
-        time.sleep(3.0)  # レート制限対策（安全優先）
-
         # 10頭ごとに改行
         if i % 10 == 0:
             success_count = len(horse_data_cache)
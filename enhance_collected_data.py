@@ -16,30 +16,17 @@
 import pandas as pd
 import numpy as np
 import requests
-from bs4 import BeautifulSoup
-import time
 import re
 from datetime import datetime
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 
-CSV_PATH = 'data/main/netkeiba_data_2020_2025_complete.csv'
+from netkeiba_pages import fetch_horse_soup, get_default_pool
+from horse_attributes import build_horse_table, merge_horse_table
 
-def get_driver():
-    """Seleniumドライバーを初期化"""
-    options = Options()
-    options.add_argument('--headless')
-    options.add_argument('--no-sandbox')
-    options.add_argument('--disable-dev-shm-usage')
-    options.add_argument('--disable-gpu')
-    options.add_argument('--log-level=3')
-    options.add_argument('user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36')
-    options.add_experimental_option('excludeSwitches', ['enable-logging'])
-    return webdriver.Chrome(options=options)
+CSV_PATH = 'data/main/netkeiba_data_2020_2025_complete.csv'
 
 def scrape_horse_details(horse_id):
     """
-    馬の詳細ページから血統と過去成績を取得（Selenium使用）
+    馬の詳細ページから血統と過去成績を取得
 
     Returns:
         dict: {
@@ -50,17 +37,11 @@ def scrape_horse_details(horse_id):
             'dirt_results': {勝, 2着, 3着, 総数}
         }
     """
-    url = f"https://db.netkeiba.com/horse/{horse_id}/"
-
-    driver = None
     try:
-        # Seleniumでページ取得
-        driver = get_driver()
-        driver.get(url)
-        time.sleep(2)
-
-        # BeautifulSoupで解析
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
+        # ブラウザを起動せずに取得（戦績テーブルはajax断片を直接取得）
+        soup = fetch_horse_soup(horse_id)
+        if soup is None:
+            return None
 
         result = {
             'father': None,
@@ -170,9 +151,6 @@ def scrape_horse_details(horse_id):
     except Exception as e:
         print(f"    Error scraping horse {horse_id}: {e}")
         return None
-    finally:
-        if driver:
-            driver.quit()
 
 def calculate_horse_statistics(horse_details):
     """馬の統計情報を計算"""
@@ -264,11 +242,13 @@ def enhance_dataframe(df):
     # 馬ごとに詳細情報を取得
     horse_data_cache = {}
 
-    for i, horse_id in enumerate(unique_horses, 1):
-        horse_id_str = str(int(horse_id))
+    # 馬ページは共有プールで並行取得（レート制限はプール側）
+    horse_id_strs = [str(int(horse_id)) for horse_id in unique_horses]
+    fetched_details = get_default_pool().imap(scrape_horse_details, horse_id_strs)
+
+    for i, (horse_id, horse_id_str, details) in enumerate(zip(unique_horses, horse_id_strs, fetched_details), 1):
         print(f"\r[{i}/{len(unique_horses)}] 馬ID: {horse_id_str} を処理中...", end='', flush=True)
 
-        details = scrape_horse_details(horse_id_str)
         if details:
             stats = calculate_horse_statistics(details)
             horse_data_cache[horse_id] = {
@@ -277,55 +257,16 @@ def enhance_dataframe(df):
                 **stats
             }
 
-        time.sleep(1.0)  # レート制限対策
-
         # 10頭ごとに改行
         if i % 10 == 0:
             print(f"\r[{i}/{len(unique_horses)}] 完了", flush=True)
 
     print(f"\n\n馬の詳細情報取得完了: {len(horse_data_cache)}頭")
 
-    # DataFrameに情報を追加
+    # 馬テーブルを作って horse_id で結合（値が変わる行だけ更新）
     print("\nDataFrameに情報をマージ中...")
-
-    new_columns = {
-        'father': [],
-        'mother_father': [],
-        'total_starts': [],
-        'total_win_rate': [],
-        'turf_win_rate': [],
-        'dirt_win_rate': [],
-        'avg_passage_position': [],
-        'running_style_category': []
-    }
-
-    for idx, row in df.iterrows():
-        horse_id = row['horse_id']
-
-        if pd.notna(horse_id) and horse_id in horse_data_cache:
-            data = horse_data_cache[horse_id]
-            new_columns['father'].append(data.get('father'))
-            new_columns['mother_father'].append(data.get('mother_father'))
-            new_columns['total_starts'].append(data.get('total_starts'))
-            new_columns['total_win_rate'].append(data.get('total_win_rate'))
-            new_columns['turf_win_rate'].append(data.get('turf_win_rate'))
-            new_columns['dirt_win_rate'].append(data.get('dirt_win_rate'))
-            new_columns['avg_passage_position'].append(data.get('avg_passage_position'))
-            new_columns['running_style_category'].append(data.get('running_style_category'))
-        else:
-            # データがない場合は既存の値を保持
-            new_columns['father'].append(row.get('father'))
-            new_columns['mother_father'].append(row.get('mother_father'))
-            new_columns['total_starts'].append(row.get('total_starts'))
-            new_columns['total_win_rate'].append(row.get('total_win_rate'))
-            new_columns['turf_win_rate'].append(row.get('turf_win_rate'))
-            new_columns['dirt_win_rate'].append(row.get('dirt_win_rate'))
-            new_columns['avg_passage_position'].append(row.get('avg_passage_position'))
-            new_columns['running_style_category'].append(row.get('running_style_category'))
-
-    # 新しいカラムを追加または更新
-    for col, values in new_columns.items():
-        df[col] = values
+    df, num_updated = merge_horse_table(df, build_horse_table(horse_data_cache))
+    print(f"更新した行: {num_updated:,}件")
 
     print("完了！")
 
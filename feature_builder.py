@@ -0,0 +1,259 @@
+"""
+LightGBM用 特徴量マトリクスの一括構築
+
+train_lightgbm_model.py などで馬ごとに iterrows で作っていた22特徴量を、
+列単位の処理で一度に作る。
+
+- 過去成績（直近5走）: 馬ID・日付順に並べた履歴から、各行の基準日より前の
+  行範囲を searchsorted で求め、(行数 × 5) の着順行列で集計
+- 騎手・調教師: PersonStatsEngine による開催日ごとの as-of 結合
+- その他: 列ごとの数値変換と既定値埋め
+
+使い方:
+    X, y, groups, meta = build_feature_matrix(train_df, history_df=df)
+"""
+import numpy as np
+import pandas as pd
+
+from horse_history_index import normalize_horse_id_series
+from person_stats_engine import PersonStatsEngine
+
+FEATURE_NAMES = [
+    'avg_rank', 'std_rank', 'min_rank', 'max_rank',
+    'recent_win_rate', 'recent_top3_rate',
+    'jockey_win_rate', 'jockey_top3_rate', 'jockey_races',
+    'trainer_win_rate', 'trainer_top3_rate', 'trainer_races',
+    'age', 'weight_diff', 'weight', 'log_odds', 'ninki', 'waku',
+    'course_turf', 'course_dirt', 'track_good', 'distance_km'
+]
+
+# 特徴量の計算に必要な元データの列（load_race_data の columns 指定用）
+FEATURE_SOURCE_COLUMNS = [
+    'race_id', 'horse_id', 'date', 'date_parsed', 'Rank', 'Umaban',
+    'JockeyName', 'TrainerName', 'Age', 'WeightDiff', 'Weight',
+    'Ninki', 'Odds_x', 'Waku', 'course_type', 'track_condition', 'distance',
+]
+
+# 過去成績がない場合の既定値（avg, std, min, max, win_rate, top3_rate）
+DEFAULT_PAST_STATS = (8, 0, 10, 10, 0, 0)
+
+_DAY_BITS = 32
+
+
+def _numeric_column(df, col, default):
+    """列を数値化して欠損を既定値で埋める（列がなければ全て既定値）"""
+    if col not in df.columns:
+        return np.full(len(df), default, dtype=np.float64)
+    return pd.to_numeric(df[col], errors='coerce').fillna(default).to_numpy(dtype=np.float64)
+
+
+def _to_days(dates):
+    """datetime列をエポックからの日数(int64)に変換"""
+    return pd.DatetimeIndex(dates).to_numpy(dtype='datetime64[D]').astype(np.int64)
+
+
+class PastRankTable:
+    """
+    馬ごとの着順履歴（馬ID・日付順）
+
+    キー = 馬コード << 32 | 日数 の昇順配列を持ち、任意の (馬, 基準日) について
+    基準日より前の直近N走を searchsorted 2回で求める。
+    """
+
+    def __init__(self, history_df):
+        keys = normalize_horse_id_series(history_df['horse_id']).to_numpy(dtype=object)
+        dates = pd.to_datetime(history_df['date'], errors='coerce')
+        valid = pd.notna(keys) & dates.notna().to_numpy()
+
+        codes, uniques = pd.factorize(keys[valid])
+        self.horses = pd.Index(uniques)
+
+        composite = (codes.astype(np.int64) << _DAY_BITS) | _to_days(dates[valid])
+        order = np.argsort(composite, kind='stable')
+        self.keys = composite[order]
+        self.ranks = pd.to_numeric(history_df['Rank'], errors='coerce').to_numpy(dtype=np.float64)[valid][order]
+
+    def recent_ranks(self, horse_ids, ref_days, n_past=5):
+        """
+        各行の基準日より前の直近 n_past 走の着順行列
+
+        Args:
+            horse_ids: 馬IDの配列
+            ref_days: 基準日（エポックからの日数）の配列
+            n_past: 取得する走数
+
+        Returns:
+            (行数 × n_past) の着順行列（新しい順、該当なしは NaN）
+        """
+        codes = self.horses.get_indexer(normalize_horse_id_series(horse_ids))
+        known = codes >= 0
+        base = np.where(known, codes, 0).astype(np.int64) << _DAY_BITS
+
+        start = np.searchsorted(self.keys, base, side='left')
+        stop = np.searchsorted(self.keys, base | np.asarray(ref_days, dtype=np.int64), side='left')
+
+        idx = stop[:, None] - 1 - np.arange(n_past)[None, :]
+        valid = known[:, None] & (idx >= start[:, None])
+        return np.where(valid, self.ranks[np.clip(idx, 0, None)], np.nan)
+
+
+def past_rank_features(recent):
+    """
+    直近着順行列から過去成績6特徴量を計算
+
+    Returns:
+        (行数 × 6) 配列: avg, std, min, max, win_rate, top3_rate
+    """
+    has = ~np.isnan(recent)
+    count = has.sum(axis=1)
+    safe_count = np.maximum(count, 1)
+
+    filled = np.where(has, recent, 0.0)
+    avg = filled.sum(axis=1) / safe_count
+    std = np.sqrt(np.where(has, (recent - avg[:, None]) ** 2, 0.0).sum(axis=1) / safe_count)
+    min_rank = np.where(has, recent, np.inf).min(axis=1)
+    max_rank = np.where(has, recent, -np.inf).max(axis=1)
+    win_rate = (has & (recent == 1)).sum(axis=1) / safe_count
+    top3_rate = (has & (recent <= 3)).sum(axis=1) / safe_count
+
+    out = np.column_stack([avg, std, min_rank, max_rank, win_rate, top3_rate])
+    out[count == 0] = DEFAULT_PAST_STATS
+    return out
+
+
+def person_features(engine, names, ref_date_strs, months_back=12):
+    """
+    騎手・調教師の (勝率, 複勝率, レース数) を開催日ごとに as-of 結合
+
+    Args:
+        engine: PersonStatsEngine
+        names: 人物名の配列
+        ref_date_strs: 各行の基準日文字列の配列
+
+    Returns:
+        (行数 × 3) 配列
+    """
+    names = np.asarray(names, dtype=object)
+    ref_date_strs = np.asarray(ref_date_strs, dtype=object)
+    out = np.zeros((len(names), 3), dtype=np.float64)
+    for date_str in pd.unique(ref_date_strs):
+        rows = np.flatnonzero(ref_date_strs == date_str)
+        stats = engine.stats_for(names[rows], date_str, months_back=months_back)
+        out[rows, 0] = stats['win_rate']
+        out[rows, 1] = stats['top3_rate']
+        out[rows, 2] = stats['races']
+    return out
+
+
+def select_race_rows(df, race_ids=None, min_horses=8, require_rank=True):
+    """
+    特徴量を作る行を選び、レース順に並べる
+
+    レース順は race_ids の順（省略時はDataFrameでの初出順）、レース内は元の行順。
+    基準日はレース先頭行の date の先頭10文字（従来スクリプトと同じ）。
+
+    Returns:
+        (行位置配列, 行ごとの基準日文字列配列)
+    """
+    if race_ids is None:
+        race_code, _ = pd.factorize(df['race_id'])
+    else:
+        race_code = pd.Index(race_ids).get_indexer(df['race_id'])
+
+    order = np.argsort(race_code, kind='stable')
+    order = order[race_code[order] >= 0]
+    codes = race_code[order]
+
+    # レース先頭行の日付
+    first = np.r_[True, codes[1:] != codes[:-1]] if len(codes) else np.array([], dtype=bool)
+    first_dates = df['date'].iloc[order[first]]
+    race_date_strs = np.where(first_dates.notna(), first_dates.astype(str).str[:10], None)
+    row_date_strs = race_date_strs[np.cumsum(first) - 1] if len(codes) else np.array([], dtype=object)
+
+    parsed = pd.to_datetime(pd.Series(row_date_strs, dtype=object), errors='coerce')
+    keep = parsed.notna().to_numpy()
+    if require_rank:
+        keep &= pd.to_numeric(df['Rank'], errors='coerce').notna().to_numpy()[order]
+
+    # 条件を満たす頭数が min_horses 以上のレースのみ
+    counts = pd.Series(keep).groupby(codes).transform('sum').to_numpy()
+    keep &= counts >= min_horses
+
+    return order[keep], row_date_strs[keep]
+
+
+def build_feature_matrix(df, history_df=None, jockey_engine=None, trainer_engine=None,
+                         race_ids=None, min_horses=8, require_rank=True, n_past=5, past_table=None):
+    """
+    LambdaRank 学習用の特徴量マトリクス・ラベル・グループを一括で作成
+
+    Args:
+        df: 対象レースの行（訓練期間など）
+        history_df: 過去成績の参照元（省略時は df）
+        jockey_engine / trainer_engine: 騎手・調教師の PersonStatsEngine（省略時は df から作成）
+        race_ids: 対象レースIDの並び（省略時は df の全レース）
+        min_horses: 着順のある馬がこの頭数未満のレースは除外
+        require_rank: 着順のない行を除外するか
+        n_past: 過去成績に使う走数
+        past_table: 作成済みの PastRankTable（省略時は history_df から作成）
+
+    Returns:
+        X: (頭数 × 22) float32 マトリクス
+        y: 着順ラベル
+        groups: レースごとの頭数
+        meta: race_id, horse_id, Umaban, date, odds の DataFrame（X と同じ行順、odds は
+              log_odds の元にした単勝オッズ（欠損は50）を float64 のまま持つ）
+    """
+    if past_table is None:
+        past_table = PastRankTable(df if history_df is None else history_df)
+    if jockey_engine is None:
+        jockey_engine = PersonStatsEngine(df, 'JockeyName')
+    if trainer_engine is None:
+        trainer_engine = PersonStatsEngine(df, 'TrainerName')
+
+    rows, date_strs = select_race_rows(df, race_ids, min_horses, require_rank)
+    target = df.iloc[rows]
+    ref_days = _to_days(pd.to_datetime(pd.Series(date_strs, dtype=object)))
+
+    recent = past_table.recent_ranks(target['horse_id'].to_numpy(), ref_days, n_past)
+    past = past_rank_features(recent)
+    jockey = person_features(jockey_engine, target['JockeyName'].to_numpy(), date_strs)
+    trainer = person_features(trainer_engine, target['TrainerName'].to_numpy(), date_strs)
+
+    odds = pd.to_numeric(target['Odds_x'], errors='coerce').to_numpy(dtype=np.float64) \
+        if 'Odds_x' in target.columns else np.full(len(target), np.nan)
+    odds = np.where(~np.isnan(odds) & (odds > 0), odds, 50)
+
+    course_type = target['course_type'] if 'course_type' in target.columns else pd.Series(None, index=target.index)
+    track_condition = target['track_condition'] if 'track_condition' in target.columns else pd.Series(None, index=target.index)
+
+    X = np.column_stack([
+        past,
+        jockey,
+        trainer,
+        _numeric_column(target, 'Age', 5),
+        _numeric_column(target, 'WeightDiff', 0),
+        _numeric_column(target, 'Weight', 480),
+        np.log1p(odds),
+        _numeric_column(target, 'Ninki', 10),
+        _numeric_column(target, 'Waku', 5),
+        (course_type == '芝').to_numpy(dtype=np.float64),
+        (course_type == 'ダート').to_numpy(dtype=np.float64),
+        (track_condition == '良').to_numpy(dtype=np.float64),
+        _numeric_column(target, 'distance', 1600) / 1000,
+    ]).astype(np.float32)
+
+    y = pd.to_numeric(target['Rank'], errors='coerce').to_numpy(dtype=np.float64)
+
+    race_code = pd.factorize(target['race_id'])[0]
+    groups = np.bincount(race_code) if len(race_code) else np.array([], dtype=np.int64)
+
+    meta = pd.DataFrame({
+        'race_id': target['race_id'].to_numpy(),
+        'horse_id': target['horse_id'].to_numpy(),
+        'Umaban': target['Umaban'].to_numpy() if 'Umaban' in target.columns else np.nan,
+        'date': date_strs,
+        'odds': odds,
+    })
+
+    return X, y, groups, meta
@@ -3,17 +3,24 @@
 """
 import pandas as pd
 import numpy as np
-import time
-import requests
 from bs4 import BeautifulSoup
 import json
 import os
 import pickle
 from improved_analyzer import ImprovedHorseAnalyzer
+from fetch_pool import FetchPool
+from response_cache import get_default_cache
+from payout_store import PayoutStore, race_dates_from_frame, race_key
 
 # 設定
 USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
 SLEEP_TIME = 1.0  # リクエスト間隔（秒）
+MAX_IN_FLIGHT = 4  # 同時に取得するページ数
+
+# 全リクエスト共通の取得プール（SLEEP_TIME 秒に1件のレートで並行取得）
+# 取得したHTMLは共通のキャッシュ（response_cache.DEFAULT_CACHE_DIR）に保存し、確定済みの結果ページは再取得しない
+fetch_pool = FetchPool(rate=1.0 / SLEEP_TIME, max_in_flight=MAX_IN_FLIGHT, timeout=30, user_agent=USER_AGENT,
+                       cache=get_default_cache())
 
 def get_payout_data(race_id):
     """
@@ -23,12 +30,8 @@ def get_payout_data(race_id):
         dict: {'単勝': {...}, '複勝': {...}, '馬連': {...}, ...}
     """
     url = f'https://race.netkeiba.com/race/result.html?race_id={race_id}'
-    headers = {'User-Agent': USER_AGENT}
-
     try:
-        time.sleep(SLEEP_TIME)
-        r = requests.get(url, headers=headers, timeout=30)
-        r.raise_for_status()
+        r = fetch_pool.get(url)
         r.encoding = r.apparent_encoding
         soup = BeautifulSoup(r.content, 'lxml')
 
@@ -183,61 +186,69 @@ def get_payout_data(race_id):
         return None
 
 
+PAYOUT_DB_PATH = r'C:\Users\bu158\Keiba_Shisaku20250928\payouts.sqlite'
+LEGACY_CACHE_FILE = r'C:\Users\bu158\Keiba_Shisaku20250928\payout_cache.pkl'
+
+
 def load_payout_cache(cache_file='payout_cache.pkl'):
-    """配当キャッシュを読み込む"""
+    """旧形式の配当キャッシュ（pickle）を読み込む"""
     if os.path.exists(cache_file):
         with open(cache_file, 'rb') as f:
             return pickle.load(f)
     return {}
 
 
-def save_payout_cache(cache, cache_file='payout_cache.pkl'):
-    """配当キャッシュを保存"""
-    with open(cache_file, 'wb') as f:
-        pickle.dump(cache, f)
+def open_payout_store(db_path=PAYOUT_DB_PATH, legacy_cache_file=LEGACY_CACHE_FILE):
+    """配当ストアを開く（空で旧形式の payout_cache.pkl があれば取り込む）"""
+    store = PayoutStore(db_path)
+    if len(store) == 0 and os.path.exists(legacy_cache_file):
+        legacy = load_payout_cache(legacy_cache_file)
+        num_imported = store.add_many({**item, 'race_id': item.get('race_id', race_id)}
+                                      for race_id, item in legacy.items())
+        print(f"旧キャッシュを取り込みました: {num_imported}レース")
+    return store
 
 
-def fetch_payouts_for_races(race_ids, max_races=50):
+def fetch_payouts_for_races(race_ids, max_races=50, race_dates=None):
     """
     指定したrace_idリストの配当データを取得
 
+    取得したレースは1件ずつ配当ストアに追記する（途中で止まっても取得済みの分は残る）。
+
     Args:
         race_ids: レースIDのリスト
         max_races: 最大取得件数
+        race_dates: {race_id: 'YYYY-MM-DD'}（期間での検索用、省略可）
 
     Returns:
-        dict: {race_id: payout_data, ...}
+        dict: {race_id: payout_data, ...}（対象レースのうち配当があるもの）
     """
-    cache_file = r'C:\Users\bu158\Keiba_Shisaku20250928\payout_cache.pkl'
-    payout_cache = load_payout_cache(cache_file)
+    store = open_payout_store()
+    race_dates = race_dates or {}
 
     print(f"\n配当データ取得開始（最大{max_races}レース）")
-    print(f"キャッシュ済み: {len(payout_cache)}レース")
+    print(f"キャッシュ済み: {len(store)}レース")
 
     new_fetched = 0
 
-    for idx, race_id in enumerate(race_ids[:max_races]):
-        # キャッシュチェック
-        if race_id in payout_cache:
-            continue
+    # ストアにないレースだけ並行取得
+    target_ids = list(race_ids[:max_races])
+    needed_ids = [race_id for race_id in target_ids if race_id not in store]
 
-        print(f"[{idx+1}/{min(max_races, len(race_ids))}] {race_id} 取得中...")
-        payout_data = get_payout_data(race_id)
+    for idx, (race_id, payout_data) in enumerate(zip(needed_ids, fetch_pool.imap(get_payout_data, needed_ids))):
+        print(f"[{idx+1}/{len(needed_ids)}] {race_id} 取得完了")
 
-        if payout_data:
-            payout_cache[race_id] = payout_data
+        if payout_data and store.add(payout_data, race_date=race_dates.get(race_key(race_id))):
             new_fetched += 1
 
-            # 10件ごとにキャッシュ保存
-            if new_fetched % 10 == 0:
-                save_payout_cache(payout_cache, cache_file)
-                print(f"  → キャッシュ保存（計{len(payout_cache)}件）")
+    print(f"\n配当取得完了: 新規{new_fetched}件、総計{len(store)}件")
 
-    # 最終保存
-    save_payout_cache(payout_cache, cache_file)
-    print(f"\n配当取得完了: 新規{new_fetched}件、総計{len(payout_cache)}件")
-
-    return payout_cache
+    payouts = {}
+    for race_id in target_ids:
+        payout_data = store.get(race_id)
+        if payout_data:
+            payouts[race_id] = payout_data
+    return payouts
 
 
 def main():
@@ -263,7 +274,7 @@ def main():
     print(f"総レース数: {len(race_ids)}")
 
     # 配当データを取得（500レース）
-    payout_cache = fetch_payouts_for_races(race_ids, max_races=500)
+    payout_cache = fetch_payouts_for_races(race_ids, max_races=500, race_dates=race_dates_from_frame(df))
 
     # サンプル表示
     if payout_cache:
@@ -275,7 +286,7 @@ def main():
             if bet_type != 'race_id':
                 print(f"  {bet_type}: {data}")
 
-    print("\n完了！payout_cache.pklに保存されました。")
+    print(f"\n完了！{PAYOUT_DB_PATH} に保存されました。")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,249 @@
+"""
+netkeiba 取得用の共有HTTPプール
+
+各取得関数が毎回 requests.get + 固定 time.sleep で直列に待っていたのを、
+以下をまとめた1つのプールに置き換える。
+
+- keep-alive の接続プール（requests.Session + HTTPAdapter）
+- 全スレッド共通のトークンバケットによるレート制限（秒あたりのリクエスト数）
+- 同時実行数の上限（imap で複数ページを並行取得）
+- 接続エラー・429・5xx のリトライ（指数バックオフ、Retry-After 対応）
+- ResponseCache を渡すとディスクキャッシュを優先（有効なら通信しない、期限切れは条件付きで再検証）
+
+使い方:
+    pool = FetchPool(rate=1.0, max_in_flight=4)
+    r = pool.get(url)
+    for race_id, html in zip(race_ids, pool.imap(fetch_func, race_ids)):
+        ...
+
+    # ローカルのテスト用サーバーで動作確認
+    python fetch_pool.py
+"""
+import collections
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+
+# リトライするHTTPステータス
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    スレッド共通のトークンバケット
+
+    rate 個/秒でトークンが補充され、最大 burst 個まで貯まる。
+    rate <= 0 の場合は制限なし。
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """トークンを1つ取得（なければ補充されるまで待つ）"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class FetchPool:
+    """
+    レート制限・同時実行数制限・リトライ付きのHTTP取得プール
+    """
+
+    def __init__(self, rate=1.0, burst=1, max_in_flight=4, retries=3, backoff=1.0,
+                 timeout=20, user_agent=DEFAULT_USER_AGENT, cache=None):
+        """
+        Args:
+            rate: 全スレッド合計の秒あたりリクエスト数（0以下で無制限）
+            burst: 連続して送れる最大リクエスト数
+            max_in_flight: 同時に処理するリクエスト数の上限
+            retries: リトライ回数
+            backoff: リトライ待機の基準秒数（1, 2, 4, ... 倍）
+            timeout: リクエストのタイムアウト（秒）
+            user_agent: User-Agent ヘッダー
+            cache: ResponseCache（省略時はキャッシュなし）
+        """
+        self.bucket = TokenBucket(rate, burst)
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.cache = cache
+
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = user_agent
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.max_in_flight, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _retry_wait(self, attempt, response=None):
+        """リトライまでの待機秒数（Retry-After があれば優先）"""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                return float(retry_after)
+        return self.backoff * (2 ** attempt)
+
+    def get(self, url, **kwargs):
+        """
+        レート制限付きで GET し、成功したレスポンスを返す
+
+        リトライしても失敗した場合は requests の例外を送出する（従来の requests.get と同じ扱い）。
+        キャッシュが有効ならレート制限も含めて通信しない。
+        """
+        entry = None
+        if self.cache is not None:
+            entry = self.cache.lookup(url)
+            if entry is not None and entry.fresh:
+                return entry.to_response()
+            if entry is not None:
+                kwargs['headers'] = {**(kwargs.get('headers') or {}), **entry.conditional_headers()}
+
+        r = self._fetch(url, **kwargs)
+
+        if self.cache is not None:
+            if r.status_code == 304 and entry is not None:
+                self.cache.revalidated(url, r)
+                return entry.to_response()
+            self.cache.store(url, r)
+        return r
+
+    def invalidate(self, url):
+        """URLのキャッシュを削除（取得できた内容が不完全だった場合など）"""
+        if self.cache is not None:
+            self.cache.invalidate(url)
+
+    def _fetch(self, url, **kwargs):
+        """リトライ付きで実際に GET する"""
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            try:
+                r = self.session.get(url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt >= self.retries:
+                    raise
+                wait = self._retry_wait(attempt)
+                print(f"[WARNING] 通信エラー、{wait:.1f}秒後にリトライ ({attempt + 1}/{self.retries}): {url} ({e})")
+                time.sleep(wait)
+                continue
+
+            if r.status_code in RETRY_STATUS and attempt < self.retries:
+                wait = self._retry_wait(attempt, r)
+                print(f"[WARNING] HTTP {r.status_code}、{wait:.1f}秒後にリトライ ({attempt + 1}/{self.retries}): {url}")
+                time.sleep(wait)
+                continue
+
+            r.raise_for_status()
+            return r
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='fetch')
+            return self._executor
+
+    def imap(self, func, items):
+        """
+        func(item) を最大 max_in_flight 件まで並行実行し、items の順に結果を返す
+
+        func の中で self.get を呼べば、並行実行中もレート制限は全体で共有される。
+        """
+        executor = self._get_executor()
+        pending = collections.deque()
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= self.max_in_flight * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _self_check():
+    """ローカルのテスト用サーバーに対してリトライ・レート制限・並行取得を確認"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    hits = collections.Counter()
+    hits_lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            with hits_lock:
+                hits[self.path] += 1
+                count = hits[self.path]
+            # /flaky は1回目だけ 503 を返す
+            if self.path == '/flaky' and count == 1:
+                self.send_response(503)
+                self.send_header('Retry-After', '0')
+                self.end_headers()
+                return
+            time.sleep(0.2)  # 応答の遅延
+            body = f'<html><body>{self.path}</body></html>'.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+
+    try:
+        with FetchPool(rate=20, burst=1, max_in_flight=4, retries=2, backoff=0.1) as pool:
+            r = pool.get(base + '/flaky')
+            assert r.status_code == 200 and hits['/flaky'] == 2, 'リトライ失敗'
+            print("[OK] 503 からのリトライ")
+
+            paths = [f'/page/{i}' for i in range(20)]
+            start = time.monotonic()
+            bodies = list(pool.imap(lambda p: pool.get(base + p).text, paths))
+            elapsed = time.monotonic() - start
+            assert all(p in b for p, b in zip(paths, bodies)), '結果の順序が不正'
+            # 直列なら 20 × 0.2秒 = 4秒、レート上限 20件/秒なら約1秒
+            assert elapsed < 3.0, f'並行取得されていない ({elapsed:.2f}秒)'
+            assert elapsed >= 0.9, f'レート制限が効いていない ({elapsed:.2f}秒)'
+            print(f"[OK] 20ページを{elapsed:.2f}秒で並行取得（順序保持・レート制限あり）")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    _self_check()
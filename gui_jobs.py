@@ -0,0 +1,258 @@
+"""
+Tk GUI 用のバックグラウンドジョブ実行
+
+スクレイピング・特徴量計算・モデル予測をメインスレッドで実行し、ループの中で
+root.update() を呼んで画面を保たせていたのを、ワーカースレッドで実行して
+結果をキューで受け渡す形にする。
+
+- submit() したジョブはワーカースレッド（最大 max_workers 本）で並行して実行
+  daemon=True ならジョブごとにデーモンスレッドを立てて上限なしで実行（中止点のない長い
+  ジョブがあっても、ウィンドウを閉じたときにプロセスの終了を待たせない）
+- 進捗・完了・エラー・中止はキューに積まれ、メインスレッドが poll_ms ごとに取り出して
+  コールバックを呼ぶ（Tkのウィジェットに触るのは常にメインスレッド）
+- cancel() / cancel_all() で中止を要求（ジョブ側は区切りごとに job.check_cancelled() を呼ぶ）
+- call_soon(func, *args) で任意の処理をメインスレッドで実行（ワーカーからの root.after(0, ...) の代わり）
+
+使い方:
+    self.jobs = JobExecutor(root, max_workers=4)
+
+    def work(job, race_id):
+        job.progress(10, "出馬表取得中...")
+        job.check_cancelled()
+        ...
+        return result
+
+    self.jobs.submit(f"予想 {race_id}", work, race_id,
+                     on_progress=lambda job, value, text: ...,
+                     on_done=lambda job, result: ...,
+                     on_error=lambda job, exc, tb: ...)
+"""
+import itertools
+import queue
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# ジョブの状態
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+# 1回のポーリングで処理するイベント数の上限（大量の進捗イベントで画面が固まらないように）
+MAX_EVENTS_PER_POLL = 200
+
+
+class JobCancelled(Exception):
+    """ジョブが中止された（job.check_cancelled() が送出する）"""
+
+
+class Job:
+    """
+    JobExecutor に投入した1つのジョブ（ワーカー関数の第1引数として渡される）
+    """
+
+    def __init__(self, executor, job_id, name, callbacks):
+        self.executor = executor
+        self.id = job_id
+        self.name = name
+        self.state = PENDING
+        self.callbacks = callbacks
+        self._cancel_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def finished(self):
+        return self.state in (DONE, FAILED, CANCELLED)
+
+    def cancel(self):
+        """中止を要求（実行中のジョブは次の check_cancelled() で止まる）"""
+        self._cancel_event.set()
+
+    def check_cancelled(self):
+        """中止が要求されていれば JobCancelled を送出"""
+        if self._cancel_event.is_set():
+            raise JobCancelled(self.name)
+
+    def progress(self, value=None, text=None):
+        """進捗（0〜100）とメッセージをメインスレッドに通知"""
+        self.executor._events.put(('progress', self, (value, text)))
+
+    def post(self, func, *args):
+        """func(*args) をメインスレッドで実行"""
+        self.executor.call_soon(func, *args)
+
+    def __repr__(self):
+        return f"Job({self.id}, {self.name!r}, {self.state})"
+
+
+class JobExecutor:
+    """
+    ワーカースレッドでジョブを並行実行し、結果をキュー経由でメインスレッドに返す
+    """
+
+    def __init__(self, root, max_workers=4, poll_ms=50, daemon=False):
+        """
+        Args:
+            root: Tkのルートウィンドウ（ポーリングに root.after を使う）
+            max_workers: 同時に実行するジョブ数の上限（超えた分は待機、daemon=True では使わない）
+            poll_ms: キューを確認する間隔（ミリ秒）
+            daemon: True ならジョブごとにデーモンスレッドで実行（上限なし、終了時に待たない）
+        """
+        self.root = root
+        self.poll_ms = poll_ms
+        self.daemon = daemon
+        self._pool = None if daemon else ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gui-job')
+        self._events = queue.Queue()
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._after_id = self.root.after(self.poll_ms, self._poll)
+
+    # --- 投入・中止 ---
+
+    def submit(self, name, func, *args, on_progress=None, on_done=None, on_error=None,
+               on_cancelled=None, on_finished=None):
+        """
+        func(job, *args) をワーカースレッドで実行
+
+        コールバックは全てメインスレッドで呼ばれる:
+            on_progress(job, value, text)  job.progress() のたび
+            on_done(job, result)           正常終了
+            on_error(job, exc, tb)         例外（省略時はトレースバックを表示）
+            on_cancelled(job)              中止
+            on_finished(job)               上のいずれの場合も最後に
+
+        Returns:
+            Job
+        """
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("JobExecutor は終了しています")
+            job = Job(self, next(self._ids), name, {
+                'progress': on_progress, 'done': on_done, 'error': on_error,
+                'cancelled': on_cancelled, 'finished': on_finished,
+            })
+            self._jobs[job.id] = job
+        if self.daemon:
+            threading.Thread(target=self._run, args=(job, func, args),
+                             name=f'gui-job-{job.id}', daemon=True).start()
+        else:
+            self._pool.submit(self._run, job, func, args)
+        return job
+
+    def cancel(self, job):
+        """ジョブ（または job.id）の中止を要求"""
+        if not isinstance(job, Job):
+            with self._lock:
+                job = self._jobs.get(job)
+        if job is not None:
+            job.cancel()
+
+    def cancel_all(self):
+        """実行中・待機中の全ジョブの中止を要求（中止したジョブ数を返す）"""
+        jobs = self.active_jobs()
+        for job in jobs:
+            job.cancel()
+        return len(jobs)
+
+    def active_jobs(self):
+        """未完了のジョブ（投入順）"""
+        with self._lock:
+            return [job for job in self._jobs.values() if not job.finished]
+
+    def call_soon(self, func, *args):
+        """func(*args) を次のポーリングでメインスレッドから実行（どのスレッドからでも呼べる）"""
+        self._events.put(('call', None, (func, args)))
+
+    # --- ワーカー側 ---
+
+    def _run(self, job, func, args):
+        if job.cancelled:
+            self._events.put(('cancelled', job, None))
+            return
+        job.state = RUNNING
+        try:
+            result = func(job, *args)
+        except JobCancelled:
+            self._events.put(('cancelled', job, None))
+        except Exception as e:
+            self._events.put(('error', job, (e, traceback.format_exc())))
+        else:
+            kind = 'cancelled' if job.cancelled else 'done'
+            self._events.put((kind, job, result))
+
+    # --- メインスレッド側 ---
+
+    def _poll(self):
+        try:
+            for _ in range(MAX_EVENTS_PER_POLL):
+                try:
+                    kind, job, payload = self._events.get_nowait()
+                except queue.Empty:
+                    break
+                self._dispatch(kind, job, payload)
+        finally:
+            if not self._closed:
+                self._after_id = self.root.after(self.poll_ms, self._poll)
+
+    def _dispatch(self, kind, job, payload):
+        if kind == 'call':
+            func, args = payload
+            self._invoke(func, *args)
+            return
+
+        if kind == 'progress':
+            if not job.finished:
+                self._invoke(job.callbacks['progress'], job, *payload)
+            return
+
+        if kind == 'done':
+            job.state = DONE
+            self._invoke(job.callbacks['done'], job, payload)
+        elif kind == 'error':
+            job.state = FAILED
+            exc, tb = payload
+            if job.callbacks['error'] is not None:
+                self._invoke(job.callbacks['error'], job, exc, tb)
+            else:
+                print(f"[ERROR] ジョブ失敗: {job.name}\n{tb}")
+        elif kind == 'cancelled':
+            job.state = CANCELLED
+            print(f"[INFO] ジョブを中止しました: {job.name}")
+            self._invoke(job.callbacks['cancelled'], job)
+
+        with self._lock:
+            self._jobs.pop(job.id, None)
+        self._invoke(job.callbacks['finished'], job)
+
+    @staticmethod
+    def _invoke(func, *args):
+        """コールバックを実行（例外でポーリングが止まらないようにする）"""
+        if func is None:
+            return
+        try:
+            func(*args)
+        except Exception:
+            print("[ERROR] コールバックでエラーが発生しました")
+            traceback.print_exc()
+
+    def shutdown(self, cancel=True):
+        """ポーリングを止め、ワーカーを終了（cancel=True なら未完了のジョブに中止を要求）"""
+        with self._lock:
+            self._closed = True
+        if cancel:
+            self.cancel_all()
+        if self._after_id is not None:
+            try:
+                self.root.after_cancel(self._after_id)
+            except Exception:
+                pass
+            self._after_id = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
@@ -0,0 +1,84 @@
+"""
+馬単位の拡張情報（血統・勝率・脚質）をレースデータに結合する
+
+スクレイピングで得た馬ごとの情報を、全レース行を1行ずつ書き換えるのではなく、
+horse_id をインデックスにした小さな馬テーブルにしてからレースデータに結合する。
+値が変わる行だけを書き換えるので、新しく数頭分を取得しただけなら
+全データに対しても列ごとの配列比較1回で済む。
+
+使い方:
+    horse_table = build_horse_table(horse_data_cache)   # {horse_id: {列: 値}}
+    df, num_updated = merge_horse_table(df, horse_table)
+"""
+import numpy as np
+import pandas as pd
+
+from horse_history_index import normalize_horse_id_series
+
+# 馬の詳細ページから得る拡張列
+HORSE_ATTRIBUTE_COLUMNS = [
+    'father',
+    'mother_father',
+    'total_starts',
+    'total_win_rate',
+    'turf_win_rate',
+    'dirt_win_rate',
+    'avg_passage_position',
+    'running_style_category',
+]
+
+
+def build_horse_table(horse_data, columns=HORSE_ATTRIBUTE_COLUMNS):
+    """
+    {horse_id: {列: 値}} を正規化した horse_id をインデックスにしたDataFrameに変換
+
+    同じ馬が表記違い（2019104308.0 と '2019104308'）で重複していれば後の値を使う。
+    """
+    if not horse_data:
+        return pd.DataFrame(columns=columns, index=pd.Index([], dtype=object))
+
+    table = pd.DataFrame.from_dict(horse_data, orient='index').reindex(columns=columns)
+    table.index = normalize_horse_id_series(table.index.to_series()).to_numpy(dtype=object)
+    table = table[table.index.notna()]
+    return table[~table.index.duplicated(keep='last')]
+
+
+def merge_horse_table(df, horse_table, columns=HORSE_ATTRIBUTE_COLUMNS):
+    """
+    馬テーブルの値をレースデータの該当行に反映（df をその場で更新）
+
+    馬テーブルにない馬の行は既存の値を保持する。列がなければ追加する。
+
+    Returns:
+        (df, 値が変わった行数)
+    """
+    for col in columns:
+        if col not in df.columns:
+            df[col] = None
+
+    if horse_table is None or horse_table.empty or df.empty:
+        return df, 0
+
+    codes = horse_table.index.get_indexer(normalize_horse_id_series(df['horse_id']))
+    rows = np.flatnonzero(codes >= 0)
+    if len(rows) == 0:
+        return df, 0
+    codes = codes[rows]
+
+    changed_any = np.zeros(len(rows), dtype=bool)
+    for col in columns:
+        new_values = horse_table[col].to_numpy()[codes]
+        old_values = df[col].to_numpy()[rows]
+        same = pd.isna(old_values) & pd.isna(new_values)
+        both = ~pd.isna(old_values) & ~pd.isna(new_values)
+        same[both] = old_values[both] == new_values[both]
+        changed = ~same
+        if changed.any():
+            # 全欠損で float 列として読まれた father などに文字列を入れる場合は型を広げる
+            dtype = df[col].dtype
+            if isinstance(dtype, np.dtype) and dtype != new_values.dtype:
+                df[col] = df[col].astype(np.promote_types(dtype, new_values.dtype))
+            df.iloc[rows[changed], df.columns.get_loc(col)] = new_values[changed]
+            changed_any |= changed
+
+    return df, int(changed_any.sum())
@@ -0,0 +1,295 @@
+"""
+馬詳細キャッシュの列指向ストア（horse_cache.pkl の置き換え）
+
+horse_details_cache（{horse_id: 馬詳細dict}）を1つのpickleにまとめて保存すると、
+1頭追加するたびに全体を書き直し、起動のたびに全馬の過去成績まで読み込むことになる。
+ここでは馬を horse_id のハッシュでバケットに分け、バケットごとに2つの表で持つ。
+
+    store_dir/
+        horses-NNN.parquet   馬ごとの属性（父・母父・生年月日など、1頭1行）
+        runs-NNN.parquet     過去成績（race_results を1走1行に展開、jra_race_results は印の列）
+
+- 辞書と同じように使える（get / in / [] / len）。値は初めて参照したときにバケット単位で読み込む
+- 追加・更新した馬のバケットだけを flush() で書き直す
+- pyarrow がなければ同じ表を圧縮pickle（.pkl.gz）で保存する
+
+使い方:
+    cache = HorseDetailsStore(os.path.join(data_dir, 'horse_details_store'))
+    cache.preload(horse_ids)             # 予測に使う馬のバケットだけ先に読み込む（省略可）
+    details = cache.get('2019104308')
+    cache['2019104308'] = details
+    cache.flush()
+
+    # 既存の horse_cache.pkl から移行
+    cache.import_legacy_pickle(os.path.join(data_dir, 'horse_cache.pkl'))
+"""
+import glob
+import os
+import pickle
+import zlib
+from collections.abc import MutableMapping
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+# data_dir 内の既定の保存先フォルダ名
+HORSE_STORE_DIRNAME = 'horse_details_store'
+
+# バケット数（1バケットあたり数百頭程度になる数）
+NUM_BUCKETS = 256
+
+# 1走1行に展開するリスト項目と、その部分集合として印の列で持つリスト項目
+RUNS_FIELD = 'race_results'
+JRA_RUNS_FIELD = 'jra_race_results'
+
+# 過去成績の表で使う内部列
+_HORSE_COL = '_horse_id'
+_ORDER_COL = '_run_no'
+_JRA_COL = '_is_jra'
+
+
+def normalize_key(horse_id):
+    """2019104308.0 / ' 2019104308' -> '2019104308'"""
+    if isinstance(horse_id, (float, np.floating)) and float(horse_id).is_integer():
+        return str(int(horse_id))
+    return str(horse_id).strip().split('.')[0]
+
+
+def bucket_of(key):
+    """horse_id のバケット番号（実行環境によらず同じ値になるよう crc32 を使う）"""
+    return zlib.crc32(key.encode('utf-8')) % NUM_BUCKETS
+
+
+def _coerce_object_columns(df):
+    """文字列と数値が混在する列を文字列にそろえる（Parquetは1列1型）"""
+    for col in df.columns:
+        if df[col].dtype != object:
+            continue
+        values = df[col][~df[col].map(_is_missing)]
+        if values.empty:
+            continue
+        if values.map(lambda v: isinstance(v, str)).all():
+            continue
+        if values.map(lambda v: isinstance(v, (int, float, np.integer, np.floating))).all():
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+            continue
+        df[col] = df[col].map(lambda v: None if _is_missing(v) else v if isinstance(v, str) else str(v))
+    return df
+
+
+class HorseDetailsStore(MutableMapping):
+    """
+    {horse_id: 馬詳細dict} として使える、バケット分割された列指向ストア
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.ext = '.parquet' if PARQUET_AVAILABLE else '.pkl.gz'
+        os.makedirs(store_dir, exist_ok=True)
+
+        self._loaded = {}          # 読み込み済み・更新済みの馬: key -> dict
+        self._loaded_buckets = set()
+        self._dirty_buckets = set()
+        self._keys = self._read_keys()
+
+    # --- ファイル入出力 ---
+
+    def _path(self, kind, bucket):
+        return os.path.join(self.store_dir, f'{kind}-{bucket:03d}{self.ext}')
+
+    def _read_table(self, path, columns=None):
+        if not os.path.exists(path):
+            return None
+        if PARQUET_AVAILABLE:
+            return pd.read_parquet(path, columns=columns)
+        df = pd.read_pickle(path, compression='gzip')
+        return df[columns] if columns is not None else df
+
+    def _write_table(self, df, path):
+        tmp_path = path + '.tmp'
+        if PARQUET_AVAILABLE:
+            df.to_parquet(tmp_path, index=False, compression='zstd')
+        else:
+            df.to_pickle(tmp_path, compression='gzip', protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def _read_keys(self):
+        """全バケットの horse_id 列だけを読んでキー一覧を作る"""
+        keys = {}
+        for path in glob.glob(os.path.join(self.store_dir, f'horses-*{self.ext}')):
+            try:
+                ids = self._read_table(path, columns=[_HORSE_COL])
+            except Exception as e:
+                print(f"[WARNING] 馬詳細ストアの読み込みに失敗: {path} ({e})")
+                continue
+            for key in ids[_HORSE_COL].astype(str):
+                keys[key] = None
+        return keys
+
+    def _load_bucket(self, bucket):
+        """バケットの全馬を dict に復元して読み込み済みにする（更新済みの馬は上書きしない）"""
+        if bucket in self._loaded_buckets:
+            return
+        self._loaded_buckets.add(bucket)
+
+        horses = self._read_table(self._path('horses', bucket))
+        if horses is None or horses.empty:
+            return
+        runs = self._read_table(self._path('runs', bucket))
+
+        runs_by_horse = {}
+        if runs is not None and not runs.empty:
+            runs = runs.sort_values([_HORSE_COL, _ORDER_COL], kind='stable')
+            run_columns = [c for c in runs.columns if c not in (_HORSE_COL, _ORDER_COL, _JRA_COL)]
+            for key, group in runs.groupby(_HORSE_COL, sort=False):
+                records = group[run_columns].to_dict('records')
+                is_jra = group[_JRA_COL].to_numpy(dtype=bool)
+                runs_by_horse[str(key)] = (records, [r for r, j in zip(records, is_jra) if j])
+
+        attr_columns = [c for c in horses.columns if c not in (_HORSE_COL, '_has_runs', '_has_jra_runs')]
+        for row in horses.to_dict('records'):
+            key = str(row[_HORSE_COL])
+            if key in self._loaded:
+                continue
+            details = {col: row[col] for col in attr_columns if not _is_missing(row[col])}
+            records, jra_records = runs_by_horse.get(key, ([], []))
+            if row.get('_has_runs'):
+                details[RUNS_FIELD] = records
+            if row.get('_has_jra_runs'):
+                details[JRA_RUNS_FIELD] = jra_records
+            self._loaded[key] = details
+
+    def _write_bucket(self, bucket, keys):
+        """バケット内の全馬を2つの表にして書き直す"""
+        self._load_bucket(bucket)
+
+        horse_rows = []
+        run_frames = []
+        for key in keys:
+            details = self._loaded.get(key)
+            if not isinstance(details, dict):
+                continue
+            runs = details.get(RUNS_FIELD)
+            jra_runs = details.get(JRA_RUNS_FIELD)
+            row = {k: v for k, v in details.items() if k not in (RUNS_FIELD, JRA_RUNS_FIELD)}
+            row[_HORSE_COL] = key
+            row['_has_runs'] = isinstance(runs, list)
+            row['_has_jra_runs'] = isinstance(jra_runs, list)
+            horse_rows.append(row)
+
+            if isinstance(runs, list) and runs:
+                # jra_race_results は race_results の部分集合なので印の列だけ持つ
+                jra_runs = jra_runs if isinstance(jra_runs, list) else []
+                records = [r for r in runs if isinstance(r, dict)]
+                if records:
+                    frame = pd.DataFrame.from_records(records)
+                    frame[_HORSE_COL] = key
+                    frame[_ORDER_COL] = np.arange(len(records))
+                    frame[_JRA_COL] = [r in jra_runs for r in records]
+                    run_frames.append(frame)
+
+        horses_path = self._path('horses', bucket)
+        runs_path = self._path('runs', bucket)
+        if not horse_rows:
+            for path in (horses_path, runs_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            return
+
+        # 馬の表を最後に置き換える（キー一覧は馬の表から作るので、途中で落ちても馬の一覧は前のまま）
+        if run_frames:
+            self._write_table(_coerce_object_columns(pd.concat(run_frames, ignore_index=True)), runs_path)
+        elif os.path.exists(runs_path):
+            os.remove(runs_path)
+        self._write_table(_coerce_object_columns(pd.DataFrame(horse_rows)), horses_path)
+
+    # --- 辞書としての操作 ---
+
+    def __getitem__(self, horse_id):
+        key = normalize_key(horse_id)
+        if key not in self._keys:
+            raise KeyError(horse_id)
+        if key not in self._loaded:
+            self._load_bucket(bucket_of(key))
+        return self._loaded[key]
+
+    def __setitem__(self, horse_id, details):
+        key = normalize_key(horse_id)
+        bucket = bucket_of(key)
+        # 書き出し時にバケットの他の馬を失わないよう先に読み込んでおく
+        self._load_bucket(bucket)
+        self._loaded[key] = details
+        self._keys[key] = None
+        self._dirty_buckets.add(bucket)
+
+    def __delitem__(self, horse_id):
+        key = normalize_key(horse_id)
+        if key not in self._keys:
+            raise KeyError(horse_id)
+        bucket = bucket_of(key)
+        self._load_bucket(bucket)
+        del self._keys[key]
+        self._loaded.pop(key, None)
+        self._dirty_buckets.add(bucket)
+
+    def __contains__(self, horse_id):
+        return normalize_key(horse_id) in self._keys
+
+    def __iter__(self):
+        return iter(list(self._keys))
+
+    def __len__(self):
+        return len(self._keys)
+
+    # --- 読み込み・保存 ---
+
+    def preload(self, horse_ids):
+        """指定した馬を含むバケットだけを読み込む"""
+        for bucket in {bucket_of(normalize_key(h)) for h in horse_ids if not _is_missing(h)}:
+            self._load_bucket(bucket)
+
+    @property
+    def dirty(self):
+        return bool(self._dirty_buckets)
+
+    def flush(self):
+        """更新のあったバケットだけを書き直す
+
+        Returns:
+            書き直したバケット数
+        """
+        dirty = sorted(self._dirty_buckets)
+        keys_by_bucket = {bucket: [] for bucket in dirty}
+        for key in self._keys:
+            bucket = bucket_of(key)
+            if bucket in keys_by_bucket:
+                keys_by_bucket[bucket].append(key)
+        for bucket in dirty:
+            self._write_bucket(bucket, keys_by_bucket[bucket])
+        self._dirty_buckets.clear()
+        return len(dirty)
+
+    def import_legacy_pickle(self, pickle_path):
+        """旧形式の horse_cache.pkl を取り込んで保存（取り込んだ頭数を返す）"""
+        with open(pickle_path, 'rb') as f:
+            legacy = pickle.load(f)
+        for horse_id, details in legacy.items():
+            if isinstance(details, dict):
+                self[horse_id] = details
+        self.flush()
+        return len(legacy)
+
+
+def _is_missing(value):
+    if value is None:
+        return True
+    try:
+        return bool(pd.isna(value))
+    except (TypeError, ValueError):
+        return False
@@ -0,0 +1,203 @@
+"""
+馬ごとの過去成績インデックス
+
+全レースデータを horse_id ごとにまとめ、日付順に一度だけソートしておくことで、
+「日付D より前の直近N走」を二分探索1回で取り出せるようにする。
+
+使い方:
+    index = HorseHistoryIndex(df)
+    past = index.get_past_results(horse_id, '2024-05-26', max_results=5)
+    past_list = index.get_past_results_batch(horse_ids, '2024-05-26', max_results=5)
+"""
+import numpy as np
+import pandas as pd
+
+# 過去成績dictのキー -> (CSV列名, 数値変換するか)
+RESULT_FIELDS = [
+    ('date', 'date', False),
+    ('place', 'track_name', False),
+    ('distance', 'distance', True),
+    ('rank', 'Rank', True),
+    ('course_type', 'course_type', False),
+    ('baba', 'track_condition', False),
+    ('time', 'Time', False),
+    ('agari', 'Agari', False),
+    ('passage', 'Passage', False),
+    ('weight', 'Weight', True),
+    ('weight_diff', 'WeightDiff', True),
+]
+
+# インデックス構築に必要な列（load_race_data の columns 指定用）
+HISTORY_COLUMNS = ['horse_id'] + [col for _, col, _ in RESULT_FIELDS]
+
+
+def normalize_horse_id(horse_id):
+    """
+    horse_id を文字列キーに正規化（2019104567.0 -> '2019104567'）
+
+    Returns:
+        正規化したID文字列（欠損時はNone）
+    """
+    if horse_id is None:
+        return None
+    try:
+        if pd.isna(horse_id):
+            return None
+    except (TypeError, ValueError):
+        pass
+    if isinstance(horse_id, (float, np.floating)) and float(horse_id).is_integer():
+        return str(int(horse_id))
+    key = str(horse_id).strip()
+    return key.split('.')[0] if key else None
+
+
+def normalize_horse_id_series(horse_ids):
+    """horse_id列をまとめて正規化（欠損はNone）"""
+    s = pd.Series(horse_ids)
+    if pd.api.types.is_float_dtype(s):
+        keys = s.astype('Int64').astype(str)
+    else:
+        keys = s.astype(str).str.strip().str.split('.').str[0]
+    keys = keys.where(s.notna() & (keys != ''), None)
+    return keys
+
+
+class HorseHistoryIndex:
+    """
+    horse_id -> 日付ソート済み過去成績 のインデックス
+
+    行は (horse_id, 日付) 順に並べ替えて列ごとに NumPy 配列で保持する。
+    各馬の行範囲は [start, end) で管理し、日付の比較は datetime64[ns] の
+    int64 値に対する searchsorted で行う。
+    """
+
+    def __init__(self, df):
+        keys = normalize_horse_id_series(df['horse_id']).to_numpy(dtype=object)
+        dates = pd.to_datetime(df['date'], errors='coerce')
+
+        # 馬IDと日付の両方が有効な行のみ対象
+        valid = pd.notna(keys) & dates.notna().to_numpy()
+        valid_pos = np.flatnonzero(valid)
+
+        codes, uniques = pd.factorize(keys[valid_pos])
+        date_ns = dates.to_numpy(dtype='datetime64[ns]')[valid_pos].astype(np.int64)
+
+        # 馬ID -> 日付 の順に安定ソート
+        order = np.lexsort((date_ns, codes))
+        self.row_positions = valid_pos[order]   # 元DataFrameでの行位置
+        self.date_ns = date_ns[order]
+        sorted_codes = codes[order]
+
+        # 馬ごとの行範囲
+        starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]) if len(sorted_codes) else np.array([], dtype=np.int64)
+        ends = np.r_[starts[1:], len(sorted_codes)] if len(starts) else np.array([], dtype=np.int64)
+        self._ranges = {
+            uniques[sorted_codes[s]]: (int(s), int(e))
+            for s, e in zip(starts, ends)
+        }
+
+        # 出力用の列配列
+        self.columns = {}
+        for key, col, numeric in RESULT_FIELDS:
+            if col not in df.columns:
+                self.columns[key] = np.full(len(self.row_positions), None, dtype=object)
+                continue
+            values = df[col].iloc[self.row_positions]
+            if numeric:
+                self.columns[key] = pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64)
+            else:
+                self.columns[key] = values.to_numpy(dtype=object)
+
+    def __len__(self):
+        return len(self._ranges)
+
+    def __contains__(self, horse_id):
+        return normalize_horse_id(horse_id) in self._ranges
+
+    @staticmethod
+    def _to_ns(race_date):
+        """基準日付を int64 (ns) に変換（不正な日付はNone）"""
+        parsed = pd.to_datetime(race_date, errors='coerce')
+        if pd.isna(parsed):
+            return None
+        return int(pd.Timestamp(parsed).value)
+
+    def past_positions(self, horse_id, race_date, max_results=5):
+        """
+        基準日より前の直近走の行位置（インデックス内）を新しい順で返す
+
+        Args:
+            horse_id: 馬ID
+            race_date: 基準となるレース日付（int64 ns も可）
+            max_results: 最大取得件数（Noneで全件）
+
+        Returns:
+            インデックス内の行位置配列（新しい順）
+        """
+        key = normalize_horse_id(horse_id)
+        span = self._ranges.get(key)
+        if span is None:
+            return np.array([], dtype=np.int64)
+
+        date_ns = race_date if isinstance(race_date, (int, np.integer)) else self._to_ns(race_date)
+        if date_ns is None:
+            return np.array([], dtype=np.int64)
+
+        start, end = span
+        # 基準日「より前」（同日は含めない）
+        stop = start + int(np.searchsorted(self.date_ns[start:end], date_ns, side='left'))
+        first = start if max_results is None else max(start, stop - max_results)
+        return np.arange(stop - 1, first - 1, -1, dtype=np.int64)
+
+    def _build_results(self, positions):
+        """行位置から過去成績dictのリストを作成"""
+        if len(positions) == 0:
+            return []
+        picked = {key: arr[positions] for key, arr in self.columns.items()}
+        return [
+            {key: picked[key][i] for key, _, _ in RESULT_FIELDS}
+            for i in range(len(positions))
+        ]
+
+    def get_past_results(self, horse_id, race_date, max_results=5):
+        """
+        指定した馬の過去成績を取得
+
+        Args:
+            horse_id: 馬ID
+            race_date: 基準となるレース日付
+            max_results: 最大取得件数
+
+        Returns:
+            過去成績のリスト（新しい順）
+        """
+        return self._build_results(self.past_positions(horse_id, race_date, max_results))
+
+    def get_past_results_batch(self, horse_ids, race_date, max_results=5):
+        """
+        1レースの出走馬の過去成績をまとめて取得
+
+        Args:
+            horse_ids: 馬IDのリスト
+            race_date: 基準となるレース日付（全馬共通）
+            max_results: 最大取得件数
+
+        Returns:
+            horse_ids と同じ順の過去成績リストのリスト
+        """
+        date_ns = self._to_ns(race_date)
+        if date_ns is None:
+            return [[] for _ in horse_ids]
+
+        per_horse = [self.past_positions(h, date_ns, max_results) for h in horse_ids]
+        counts = [len(p) for p in per_horse]
+        if sum(counts) == 0:
+            return [[] for _ in horse_ids]
+
+        # 全馬分の行をまとめて1回で取り出してから分割
+        all_results = self._build_results(np.concatenate(per_horse))
+        results, offset = [], 0
+        for n in counts:
+            results.append(all_results[offset:offset + n])
+            offset += n
+        return results
@@ -1,8 +1,10 @@
 import os
 
 import sys
+import functools
 import json
 import pickle
+import shutil
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import pandas as pd # type: ignore
@@ -19,11 +21,20 @@ import time # 追加
 import traceback # 追加
 import time as _time
 from selenium import webdriver # type: ignore # 追加
-from selenium.webdriver.common.by import By # type: ignore # type: ignore # 追加
-from selenium.webdriver.support import expected_conditions as EC # type: ignore # 追加
-from selenium.webdriver.support.ui import WebDriverWait # type: ignore # type: ignore # 追加
-from selenium.common.exceptions import TimeoutException, WebDriverException, NoSuchElementException # type: ignore # 追加
 from selenium.webdriver.chrome.service import Service as ChromeService # type: ignore # type: ignore # 追加
+from race_data_store import load_race_data, normalize_date_series, derived_columns
+from bet_settlement import find_payout
+from fetch_pool import FetchPool
+from response_cache import ResponseCache, get_default_cache, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES
+from netkeiba_pages import fetch_race_ids
+from race_simulator import exotic_probabilities
+from ticket_probability import TicketProbabilityTable
+from collection_journal import CollectionJournal
+from race_dataset import AppendOnlyRaceDataset, INDEX_SUFFIX
+from horse_details_store import HorseDetailsStore, HORSE_STORE_DIRNAME
+from payout_store import PayoutStore, race_dates_from_frame
+from gui_jobs import JobExecutor
+from stats_snapshot import StatsSnapshot, merge_additive, SAME, APPENDED, CHANGED
 
 # --- Matplotlibの日本語設定 (Windows向け) ---
 # 使用可能な日本語フォントを指定してください。
@@ -38,6 +49,13 @@ except Exception as e:
     # フォントが見つからない場合の代替フォントを設定（なければデフォルト）
     # plt.rcParams['font.family'] = 'sans-serif'
 
+# 各種統計の計算に使う列（統計スナップショットの指紋に使う。存在する列のみ）
+STATS_SOURCE_COLUMNS = [
+    'track_name', '開催場所', '競馬場', 'course_type', 'distance', 'track_condition', 'Time', 'Rank',
+    'race_name', 'father', 'mother_father', 'Waku', '枠番', 'JockeyName',
+]
+# 統計の計算方法を変えたら上げる（保存済みのスナップショットを使わなくなる）
+STATS_SNAPSHOT_VERSION = 1
 
 
 class HorseRacingAnalyzerApp:
@@ -87,6 +105,10 @@ class HorseRacingAnalyzerApp:
     def __init__(self, root):
         self.root = root
         self.root.title("競馬データ分析ツール")
+        # 重い処理はバックグラウンドジョブで実行し、GUIの更新はキュー経由でメインスレッドから行う
+        # 収集・学習・バックテストは中止点のない長いジョブなので、上限なしのデーモンスレッドで実行
+        # （ウィンドウを閉じたら終了を待たずに打ち切る。以前の daemon=True のスレッドと同じ）
+        self.jobs = JobExecutor(self.root, daemon=True)
         self.root.geometry("1000x700")
         self.root.minsize(800, 600)
 
@@ -149,7 +171,6 @@ class HorseRacingAnalyzerApp:
         self.result_data = None
         self.combined_data = pd.DataFrame() # 分析や予測に使う結合済みデータ用
         self.processed_data = pd.DataFrame() # ★ 前処理済みデータ用を追加
-        self.payout_data = []             # ★ 払い戻しデータも初期化
         self.model = None # 予測モデル用
         self.settings = {} # load_settingsで初期化される
         
@@ -200,6 +221,18 @@ class HorseRacingAnalyzerApp:
         self.CHROME_DRIVER_PATH = self.settings.get("chrome_driver_path", None) # NoneならPATH検索
         self.SAVE_DIRECTORY = self.settings.get("data_dir", ".") # 保存先はdata_dirを使う
         self.PROCESSED_LOG_FILE = os.path.join(self.SAVE_DIRECTORY, "processed_race_ids.log")
+        # requests での取得は共有プール経由（接続の使い回し・全体のレート制限・リトライ・HTTPキャッシュ）
+        self.fetch_pool = FetchPool(
+            rate=float(self.settings.get("scrape_rate_per_sec", 1.0)),
+            max_in_flight=int(self.settings.get("scrape_max_in_flight", 4)),
+            timeout=self.REQUEST_TIMEOUT,
+            user_agent=self.USER_AGENT,
+            cache=self._http_cache(),
+        )
+        # 払戻は SQLite のストアから必要なレースだけ引く（精算・バックテスト用）
+        self.payout_store = PayoutStore(
+            self.settings.get("payout_db_path", os.path.join(self.SAVE_DIRECTORY, "payouts.sqlite"))
+        )
         # ★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★★
         # ↑↑↑ ここまで追加・確認 ↑↑↑
 
@@ -217,74 +250,83 @@ class HorseRacingAnalyzerApp:
         # UIに設定値を反映
         self.reflect_settings_to_ui()
     
-    # --- ★★★ キャッシュ保存用の一時的なメソッド ★★★ ---
+    # --- ★★★ キャッシュ保存用メソッド ★★★ ---
+    def _http_cache(self):
+        """
+        HTTPキャッシュ（既定は他のスクリプトと共通の response_cache.DEFAULT_CACHE_DIR）
+        設定で http_cache_dir / http_cache_max_mb を指定した場合だけ別に作る
+        """
+        if "http_cache_dir" not in self.settings and "http_cache_max_mb" not in self.settings:
+            return get_default_cache()
+        return ResponseCache(
+            self.settings.get("http_cache_dir", DEFAULT_CACHE_DIR),
+            max_bytes=int(self.settings.get("http_cache_max_mb", DEFAULT_MAX_BYTES // 1024 ** 2)) * 1024 ** 2,
+        )
+
+    def _horse_store_dir(self):
+        """馬詳細ストアの保存先（data_dir/horse_details_store）"""
+        return os.path.join(self.settings.get("data_dir", "data"), HORSE_STORE_DIRNAME)
+
     def save_cache_to_file(self, filename="horse_cache.pkl"):
-        """現在の self.horse_details_cache の内容を指定ファイルに保存する"""
-        # 必要なライブラリをインポート
-        import pickle
-        import os
+        """
+        self.horse_details_cache のうち追加・更新された馬だけをストアに書き出す
+
+        filename は旧形式（pickle）のファイル名。ストアは data_dir/horse_details_store に保存する。
+        """
         from tkinter import messagebox # メッセージボックス用にインポート
 
         if hasattr(self, 'horse_details_cache') and self.horse_details_cache:
-            # 保存先ディレクトリ (dataフォルダ推奨)
-            save_dir = self.settings.get("data_dir", "data") # dataフォルダをデフォルトに
-            if not os.path.exists(save_dir):
-                try:
-                    os.makedirs(save_dir)
-                    print(f"INFO: Created directory {save_dir}")
-                except Exception as e:
-                    print(f"ERROR: Failed to create directory {save_dir}: {e}")
-                    messagebox.showerror("エラー", f"ディレクトリ作成失敗: {save_dir}")
-                    save_dir = "." # 作成失敗時はカレントディレクトリ
-
-            filepath = os.path.join(save_dir, filename)
+            store_dir = self._horse_store_dir()
             try:
-                print(f"Attempting to save horse details cache to: {filepath}")
+                # 読み込みに失敗して dict になっている場合はストアに移し替える
+                if not isinstance(self.horse_details_cache, HorseDetailsStore):
+                    store = HorseDetailsStore(store_dir)
+                    store.update(self.horse_details_cache)
+                    self.horse_details_cache = store
                 print(f"Number of items in cache: {len(self.horse_details_cache)}")
-                with open(filepath, 'wb') as f: # バイナリ書き込みモード ('wb')
-                    pickle.dump(self.horse_details_cache, f, pickle.HIGHEST_PROTOCOL) # pickleで辞書を保存
-                print(f"Successfully saved horse details cache to {filepath}")
+                num_buckets = self.horse_details_cache.flush()
+                print(f"Successfully saved horse details cache to {store_dir} ({num_buckets} buckets updated)")
                 # 保存完了をユーザーに通知 (メインスレッドで実行)
-                self.root.after(0, lambda path=filepath: messagebox.showinfo("キャッシュ保存完了", f"馬詳細キャッシュ ({len(self.horse_details_cache)}件) を保存しました:\n{path}"))
-                self.root.after(0, lambda path=filepath: self.update_status(f"キャッシュ保存完了: {os.path.basename(path)}"))
+                self.jobs.call_soon(lambda path=store_dir: messagebox.showinfo("キャッシュ保存完了", f"馬詳細キャッシュ ({len(self.horse_details_cache)}件) を保存しました:\n{path}"))
+                self.jobs.call_soon(lambda path=store_dir: self.update_status(f"キャッシュ保存完了: {os.path.basename(path)}"))
             except Exception as e:
-                print(f"ERROR: Failed to save horse details cache to {filepath}: {e}")
-                self.root.after(0, lambda err=e, path=filepath: messagebox.showerror("キャッシュ保存エラー", f"キャッシュの保存中にエラーが発生しました:\n{path}\n{err}"))
-                self.root.after(0, lambda err=e: self.update_status(f"エラー: キャッシュ保存失敗 ({type(err).__name__})"))
+                print(f"ERROR: Failed to save horse details cache to {store_dir}: {e}")
+                self.jobs.call_soon(lambda err=e, path=store_dir: messagebox.showerror("キャッシュ保存エラー", f"キャッシュの保存中にエラーが発生しました:\n{path}\n{err}"))
+                self.jobs.call_soon(lambda err=e: self.update_status(f"エラー: キャッシュ保存失敗 ({type(err).__name__})"))
         else:
             print("WARN: No horse details cache found or cache is empty. Nothing to save.")
-            self.root.after(0, lambda: messagebox.showwarning("キャッシュ保存", "保存するキャッシュデータが見つかりません。"))
-    # --- ここまで一時的なメソッド ---
+            self.jobs.call_soon(lambda: messagebox.showwarning("キャッシュ保存", "保存するキャッシュデータが見つかりません。"))
+    # --- ここまでキャッシュ保存メソッド ---
     
-    # --- ★★★ キャッシュ読み込み用メソッド (新規追加) ★★★ ---
+    # --- ★★★ キャッシュ読み込み用メソッド ★★★ ---
     def load_cache_from_file(self, filename="horse_cache.pkl"):
-        """指定されたファイルから馬詳細キャッシュを読み込み、self.horse_details_cache を初期化する"""
-        # 必要なライブラリをインポート (ファイル先頭推奨だが、ここでimport)
-        import pickle
-        import os
+        """
+        馬詳細ストアを開き、self.horse_details_cache に設定する
 
-        # キャッシュファイルのパスを取得 (保存場所と合わせる)
-        load_dir = self.settings.get("data_dir", "data") # 保存場所に合わせて "data" など
-        filepath = os.path.join(load_dir, filename)
+        起動時に読むのは horse_id の一覧だけで、各馬の詳細は参照したときにバケット単位で読み込む。
+        ストアが空で旧形式の filename（pickle）があれば、一度だけ取り込んでストアに変換する。
+        """
+        load_dir = self.settings.get("data_dir", "data")
+        legacy_path = os.path.join(load_dir, filename)
+        store_dir = self._horse_store_dir()
 
-        if os.path.exists(filepath):
-            try:
-                print(f"INFO: Loading horse details cache from: {filepath}")
-                with open(filepath, 'rb') as f: # バイナリ読み込みモード ('rb')
-                    # ★★★ self.horse_details_cache に読み込んだデータを代入 ★★★
-                    self.horse_details_cache = pickle.load(f)
-                print(f"INFO: Successfully loaded {len(self.horse_details_cache)} items from cache.")
-                self.update_status(f"馬詳細キャッシュ読み込み完了 ({len(self.horse_details_cache)}件)")
-            except Exception as e:
-                print(f"ERROR: Failed to load horse details cache from {filepath}: {e}")
-                # messageboxはメインスレッドから呼ぶべきだが、初期化中なのでprintのみ
-                # self.root.after(0, lambda err=e, path=filepath: messagebox.showerror("キャッシュ読込エラー", f"キャッシュファイルの読み込みに失敗しました:\n{path}\n{err}"))
-                self.horse_details_cache = {} # 読み込み失敗時は空にする
-                self.update_status("警告: キャッシュ読み込み失敗")
-        else:
-            print(f"INFO: Cache file not found at {filepath}. Initializing empty cache.")
-            self.horse_details_cache = {} # ファイルがなければ空で初期化
-            self.update_status("キャッシュファイルなし")
+        try:
+            store = HorseDetailsStore(store_dir)
+            if len(store) == 0 and os.path.exists(legacy_path):
+                print(f"INFO: Converting legacy horse cache {legacy_path} -> {store_dir}")
+                num_imported = store.import_legacy_pickle(legacy_path)
+                print(f"INFO: Imported {num_imported} horses into the horse details store.")
+            self.horse_details_cache = store
+            if len(store):
+                print(f"INFO: Opened horse details store with {len(store)} horses: {store_dir}")
+                self.update_status(f"馬詳細キャッシュ読み込み完了 ({len(store)}件)")
+            else:
+                print(f"INFO: Horse details store is empty: {store_dir}")
+                self.update_status("キャッシュファイルなし")
+        except Exception as e:
+            print(f"ERROR: Failed to open horse details store {store_dir}: {e}")
+            self.horse_details_cache = {} # 読み込み失敗時は空にする
+            self.update_status("警告: キャッシュ読み込み失敗")
     # --- ここまでキャッシュ読み込みメソッド ---
     
     # --- 部品関数1: 開催日取得 (requests) ---
@@ -294,8 +336,7 @@ class HorseRacingAnalyzerApp:
         print(f"  開催日取得試行: {url}")
         headers = {'User-Agent': self.USER_AGENT}
         try:
-            time.sleep(self.SLEEP_TIME_PER_PAGE) # ★待機
-            r = requests.get(url, headers=headers, timeout=self.REQUEST_TIMEOUT)
+            r = self.fetch_pool.get(url, headers=headers) # レート制限はプール側で行う
             r.raise_for_status() # HTTPエラーチェック
             r.encoding = r.apparent_encoding # 文字化け対策
             soup = BeautifulSoup(r.content, 'lxml')
@@ -321,121 +362,18 @@ class HorseRacingAnalyzerApp:
     # --- 部品関数2: レースID取得 (Selenium) ---
     def get_race_ids(self, date_str):
         """指定日のレースIDリストと開催日をタプルのリストで取得"""
-        url = f'https://race.netkeiba.com/top/race_list.html?kaisai_date={date_str}'
-        driver = None # ★ 関数の最初に初期化
-        options = webdriver.ChromeOptions()
-        options.add_argument(f'--user-agent={self.USER_AGENT}')
-        options.add_argument('--headless')
-        options.add_argument('--disable-gpu')
-        options.add_argument('--no-sandbox')
-        options.add_argument('--disable-dev-shm-usage')
-        options.add_argument("--log-level=3")
-        options.add_experimental_option('excludeSwitches', ['enable-logging'])
-        race_data_list = []
-
-        try: # ★★★ メインのtryブロック開始 ★★★
-            # --- WebDriver初期化 ---
-            print(f"    DEBUG: Initializing WebDriver...")
-            try: # ★ WebDriver初期化専用のtry
-                if self.CHROME_DRIVER_PATH and os.path.exists(self.CHROME_DRIVER_PATH):
-                     service = ChromeService(executable_path=self.CHROME_DRIVER_PATH)
-                     driver = webdriver.Chrome(service=service, options=options)
-                elif self.CHROME_DRIVER_PATH:
-                     print(f"    警告: 指定されたChromeDriverが見つかりません...")
-                     driver = webdriver.Chrome(options=options)
-                else:
-                     print("    DEBUG: Initializing WebDriver using PATH...")
-                     driver = webdriver.Chrome(options=options)
-                print("    DEBUG: WebDriver initialization successful.")
-            except WebDriverException as e_init: # ★ WebDriver初期化失敗をここで捕捉
-                self.update_status(f"WebDriver初期化エラー: {date_str}")
-                print(f"  WebDriverエラー (初期化中): {e_init}")
-                print("  ChromeDriver/Chromeバージョン・パス設定を確認してください。")
-                traceback.print_exc()
-                driver = None # ★ 失敗したらNoneにする
-            except Exception as e_init_other: # ★ その他の初期化エラー
-                 self.update_status(f"WebDriver初期化中に予期せぬエラー: {date_str}")
-                 print(f"  予期せぬエラー (WebDriver初期化中): {e_init_other}")
-                 traceback.print_exc()
-                 driver = None
-
-            # --- WebDriver初期化成功後の処理 ---
-            if driver: # ★ driverがNoneでないことを確認
-                 print(f"    DEBUG: Driver instance created, getting URL: {url}")
-                 driver.get(url)
-                 wait = WebDriverWait(driver, self.SELENIUM_WAIT_TIMEOUT)
-                 print(f"    DEBUG: Waiting for elements...")
-                 try: # ★ wait.until を try...except で囲む
-                     wait.until(EC.presence_of_element_located(
-                         (By.CSS_SELECTOR, '#RaceTopRace, .RaceList_Box, .no_race, .alert')
-                     ))
-                     print(f"    DEBUG: Element found after wait!")
-                 except TimeoutException:
-                     print(f"  ★★★★★ TimeoutException occurred while waiting for elements on {url}")
-                     # タイムアウトしても finally で閉じるのでここでは何もしない（空リストが返る）
-                     # driver.quit() をここで呼ぶと finally で二重に呼ばれる可能性があるので注意
-
-                 # ★ wait.untilが成功しても失敗しても、ページソース取得と解析を試みる
-                 # （タイムアウトしても部分的に取得できる場合があるため）
-                 time.sleep(self.SLEEP_TIME_PER_PAGE / 2)
-                 print(f"    DEBUG: Page loaded (or timed out), getting source...")
-                 try:
-                     page_source = driver.page_source
-                     print(f"    DEBUG: Page source length: {len(page_source)}")
-                     soup = BeautifulSoup(page_source, 'lxml')
-                     print(f"    DEBUG: BeautifulSoup parsing done.")
-
-                     # --- レースID抽出処理 ---
-                     selector = '.RaceList_DataItem > a:first-of-type'
-                     print(f"    DEBUG: Selecting links with selector: {selector}")
-                     found_links = soup.select(selector)
-                     print(f"    DEBUG: Found {len(found_links)} links.")
-
-                     if not found_links:
-                        if soup.select_one('.no_race') or soup.select_one('.RaceList_Item02'):
-                            print(f"      情報: {date_str} にはレースがありませんでした。")
-                        else:
-                            print(f"    警告: レースIDリンクが見つかりませんでした。 ({date_str})")
-                     else:
-                         print(f"    DEBUG: Extracting race IDs...")
-                         for i, a_tag in enumerate(found_links):
-                             href = a_tag.get('href')
-                             if not href: continue
-                             match = re.search(r'race_id=(\d+)', href)
-                             if match:
-                                 race_id = match.group(1)
-                                 race_data_list.append((race_id, date_str))
-                             else:
-                                  match_alt = re.search(r'/race/result/(\d+)', href)
-                                  if match_alt:
-                                       race_id = match_alt.group(1)
-                                       race_data_list.append((race_id, date_str))
-                                  else:
-                                       print(f"      警告: レースIDの抽出失敗({i+1}): {href}")
-                         print(f"    DEBUG: Race ID extraction finished.")
-
-                 except Exception as e_parse:
-                      print(f"  ★★★★★ Error during page source processing or race ID extraction ({url}): {e_parse}")
-                      traceback.print_exc()
-
-            else: # driverがNoneの場合 (初期化失敗)
-                 print("    エラー: WebDriverの初期化に失敗したため、処理をスキップします。")
-
-        # ★★★ メインのtryブロックに対応するexceptとfinally ★★★
-        except Exception as e_main: # 予期せぬエラー全般
+        # ブラウザを起動せず race_list_sub の断片を直接取得（失敗時のみ常駐ブラウザ）
+        try:
+            race_ids = fetch_race_ids(date_str, pool=self.fetch_pool)
+        except Exception as e_main:
             self.update_status(f"予期せぬエラー(get_race_ids): {date_str}")
             print(f"  予期せぬエラー (get_race_ids 全体): {e_main}")
             traceback.print_exc()
-        finally: # ★ 必ず実行されるブロック
-            if driver: # driverがNoneでなければ閉じる
-                try:
-                    driver.quit()
-                    print(f"    DEBUG: WebDriver quit.")
-                except Exception: pass
+            return []
 
-        # ★ 最終的に race_data_list を処理して返す
-        unique_race_data = sorted(list(set(race_data_list)), key=lambda x: x[0])
-        return unique_race_data
+        if not race_ids:
+            print(f"      情報: {date_str} にはレースがありませんでした。")
+        return [(race_id, date_str) for race_id in race_ids]
     
 # --- 部品関数3: レース結果テーブル取得 (レース番号抽出・インデント調整版) ---
     def get_result_table(self, race_id):
@@ -447,8 +385,7 @@ class HorseRacingAnalyzerApp:
         result_table = [] # ヘッダー行を含むリスト
 
         try:
-            time.sleep(self.SLEEP_TIME_PER_RACE)
-            r = requests.get(url, headers=headers, timeout=self.REQUEST_TIMEOUT)
+            r = self.fetch_pool.get(url, headers=headers)
             r.raise_for_status()
             r.encoding = r.apparent_encoding
             soup = BeautifulSoup(r.content, 'lxml')
@@ -613,8 +550,7 @@ class HorseRacingAnalyzerApp:
         print(f"      払戻取得試行: {url}")
         headers = {'User-Agent': self.USER_AGENT}
         try:
-            time.sleep(self.SLEEP_TIME_PER_PAGE)
-            r = requests.get(url, headers=headers, timeout=self.REQUEST_TIMEOUT)
+            r = self.fetch_pool.get(url, headers=headers)
             r.raise_for_status()
             r.encoding = r.apparent_encoding
             soup = BeautifulSoup(r.content, 'lxml')
@@ -962,10 +898,7 @@ class HorseRacingAnalyzerApp:
         horse_details = {'horse_id': horse_id} 
 
         try:
-            # 待機時間を少し長めに設定 (0.8秒)
-            time.sleep(1.5) 
-
-            r = requests.get(url, headers=headers, timeout=self.REQUEST_TIMEOUT)
+            r = self.fetch_pool.get(url, headers=headers)
             r.raise_for_status() # 4xx, 5xx エラーをチェック
 
             r.encoding = r.apparent_encoding
@@ -1261,48 +1194,94 @@ class HorseRacingAnalyzerApp:
         return 0.0, features
      
     # --- 持ちタイム指数用の統計計算メソッド (修正・完全版) ---
-    def _calculate_course_time_stats(self):
+    # --- ★★★ 各種統計のまとめて計算（スナップショット利用） ★★★ ---
+    def _stats_snapshot_path(self):
+        """統計スナップショットの保存先（data_dir/stats_snapshot.pkl）"""
+        return os.path.join(self.settings.get("data_dir", "data"), "stats_snapshot.pkl")
+
+    def _stats_table_specs(self):
+        """(属性名, 計算メソッド, 集計メソッド) の一覧（データにある列に応じて）"""
+        columns = self.combined_data.columns
+        specs = [('course_time_stats', self._calculate_course_time_stats, self._course_time_partials)]
+        for sire_column in ('father', 'mother_father'):
+            if sire_column in columns:
+                specs.append((f"{sire_column}_stats",
+                              functools.partial(self._calculate_sire_stats, sire_column=sire_column),
+                              functools.partial(self._sire_partials, sire_column=sire_column)))
+        specs.append(('gate_stats', self._calculate_gate_stats, self._gate_partials))
+        specs.append(('reference_times', self._calculate_reference_times, self._reference_time_partials))
+        if 'JockeyName' in columns:
+            specs.append(('jockey_stats', self._calculate_jockey_stats, self._jockey_partials))
+        return specs
+
+    def _calculate_all_stats(self):
         """
-        読み込んだデータ全体から、競馬場・コース種別・距離ごとの
-        馬場補正済み走破タイムの平均と標準偏差を計算し、クラス変数に格納する。
+        各種統計（タイム・血統・枠番・基準タイム・騎手）をまとめて計算する。
+        前回と同じデータならスナップショットから読み込み、行が追加されただけなら
+        追加行だけ集計して保存済みの集計（件数・合計）に足し合わせる。
         """
-        print("競馬場・コース・距離別のタイム統計データ（平均・標準偏差）を計算中...")
-        self.update_status("タイム統計データ計算中...")
-        start_calc_time = time.time() # time.time() を使う (timeモジュールをインポート済みと仮定)
+        start_calc_time = time.time()
+        specs = self._stats_table_specs()
+        snapshot = StatsSnapshot(self._stats_snapshot_path(), version=STATS_SNAPSHOT_VERSION)
+        try:
+            status, saved, new_rows = snapshot.match(self.combined_data, columns=STATS_SOURCE_COLUMNS)
+        except Exception as e:
+            print(f"[WARNING] 統計スナップショットの照合に失敗しました: {e}")
+            status, saved, new_rows = CHANGED, None, None
+
+        if status == APPENDED and new_rows.empty:
+            status = SAME # 並び順が変わっただけ
+        if status == SAME and all(name in saved['stats'] for name, _, _ in specs):
+            for name, _, _ in specs:
+                setattr(self, name, saved['stats'][name])
+            print(f"[INFO] 各種統計をスナップショットから読み込みました ({time.time() - start_calc_time:.2f}秒)")
+            self.update_status("各種統計データ準備完了 (スナップショット)")
+            return
 
-        self.course_time_stats = {} # 初期化
+        if status == APPENDED:
+            print(f"[INFO] 追加された{len(new_rows):,}行だけ集計して各種統計を更新します")
+        partials = {}
+        for name, calculate, aggregate in specs:
+            old = saved['partials'].get(name) if status == APPENDED else None
+            if old is not None:
+                partials[name] = calculate(partials=merge_additive(old, aggregate(new_rows)))
+            else:
+                partials[name] = calculate()
+        print(f"[INFO] 各種統計の計算完了 ({time.time() - start_calc_time:.2f}秒)")
 
-        if self.combined_data is None or self.combined_data.empty:
-            print("警告: タイム統計計算のためのデータがありません。")
-            self.update_status("タイム統計計算不可 (データなし)")
-            return
+        snapshot.save({'stats': {name: getattr(self, name) for name, _, _ in specs}, 'partials': partials})
 
+    def _course_time_partials(self, data):
+        """
+        タイム統計の集計（競馬場・コース種別・距離ごとの馬場補正済み走破タイムの件数・合計・二乗和）。
+        必要な列がなければ None を返す。
+        """
         # === "競馬場名" 列の特定 ===
         actual_track_name_col = None
         possible_track_name_cols = ['track_name', '開催場所', '競馬場'] # CSVの列名に合わせて調整
         for col_name in possible_track_name_cols:
-            if col_name in self.combined_data.columns:
+            if col_name in data.columns:
                 actual_track_name_col = col_name
-                print(f"INFO: _calculate_course_time_stats - 使用する競馬場名の列: '{actual_track_name_col}'")
+                print(f"INFO: _course_time_partials - 使用する競馬場名の列: '{actual_track_name_col}'")
                 break
         
         if actual_track_name_col is None:
-            print(f"CRITICAL ERROR: _calculate_course_time_stats - 競馬場名に相当する列が見つかりません。候補: {possible_track_name_cols}")
-            print(f"  combined_dataの列名: {self.combined_data.columns.tolist()}")
+            print(f"CRITICAL ERROR: _course_time_partials - 競馬場名に相当する列が見つかりません。候補: {possible_track_name_cols}")
+            print(f"  combined_dataの列名: {data.columns.tolist()}")
             self.update_status("エラー: タイム統計計算失敗 (競馬場名列なし)")
-            return
+            return None
         # === "競馬場名" 列の特定ここまで ===
 
         # 必要な列を定義 (actual_track_name_col を使用)
         required_cols = [actual_track_name_col, 'course_type', 'distance', 'track_condition', 'Time', 'Rank']
-        if not all(col in self.combined_data.columns for col in required_cols):
-            missing = [c for c in required_cols if c not in self.combined_data.columns]
+        if not all(col in data.columns for col in required_cols):
+            missing = [c for c in required_cols if c not in data.columns]
             print(f"警告: タイム統計計算に必要な他の列が不足しています: {missing}")
-            print(f"  combined_dataの列名: {self.combined_data.columns.tolist()}")
+            print(f"  combined_dataの列名: {data.columns.tolist()}")
             self.update_status(f"タイム統計計算不可 (列不足: {missing})")
-            return
+            return None
 
-        df = self.combined_data[required_cols].copy()
+        df = data[required_cols].copy()
         # df 内の競馬場名の列名を 'track_name' に統一
         df.rename(columns={actual_track_name_col: 'track_name'}, inplace=True)
 
@@ -1324,13 +1303,6 @@ class HorseRacingAnalyzerApp:
         df['distance_numeric'] = pd.to_numeric(df['distance'], errors='coerce')
         df['Rank_numeric'] = pd.to_numeric(df['Rank'], errors='coerce')
         df.dropna(subset=['distance_numeric', 'Rank_numeric'], inplace=True) # 数値変換後のNaNも除去
-        
-        # astype(int) の前に NaN がないことを保証する
-        if df['distance_numeric'].isnull().any() or df['Rank_numeric'].isnull().any():
-            print("WARN: distance_numeric または Rank_numeric にNaNが含まれるため、int変換をスキップまたはエラーの可能性があります。")
-            # 必要であればここでさらにNaN行を除去するか、エラー処理
-            df.dropna(subset=['distance_numeric', 'Rank_numeric'], inplace=True)
-
 
         df['distance_numeric'] = df['distance_numeric'].astype(int)
         df['Rank_numeric'] = df['Rank_numeric'].astype(int)
@@ -1347,42 +1319,63 @@ class HorseRacingAnalyzerApp:
         def get_hosei(row):
             course = row['course_type']; baba = row['baba']
             return baba_hosei.get(course, {}).get(baba, 0.0)
-        df['hosei_value'] = df.apply(get_hosei, axis=1)
+        df['hosei_value'] = df.apply(get_hosei, axis=1) if not df.empty else 0.0
         df['corrected_time_sec'] = df['time_sec_numeric'] - df['hosei_value']
         # ----------------------------
 
         # --- 異常なタイムを除外 ---
-        df_filtered = df[df['Rank_numeric'] <= 5] # 上位5着までを対象
+        df_filtered = df[df['Rank_numeric'] <= 5].copy() # 上位5着までを対象
         print(f"タイム統計計算: {len(df)}行からRank<=5の{len(df_filtered)}行を対象とします。")
         # --------------------------
 
-        if df_filtered.empty:
+        df_filtered['corrected_time_sq'] = df_filtered['corrected_time_sec'] ** 2
+        return df_filtered.groupby(['track_name', 'course_type', 'distance_numeric']).agg(
+            count=('corrected_time_sec', 'size'),
+            time_sum=('corrected_time_sec', 'sum'),
+            time_sq_sum=('corrected_time_sq', 'sum')
+        )
+
+    def _calculate_course_time_stats(self, partials=None):
+        """
+        読み込んだデータ全体から、競馬場・コース種別・距離ごとの
+        馬場補正済み走破タイムの平均と標準偏差を計算し、クラス変数に格納する。
+        partials（_course_time_partials の集計）を渡した場合はそこから計算する。
+        使った集計を返す。
+        """
+        print("競馬場・コース・距離別のタイム統計データ（平均・標準偏差）を計算中...")
+        self.update_status("タイム統計データ計算中...")
+        start_calc_time = time.time() # time.time() を使う (timeモジュールをインポート済みと仮定)
+
+        self.course_time_stats = {} # 初期化
+
+        if partials is None:
+            if self.combined_data is None or self.combined_data.empty:
+                print("警告: タイム統計計算のためのデータがありません。")
+                self.update_status("タイム統計計算不可 (データなし)")
+                return None
+            partials = self._course_time_partials(self.combined_data)
+            if partials is None:
+                return None
+
+        if partials.empty:
             print("警告: タイム統計計算の対象となるデータがありません (フィルター後)。")
             self.update_status("タイム統計計算不可 (対象データなし)")
-            return
+            return partials
 
-        # --- 競馬場、コース種別、距離でグループ化し統計計算 ---
+        # --- 件数・合計・二乗和から平均と標準偏差を計算 ---
         try:
-            if 'track_name' not in df_filtered.columns:
-                print("CRITICAL ERROR: _calculate_course_time_stats - 'track_name' column is missing in df_filtered before groupby.")
-                self.update_status("エラー: タイム統計計算失敗 (track_name列なし)")
-                return
-
-            stats = df_filtered.groupby(['track_name', 'course_type', 'distance_numeric'])['corrected_time_sec'].agg(
-                mean='mean', std='std', count='size'
-            ).reset_index()
-            
-            stats['std_revised'] = stats.apply(
-                lambda x: x['std'] if pd.notna(x['std']) and x['std'] > 0 and x['count'] >= 5 else np.nan,
-                axis=1
-            )
-
-            for _, row in stats.iterrows():
-                key = (str(row['track_name']), str(row['course_type']), int(row['distance_numeric']))
+            counts = partials['count'].to_numpy()
+            means = partials['time_sum'].to_numpy() / counts
+            with np.errstate(divide='ignore', invalid='ignore'):
+                variances = (partials['time_sq_sum'].to_numpy() - partials['time_sum'].to_numpy() * means) / (counts - 1)
+            stds = np.sqrt(np.clip(variances, 0, None))
+
+            for (track, course, distance), count, mean, std in zip(partials.index, counts, means, stds):
+                key = (str(track), str(course), int(distance))
                 self.course_time_stats[key] = {
-                    'mean': row['mean'] if pd.notna(row['mean']) else np.nan,
-                    'std': row['std_revised'],
-                    'count': int(row['count'])
+                    'mean': mean if pd.notna(mean) else np.nan,
+                    'std': std if pd.notna(std) and std > 0 and count >= 5 else np.nan,
+                    'count': int(count)
                 }
 
             end_calc_time = time.time()
@@ -1441,72 +1434,72 @@ class HorseRacingAnalyzerApp:
             traceback.print_exc()
             self.course_time_stats = {}
             self.update_status("エラー: タイム統計計算失敗")
+        return partials
     
-    def _calculate_sire_stats(self, sire_column='father'):
-        """
-        【強化版】種牡馬ごとに、競馬場・コース種別・距離区分別の成績を集計する。
-        """
-        stats_attr_name = f"{sire_column}_stats"
-        print(f"{sire_column} ごとの産駒成績データ（強化版）を計算中...")
-        self.update_status(f"{sire_column} 成績データ計算中...")
-        start_calc_time = time.time()
-
-        setattr(self, stats_attr_name, {})
-
-        if self.combined_data is None or self.combined_data.empty:
-            print(f"警告: {stats_attr_name} 計算のためのデータがありません。")
-            return
-
+    def _sire_partials(self, data, sire_column='father'):
+        """種牡馬・競馬場・コース種別・距離区分ごとの出走数と3着内数。必要な列がなければ None を返す。"""
         required_cols = [sire_column, 'track_name', 'course_type', 'distance', 'Rank']
-        if not all(col in self.combined_data.columns for col in required_cols):
-             missing = [c for c in required_cols if c not in self.combined_data.columns]
-             print(f"警告: {stats_attr_name} 計算に必要な列が不足しています: {missing}")
-             return
+        if not all(col in data.columns for col in required_cols):
+             missing = [c for c in required_cols if c not in data.columns]
+             print(f"警告: {sire_column}_stats 計算に必要な列が不足しています: {missing}")
+             return None
 
-        df = self.combined_data.copy()
+        df = data[required_cols].copy()
 
         # データ前処理
         df.dropna(subset=required_cols, inplace=True)
         df[sire_column] = df[sire_column].fillna('Unknown').astype(str).str.strip()
-        df = df[df[sire_column] != '']
+        df = df[df[sire_column] != ''].copy()
         df['track_name'] = df['track_name'].astype(str).str.strip()
         df['course_type'] = df['course_type'].astype(str).str.strip()
         df['distance_numeric'] = pd.to_numeric(df['distance'], errors='coerce')
         df['Rank_numeric'] = pd.to_numeric(df['Rank'], errors='coerce')
         df.dropna(subset=['distance_numeric', 'Rank_numeric'], inplace=True)
         df['distance_numeric'] = df['distance_numeric'].astype(int)
-        df['Rank_numeric'] = df['Rank_numeric'].astype(int)
+        df['Place3'] = (df['Rank_numeric'] <= 3).astype(int)
 
         # 距離区分を作成
         bins = [0, 1400, 1800, 2200, 2600, float('inf')]
         labels = ['1400m以下', '1401-1800m', '1801-2200m', '2201-2600m', '2601m以上']
         df['DistanceGroup'] = pd.cut(df['distance_numeric'], bins=bins, labels=labels, right=True)
+        df = df.dropna(subset=['DistanceGroup'])
+        df['DistanceGroup'] = df['DistanceGroup'].astype(str)
 
-        try:
-            # ★★★ グループ化のキーに 'track_name' を追加 ★★★
-            stats = df.groupby([sire_column, 'track_name', 'course_type', 'DistanceGroup'], observed=False).agg(
-                Runs=('Rank_numeric', 'size'),
-                Place3=('Rank_numeric', lambda x: (x <= 3).sum())
-            ).reset_index()
+        return df.groupby([sire_column, 'track_name', 'course_type', 'DistanceGroup']).agg(
+            Runs=('Place3', 'size'),
+            Place3=('Place3', 'sum')
+        )
+
+    def _calculate_sire_stats(self, sire_column='father', partials=None):
+        """
+        【強化版】種牡馬ごとに、競馬場・コース種別・距離区分別の成績を集計する。
+        partials（_sire_partials の集計）を渡した場合はそこから計算する。使った集計を返す。
+        """
+        stats_attr_name = f"{sire_column}_stats"
+        print(f"{sire_column} ごとの産駒成績データ（強化版）を計算中...")
+        self.update_status(f"{sire_column} 成績データ計算中...")
+        start_calc_time = time.time()
+
+        setattr(self, stats_attr_name, {})
 
-            stats['Place3Rate'] = stats.apply(lambda r: r['Place3'] / r['Runs'] if r['Runs'] > 0 else 0, axis=1)
+        if partials is None:
+            if self.combined_data is None or self.combined_data.empty:
+                print(f"警告: {stats_attr_name} 計算のためのデータがありません。")
+                return None
+            partials = self._sire_partials(self.combined_data, sire_column)
+            if partials is None:
+                return None
 
+        try:
             sire_stats_dict = {}
-            for _, row in stats.iterrows():
-                sire = row[sire_column]
-                track = row['track_name']
-                course = row['course_type']
-                dist_group = row['DistanceGroup']
-                runs = row['Runs']
-                place3_rate = row['Place3Rate']
-
+            for (sire, track, course, dist_group), runs, place3 in zip(partials.index, partials['Runs'], partials['Place3']):
                 if sire not in sire_stats_dict:
                     sire_stats_dict[sire] = {}
                 
                 # ★★★ キーを (競馬場, コース, 距離区分) に変更 ★★★
                 key = (track, course, dist_group)
                 if runs >= 5: # 最低出走回数
-                    sire_stats_dict[sire][key] = {'Runs': int(runs), 'Place3Rate': place3_rate}
+                    sire_stats_dict[sire][key] = {'Runs': int(runs), 'Place3Rate': place3 / runs}
 
             setattr(self, stats_attr_name, sire_stats_dict)
 
@@ -1517,101 +1510,100 @@ class HorseRacingAnalyzerApp:
             print(f"!!! Error during sire stats calculation ({sire_column}): {e}")
             traceback.print_exc()
             setattr(self, stats_attr_name, {})
+        return partials
 
     # --- ★★★ 枠番別統計計算メソッド (新規追加) ★★★ ---
-    def _calculate_gate_stats(self):
-        """
-        読み込んだデータ全体から、コース・距離・枠番ごとの
-        成績（複勝率など）を集計し、クラス変数 self.gate_stats に格納する。
-        """
-        print("コース・距離・枠番別の成績統計データを計算中...")
-        self.update_status("枠番統計データ計算中...")
-        start_calc_time = time.time()
-
-        # 計算結果を格納するクラス変数を初期化
-        self.gate_stats = {} # キー: (競馬場, コース, 距離, 枠番), 値: {'Runs': N, 'Place3Rate': R}
-
-        if self.combined_data is None or self.combined_data.empty:
-            print("警告: 枠番統計計算のためのデータがありません。")
-            self.update_status("枠番統計計算不可 (データなし)")
-            return
-
+    def _gate_partials(self, data):
+        """競馬場・コース・距離・枠番ごとの出走数と3着内数。必要な列がなければ None を返す。"""
         # --- 必要な列名を確認 ('Waku' または '枠番') ---
         waku_col_name = None
-        if 'Waku' in self.combined_data.columns:
+        if 'Waku' in data.columns:
             waku_col_name = 'Waku'
-        elif '枠番' in self.combined_data.columns:
+        elif '枠番' in data.columns:
             waku_col_name = '枠番'
             print("INFO: Using '枠番' column for gate stats.")
         else:
             print("警告: 枠番統計計算に必要な列 ('Waku' または '枠番') が見つかりません。")
             self.update_status("枠番統計計算不可 (列不足)")
-            return
+            return None
 
         required_cols = ['track_name', 'course_type', 'distance', waku_col_name, 'Rank']
-        if not all(col in self.combined_data.columns for col in required_cols):
-             missing = [c for c in required_cols if c not in self.combined_data.columns]
+        if not all(col in data.columns for col in required_cols):
+             missing = [c for c in required_cols if c not in data.columns]
              print(f"警告: 枠番統計計算に必要な他の列が不足しています: {missing}")
              self.update_status(f"枠番統計計算不可 (列不足: {missing})")
-             return
+             return None
         # --- ここまで列名確認 ---
 
-        df = self.combined_data[required_cols].copy()
+        df = data[required_cols].copy()
 
         # --- データ前処理 ---
-        try:
-            df.dropna(subset=required_cols, inplace=True) # 必要な列の欠損を除外
-            df['track_name'] = df['track_name'].astype(str).str.strip()
-            df['course_type'] = df['course_type'].astype(str).str.strip()
-            df['distance_numeric'] = pd.to_numeric(df['distance'], errors='coerce')
-            df[waku_col_name + '_numeric'] = pd.to_numeric(df[waku_col_name], errors='coerce')
-            df['Rank_numeric'] = pd.to_numeric(df['Rank'], errors='coerce')
-            # 数値変換失敗や必要な情報が欠損した行を除外
-            df.dropna(subset=['distance_numeric', waku_col_name + '_numeric', 'Rank_numeric'], inplace=True)
-
-            # 枠番と着順は整数のはず
-            df[waku_col_name + '_int'] = df[waku_col_name + '_numeric'].astype(int)
-            df['Rank_int'] = df['Rank_numeric'].astype(int)
-            df['distance_int'] = df['distance_numeric'].astype(int)
-
-            # 枠番が1～8のデータのみに絞る (競馬の枠番は最大8枠)
-            df = df[(df[waku_col_name + '_int'] >= 1) & (df[waku_col_name + '_int'] <= 8)]
-
-        except Exception as e_prep:
-            print(f"!!! ERROR during gate stats data preparation: {e_prep}")
-            traceback.print_exc()
-            self.gate_stats = {}
-            self.update_status("エラー: 枠番統計データ準備失敗")
-            return
+        df.dropna(subset=required_cols, inplace=True) # 必要な列の欠損を除外
+        df['track_name'] = df['track_name'].astype(str).str.strip()
+        df['course_type'] = df['course_type'].astype(str).str.strip()
+        df['distance_numeric'] = pd.to_numeric(df['distance'], errors='coerce')
+        df['waku_numeric'] = pd.to_numeric(df[waku_col_name], errors='coerce')
+        df['Rank_numeric'] = pd.to_numeric(df['Rank'], errors='coerce')
+        # 数値変換失敗や必要な情報が欠損した行を除外
+        df.dropna(subset=['distance_numeric', 'waku_numeric', 'Rank_numeric'], inplace=True)
+
+        # 枠番と着順は整数のはず
+        df['waku_int'] = df['waku_numeric'].astype(int)
+        df['distance_int'] = df['distance_numeric'].astype(int)
+        df['Place3'] = (df['Rank_numeric'] <= 3).astype(int)
+
+        # 枠番が1～8のデータのみに絞る (競馬の枠番は最大8枠)
+        df = df[(df['waku_int'] >= 1) & (df['waku_int'] <= 8)]
         # --- ここまで前処理 ---
 
-        if df.empty:
+        return df.groupby(['track_name', 'course_type', 'distance_int', 'waku_int']).agg(
+            Runs=('Place3', 'size'),    # 出走回数
+            Place3=('Place3', 'sum')    # 3着内回数
+        )
+
+    def _calculate_gate_stats(self, partials=None):
+        """
+        読み込んだデータ全体から、コース・距離・枠番ごとの
+        成績（複勝率など）を集計し、クラス変数 self.gate_stats に格納する。
+        partials（_gate_partials の集計）を渡した場合はそこから計算する。使った集計を返す。
+        """
+        print("コース・距離・枠番別の成績統計データを計算中...")
+        self.update_status("枠番統計データ計算中...")
+        start_calc_time = time.time()
+
+        # 計算結果を格納するクラス変数を初期化
+        self.gate_stats = {} # キー: (競馬場, コース, 距離, 枠番), 値: {'Runs': N, 'Place3Rate': R}
+
+        if partials is None:
+            if self.combined_data is None or self.combined_data.empty:
+                print("警告: 枠番統計計算のためのデータがありません。")
+                self.update_status("枠番統計計算不可 (データなし)")
+                return None
+            try:
+                partials = self._gate_partials(self.combined_data)
+            except Exception as e_prep:
+                print(f"!!! ERROR during gate stats data preparation: {e_prep}")
+                traceback.print_exc()
+                self.update_status("エラー: 枠番統計データ準備失敗")
+                return None
+            if partials is None:
+                return None
+
+        if partials.empty:
             print("警告: 枠番統計計算の対象となる有効なデータがありません。")
             self.update_status("枠番統計計算不可 (有効データなし)")
-            return
+            return partials
 
-        # --- 競馬場、コース、距離、枠番でグループ化し、成績を集計 ---
+        # --- 集計から複勝率を計算 ---
         try:
-            group_keys = ['track_name', 'course_type', 'distance_int', waku_col_name + '_int']
-            stats = df.groupby(group_keys).agg(
-                Runs=('Rank_int', 'size'),             # 出走回数
-                Place3=('Rank_int', lambda x: (x <= 3).sum()) # 3着内回数
-            ).reset_index()
-
-            # 複勝率を計算
-            stats['Place3Rate'] = stats.apply(lambda r: r['Place3'] / r['Runs'] if r['Runs'] > 0 else 0, axis=1)
-
             # 結果を辞書形式で格納 { (競馬場, コース, 距離, 枠番): {'Runs': N, 'Place3Rate': R}, ... }
             temp_gate_stats = {}
             min_runs_threshold = 10 # 例: 最低10走以上のデータのみ採用（信頼性のため）
 
-            for _, row in stats.iterrows():
-                runs = row['Runs']
+            for (track, course, distance, waku), runs, place3 in zip(partials.index, partials['Runs'], partials['Place3']):
                 if runs >= min_runs_threshold: # 最低出走回数を満たす場合のみ格納
-                    # キーを作成
-                    key = (row['track_name'], row['course_type'], row['distance_int'], row[waku_col_name + '_int'])
                     # 値を格納 (複勝率は丸める)
-                    temp_gate_stats[key] = {'Runs': int(runs), 'Place3Rate': round(row['Place3Rate'], 3)}
+                    temp_gate_stats[(track, course, int(distance), int(waku))] = {'Runs': int(runs), 'Place3Rate': round(place3 / runs, 3)}
 
             self.gate_stats = temp_gate_stats # 計算結果をクラス変数にセット
 
@@ -1624,38 +1616,23 @@ class HorseRacingAnalyzerApp:
             traceback.print_exc()
             self.gate_stats = {} # エラー時は空にする
             self.update_status("エラー: 枠番統計計算失敗")
+        return partials
     # --- ここまで枠番統計計算メソッド ---
     
-    def _calculate_jockey_stats(self):
-        """
-        読み込んだデータ全体から、騎手ごとに、
-        競馬場・コース種別・距離別の成績（複勝率など）を集計し、
-        クラス変数 self.jockey_stats に格納する。
-        """
-        print("騎手別のコース成績データを計算中...")
-        self.update_status("騎手成績データ計算中...")
-        start_calc_time = time.time()
-
-        self.jockey_stats = {} # 初期化
-
-        if self.combined_data is None or self.combined_data.empty:
-            print("警告: 騎手統計計算のためのデータがありません。")
-            self.update_status("騎手成績計算不可 (データなし)")
-            return
-
-        # 必要な列を確認
+    def _jockey_partials(self, data):
+        """騎手・競馬場・コース種別・距離ごとの騎乗数と3着内数。必要な列がなければ None を返す。"""
         required_cols = ['JockeyName', 'track_name', 'course_type', 'distance', 'Rank']
-        if not all(col in self.combined_data.columns for col in required_cols):
-             missing = [c for c in required_cols if c not in self.combined_data.columns]
+        if not all(col in data.columns for col in required_cols):
+             missing = [c for c in required_cols if c not in data.columns]
              print(f"警告: 騎手統計計算に必要な列が不足しています: {missing}")
              self.update_status(f"騎手成績計算不可 (列不足: {missing})")
-             return
+             return None
 
-        df = self.combined_data.copy()
+        df = data[required_cols].copy()
 
         # データ前処理
         df.dropna(subset=required_cols, inplace=True)
-        df = df[df['JockeyName'] != '']
+        df = df[df['JockeyName'] != ''].copy()
         df['JockeyName'] = df['JockeyName'].astype(str).str.strip()
         df['track_name'] = df['track_name'].astype(str).str.strip()
         df['course_type'] = df['course_type'].astype(str).str.strip()
@@ -1663,38 +1640,51 @@ class HorseRacingAnalyzerApp:
         df['Rank_numeric'] = pd.to_numeric(df['Rank'], errors='coerce')
         df.dropna(subset=['distance_numeric', 'Rank_numeric'], inplace=True)
         df['distance_int'] = df['distance_numeric'].astype(int)
-        df['Rank_int'] = df['Rank_numeric'].astype(int)
+        df['Place3'] = (df['Rank_numeric'] <= 3).astype(int)
 
-        if df.empty:
-            print("警告: 騎手統計計算の対象となる有効なデータがありません。")
-            return
+        return df.groupby(['JockeyName', 'track_name', 'course_type', 'distance_int']).agg(
+            Runs=('Place3', 'size'),
+            Place3=('Place3', 'sum')
+        )
 
-        # 騎手、競馬場、コース、距離でグループ化し、成績を集計
-        try:
-            stats = df.groupby(['JockeyName', 'track_name', 'course_type', 'distance_int']).agg(
-                Runs=('Rank_int', 'size'),
-                Place3=('Rank_int', lambda x: (x <= 3).sum())
-            ).reset_index()
+    def _calculate_jockey_stats(self, partials=None):
+        """
+        読み込んだデータ全体から、騎手ごとに、
+        競馬場・コース種別・距離別の成績（複勝率など）を集計し、
+        クラス変数 self.jockey_stats に格納する。
+        partials（_jockey_partials の集計）を渡した場合はそこから計算する。使った集計を返す。
+        """
+        print("騎手別のコース成績データを計算中...")
+        self.update_status("騎手成績データ計算中...")
+        start_calc_time = time.time()
+
+        self.jockey_stats = {} # 初期化
+
+        if partials is None:
+            if self.combined_data is None or self.combined_data.empty:
+                print("警告: 騎手統計計算のためのデータがありません。")
+                self.update_status("騎手成績計算不可 (データなし)")
+                return None
+            partials = self._jockey_partials(self.combined_data)
+            if partials is None:
+                return None
 
-            stats['Place3Rate'] = stats.apply(lambda r: r['Place3'] / r['Runs'] if r['Runs'] > 0 else 0, axis=1)
+        if partials.empty:
+            print("警告: 騎手統計計算の対象となる有効なデータがありません。")
+            return partials
 
+        # 騎手、競馬場、コース、距離ごとの集計から複勝率を計算
+        try:
             # 辞書形式で格納 { 騎手名: { (競馬場, コース, 距離): {'Runs': N, 'Place3Rate': R}, ... }, ... }
             jockey_stats_dict = {}
-            for _, row in stats.iterrows():
-                jockey = row['JockeyName']
-                track = row['track_name']
-                course = row['course_type']
-                distance = row['distance_int']
-                runs = row['Runs']
-                place3_rate = row['Place3Rate']
-
+            for (jockey, track, course, distance), runs, place3 in zip(partials.index, partials['Runs'], partials['Place3']):
                 if jockey not in jockey_stats_dict:
                     jockey_stats_dict[jockey] = {}
-                key = (track, course, distance)
+                key = (track, course, int(distance))
                 
                 # 信頼性のため、最低騎乗回数を設ける (例: 5回以上)
                 if runs >= 5:
-                    jockey_stats_dict[jockey][key] = {'Runs': int(runs), 'Place3Rate': place3_rate}
+                    jockey_stats_dict[jockey][key] = {'Runs': int(runs), 'Place3Rate': place3 / runs}
 
             self.jockey_stats = jockey_stats_dict
 
@@ -1707,12 +1697,56 @@ class HorseRacingAnalyzerApp:
             traceback.print_exc()
             self.jockey_stats = {}
             self.update_status("エラー: 騎手成績計算失敗")
+        return partials
     
     # --- ★★★ 基準タイム計算メソッド (新規追加) ★★★ ---
-    def _calculate_reference_times(self):
+    def _reference_time_partials(self, data):
+        """クラス・競馬場・コース・距離ごとの勝ち馬の件数と馬場補正タイムの合計。必要な列がなければ None を返す。"""
+        # --- 必要な列を確認 ---
+        required_cols = ['race_name', 'track_name', 'course_type', 'distance', 'track_condition', 'Time', 'Rank']
+        if not all(col in data.columns for col in required_cols):
+             missing = [c for c in required_cols if c not in data.columns]
+             print(f"警告: 基準タイム計算に必要な列が不足しています: {missing}")
+             self.update_status(f"基準タイム計算不可 (列不足: {missing})")
+             return None
+        # --- ここまで列確認 ---
+
+        df = data[required_cols].copy()
+
+        # --- データ前処理 ---
+        df.dropna(subset=required_cols, inplace=True)
+        # 基準タイム計算の対象データ (勝ち馬に限定)
+        df['Rank_int'] = pd.to_numeric(df['Rank'], errors='coerce')
+        df = df[df['Rank_int'] == 1].copy()
+        # タイム文字列を秒に変換 (共通ヘルパー関数を使用)
+        df['time_sec'] = df['Time'].apply(self._time_str_to_sec)
+        # クラスを判定して数値化 (ヘルパー関数を使用)
+        df['race_class'] = df['race_name'].apply(self._get_race_class_level)
+        # 必要な列の型変換と欠損値処理
+        df['distance_int'] = pd.to_numeric(df['distance'], errors='coerce')
+        df.dropna(subset=['time_sec', 'race_class', 'distance_int', 'track_condition', 'course_type', 'track_name'], inplace=True)
+        df['distance_int'] = df['distance_int'].astype(int)
+        df['track_name'] = df['track_name'].astype(str).str.strip()
+        df['course_type'] = df['course_type'].astype(str).str.strip()
+        df['baba'] = df['track_condition'].astype(str).str.strip() # 'baba' 列名を使用
+
+        # 馬場補正タイムを計算
+        baba_hosei = {'芝': {'良': 0.0, '稍重': 0.5, '重': 1.0, '不良': 1.5}, 'ダ': {'良': 0.0, '稍重': -0.3, '重': -0.8, '不良': -1.3}}
+        def get_hosei(row): return baba_hosei.get(row['course_type'], {}).get(row['baba'], 0.0)
+        df['hosei_value'] = df.apply(get_hosei, axis=1) if not df.empty else 0.0
+        df['corrected_time_sec'] = df['time_sec'] - df['hosei_value']
+        # --- ここまで前処理 ---
+
+        return df.groupby(['race_class', 'track_name', 'course_type', 'distance_int']).agg(
+            count=('corrected_time_sec', 'size'),
+            time_sum=('corrected_time_sec', 'sum')
+        )
+
+    def _calculate_reference_times(self, partials=None):
         """
         手持ちデータ全体から、クラス・コース・距離ごとの基準タイム（勝ち馬の平均馬場補正タイム）を計算し、
         クラス変数 self.reference_times に格納する。
+        partials（_reference_time_partials の集計）を渡した場合はそこから計算する。使った集計を返す。
         """
         print("クラス・コース・距離別の基準タイムを計算中...")
         self.update_status("基準タイム計算中...")
@@ -1720,76 +1754,36 @@ class HorseRacingAnalyzerApp:
 
         self.reference_times = {} # 初期化 (キー: (クラスLv, 場, 種, 距), 値: 平均補正タイム)
 
-        if self.combined_data is None or self.combined_data.empty:
-            print("警告: 基準タイム計算のためのデータがありません。")
-            self.update_status("基準タイム計算不可 (データなし)")
-            return
-
-        # --- 必要な列を確認 ---
-        required_cols = ['race_name', 'track_name', 'course_type', 'distance', 'track_condition', 'Time', 'Rank']
-        if not all(col in self.combined_data.columns for col in required_cols):
-             missing = [c for c in required_cols if c not in self.combined_data.columns]
-             print(f"警告: 基準タイム計算に必要な列が不足しています: {missing}")
-             self.update_status(f"基準タイム計算不可 (列不足: {missing})")
-             return
-        # --- ここまで列確認 ---
-
-        df = self.combined_data[required_cols].copy()
-
-        # --- データ前処理 ---
-        try:
-            df.dropna(subset=required_cols, inplace=True)
-            # タイム文字列を秒に変換 (共通ヘルパー関数を使用)
-            df['time_sec'] = df['Time'].apply(self._time_str_to_sec)
-            # クラスを判定して数値化 (ヘルパー関数を使用)
-            df['race_class'] = df['race_name'].apply(self._get_race_class_level)
-            # 必要な列の型変換と欠損値処理
-            df['distance_int'] = pd.to_numeric(df['distance'], errors='coerce')
-            df['Rank_int'] = pd.to_numeric(df['Rank'], errors='coerce')
-            df.dropna(subset=['time_sec', 'race_class', 'distance_int', 'Rank_int', 'track_condition', 'course_type', 'track_name'], inplace=True)
-            df['distance_int'] = df['distance_int'].astype(int)
-            df['Rank_int'] = df['Rank_int'].astype(int)
-            df['track_name'] = df['track_name'].astype(str).str.strip()
-            df['course_type'] = df['course_type'].astype(str).str.strip()
-            df['baba'] = df['track_condition'].astype(str).str.strip() # 'baba' 列名を使用
-
-            # 馬場補正タイムを計算
-            baba_hosei = {'芝': {'良': 0.0, '稍重': 0.5, '重': 1.0, '不良': 1.5}, 'ダ': {'良': 0.0, '稍重': -0.3, '重': -0.8, '不良': -1.3}}
-            def get_hosei(row): return baba_hosei.get(row['course_type'], {}).get(row['baba'], 0.0)
-            df['hosei_value'] = df.apply(get_hosei, axis=1)
-            df['corrected_time_sec'] = df['time_sec'] - df['hosei_value']
-
-            # 基準タイム計算の対象データ (勝ち馬に限定)
-            df_filtered = df[df['Rank_int'] == 1].copy()
-            if df_filtered.empty:
-                print("警告: 基準タイム計算の対象となる勝ち馬データがありません。")
-                self.update_status("基準タイム計算不可 (対象データなし)")
-                return
+        if partials is None:
+            if self.combined_data is None or self.combined_data.empty:
+                print("警告: 基準タイム計算のためのデータがありません。")
+                self.update_status("基準タイム計算不可 (データなし)")
+                return None
+            try:
+                partials = self._reference_time_partials(self.combined_data)
+            except Exception as e_prep:
+                print(f"!!! ERROR during reference time data preparation: {e_prep}")
+                traceback.print_exc()
+                self.update_status("エラー: 基準タイム データ準備失敗")
+                return None
+            if partials is None:
+                return None
 
-        except Exception as e_prep:
-            print(f"!!! ERROR during reference time data preparation: {e_prep}")
-            traceback.print_exc()
-            self.reference_times = {}
-            self.update_status("エラー: 基準タイム データ準備失敗")
-            return
-        # --- ここまで前処理 ---
+        if partials.empty:
+            print("警告: 基準タイム計算の対象となる勝ち馬データがありません。")
+            self.update_status("基準タイム計算不可 (対象データなし)")
+            return partials
 
-        # --- クラス、競馬場、コース、距離でグループ化し、平均補正タイムを計算 ---
+        # --- クラス、競馬場、コース、距離ごとの平均補正タイムを計算 ---
         try:
-            group_keys = ['race_class', 'track_name', 'course_type', 'distance_int']
-            stats = df_filtered.groupby(group_keys)['corrected_time_sec'].agg(
-                mean_time='mean',
-                count='size' # データ数も集計
-            ).reset_index()
-
             min_races_threshold = 5 # 例: 最低5レース分の勝ち馬データがある条件のみ採用
             temp_reference_times = {}
-            for _, row in stats.iterrows():
-                if row['count'] >= min_races_threshold: # 最低レース数を満たす場合のみ
+            for (race_class, track, course, distance), count, time_sum in zip(partials.index, partials['count'], partials['time_sum']):
+                if count >= min_races_threshold: # 最低レース数を満たす場合のみ
                     # キー: (クラスレベル, 競馬場名, コース種別, 距離(int))
-                    key = (int(row['race_class']), row['track_name'], row['course_type'], int(row['distance_int']))
+                    key = (int(race_class), track, course, int(distance))
                     # 値: 平均補正タイム (秒)
-                    temp_reference_times[key] = round(row['mean_time'], 3) # 小数点3位まで
+                    temp_reference_times[key] = round(time_sum / count, 3) # 小数点3位まで
 
             self.reference_times = temp_reference_times # 計算結果をクラス変数にセット
 
@@ -1802,6 +1796,7 @@ class HorseRacingAnalyzerApp:
             traceback.print_exc()
             self.reference_times = {} # エラー時は空にする
             self.update_status("エラー: 基準タイム計算失敗")
+        return partials
     # --- ここまで基準タイム計算メソッド ---
 
     # --- ★★★ レースクラス判定ヘルパー関数 (クラス内に追加) ★★★ ---
@@ -1875,12 +1870,12 @@ class HorseRacingAnalyzerApp:
                     pickle.dump(self.trained_model, f, pickle.HIGHEST_PROTOCOL)
                 print(f"INFO: Successfully saved trained model to {filepath}")
                 # GUIへの通知 (オプション)
-                self.root.after(0, lambda path=os.path.basename(filepath): self.update_status(f"学習済みモデル保存完了: {path}"))
-                # self.root.after(0, lambda path=filepath: messagebox.showinfo("モデル保存完了", f"学習済みモデルを保存しました:\n{path}"))
+                self.jobs.call_soon(lambda path=os.path.basename(filepath): self.update_status(f"学習済みモデル保存完了: {path}"))
+                # self.jobs.call_soon(lambda path=filepath: messagebox.showinfo("モデル保存完了", f"学習済みモデルを保存しました:\n{path}"))
             except Exception as e:
                 print(f"ERROR: Failed to save trained model to {filepath}: {e}")
-                self.root.after(0, lambda err=e, path=filepath: messagebox.showerror("モデル保存エラー", f"モデルの保存中にエラー:\n{path}\n{err}"))
-                self.root.after(0, lambda err=e: self.update_status(f"エラー: モデル保存失敗 ({type(err).__name__})"))
+                self.jobs.call_soon(lambda err=e, path=filepath: messagebox.showerror("モデル保存エラー", f"モデルの保存中にエラー:\n{path}\n{err}"))
+                self.jobs.call_soon(lambda err=e: self.update_status(f"エラー: モデル保存失敗 ({type(err).__name__})"))
         else:
             print("WARN: No trained model found to save.")
             # messagebox.showwarning("モデル保存", "保存する学習済みモデルが見つかりません。")
@@ -2060,11 +2055,11 @@ class HorseRacingAnalyzerApp:
             return
 
         print("データ前処理開始: キャッシュ情報を元に、レース単位での特徴量を再計算します...")
-        self.root.after(0, lambda: self.update_status("全データの特徴量計算中...（時間がかかります）"))
+        self.jobs.call_soon(lambda: self.update_status("全データの特徴量計算中...（時間がかかります）"))
         
         try:
             # --- 1. 個別特徴量の再計算 ---
-            self.root.after(0, lambda: self.update_status("ステップ1/2: 各馬の個別能力を計算中..."))
+            self.jobs.call_soon(lambda: self.update_status("ステップ1/2: 各馬の個別能力を計算中..."))
             
             all_indiv_features = []
             
@@ -2083,7 +2078,7 @@ class HorseRacingAnalyzerApp:
             for i, (race_id, race_df) in enumerate(grouped_by_race):
                 if (i + 1) % 50 == 0:
                     progress = (i + 1) / len(grouped_by_race) * 100
-                    self.root.after(0, lambda p=progress: self.update_status(f"ステップ1/2... {p:.0f}%"))
+                    self.jobs.call_soon(lambda p=progress: self.update_status(f"ステップ1/2... {p:.0f}%"))
 
                 race_conditions = race_df.iloc[0].to_dict()
                 predict_date = race_conditions[date_col] # 予測対象のレース開催日
@@ -2126,7 +2121,7 @@ class HorseRacingAnalyzerApp:
             indiv_features_df = pd.DataFrame(all_indiv_features)
 
             # --- 2. レースレベル特徴量の追加 (変更なし) ---
-            self.root.after(0, lambda: self.update_status("ステップ2/2: レース全体の傾向を分析中..."))
+            self.jobs.call_soon(lambda: self.update_status("ステップ2/2: レース全体の傾向を分析中..."))
 
             race_level_features = indiv_features_df.groupby('race_id').agg(
                 num_nige_horses=('leg_type', lambda x: (x == 0).sum()),
@@ -2155,12 +2150,12 @@ class HorseRacingAnalyzerApp:
 
             self.processed_data = final_df
             print(f"INFO: self.processed_data に前処理済みデータを格納しました。Shape: {self.processed_data.shape}")
-            self.root.after(0, lambda: self.update_status("全データの特徴量計算が完了しました。"))
+            self.jobs.call_soon(lambda: self.update_status("全データの特徴量計算が完了しました。"))
 
         except Exception as e_outer:
             print("--- 致命的なエラーが発生しました (preprocess_data_for_training) ---")
             traceback.print_exc()
-            self.root.after(0, lambda err=e_outer: messagebox.showerror("前処理エラー", f"データの前処理中に致命的なエラーが発生しました:\n{err}"))
+            self.jobs.call_soon(lambda err=e_outer: messagebox.showerror("前処理エラー", f"データの前処理中に致命的なエラーが発生しました:\n{err}"))
             self.processed_data = pd.DataFrame() # 失敗時はクリア
      
     # --- ★★★ レースクラス判定ヘルパー関数 (クラス内に追加 - 変更なし) ★★★ ---
@@ -2257,11 +2252,11 @@ class HorseRacingAnalyzerApp:
         import matplotlib.pyplot as plt
 
         try:
-            self.root.after(0, lambda: self.update_status(f"{mode}モデルの学習と評価を開始します..."))
+            self.jobs.call_soon(lambda: self.update_status(f"{mode}モデルの学習と評価を開始します..."))
             print(f"\n--- Starting Ensemble Model Training and Evaluation (mode: {mode}) ---")
 
             if processed_data is None or processed_data.empty:
-                self.root.after(0, lambda: messagebox.showerror("学習エラー", "学習に使用するデータがありません。"))
+                self.jobs.call_soon(lambda: messagebox.showerror("学習エラー", "学習に使用するデータがありません。"))
                 return
 
             # 特徴量リストを更新
@@ -2348,11 +2343,11 @@ class HorseRacingAnalyzerApp:
                 self.trained_model = lgbm_model # 主要モデルとしてLGBMを保持
                 self.model_features = final_feature_list
                 self.imputation_values_ = imputation_values_for_this_model
-                self.root.after(0, lambda: self.update_status(f"複勝モデル(アンサンブル)を更新しました (LGBM AUC: {lgbm_auc:.4f})"))
+                self.jobs.call_soon(lambda: self.update_status(f"複勝モデル(アンサンブル)を更新しました (LGBM AUC: {lgbm_auc:.4f})"))
 
         except Exception as e:
             traceback.print_exc()
-            self.root.after(0, lambda err=e: messagebox.showerror("モデル学習エラー", f"モデル学習・評価中に予期せぬエラー:\n{err}"))
+            self.jobs.call_soon(lambda err=e: messagebox.showerror("モデル学習エラー", f"モデル学習・評価中に予期せぬエラー:\n{err}"))
         finally:
             print(f"--- Ensemble Model Training and Evaluation Finished (mode: {mode}) ---")
 
@@ -2406,7 +2401,7 @@ class HorseRacingAnalyzerApp:
 
             if prepared_data_place is None or prepared_data_place.empty:
                 print("ERROR: 複勝モデルの学習データ準備に失敗しました。")
-                self.root.after(0, lambda: self.update_status("エラー: 複勝モデルの学習準備失敗"))
+                self.jobs.call_soon(lambda: self.update_status("エラー: 複勝モデルの学習準備失敗"))
                 return # 処理を中断
 
             # 複勝モデルを学習・評価・保存
@@ -2421,20 +2416,20 @@ class HorseRacingAnalyzerApp:
 
             if prepared_data_win is None or prepared_data_win.empty:
                 print("ERROR: 単勝モデルの学習データ準備に失敗しました。")
-                self.root.after(0, lambda: self.update_status("エラー: 単勝モデルの学習準備失敗"))
+                self.jobs.call_soon(lambda: self.update_status("エラー: 単勝モデルの学習準備失敗"))
                 return # 処理を中断
 
             # 単勝モデルを学習・評価・保存
             self.train_and_evaluate_model(processed_data=prepared_data_win, target_column='target_win', mode='win')
             print("INFO: 単勝モデルの学習が完了しました。")
             
-            self.root.after(0, lambda: self.update_status("全てのモデル学習が完了しました。"))
+            self.jobs.call_soon(lambda: self.update_status("全てのモデル学習が完了しました。"))
 
         except Exception as e:
             print(f"!!! FATAL ERROR in _run_training_pipeline_thread !!!")
             traceback.print_exc()
-            self.root.after(0, lambda err=e: messagebox.showerror("学習プロセスエラー", f"モデル学習プロセス全体で予期せぬエラーが発生しました:\n{type(err).__name__}: {err}"))
-            self.root.after(0, lambda err=e: self.update_status(f"致命的エラー: 学習プロセス失敗 ({type(err).__name__})"))
+            self.jobs.call_soon(lambda err=e: messagebox.showerror("学習プロセスエラー", f"モデル学習プロセス全体で予期せぬエラーが発生しました:\n{type(err).__name__}: {err}"))
+            self.jobs.call_soon(lambda err=e: self.update_status(f"致命的エラー: 学習プロセス失敗 ({type(err).__name__})"))
    
     def format_shutuba_data(self,shutuba_table_list, race_id):
         """self.get_shutuba_tableの結果をDataFrameに整形"""
@@ -2759,22 +2754,38 @@ class HorseRacingAnalyzerApp:
 
     # --- 期間指定データ収集メイン関数 ---
     def collect_race_data_for_period(self, start_year, start_month, end_year, end_month):
-        """指定された期間のレースデータを収集し、DataFrameと払い戻しリストを返す"""
-        all_combined_results_list = []
-        all_payouts_list = []
+        """
+        指定された期間のレースデータを収集し、結果を書き出したジャーナル（CollectionJournal）を返す
+
+        収集結果は数レースごとに期間別のジャーナルへ書き出し、
+        処理済みログにはディスクに書き出せたレースだけを記録する。
+        途中で落ちても同じ期間で再実行すれば、書き出し済みの分を読み込んで続きから収集する。
+        """
         processed_race_ids = set()
         processed_log_file_path = self.PROCESSED_LOG_FILE
+        journal = CollectionJournal(
+            os.path.join(self.SAVE_DIRECTORY, "collection_journal",
+                         f"{start_year}{start_month:02d}_{end_year}{end_month:02d}"),
+            flush_every=int(self.settings.get("collect_flush_every", 20)),
+        )
+        self.collection_journal = journal
+        # ジャーナルに書き出し済みのレースは処理済み（ログへの記録前に落ちた分も含む）
+        processed_race_ids.update(journal.completed_race_ids())
 
         # --- 処理済レースIDの読み込み ---
+        logged_race_ids = set()
         try:
             if os.path.exists(processed_log_file_path):
                 with open(processed_log_file_path, "r", encoding="utf-8") as f:
-                    processed_race_ids = set(line.strip() for line in f if line.strip())
+                    logged_race_ids = set(line.strip() for line in f if line.strip())
+                processed_race_ids.update(logged_race_ids)
                 self.update_status(f"処理済レースID {len(processed_race_ids)}件読込")
-                print(f"処理済みレースIDを {len(processed_race_ids)} 件読み込みました。({processed_log_file_path})")
+                print(f"処理済みレースIDを {len(logged_race_ids)} 件読み込みました。({processed_log_file_path})")
         except Exception as e:
             self.update_status(f"エラー: 処理済ID読込失敗")
             print(f"処理済みレースIDファイルの読み込みエラー: {e}")
+        # ジャーナルにあってログにないレース（書き出し直後に落ちた分）
+        unlogged_race_ids = sorted(journal.completed_race_ids() - logged_race_ids)
 
         current_year = start_year
         current_month = start_month
@@ -2783,6 +2794,10 @@ class HorseRacingAnalyzerApp:
 
         try:
             log_file_handle = open(processed_log_file_path, "a", encoding="utf-8")
+            if unlogged_race_ids:
+                print(f"ジャーナルに書き出し済みでログに未記録のレースID {len(unlogged_race_ids)}件をログに追記します。")
+                log_file_handle.write("".join(f"{rid}\n" for rid in unlogged_race_ids))
+                log_file_handle.flush()
             # debug_target_date_processed = False # デバッグフラグは不要なので削除
 
             while not (current_year > end_year or (current_year == end_year and current_month > end_month)):
@@ -2846,14 +2861,15 @@ class HorseRacingAnalyzerApp:
                                      # ★★★ scrape_and_process_race_data に date_str も渡す ★★★
                                      combined_df, payout_dict = self.scrape_and_process_race_data(race_id, date_str)
 
-                                     if combined_df is not None: all_combined_results_list.append(combined_df)
-                                     if payout_dict and len(payout_dict) > 1: all_payouts_list.append(payout_dict)
-
-                                     # ↓↓↓ ログに記録するのは race_id のみ ↓↓↓
+                                     # ジャーナルに追加（一定件数ごとにディスクへ書き出す）
+                                     committed = journal.add(race_id, date_str, combined_df, payout_dict)
                                      processed_race_ids.add(race_id)
                                      total_processed_in_run += 1
-                                     log_file_handle.write(f"{race_id}\n") # ★ race_id のみ書き込み
-                                     log_file_handle.flush()
+
+                                     # ↓↓↓ ログに記録するのはディスクに書き出せた race_id のみ ↓↓↓
+                                     if committed:
+                                         log_file_handle.write("".join(f"{rid}\n" for rid in committed))
+                                         log_file_handle.flush()
 
                                  except Exception as e_scrape:
                                       self.update_status(f"エラー: データ処理中 ({race_id})")
@@ -2879,6 +2895,14 @@ class HorseRacingAnalyzerApp:
              self.update_status(f"エラー: メインループ異常終了")
              traceback.print_exc()
         finally:
+            # 書き出し前のレースを保存（中断時も取得済みの分は残す）
+            try:
+                committed = journal.flush()
+                if committed and log_file_handle:
+                    log_file_handle.write("".join(f"{rid}\n" for rid in committed))
+                    log_file_handle.flush()
+            except Exception as e_flush:
+                print(f"収集ジャーナルの書き出しエラー: {e_flush}")
             if log_file_handle:
                 try:
                     log_file_handle.close()
@@ -2889,21 +2913,14 @@ class HorseRacingAnalyzerApp:
         self.update_status(f"データ収集完了/中断 ({total_processed_in_run}レース処理)")
         print("\n--- データ収集ループ終了 ---")
 
-        # データ結合処理 (変更なし)
-        if not all_combined_results_list:
-            print("収集されたレース結果データがありません。")
-            final_combined_df = pd.DataFrame()
+        completed = len(journal.completed_race_ids())
+        if completed:
+            print(f"収集ジャーナルに書き出し済みのレース: {completed}件（以前の中断分も含む）")
         else:
-            try:
-                 final_combined_df = pd.concat(all_combined_results_list, ignore_index=True)
-                 print(f"最終的な結合レースデータ: {final_combined_df.shape}")
-            except Exception as e_concat:
-                self.update_status("エラー: データ結合失敗")
-                print(f"エラー: 最終データの結合中にエラー: {e_concat}")
-                traceback.print_exc()
-                final_combined_df = pd.DataFrame()
+            print("収集されたレース結果データがありません。")
 
-        return final_combined_df, all_payouts_list
+        # 結果は1つのDataFrameにまとめず、ジャーナルのまま返す（process_collection_results で部品ごとに保存）
+        return journal
     
        
     def ensure_directories_exist(self):
@@ -3226,43 +3243,34 @@ class HorseRacingAnalyzerApp:
                 existing_csv = self.file_path_var.get()
                 if existing_csv and os.path.exists(existing_csv):
                     print(f"既存データを読み込み中: {existing_csv}")
-                    self.root.after(0, lambda: self.update_status(f"既存データ読み込み中: {os.path.basename(existing_csv)}"))
+                    self.jobs.call_soon(lambda: self.update_status(f"既存データ読み込み中: {os.path.basename(existing_csv)}"))
                     try:
                         existing_df = pd.read_csv(existing_csv, encoding='utf-8', low_memory=False)
                         self.combined_data = existing_df
                         print(f"既存データ読み込み完了: {len(existing_df)}件")
-                        self.root.after(0, lambda: self.update_status(f"既存データ読み込み完了: {len(existing_df)}件"))
+                        self.jobs.call_soon(lambda: self.update_status(f"既存データ読み込み完了: {len(existing_df)}件"))
                     except Exception as e:
                         print(f"既存データ読み込みエラー: {e}")
-                        self.root.after(0, lambda err=e: messagebox.showwarning("読み込みエラー", f"既存ファイルの読み込みに失敗しました:\n{err}\n新規データのみ保存されます。"))
+                        self.jobs.call_soon(lambda err=e: messagebox.showwarning("読み込みエラー", f"既存ファイルの読み込みに失敗しました:\n{err}\n新規データのみ保存されます。"))
                 else:
                     print("既存ファイルが指定されていないか、存在しません。新規作成モードで実行します。")
-                    self.root.after(0, lambda: self.update_status("既存ファイルなし - 新規作成モードで実行"))
+                    self.jobs.call_soon(lambda: self.update_status("既存ファイルなし - 新規作成モードで実行"))
 
             # ★ 移植したデータ収集メイン関数を呼び出す (selfを付ける)
-            final_combined_df, final_payouts_list = self.collect_race_data_for_period(
+            journal = self.collect_race_data_for_period(
                 start_year, start_month, end_year, end_month
             )
-            
-            # ↓↓↓ ここで戻り値を確認 ↓↓↓
-            print("DEBUG run_netkeiba_collection: collect_race_data_for_period completed.")
-            print(f"  final_combined_df is DataFrame: {isinstance(final_combined_df, pd.DataFrame)}")
-            if isinstance(final_combined_df, pd.DataFrame):
-                print(f"  final_combined_df shape: {final_combined_df.shape}")
-            print(f"  final_payouts_list is list: {isinstance(final_payouts_list, list)}")
-            if isinstance(final_payouts_list, list):
-                print(f"  final_payouts_list length: {len(final_payouts_list)}")
-            # ↑↑↑ ここまで追加 ↑↑↑
-            
+            print(f"DEBUG run_netkeiba_collection: collect_race_data_for_period completed. ({len(journal.completed_race_ids())}レース)")
+
             # 処理完了後にUIスレッドでデータを格納・表示更新
-            self.root.after(0, self.process_collection_results, final_combined_df, final_payouts_list, start_year, start_month, end_year, end_month)
+            self.jobs.call_soon(self.process_collection_results, journal, start_year, start_month, end_year, end_month)
 
         except Exception as e:
              # ↓↓↓ このデバッグプリントを追加 ↓↓↓
              print(f"DEBUG run_netkeiba_collection: 捕捉したエラー e は -> {repr(e)}")
              # ↑↑↑ repr(e) でエラーオブジェクトの詳細な表現を出力 ↑↑↑
              # ★ エラー発生時もUIスレッドでメッセージ表示
-             self.root.after(0, self.handle_collection_error, e)
+             self.jobs.call_soon(self.handle_collection_error, e)
     
     def load_local_files(self, csv_path, json_path=None):
         """
@@ -3271,23 +3279,29 @@ class HorseRacingAnalyzerApp:
         """
         try:
             if not (csv_path and os.path.exists(csv_path)):
-                self.root.after(0, lambda: messagebox.showerror("ファイルエラー", "有効なCSVファイルが選択されていません。"))
+                self.jobs.call_soon(lambda: messagebox.showerror("ファイルエラー", "有効なCSVファイルが選択されていません。"))
                 return
 
             self.update_status(f"CSV読み込み中: {os.path.basename(csv_path)}")
-            df_combined = pd.read_csv(csv_path, low_memory=False)
+            df_combined = load_race_data(csv_path, categorical=False)
             
             # --- 日付データの健康診断 (変更なし) ---
             date_col = 'date' if 'date' in df_combined.columns else 'race_date'
             if date_col in df_combined.columns:
                 original_nulls = df_combined[date_col].isnull().sum()
-                converted_dates = pd.to_datetime(df_combined[date_col], errors='coerce')
+                if date_col == 'date' and 'date_parsed' in df_combined.columns:
+                    converted_dates = df_combined['date_parsed']  # ストアで変換済み
+                else:
+                    converted_dates = pd.to_datetime(df_combined[date_col], errors='coerce')
                 failed_conversions = converted_dates.isnull().sum()
                 num_bad_data = failed_conversions - original_nulls
                 if num_bad_data > 0:
                     print(f"警告: {num_bad_data}行の日付データが不正な形式でした。")
                 df_combined[date_col] = converted_dates
 
+            # ストアが追加した派生列は保存時に混ざらないよう落とす（元のCSVにある同名の列は残す）
+            df_combined = df_combined.drop(columns=[c for c in derived_columns(csv_path) if c in df_combined.columns])
+
             self.combined_data = df_combined
             
             # ================================================================= #
@@ -3311,7 +3325,9 @@ class HorseRacingAnalyzerApp:
                 success_count = 0
                 fail_count = 0
 
-                for i, horse_id in enumerate(needed_horse_ids):
+                # 馬ページは共有プールで並行取得（結果は needed_horse_ids の順）
+                fetched_details = self.fetch_pool.imap(self.get_horse_details, needed_horse_ids)
+                for i, (horse_id, details) in enumerate(zip(needed_horse_ids, fetched_details)):
                     # --- コンソールに進捗を表示 ---
                     progress_percent = (i + 1) / num_total_needed * 100
                     # print文を追加して、現在の進捗を詳細に表示
@@ -3321,9 +3337,6 @@ class HorseRacingAnalyzerApp:
                     if (i + 1) % 10 == 0: # 10頭ごとにGUIの表示を更新
                         self.update_status(f"馬情報取得中... {progress_percent:.1f}% ({i+1}/{num_total_needed})")
 
-                    # Webから取得
-                    details = self.get_horse_details(horse_id)
-                    
                     if isinstance(details, dict) and 'error' not in details:
                         self.horse_details_cache[horse_id] = details
                         success_count += 1
@@ -3345,215 +3358,189 @@ class HorseRacingAnalyzerApp:
             # ▲▲▲ 進捗表示ロジックここまで ▲▲▲
             # ================================================================= #
 
-            # --- 払い戻しJSONの読み込み ---
+            # --- 払い戻しJSONを払戻ストアに取り込む（同じファイルを取り込み済みなら日付の補完のみ） ---
             if json_path and os.path.exists(json_path):
-                self.update_status("払い戻しJSON読み込み中...")
-                with open(json_path, 'r', encoding='utf-8') as f:
-                    self.payout_data = json.load(f)
+                self.update_status("払い戻しJSON取り込み中...")
+                self.payout_store.import_json(json_path, race_dates=race_dates_from_frame(self.combined_data))
             
             # --- 統計計算と最終的な前処理 ---
             if self.combined_data is not None and not self.combined_data.empty:
                 self.update_status("各種統計データ計算中...")
-                self._calculate_course_time_stats()
-                if 'father' in self.combined_data.columns: self._calculate_sire_stats(sire_column='father')
-                if 'mother_father' in self.combined_data.columns: self._calculate_sire_stats(sire_column='mother_father')
-                self._calculate_gate_stats()
-                self._calculate_reference_times()
-                if 'JockeyName' in self.combined_data.columns: self._calculate_jockey_stats()
+                self._calculate_all_stats()
                 
                 self.preprocess_data_for_training()
             else:
                 self.course_time_stats={}; self.father_stats={}; self.mother_father_stats={}; self.gate_stats={}; self.jockey_stats={}; self.reference_times={}
                 self.processed_data = pd.DataFrame()
 
-            self.root.after(0, lambda: self.update_status("ローカルデータ準備完了"))
-            self.root.after(0, lambda: messagebox.showinfo("読み込み完了", "データの読み込みと準備が完了しました。"))
-            self.root.after(0, self.update_data_preview)
-            self.root.after(0, self.update_data_info)
+            self.jobs.call_soon(lambda: self.update_status("ローカルデータ準備完了"))
+            self.jobs.call_soon(lambda: messagebox.showinfo("読み込み完了", "データの読み込みと準備が完了しました。"))
+            self.jobs.call_soon(self.update_data_preview)
+            self.jobs.call_soon(self.update_data_info)
 
         except Exception as e:
-            self.root.after(0, self.handle_collection_error, e)
+            self.jobs.call_soon(self.handle_collection_error, e)
+
+    def _frame_for_csv(self, df):
+        """CSV保存用のコピー（日付列は 'YYYY-MM-DD HH:MM:SS' の文字列、日付でない値は空文字）"""
+        df = df.copy()
+        date_col = 'date' if 'date' in df.columns else 'race_date'
+        if date_col in df.columns:
+            dates = pd.to_datetime(normalize_date_series(df[date_col]), errors='coerce')
+            df[date_col] = dates.dt.strftime('%Y-%m-%d %H:%M:%S').fillna('')
+        return df
+
+    def _frame_for_memory(self, df):
+        """CSVに追記した行を combined_data と同じ型にそろえる（日付は datetime、既存の数値列は数値）"""
+        df = df.copy()
+        date_col = 'date' if 'date' in df.columns else 'race_date'
+        if date_col in df.columns:
+            df[date_col] = pd.to_datetime(normalize_date_series(df[date_col]), errors='coerce')
+        if self.combined_data is not None:
+            for col in df.columns.intersection(self.combined_data.columns):
+                if pd.api.types.is_numeric_dtype(self.combined_data[col]) and not pd.api.types.is_numeric_dtype(df[col]):
+                    df[col] = pd.to_numeric(df[col], errors='coerce')
+        return df
 
-    def smart_merge_data(self, existing_df, new_df):
+    def process_collection_results(self, journal, start_year, start_month, end_year, end_month):
         """
-        スマートマージ：重複を避けてデータをマージ
-
-        Args:
-            existing_df: 既存データ
-            new_df: 新規データ
-
-        Returns:
-            merged_df: マージ後のデータ
-            num_new: 追加された新規レコード数
+        データ収集完了後の処理。
+        収集分はジャーナルの部品ごとに保存先CSV（重複を除いて追記）と払戻ストアへ流し込み、
+        期間全体を1つのDataFrameにまとめない。既存データのCSVは書き直さずに末尾へ追記し、
+        追記した行だけをメモリ上の combined_data に足してから統計を計算する。
         """
-        if existing_df is None or existing_df.empty:
-            return new_df.copy(), len(new_df)
-
-        if new_df is None or new_df.empty:
-            return existing_df.copy(), 0
-
-        # 重複チェック用のキーを作成（race_id + horse_id）
-        existing_df = existing_df.copy()
-        new_df = new_df.copy()
-
-        if 'race_id' in existing_df.columns and 'horse_id' in existing_df.columns:
-            existing_df['_merge_key'] = (
-                existing_df['race_id'].astype(str) + '_' +
-                existing_df['horse_id'].astype(str)
-            )
-            new_df['_merge_key'] = (
-                new_df['race_id'].astype(str) + '_' +
-                new_df['horse_id'].astype(str)
-            )
+        save_filename_base = "netkeiba_data"
+        date_range = []  # [最小日付, 最大日付]
+        has_existing = self.combined_data is not None and not self.combined_data.empty
 
-            # 新規データのみ抽出
-            new_only = new_df[~new_df['_merge_key'].isin(existing_df['_merge_key'])].copy()
-
-            # マージ
-            merged_df = pd.concat([existing_df, new_only], ignore_index=True)
-
-            # クリーンアップ
-            merged_df.drop('_merge_key', axis=1, inplace=True, errors='ignore')
-            num_new = len(new_only)
-
-            print(f"スマートマージ: 既存{len(existing_df)}件 + 新規{num_new}件 = 合計{len(merged_df)}件")
-            return merged_df, num_new
-        else:
-            # race_idまたはhorse_idがない場合は単純結合
-            merged_df = pd.concat([existing_df, new_df], ignore_index=True)
-            return merged_df, len(new_df)
+        def track_dates(dates):
+            dates = pd.to_datetime(dates, errors='coerce').dropna()
+            if dates.empty:
+                return
+            if date_range:
+                date_range[0] = min(date_range[0], dates.min()); date_range[1] = max(date_range[1], dates.max())
+            else:
+                date_range.extend([dates.min(), dates.max()])
 
-    def process_collection_results(self, df_new_combined, new_payout_data, start_year, start_month, end_year, end_month):
-        """【最終修正版】データ収集完了後の処理。ファイル保存時の日付エラーを完全に回避する。"""
-        
-        # --- 既存データと新規収集データを結合 ---
-        if self.combined_data is not None and not self.combined_data.empty:
-            print("既存データに新規収集データを結合します...")
-            self.update_status("既存データと新規データをスマートマージ中...")
-            try:
+        # --- 新規収集データを既存データのCSVに追記（重複除外） ---
+        try:
+            save_dir = self.settings.get("data_dir", ".")
+            os.makedirs(save_dir, exist_ok=True)
+            existing_csv = self.file_path_var.get() if has_existing else None
+            if not (existing_csv and os.path.exists(existing_csv)):
+                existing_csv = None
+
+            if existing_csv and self.fetch_mode_var.get() == "append":
+                # 既存ファイルにそのまま追記（保存時に期間のファイル名へ付け替える）
+                target_csv = existing_csv
+            else:
+                # 作業用CSVに追記（新規作成モードでは読み込み元のファイルを書き換えない）
+                target_csv = os.path.join(save_dir, f"{save_filename_base}_combined_collecting.csv")
+                for path in (target_csv, target_csv + INDEX_SUFFIX):
+                    if os.path.exists(path):
+                        os.remove(path)
+                if existing_csv:
+                    shutil.copyfile(existing_csv, target_csv)
+                elif has_existing:
+                    # 元のファイルがないメモリ上の既存データだけは1回書き出す
+                    self.update_status("既存データを書き出し中...")
+                    AppendOnlyRaceDataset(target_csv).append(self._frame_for_csv(self.combined_data))
+            dataset = AppendOnlyRaceDataset(target_csv)
+
+            num_existing = len(self.combined_data) if has_existing else 0
+            if has_existing:
                 date_col = 'date' if 'date' in self.combined_data.columns else 'race_date'
-                self.combined_data[date_col] = pd.to_datetime(self.combined_data[date_col], errors='coerce')
-                df_new_combined[date_col] = pd.to_datetime(df_new_combined[date_col], errors='coerce')
-
-                # スマートマージを使用（重複除外）
-                merged_data, num_new = self.smart_merge_data(self.combined_data, df_new_combined)
-                self.combined_data = merged_data
-
-                print(f"データ結合完了。新規追加: {num_new}件、総件数: {len(self.combined_data)}件")
-                self.update_status(f"データ結合完了：新規{num_new}件追加")
-            except Exception as e_concat:
-                 print(f"!!! ERROR during data concatenation: {e_concat}")
-                 self.root.after(0, lambda err=e_concat: messagebox.showerror("結合エラー", f"データの結合中にエラーが発生しました:\n{err}"))
-                 self.combined_data = df_new_combined.copy()
-
-            existing_payout_race_ids = {str(p.get('race_id')) for p in self.payout_data if p.get('race_id')}
-            new_payouts_to_add = [p for p in new_payout_data if str(p.get('race_id')) not in existing_payout_race_ids]
-            self.payout_data.extend(new_payouts_to_add)
-            print(f"配当データ追加: {len(new_payouts_to_add)}件")
-
-        elif df_new_combined is not None and not df_new_combined.empty:
-            self.combined_data = df_new_combined.copy()
-            self.payout_data = new_payout_data[:]
-        
-        # --- 統計計算・UI更新 ---
-        if self.combined_data is not None and not self.combined_data.empty:
-            self.update_status("各種統計データ再計算中...")
-            self._calculate_course_time_stats()
-            if 'father' in self.combined_data.columns: self._calculate_sire_stats(sire_column='father')
-            if 'mother_father' in self.combined_data.columns: self._calculate_sire_stats(sire_column='mother_father')
-            self._calculate_gate_stats()
-            self._calculate_reference_times()
-            if 'JockeyName' in self.combined_data.columns: self._calculate_jockey_stats() 
-            self.preprocess_data_for_training()
-            
-            self.root.after(0, lambda: self.update_status(f"データ処理完了: {self.combined_data.shape[0]}行"))
-            self.root.after(0, lambda: messagebox.showinfo("データ処理完了", f"データの準備が完了しました。\nレースデータ: {self.combined_data.shape[0]}行\n(各種統計計算済)"))
-            self.root.after(0, self.update_data_preview)
-            self.root.after(0, self.update_data_info)
+                if date_col in self.combined_data.columns:
+                    track_dates(self.combined_data[date_col])
+
+            self.update_status("収集データを部品ごとに追記中...")
+            new_frames = []
+            num_new_payouts = 0
+            for results_df, payouts in journal.iter_parts():
+                if results_df is not None and not results_df.empty:
+                    added = dataset.append_rows(self._frame_for_csv(results_df))
+                    if not added.empty:
+                        added = self._frame_for_memory(added)
+                        date_col = 'date' if 'date' in added.columns else 'race_date'
+                        if date_col in added.columns:
+                            track_dates(added[date_col])
+                        new_frames.append(added)
+                if payouts:
+                    # 収集した払戻はストアにだけ追記（登録済みのレースは無視される）
+                    num_new_payouts += self.payout_store.add_many(payouts, race_dates=race_dates_from_frame(results_df))
+            num_new = sum(len(f) for f in new_frames)
+
+            print(f"データ結合完了。新規追加: {num_new}件、総件数: {num_existing + num_new}件")
+            print(f"配当データ追加: {num_new_payouts}件")
+            self.update_status(f"データ結合完了：新規{num_new}件追加")
+        except Exception as e_concat:
+            print(f"!!! ERROR during data concatenation: {e_concat}")
+            traceback.print_exc()
+            self.jobs.call_soon(lambda err=e_concat: messagebox.showerror("結合エラー", f"データの結合中にエラーが発生しました:\n{err}"))
+            return
 
-            # --- ▼▼▼ 自動ファイル保存処理 ▼▼▼ ---
-            if start_year:
-                try:
-                    save_dir = self.settings.get("data_dir", ".")
-                    if not os.path.exists(save_dir):
-                        os.makedirs(save_dir)
-                    
-                    date_col = 'date' if 'date' in self.combined_data.columns else 'race_date'
-                    
-                    # ★★★ ここが修正ポイント ★★★
-                    # pd.to_datetimeでエラーを無視し(coerce)、NaTになったものをdropna()で除去する
-                    valid_dates = pd.to_datetime(self.combined_data[date_col], errors='coerce').dropna()
-                    
-                    if not valid_dates.empty:
-                        min_date = valid_dates.min()
-                        max_date = valid_dates.max()
-                        period_str = f"{min_date.strftime('%Y%m')}_{max_date.strftime('%Y%m')}"
-                    else:
-                        period_str = f"{start_year}{start_month:02d}_{end_year}{end_month:02d}"
-                    # ★★★ 修正ポイントここまで ★★★
-                    
-                    save_filename_base = "netkeiba_data"
-                    results_filename = os.path.join(save_dir, f"{save_filename_base}_combined_{period_str}.csv")
-                    payouts_filename = os.path.join(save_dir, f"{save_filename_base}_payouts_{period_str}.json")
-
-                    df_to_save = self.combined_data.copy()
-                    if date_col in df_to_save.columns:
-                         # 日付でないデータは空文字にする
-                         df_to_save[date_col] = pd.to_datetime(df_to_save[date_col], errors='coerce').dt.strftime('%Y-%m-%d %H:%M:%S').fillna('')
-                    
-                    # 保存前処理：古いファイルと同名ファイルを削除
-                    # 1. 「既存に追加」モードで古いファイル名と新しいファイル名が異なる場合、古いファイルを削除
-                    if self.fetch_mode_var.get() == "append":
-                        old_csv = self.file_path_var.get()
-                        if old_csv and os.path.exists(old_csv) and old_csv != results_filename:
-                            try:
-                                os.remove(old_csv)
-                                print(f"古いファイルを削除: {old_csv}")
-                                # 対応するJSONファイルも削除
-                                old_json = old_csv.replace('.csv', '.json').replace('_combined_', '_payouts_')
-                                if os.path.exists(old_json):
-                                    os.remove(old_json)
-                                    print(f"古いJSONファイルを削除: {old_json}")
-                            except Exception as e:
-                                print(f"古いファイル削除エラー（無視）: {e}")
-
-                    # 2. 保存先ファイルが既に存在する場合は削除（タイムスタンプ更新のため）
-                    if os.path.exists(results_filename):
-                        try:
-                            os.remove(results_filename)
-                            print(f"既存の保存先ファイルを削除: {results_filename}")
-                        except Exception as e:
-                            print(f"保存先ファイル削除エラー（無視）: {e}")
-                    if os.path.exists(payouts_filename):
-                        try:
-                            os.remove(payouts_filename)
-                            print(f"既存の保存先JSONファイルを削除: {payouts_filename}")
-                        except Exception as e:
-                            print(f"保存先JSONファイル削除エラー（無視）: {e}")
-
-                    # 3. 新規ファイルとして保存
-                    df_to_save.to_csv(results_filename, index=False, encoding='utf-8-sig')
-                    print(f"収集・結合したデータを '{results_filename}' に保存しました。")
-
-                    # file_path_varを新しいファイル名に更新
-                    self.file_path_var.set(results_filename)
-
-                    if self.payout_data:
-                        with open(payouts_filename, 'w', encoding='utf-8') as f:
-                            json.dump(self.payout_data, f, indent=2, ensure_ascii=False)
-                        print(f"払い戻しデータを '{payouts_filename}' に保存しました。")
-
-                    self.root.after(0, lambda: messagebox.showinfo("データ保存完了", f"収集・結合したデータは以下に保存されました:\nCSV: {results_filename}\nJSON: {payouts_filename}"))
-                    
-                    # キャッシュの保存
-                    self.save_cache_to_file()
-                    
-                except Exception as e_save:
-                    traceback.print_exc()
-                    self.root.after(0, lambda err=e_save: messagebox.showerror("自動保存エラー", f"収集・結合データの自動保存中にエラーが発生しました:\n{err}"))
-        else:
+        if num_existing + num_new == 0:
             self.update_status("データ処理完了: 有効なデータがありませんでした。")
             messagebox.showwarning("データ処理完了", "有効なレースデータが見つかりませんでした。")
+            return
+
+        # --- ▼▼▼ 自動ファイル保存処理 ▼▼▼ ---
+        try:
+            if date_range:
+                period_str = f"{date_range[0].strftime('%Y%m')}_{date_range[1].strftime('%Y%m')}"
+            else:
+                period_str = f"{start_year}{start_month:02d}_{end_year}{end_month:02d}"
+
+            results_filename = os.path.join(save_dir, f"{save_filename_base}_combined_{period_str}.csv")
+
+            # 追記したCSV（とキー索引）を保存先の名前に付け替える
+            if os.path.abspath(target_csv) != os.path.abspath(results_filename):
+                os.replace(target_csv, results_filename)
+                if os.path.exists(target_csv + INDEX_SUFFIX):
+                    os.replace(target_csv + INDEX_SUFFIX, results_filename + INDEX_SUFFIX)
+                elif os.path.exists(results_filename + INDEX_SUFFIX):
+                    os.remove(results_filename + INDEX_SUFFIX)
+                if target_csv == existing_csv:
+                    print(f"古いファイル名から付け替え: {existing_csv}")
+            print(f"収集・結合したデータを '{results_filename}' に保存しました。")
+
+            # file_path_varを新しいファイル名に更新
+            self.file_path_var.set(results_filename)
+
+            # 保存できたので収集ジャーナルは不要
+            journal.clear()
+            if getattr(self, 'collection_journal', None) is journal:
+                self.collection_journal = None
+        except Exception as e_save:
+            traceback.print_exc()
+            self.jobs.call_soon(lambda err=e_save: messagebox.showerror("自動保存エラー", f"収集・結合データの自動保存中にエラーが発生しました:\n{err}"))
+            return
+
+        # --- 追記した行だけをメモリ上のデータに足して統計計算・UI更新 ---
+        if has_existing:
+            # 「既存に追加」で読み込んだ直後の既存データは日付が文字列のまま
+            date_col = 'date' if 'date' in self.combined_data.columns else 'race_date'
+            if date_col in self.combined_data.columns and \
+                    not pd.api.types.is_datetime64_any_dtype(self.combined_data[date_col]):
+                self.combined_data[date_col] = pd.to_datetime(
+                    normalize_date_series(self.combined_data[date_col]), errors='coerce')
+        if new_frames:
+            frames = ([self.combined_data] if has_existing else []) + new_frames
+            self.combined_data = pd.concat(frames, ignore_index=True)
+            del frames, new_frames
+
+        self.update_status("各種統計データ再計算中...")
+        self._calculate_all_stats()
+        self.preprocess_data_for_training()
+
+        self.jobs.call_soon(lambda: self.update_status(f"データ処理完了: {self.combined_data.shape[0]}行"))
+        self.jobs.call_soon(lambda: messagebox.showinfo("データ処理完了", f"データの準備が完了しました。\nレースデータ: {self.combined_data.shape[0]}行\n(各種統計計算済)"))
+        self.jobs.call_soon(self.update_data_preview)
+        self.jobs.call_soon(self.update_data_info)
+        self.jobs.call_soon(lambda: messagebox.showinfo("データ保存完了", f"収集・結合したデータは以下に保存されました:\nCSV: {results_filename}\n払戻: {self.payout_store.db_path}"))
+
+        # キャッシュの保存
+        self.save_cache_to_file()
 
     def handle_collection_error(self, error):
         """データ収集/読み込みエラー発生時の処理 (UIスレッドで実行)"""
@@ -3921,9 +3908,8 @@ class HorseRacingAnalyzerApp:
         self.root.update_idletasks() # 即時反映
 
     def run_in_thread(self, target_func, *args):
-        """指定された関数を別スレッドで実行"""
-        thread = threading.Thread(target=target_func, args=args, daemon=True)
-        thread.start()
+        """指定された関数をバックグラウンドジョブとして実行（GUIの更新は self.jobs.call_soon で行う）"""
+        return self.jobs.submit(getattr(target_func, '__name__', 'job'), lambda job: target_func(*args))
 
     # --- File/Directory Browsing ---
     def browse_file(self):
@@ -4054,17 +4040,17 @@ class HorseRacingAnalyzerApp:
                     self.combined_data = None
 
                 # UI更新
-                self.root.after(0, self.update_data_preview)
-                self.root.after(0, lambda: self.update_status(f"ローカルファイル読み込み完了: {os.path.basename(file_path)}"))
-                self.root.after(0, lambda: messagebox.showinfo("読み込み完了", f"データの読み込みが完了しました。\n結合データ: {self.combined_data.shape if self.combined_data is not None else 'N/A'}"))
+                self.jobs.call_soon(self.update_data_preview)
+                self.jobs.call_soon(lambda: self.update_status(f"ローカルファイル読み込み完了: {os.path.basename(file_path)}"))
+                self.jobs.call_soon(lambda: messagebox.showinfo("読み込み完了", f"データの読み込みが完了しました。\n結合データ: {self.combined_data.shape if self.combined_data is not None else 'N/A'}"))
 
             elif file_path and not os.path.exists(file_path):
                 # --- ファイルパスはあるが存在しない場合：エラー表示 ---
-                self.root.after(0, lambda: messagebox.showerror("ファイルエラー", f"指定されたファイルが見つかりません:\n{file_path}"))
-                self.root.after(0, lambda: self.update_status("エラー: 指定ファイルが見つかりません"))
+                self.jobs.call_soon(lambda: messagebox.showerror("ファイルエラー", f"指定されたファイルが見つかりません:\n{file_path}"))
+                self.jobs.call_soon(lambda: self.update_status("エラー: 指定ファイルが見つかりません"))
                 # データクリア
                 self.race_data, self.horse_data, self.result_data, self.combined_data = None, None, None, None
-                self.root.after(0, self.update_data_preview)
+                self.jobs.call_soon(self.update_data_preview)
 
             else:
                 # --- ファイルパスが指定されていない場合：サンプルデータを生成 ---
@@ -4081,28 +4067,28 @@ class HorseRacingAnalyzerApp:
                     self.combined_data = None
 
                 # UI更新
-                self.root.after(0, self.update_data_preview)
-                self.root.after(0, lambda: self.update_status("サンプルデータの読み込み完了"))
-                self.root.after(0, lambda: messagebox.showinfo("サンプルデータ", f"サンプルデータを使用します。\n結合データ: {self.combined_data.shape if self.combined_data is not None else 'N/A'}"))
+                self.jobs.call_soon(self.update_data_preview)
+                self.jobs.call_soon(lambda: self.update_status("サンプルデータの読み込み完了"))
+                self.jobs.call_soon(lambda: messagebox.showinfo("サンプルデータ", f"サンプルデータを使用します。\n結合データ: {self.combined_data.shape if self.combined_data is not None else 'N/A'}"))
 
 
         except FileNotFoundError: # これは os.path.exists でチェックしてるので通常発生しないはず
-            self.root.after(0, lambda: messagebox.showerror("ファイルエラー", f"ファイルが見つかりません:\n{file_path}"))
-            self.root.after(0, lambda: self.update_status("エラー: ファイルが見つかりません"))
+            self.jobs.call_soon(lambda: messagebox.showerror("ファイルエラー", f"ファイルが見つかりません:\n{file_path}"))
+            self.jobs.call_soon(lambda: self.update_status("エラー: ファイルが見つかりません"))
         except pd.errors.ParserError:
-             self.root.after(0, lambda: messagebox.showerror("CSVパースエラー", f"CSVファイルの形式が正しくない可能性があります。\n{file_path}"))
-             self.root.after(0, lambda: self.update_status("エラー: CSVパースエラー"))
+             self.jobs.call_soon(lambda: messagebox.showerror("CSVパースエラー", f"CSVファイルの形式が正しくない可能性があります。\n{file_path}"))
+             self.jobs.call_soon(lambda: self.update_status("エラー: CSVパースエラー"))
         except Exception as e:
             import traceback
             traceback.print_exc() # 詳細なエラーをコンソールに出力
-            self.root.after(0, lambda: messagebox.showerror("読み込みエラー", f"データの読み込み中にエラーが発生しました:\n{e}"))
-            self.root.after(0, lambda: self.update_status(f"エラー: {e}"))
+            self.jobs.call_soon(lambda: messagebox.showerror("読み込みエラー", f"データの読み込み中にエラーが発生しました:\n{e}"))
+            self.jobs.call_soon(lambda: self.update_status(f"エラー: {e}"))
             # エラー発生時はデータをクリア
             self.race_data = None
             self.horse_data = None
             self.result_data = None
             self.combined_data = None
-            self.root.after(0, self.update_data_preview)
+            self.jobs.call_soon(self.update_data_preview)
 
 
     def _fetch_web_data(self, source, from_date, to_date):
@@ -4123,9 +4109,9 @@ class HorseRacingAnalyzerApp:
         # _load_local_csvと同様の処理
 
         print("Webデータ取得完了（シミュレーション）")
-        self.root.after(0, self.update_data_preview)
-        self.root.after(0, lambda: self.update_status(f"{source}からのデータ取得完了"))
-        self.root.after(0, lambda: messagebox.showinfo("取得完了", f"{source}からのデータ取得が完了しました。（シミュレーション）"))
+        self.jobs.call_soon(self.update_data_preview)
+        self.jobs.call_soon(lambda: self.update_status(f"{source}からのデータ取得完了"))
+        self.jobs.call_soon(lambda: messagebox.showinfo("取得完了", f"{source}からのデータ取得が完了しました。（シミュレーション）"))
 
 
     def update_data_info(self):
@@ -4295,7 +4281,7 @@ class HorseRacingAnalyzerApp:
             # print(f"\n--- Starting Analysis Thread ---")
             # print(f"DEBUG: Analysis type selected from GUI: '{self.analysis_type_var.get()}'...")
             analysis_type = self.analysis_type_var.get()
-            self.root.after(0, lambda: self.update_status(f"{analysis_type} の分析実行中..."))
+            self.jobs.call_soon(lambda: self.update_status(f"{analysis_type} の分析実行中..."))
 
             if self.combined_data is None or self.combined_data.empty:
                 # ... (データなし処理) ...
@@ -4375,7 +4361,7 @@ class HorseRacingAnalyzerApp:
                           messagebox.showerror("データエラー", "血統分析には父情報が必要です。\nデータ管理タブでデータを再取得するか、血統分析を再度実行して父情報を準備してください。")
                      else:
                           messagebox.showerror("データエラー", f"分析に必要な列({', '.join(missing_cols)})がデータに含まれていません。")
-                     self.root.after(0, lambda: self.update_status("エラー: データ形式不正"))
+                     self.jobs.call_soon(lambda: self.update_status("エラー: データ形式不正"))
                      return
 
                 print(f"  血統分析 (父別){filter_str}: {len(filtered_df)} 行のデータで集計開始...")
@@ -4387,7 +4373,7 @@ class HorseRacingAnalyzerApp:
                 df_analysis['Rank'] = df_analysis['Rank'].astype(int)
 
                 if df_analysis.empty:
-                     self.root.after(0, lambda: messagebox.showinfo("分析結果", "フィルター条件に該当する有効な父・着順データがありません。")); self.root.after(0, lambda: self.update_status("分析完了: 対象データなし")); self.root.after(0, lambda: self._update_analysis_table(pd.DataFrame(), f"血統分析 (父別) (データなし){filter_str}")); return
+                     self.jobs.call_soon(lambda: messagebox.showinfo("分析結果", "フィルター条件に該当する有効な父・着順データがありません。")); self.jobs.call_soon(lambda: self.update_status("分析完了: 対象データなし")); self.jobs.call_soon(lambda: self._update_analysis_table(pd.DataFrame(), f"血統分析 (父別) (データなし){filter_str}")); return
 
                 # 父でグループ化して集計
                 analysis_result = df_analysis.groupby('father').agg(
@@ -4418,29 +4404,29 @@ class HorseRacingAnalyzerApp:
             # === 他の未実装分析タイプ ===
             else:
                  print(f"DEBUG: Analysis type '{analysis_type}' is not implemented or does not match.")
-                 self.root.after(0, lambda: self._update_analysis_table(pd.DataFrame(), f"{analysis_type} (未実装)"))
+                 self.jobs.call_soon(lambda: self._update_analysis_table(pd.DataFrame(), f"{analysis_type} (未実装)"))
 
             # --- 結果表示 (テーブル表示) ---
             # ★ analysis_type をチェックする条件に 血統分析 を追加 ★
             if analysis_type in ["人気別分析", "距離別分析", "コース種別分析", "騎手分析", "血統分析"]:
                  if not analysis_result_df.empty:
-                     self.root.after(0, self._update_analysis_table, analysis_result_df, table_title)
+                     self.jobs.call_soon(self._update_analysis_table, analysis_result_df, table_title)
                  # ★ analysis_type をチェックする条件に 血統分析 を追加 ★
                  elif analysis_type in ["人気別分析", "距離別分析", "コース種別分析", "騎手分析", "血統分析"]: # 集計結果が空だった場合
-                     self.root.after(0, lambda: self._update_analysis_table(pd.DataFrame(), f"{analysis_type} (データなし){filter_str}"))
+                     self.jobs.call_soon(lambda: self._update_analysis_table(pd.DataFrame(), f"{analysis_type} (データなし){filter_str}"))
             # else: # 未実装の場合は上の else ブロックでテーブルクリア済み
 
             # --- ステータス更新 ---
             end_time = time.time()
             # print(f"  分析処理時間: {end_time - start_time:.2f} 秒")
-            self.root.after(0, lambda: self.update_status(f"{analysis_type} の分析完了 ({end_time - start_time:.2f}秒)"))
+            self.jobs.call_soon(lambda: self.update_status(f"{analysis_type} の分析完了 ({end_time - start_time:.2f}秒)"))
             print(f"--- Analysis Thread for {analysis_type} finished ---")
 
         except Exception as e:
             print(f"!!! Error in _run_analysis_thread ({analysis_type}) !!!")
-            self.root.after(0, lambda: messagebox.showerror("分析エラー", f"分析中にエラーが発生しました:\n{e}"))
-            self.root.after(0, lambda: self.update_status(f"エラー: 分析失敗 ({e})"))
-            self.root.after(0, lambda: self._update_analysis_table(pd.DataFrame(), "分析エラー"))
+            self.jobs.call_soon(lambda: messagebox.showerror("分析エラー", f"分析中にエラーが発生しました:\n{e}"))
+            self.jobs.call_soon(lambda: self.update_status(f"エラー: 分析失敗 ({e})"))
+            self.jobs.call_soon(lambda: self._update_analysis_table(pd.DataFrame(), "分析エラー"))
             traceback.print_exc()
 
     def _prepare_father_data_and_analyze(self, analysis_type, filters):
@@ -4473,7 +4459,7 @@ class HorseRacingAnalyzerApp:
                     # self.update_status("父情報をCSVに保存中...")
                     # self.combined_data.to_csv(current_csv_path, index=False, encoding='utf-8-sig')
                     # print("CSVファイルの保存が完了しました。")
-                    # self.root.after(0, lambda: messagebox.showinfo("情報", "血統情報をCSVファイルに保存しました。..."))
+                    # self.jobs.call_soon(lambda: messagebox.showinfo("情報", "血統情報をCSVファイルに保存しました。..."))
                 # except Exception as e_save: print(f"ERROR: Failed to save combined_data ...: {e_save}"); messagebox.showerror(...)
             # else: print("警告: 現在のCSVファイルパスが無効なため、父情報はCSVに保存されませんでした。")
 
@@ -4488,8 +4474,8 @@ class HorseRacingAnalyzerApp:
 
         except Exception as e:
             print(f"!!! Error in _prepare_father_data_and_analyze !!!")
-            self.root.after(0, lambda: messagebox.showerror("前処理エラー", f"血統情報の準備中にエラーが発生しました:\n{e}"))
-            self.root.after(0, lambda: self.update_status(f"エラー: 血統情報準備失敗 ({e})"))
+            self.jobs.call_soon(lambda: messagebox.showerror("前処理エラー", f"血統情報の準備中にエラーが発生しました:\n{e}"))
+            self.jobs.call_soon(lambda: self.update_status(f"エラー: 血統情報準備失敗 ({e})"))
             traceback.print_exc()
 
     def _update_analysis_table(self, result_df, title="分析結果"):
@@ -4550,68 +4536,35 @@ class HorseRacingAnalyzerApp:
         self.update_status(f"レース情報検索中: {race_id}")
         self.run_in_thread(self._fetch_race_info_thread, race_id)
     
-    def run_race_simulation(self, horses_info, n_simulations=10000):
+    def run_race_simulation(self, horses_info, n_simulations=100000, method='auto'):
         """
-        【強化版】モンテカルロ法でレース着順を予測し、
+        Plackett–Luce モデルでレース着順を予測し、
         馬連・馬単・3連複・3連単の確率を計算して返す。
+
+        method='auto' ではフルゲートまで厳密計算、'simulate' では
+        Gumbel-top-k による一括シミュレーション（race_simulator 参照）。
         """
-        from collections import defaultdict
-        import numpy as np
+        sim_data = [(int(h['Umaban']), h['win_proba']) for h in horses_info if pd.notna(h.get('Umaban')) and pd.notna(h.get('win_proba'))]
 
-        sim_data = [{'umaban': int(h['Umaban']), 'win_proba': h['win_proba']} for h in horses_info if pd.notna(h.get('Umaban')) and pd.notna(h.get('win_proba'))]
-        
-        if not sim_data or sum(h['win_proba'] for h in sim_data) <= 0:
+        if not sim_data or sum(p for _, p in sim_data) <= 0:
             return {'exacta': {}, 'quinella': {}, 'trio': {}, 'trifecta': {}}
 
-        total_proba = sum(h['win_proba'] for h in sim_data)
-        for h in sim_data:
-            h['normalized_proba'] = h['win_proba'] / total_proba if total_proba > 0 else 0
+        umabans = [u for u, _ in sim_data]
+        probabilities = [p for _, p in sim_data]
 
-        umabans = [h['umaban'] for h in sim_data]
-        probabilities = [h['normalized_proba'] for h in sim_data]
-        
-        exacta_counts = defaultdict(int)
-        quinella_counts = defaultdict(int)
-        trio_counts = defaultdict(int)
-        trifecta_counts = defaultdict(int)
-
-        print(f"{n_simulations}回のレースシミュレーションを開始します...")
-        for _ in range(n_simulations):
-            simulated_order = np.random.choice(umabans, size=len(umabans), p=probabilities, replace=False)
-            
-            if len(simulated_order) >= 3:
-                first = simulated_order[0]
-                second = simulated_order[1]
-                third = simulated_order[2]
-                
-                exacta_counts[(first, second)] += 1
-                quinella_counts[tuple(sorted((first, second)))] += 1
-                trifecta_counts[(first, second, third)] += 1
-                trio_counts[tuple(sorted((first, second, third)))] += 1
-
-        exacta_probabilities = {k: v / n_simulations for k, v in exacta_counts.items()}
-        quinella_probabilities = {k: v / n_simulations for k, v in quinella_counts.items()}
-        trio_probabilities = {k: v / n_simulations for k, v in trio_counts.items()}
-        trifecta_probabilities = {k: v / n_simulations for k, v in trifecta_counts.items()}
-        
+        print(f"着順確率の計算を開始します（{len(umabans)}頭, method={method}）...")
+        results = exotic_probabilities(umabans, probabilities, method=method, n_simulations=n_simulations)
         print("シミュレーションが完了しました。")
-        return {
-            'exacta': exacta_probabilities, 
-            'quinella': quinella_probabilities,
-            'trio': trio_probabilities,
-            'trifecta': trifecta_probabilities
-        }
-    
+        return results
+
     def fetch_race_info(self):
         """
         GUIからレースIDを取得し、別スレッドで予測処理を開始する司令塔。
         """
         race_id = self.race_id_entry.get().strip()
         if race_id and race_id.isdigit() and len(race_id) == 12:
-            # 予測処理を別スレッドで実行し、GUIが固まるのを防ぐ
-            thread = threading.Thread(target=self._fetch_race_info_thread, args=(race_id,))
-            thread.daemon = True
-            thread.start()
+            # 予測処理をバックグラウンドジョブで実行し、GUIが固まるのを防ぐ
+            self.run_in_thread(self._fetch_race_info_thread, race_id)
         else:
             messagebox.showwarning("入力エラー", "有効な12桁のレースIDを入力してください。")
     
@@ -4629,7 +4582,7 @@ class HorseRacingAnalyzerApp:
         import os # osモジュールをインポート
 
         try:
-            self.root.after(0, lambda: self.update_status(f"レースID {race_id}: 予測処理開始..."))
+            self.jobs.call_soon(lambda: self.update_status(f"レースID {race_id}: 予測処理開始..."))
             print(f"--- _fetch_race_info_thread (Ensemble): START (Race ID: {race_id}) ---")
             
             model_dir = self.settings.get("models_dir")
@@ -4641,7 +4594,7 @@ class HorseRacingAnalyzerApp:
             win_lr_model = self._load_pickle(os.path.join(model_dir, "lr_model_win.pkl"))
             win_scaler = self._load_pickle(os.path.join(model_dir, "scaler_win.pkl"))
             if not all([win_model, win_features, win_calibrator, win_lr_model, win_scaler]):
-                self.root.after(0, lambda: messagebox.showerror("モデルエラー", "単勝予測に必要なモデルファイルの一部が見つかりません。"))
+                self.jobs.call_soon(lambda: messagebox.showerror("モデルエラー", "単勝予測に必要なモデルファイルの一部が見つかりません。"))
                 return
 
             self.load_model_from_file(model_filename="trained_lgbm_model_place.pkl", mode='place')
@@ -4650,14 +4603,14 @@ class HorseRacingAnalyzerApp:
             place_lr_model = self._load_pickle(os.path.join(model_dir, "lr_model_place.pkl"))
             place_scaler = self._load_pickle(os.path.join(model_dir, "scaler_place.pkl"))
             if not all([place_model, place_features, place_calibrator, place_lr_model, place_scaler]):
-                self.root.after(0, lambda: messagebox.showerror("モデルエラー", "複勝予測に必要なモデルファイルの一部が見つかりません。"))
+                self.jobs.call_soon(lambda: messagebox.showerror("モデルエラー", "複勝予測に必要なモデルファイルの一部が見つかりません。"))
                 return
 
             # --- 2. レース情報取得 ---
-            self.root.after(0, lambda: self.update_status(f"レースID {race_id}: Webから出馬表情報取得中..."))
+            self.jobs.call_soon(lambda: self.update_status(f"レースID {race_id}: Webから出馬表情報取得中..."))
             web_data = self.get_shutuba_table(race_id)
             if not web_data or not web_data.get('horse_list'):
-                self.root.after(0, lambda: messagebox.showerror("Web取得エラー", f"レースID {race_id} の出馬表を取得できませんでした。"))
+                self.jobs.call_soon(lambda: messagebox.showerror("Web取得エラー", f"レースID {race_id} の出馬表を取得できませんでした。"))
                 return
             
             race_df = pd.DataFrame(web_data['horse_list'])
@@ -4675,8 +4628,8 @@ class HorseRacingAnalyzerApp:
             condition_display = str(race_conditions.get('TrackCondition', '馬場不明'))
             race_info_text = f"{race_date_str_display} {track_name_display}{race_num_display}R {race_name_display}"
             race_details_text = f"{course_type_display}{turn_detail_display}{distance_display_str}m / 天候:{weather_display} / 馬場:{condition_display}"
-            self.root.after(0, lambda text=race_info_text: self.race_info_label.config(text=text))
-            self.root.after(0, lambda text=race_details_text: self.race_details_label.config(text=text))
+            self.jobs.call_soon(lambda text=race_info_text: self.race_info_label.config(text=text))
+            self.jobs.call_soon(lambda text=race_details_text: self.race_details_label.config(text=text))
 
             # --- 4. 特徴量計算と確率予測 ---
             all_features_list = []
@@ -4741,26 +4694,26 @@ class HorseRacingAnalyzerApp:
             except Exception: pass
 
             # --- 6. 結果の表示 ---
-            self.root.after(0, lambda time_sec=standard_time_sec: self.standard_time_label.config(text=self._format_time_from_seconds(time_sec)))
-            self.root.after(0, lambda time_sec=predicted_time_sec: self.predicted_time_label.config(text=self._format_time_from_seconds(time_sec)))
-            self.root.after(0, lambda text=pace_text: self.pace_prediction_label.config(text=text))
+            self.jobs.call_soon(lambda time_sec=standard_time_sec: self.standard_time_label.config(text=self._format_time_from_seconds(time_sec)))
+            self.jobs.call_soon(lambda time_sec=predicted_time_sec: self.predicted_time_label.config(text=self._format_time_from_seconds(time_sec)))
+            self.jobs.call_soon(lambda text=pace_text: self.pace_prediction_label.config(text=text))
             self.update_status(f"レースID {race_id}: シミュレーション実行中...")
             simulation_results = self.run_race_simulation(horse_details_list_for_gui)
             horse_details_list_for_gui.sort(key=lambda x: x.get('place_proba', 0), reverse=True)
-            self.root.after(0, self._update_prediction_table, horse_details_list_for_gui)
+            self.jobs.call_soon(self._update_prediction_table, horse_details_list_for_gui)
             recommendation_text = self.create_recommendation_text(horse_details_list_for_gui, simulation_results)
             if hasattr(self, 'recommendation_text') and self.recommendation_text.winfo_exists():
-                self.root.after(0, lambda: self.recommendation_text.delete(1.0, tk.END))
-                self.root.after(0, lambda: self.recommendation_text.insert(tk.END, recommendation_text))
-            self.root.after(0, lambda: self.update_status(f"予測完了: {race_id}"))
+                self.jobs.call_soon(lambda: self.recommendation_text.delete(1.0, tk.END))
+                self.jobs.call_soon(lambda: self.recommendation_text.insert(tk.END, recommendation_text))
+            self.jobs.call_soon(lambda: self.update_status(f"予測完了: {race_id}"))
 
         except Exception as e:
             traceback.print_exc()
-            self.root.after(0, lambda err=e: messagebox.showerror("予測処理エラー", f"予測処理中に予期せぬエラー: {err}"))
+            self.jobs.call_soon(lambda err=e: messagebox.showerror("予測処理エラー", f"予測処理中に予期せぬエラー: {err}"))
     
     def create_recommendation_text(self, horses_info, simulation_results):
         """
-        【改訂版】レースパターンに応じて「複勝・ワイド」「フォーメーション」を推奨する
+        【改訂版】レースパターンに応じて「複勝・ワイド」「3連単」を推奨する（オッズがあれば期待値順）
         """
         text = "【AIレース診断＆推奨買い目】\n"
         text += "----------------------------------\n"
@@ -4769,53 +4722,42 @@ class HorseRacingAnalyzerApp:
         if len(valid_horses) < 5:
             return text + "予測データ不足のため、買い目を生成できません。"
 
-        sorted_by_win_proba = sorted(valid_horses, key=lambda x: x.get('win_proba', 0), reverse=True)
-        
+        recommendation = self._recommend_tickets(valid_horses)
+        if recommendation is None:
+            return text + "予測データ不足のため、買い目を生成できません。"
+        race_pattern, sorted_by_win_proba, picks, has_odds = recommendation
         win_proba_top1 = sorted_by_win_proba[0].get('win_proba', 0)
-        win_proba_top2 = sorted_by_win_proba[1].get('win_proba', 0)
-        win_proba_top3 = sorted_by_win_proba[2].get('win_proba', 0)
+        order_label = "期待値上位" if has_odds else "確率上位"
 
-        # レースパターンの診断
-        race_pattern = "標準"
-        if win_proba_top1 > 0.35 and (win_proba_top1 > win_proba_top2 * 1.8):
-            race_pattern = "絶対軸馬"
-        elif win_proba_top1 < 0.25 and (win_proba_top1 - win_proba_top3) < 0.08:
-            race_pattern = "混戦"
+        def format_ranked(ranked, sep):
+            lines = ""
+            for row in ranked.itertuples():
+                line = f"  {sep.join(str(n) for n in row.numbers)} (確率{row.probability:.1%} / 理論オッズ{row.fair_odds:.1f}倍"
+                if pd.notna(row.expected_value):
+                    line += f" / 推定オッズ{row.odds:.1f}倍 / 期待値{row.expected_value:.2f}"
+                lines += line + ")\n"
+            return lines
 
         # パターンに応じた買い目をテキスト化
         if race_pattern == "混戦":
             text += "診断: 上位人気は混戦模様です\n"
-            text += "推奨戦略: 複勝・ワイドボックスでリスク分散\n\n"
-            top3_horses = sorted_by_win_proba[:3]
-            top3_numbers = [str(h.get('Umaban')) for h in top3_horses]
-            
+            text += "推奨戦略: 複勝・ワイドでリスク分散\n\n"
+            top3_numbers = [str(h.get('Umaban')) for h in sorted_by_win_proba[:3]]
+
             text += f"◎ 注目馬 (上位3頭): {', '.join(top3_numbers)}\n\n"
-            text += f"◇ 複勝 (1点)\n  {top3_numbers[0]}\n\n"
-            text += f"◇ ワイド (ボックス3点)\n  {top3_numbers[0]}-{top3_numbers[1]}\n"
-            text += f"  {top3_numbers[0]}-{top3_numbers[2]}\n"
-            text += f"  {top3_numbers[1]}-{top3_numbers[2]}\n"
+            text += "◇ 複勝 (1点)\n" + format_ranked(picks['複勝'], '') + "\n"
+            text += f"◇ ワイド ({order_label}3点)\n" + format_ranked(picks['ワイド'], '-')
         else: # 絶対軸馬 or 標準
             if race_pattern == "絶対軸馬":
                 text += f"診断: 信頼できる軸馬がいます (単勝確率: {win_proba_top1:.1%})\n"
             else:
                 text += "診断: 標準的なレースです\n"
-            text += "推奨戦略: 3連単フォーメーション\n\n"
+            text += f"推奨戦略: 3連単 {order_label}12点\n\n"
+            text += f"◎ 本命: {sorted_by_win_proba[0].get('Umaban', '？')}\n\n"
+            text += "◇ 3連単 (12点)\n" + format_ranked(picks['3連単'], '→')
+        if has_odds:
+            text += "※ 推定オッズは単勝オッズから逆算した市場の確率と払戻率による目安です\n"
 
-            axis_horse = sorted_by_win_proba[0]
-            sorted_by_place_proba = sorted(valid_horses, key=lambda x: x.get('place_proba', 0), reverse=True)
-            opponents = [h for h in sorted_by_place_proba if h.get('Umaban') != axis_horse.get('Umaban')][:4]
-            
-            axis_num = str(axis_horse.get('Umaban', '？'))
-            opponent_nums = [str(h.get('Umaban', '？')) for h in opponents]
-
-            text += f"◎ 1列目 (軸): {axis_num}\n"
-            text += f"○ 2,3列目 (相手): {', '.join(opponent_nums)}\n\n"
-            text += "◇ 3連単フォーメーション (12点)\n"
-            text += f"  1着: {axis_num}\n"
-            text += f"  2着: {', '.join(opponent_nums)}\n"
-            text += f"  3着: {', '.join([n for n in opponent_nums if n != opponent_nums[0]])}\n"
-            text += "  (例: 4→12→8, 4→12→5, ...)\n"
-        
         text += "----------------------------------\n"
         return text
    
@@ -5005,7 +4947,7 @@ class HorseRacingAnalyzerApp:
              messagebox.showwarning("バックテスト実行", "分析対象のデータが読み込まれていません。\nデータ管理タブでデータを読み込んでください。")
              return
         
-        if self.payout_data is None or not self.payout_data:
+        if len(self.payout_store) == 0:
             messagebox.showwarning("バックテスト実行", "払い戻しデータ(JSON)が読み込まれていません。\n的中判定ができないため、処理を中断します。")
             return
 
@@ -5042,7 +4984,7 @@ class HorseRacingAnalyzerApp:
         import os
 
         try:
-            self.root.after(0, lambda: self.update_status("バックテスト準備中..."))
+            self.jobs.call_soon(lambda: self.update_status("バックテスト準備中..."))
             print("\n--- バックテスト処理 開始 ---")
 
             # --- 1. 必要なモデルと設定をロード ---
@@ -5050,14 +4992,14 @@ class HorseRacingAnalyzerApp:
             win_model, win_features, win_imputation = self.trained_model, self.model_features, self.imputation_values_
             win_calibrator = self._load_pickle(os.path.join(self.settings.get("models_dir"), "calibrator_win.pkl"))
             if not all([win_model, win_features, win_calibrator]):
-                self.root.after(0, lambda: messagebox.showerror("モデルエラー", "単勝予測モデルまたは関連ファイルが見つかりません。"))
+                self.jobs.call_soon(lambda: messagebox.showerror("モデルエラー", "単勝予測モデルまたは関連ファイルが見つかりません。"))
                 return
 
             self.load_model_from_file(model_filename="trained_lgbm_model_place.pkl", mode='place')
             place_model, place_features, place_imputation = self.trained_model, self.model_features, self.imputation_values_
             place_calibrator = self._load_pickle(os.path.join(self.settings.get("models_dir"), "calibrator_place.pkl"))
             if not all([place_model, place_features, place_calibrator]):
-                self.root.after(0, lambda: messagebox.showerror("モデルエラー", "複勝予測モデルまたは関連ファイルが見つかりません。"))
+                self.jobs.call_soon(lambda: messagebox.showerror("モデルエラー", "複勝予測モデルまたは関連ファイルが見つかりません。"))
                 return
 
             # --- 2. 対象となるレースIDを期間で絞り込む ---
@@ -5067,13 +5009,10 @@ class HorseRacingAnalyzerApp:
             target_race_ids = temp_df[(temp_df[date_col] >= start_dt) & (temp_df[date_col] <= end_dt)]['race_id'].unique()
 
             if len(target_race_ids) == 0:
-                self.root.after(0, lambda: messagebox.showinfo("バックテスト結果", "指定期間に該当するレースデータがありません。"))
-                self.root.after(0, lambda: self.update_status("バックテスト完了: 対象レースなし"))
+                self.jobs.call_soon(lambda: messagebox.showinfo("バックテスト結果", "指定期間に該当するレースデータがありません。"))
+                self.jobs.call_soon(lambda: self.update_status("バックテスト完了: 対象レースなし"))
                 return
             
-            # 払い戻しデータを高速に検索できるよう、辞書形式に変換
-            payouts_map = {str(p['race_id']): p for p in self.payout_data if 'race_id' in p}
-
             # --- 3. バックテストのメインループ ---
             simulation_results = []
             total_investment = 0
@@ -5091,7 +5030,7 @@ class HorseRacingAnalyzerApp:
                 log_file.write("="*50 + "\nバックテスト詳細ログ\n" + "="*50 + "\n")
 
                 for i, race_id in enumerate(target_race_ids):
-                    self.root.after(0, lambda i=i, total=len(target_race_ids): self.update_status(f"バックテスト実行中... {i+1}/{total}"))
+                    self.jobs.call_soon(lambda i=i, total=len(target_race_ids): self.update_status(f"バックテスト実行中... {i+1}/{total}"))
                     
                     # 予測の前提となる出馬表データを取得
                     # 注: 実際のオッズはレース当日のものを使うのが理想ですが、ここでは出馬表確定時のオッズで代用します
@@ -5149,7 +5088,7 @@ class HorseRacingAnalyzerApp:
                     return_this_race = 0
                     
                     if bets_for_this_race:
-                        payout_info = payouts_map.get(str(race_id))
+                        payout_info = self.payout_store.get(race_id)
                         if payout_info:
                             races_bet_on += 1
                             log_file.write("【結果照合】\n")
@@ -5202,110 +5141,108 @@ class HorseRacingAnalyzerApp:
 
 
             # --- 5. GUIに結果を反映 ---
-            self.root.after(0, self._update_summary_text, summary)
-            self.root.after(0, self._draw_result_graph, simulation_results, analysis_type, f"収支推移 ({start_dt.strftime('%Y/%m/%d')}～)")
-            self.root.after(0, lambda: self.update_status("バックテストが完了しました。"))
-            self.root.after(0, lambda path=detailed_log_path: messagebox.showinfo("バックテスト完了", f"バックテストが完了しました。\n詳細は以下のログファイルを確認してください:\n{path}"))
+            self.jobs.call_soon(self._update_summary_text, summary)
+            self.jobs.call_soon(self._draw_result_graph, simulation_results, analysis_type, f"収支推移 ({start_dt.strftime('%Y/%m/%d')}～)")
+            self.jobs.call_soon(lambda: self.update_status("バックテストが完了しました。"))
+            self.jobs.call_soon(lambda path=detailed_log_path: messagebox.showinfo("バックテスト完了", f"バックテストが完了しました。\n詳細は以下のログファイルを確認してください:\n{path}"))
 
         except Exception as e:
             traceback.print_exc()
-            self.root.after(0, lambda err=e: messagebox.showerror("バックテストエラー", f"バックテスト処理中にエラーが発生しました:\n{err}"))
-            self.root.after(0, lambda: self.update_status("エラー: バックテスト失敗"))
+            self.jobs.call_soon(lambda err=e: messagebox.showerror("バックテストエラー", f"バックテスト処理中にエラーが発生しました:\n{err}"))
+            self.jobs.call_soon(lambda: self.update_status("エラー: バックテスト失敗"))
     
-    def get_bets_from_recommendation(self, horses_info):
-        """【改訂版】レースパターンに応じて「複勝・ワイド」「フォーメーション」の買い目リストを返す"""
-        from itertools import permutations, combinations
-        
-        bets = []
-        valid_horses = [h for h in horses_info if pd.notna(h.get('win_proba'))]
-        if len(valid_horses) < 5: return []
+    def _ticket_probability_table(self, horses_info):
+        """予測勝率から全組み合わせの的中確率テーブルを作成（作れなければ None）"""
+        valid = [h for h in horses_info if pd.notna(h.get('Umaban')) and pd.notna(h.get('win_proba'))]
+        if len(valid) < 3:
+            return None
+        return TicketProbabilityTable([int(h['Umaban']) for h in valid], [h['win_proba'] for h in valid])
+
+    def _market_probability_table(self, horses_info):
+        """
+        単勝オッズから市場の確率テーブルを作成（推定オッズ用）
+
+        馬番のある馬のうち1頭でも単勝オッズがない（発売前など）と市場の確率が歪むので None を返す。
+        """
+        valid = [h for h in horses_info if pd.notna(h.get('Umaban')) and int(h['Umaban']) > 0]
+        odds = [pd.to_numeric(h.get('Odds'), errors='coerce') for h in valid]
+        if len(valid) < 3 or any(pd.isna(o) or o <= 0 for o in odds):
+            return None
+        return TicketProbabilityTable.from_win_odds([int(h['Umaban']) for h in valid], odds)
+
+    def _recommend_tickets(self, valid_horses):
+        """
+        レースパターンを診断し、券種ごとの推奨買い目を選ぶ（create_recommendation_text と
+        get_bets_from_recommendation で共通）
 
+        単勝オッズがあれば、単勝オッズから推定した各券種のオッズとの期待値の高い順に選ぶ。
+        複勝の確率は較正済みの複勝モデルの出力（place_proba）を使う。
+
+        Returns:
+            (race_pattern, 勝率順の馬リスト, {券種: rank() と同じ列の DataFrame}, オッズの有無)
+            テーブルが作れなければ None
+        """
+        table = self._ticket_probability_table(valid_horses)
+        if table is None:
+            return None
         sorted_by_win_proba = sorted(valid_horses, key=lambda x: x.get('win_proba', 0), reverse=True)
-        
+
         win_proba_top1 = sorted_by_win_proba[0].get('win_proba', 0)
         win_proba_top2 = sorted_by_win_proba[1].get('win_proba', 0)
         win_proba_top3 = sorted_by_win_proba[2].get('win_proba', 0)
 
+        # レースパターンの診断
         race_pattern = "標準"
         if win_proba_top1 > 0.35 and (win_proba_top1 > win_proba_top2 * 1.8):
             race_pattern = "絶対軸馬"
         elif win_proba_top1 < 0.25 and (win_proba_top1 - win_proba_top3) < 0.08:
             race_pattern = "混戦"
-        
+
+        market = self._market_probability_table(valid_horses)
+
+        def estimated_odds(bet_type):
+            return market.estimated_odds(bet_type) if market is not None else None
+
+        picks = {}
         if race_pattern == "混戦":
-            top3_horses = sorted_by_win_proba[:3]
-            if len(top3_horses) == 3:
-                top3_numbers = [int(h['Umaban']) for h in top3_horses]
-                # 複勝: 予測1位の馬
-                bets.append({'type': '複勝', 'numbers': (top3_numbers[0],)})
-                # ワイド: 上位3頭ボックス
-                for comb in combinations(top3_numbers, 2):
-                    bets.append({'type': 'ワイド', 'numbers': tuple(sorted(comb))})
+            # 複勝: 較正済みの複勝確率（なければテーブルの3着以内確率）x 推定オッズの最大の馬
+            place = table.rank('複勝', odds=estimated_odds('複勝'))
+            place_proba = {int(h['Umaban']): h['place_proba'] for h in valid_horses
+                           if pd.notna(h.get('Umaban')) and pd.notna(h.get('place_proba'))}
+            place['probability'] = [place_proba.get(numbers[0], p)
+                                    for numbers, p in zip(place['numbers'], place['probability'])]
+            place['fair_odds'] = np.where(place['probability'] > 0, 1.0 / place['probability'].clip(lower=1e-12), np.inf)
+            place['expected_value'] = place['probability'] * place['odds']
+            sort_key = place['expected_value'] if market is not None else place['probability']
+            picks['複勝'] = place.loc[sort_key.fillna(-np.inf).sort_values(ascending=False, kind='stable').index[:1]]
+            # ワイド: 期待値（オッズなしなら確率）上位3点
+            picks['ワイド'] = table.rank('ワイド', odds=estimated_odds('ワイド'), top=3)
         else:  # 絶対軸馬 or 標準
-            axis_horse = sorted_by_win_proba[0]
-            sorted_by_place_proba = sorted(valid_horses, key=lambda x: x.get('place_proba', 0), reverse=True)
-            opponents = [h for h in sorted_by_place_proba if h.get('Umaban') != axis_horse.get('Umaban')][:4]
-            
-            if len(opponents) >= 2:
-                axis_num = int(axis_horse['Umaban'])
-                opponent_nums = [int(h['Umaban']) for h in opponents]
-                
-                # 3連単フォーメーション: 軸1頭 -> 相手4頭 -> 相手3頭 (12点)
-                for i in range(len(opponent_nums)):
-                    for j in range(len(opponent_nums)):
-                        if i == j: continue
-                        second_horse = opponent_nums[i]
-                        third_horse = opponent_nums[j]
-                        bets.append({'type': '三連単', 'numbers': (axis_num, second_horse, third_horse)})
+            # 3連単: 期待値（オッズなしなら確率）上位12点
+            picks['3連単'] = table.rank('3連単', odds=estimated_odds('3連単'), top=12)
+        return race_pattern, sorted_by_win_proba, picks, market is not None
+
+    def get_bets_from_recommendation(self, horses_info):
+        """【改訂版】レースパターンに応じて「複勝・ワイド」「3連単」の買い目リストを返す（オッズがあれば期待値順）"""
+        valid_horses = [h for h in horses_info if pd.notna(h.get('win_proba'))]
+        if len(valid_horses) < 5: return []
+
+        # create_recommendation_text と同じ買い目
+        recommendation = self._recommend_tickets(valid_horses)
+        if recommendation is None: return []
+        _, _, picks, _ = recommendation
+
+        bets = []
+        for bet_type, ranked in picks.items():
+            for numbers in ranked['numbers']:
+                bets.append({'type': '三連単' if bet_type == '3連単' else bet_type, 'numbers': numbers})
         return bets
     
     def check_bet_hit(self, bet, payout_info):
-        """【改訂版】複勝とワイドの的中判定を追加"""
-        import re
-        bet_type = bet['type']
-        bet_numbers = bet['numbers']
-        
-        payout_type_jp = bet_type.replace('三連複', '3連複').replace('三連単', '3連単')
-        
-        if payout_type_jp in payout_info and '馬番' in payout_info[payout_type_jp] and '払戻金' in payout_info[payout_type_jp]:
-            winning_combinations = payout_info[payout_type_jp].get('馬番', [])
-            payouts = payout_info[payout_type_jp].get('払戻金', [])
-
-            for idx, win_comb_str in enumerate(winning_combinations):
-                try:
-                    payout_val = payouts[idx]
-                    if payout_val is None: continue
-
-                    win_nums_str = re.findall(r'\d+', str(win_comb_str))
-                    if not win_nums_str: continue
-                    
-                    # --- 的中判定ロジック ---
-                    if bet_type == '複勝':
-                        # 買った馬番が、的中馬番のどれか一つと一致すればOK
-                        if bet_numbers[0] in [int(n) for n in win_nums_str]:
-                            return int(payout_val), True
-                    
-                    elif bet_type == 'ワイド':
-                        # 買った馬番のペアが、的中馬番のペアのいずれかと一致すればOK
-                        win_nums_int = {int(n) for n in win_nums_str}
-                        if set(bet_numbers).issubset(win_nums_int):
-                             return int(payout_val), True
-                             
-                    else: # 3連複・3連単
-                        win_nums = tuple(int(n) for n in win_nums_str)
-                        if bet_type == '三連複':
-                            win_nums = tuple(sorted(win_nums))
-                        
-                        if bet_numbers == win_nums:
-                            return int(payout_val), True
-                
-                except (ValueError, IndexError):
-                    continue
-        
-        # 複勝・ワイドは複数の的中がありうるので、ループを最後まで回してから失敗を返す
-        if bet_type in ['複勝', 'ワイド']:
-            return 0, False # ループ内で的中しなかった場合
-        
+        """【改訂版】全券種の的中判定（bet_settlement の組番キーで照合）"""
+        payout_val = find_payout(payout_info, bet['type'], bet['numbers'])
+        if payout_val > 0:
+            return int(payout_val), True
         return 0, False
 
     # --- バックテスト結果表示用ヘルパーメソッド (新規追加) ---
@@ -5595,6 +5532,7 @@ def main():
         # 必要なら設定を自動保存するなどの処理
         # if messagebox.askokcancel("終了確認", "アプリケーションを終了しますか？"):
         #     # app.save_settings() # 自動保存する場合
+        app.jobs.shutdown()
         root.destroy()
 
     root.protocol("WM_DELETE_WINDOW", on_closing)
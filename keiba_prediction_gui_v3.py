@@ -14,10 +14,21 @@ from datetime import datetime
 import re
 import sys
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.join(BASE_DIR, 'scripts'))
 
+from race_data_store import load_race_data, prepare_race_frame, DERIVED_COLUMNS
+from horse_history_index import HorseHistoryIndex
+from race_dataset import AppendOnlyRaceDataset
+from horse_attributes import build_horse_table, merge_horse_table
+from netkeiba_pages import fetch_race_ids, fetch_horse_soup, get_default_pool
+from win5_allocator import allocate_win5
+from gui_jobs import JobExecutor, JobCancelled
+from stats_snapshot import StatsSnapshot, SAME
+
 # バックテストモジュールから関数をインポート
 try:
     from backtest_phase2_phase3_dynamic import (
@@ -67,6 +78,18 @@ except ImportError:
     print("Warning: feature_engineering_v4 not found. V4 features disabled.")
     PHASE12_V4_AVAILABLE = False
 
+# スナップショットに保存する派生統計・分析器（load_data で作るもの）
+DERIVED_STATS_ATTRS = [
+    'sire_stats', 'trainer_jockey_stats',
+    'pace_predictor', 'bias_analyzer', 'form_analyzer',
+    'track_bias_analyzer', 'weather_analyzer', 'enhanced_pace_predictor', 'distance_analyzer',
+]
+# 統計・分析器の作り方を変えたら上げる（保存済みのスナップショットを使わなくなる）
+GUI_STATS_SNAPSHOT_VERSION = 1
+
+# 読み込み時に追加する列（CSVには保存しない）
+LOAD_TIME_COLUMNS = ['training_rank_numeric', 'pace_fast', 'pace_medium', 'pace_slow']
+
 
 class KeibaGUIv3:
     def __init__(self, root):
@@ -74,6 +97,16 @@ class KeibaGUIv3:
         self.root.title("競馬予想AI - Phase 12")
         self.root.geometry("1200x900")
 
+        # スクレイピング・予測はバックグラウンドジョブで実行（結果はメインスレッドで受け取る）
+        self.jobs = JobExecutor(self.root, max_workers=4)
+
+        # self.df と self.phase10 は組で差し替える（ワーカーは _data_snapshot() で1組を読む）
+        self._data_lock = threading.Lock()
+        # 行の追加・差し替えは1つずつ（同時に追加すると片方が失われる）
+        self._update_lock = threading.Lock()
+        # レース予想は1レースずつ（結果のテキスト・表・last_prediction を1つのレースにそろえる）
+        self._predict_lock = threading.Lock()
+
         # 予測結果を保存
         self.last_prediction = None
         self.last_race_id = None
@@ -125,66 +158,17 @@ class KeibaGUIv3:
     def load_data(self):
         """過去データ読み込み"""
         try:
-            self.df = pd.read_csv(os.path.join(BASE_DIR, 'data/main/netkeiba_data_2020_2025_complete.csv'), low_memory=False)
+            # 列指向ストアから読み込み（日付は'YYYY-MM-DD'に正規化済み、着順・オッズは rank / win_odds に数値化済み）
+            # ※ pd.to_datetime()が日本語形式を解釈できずNaTになる問題もストア変換時に解消
+            self.df = load_race_data(os.path.join(BASE_DIR, 'data/main/netkeiba_data_2020_2025_complete.csv'),
+                                     categorical=False)
+            self.df = self._add_load_time_columns(self.df)
 
-            # 日付列をISO形式に正規化（'2025年01月05日' → '2025-01-05'）
-            # ※ pd.to_datetime()が日本語形式を解釈できずNaTになる問題の根本対策
-            if 'date' in self.df.columns:
-                def _normalize_date(date_str):
-                    s = str(date_str)
-                    m = re.search(r'(\d{4})年(\d{1,2})月(\d{1,2})日', s)
-                    if m:
-                        return f"{m.group(1)}-{m.group(2).zfill(2)}-{m.group(3).zfill(2)}"
-                    m2 = re.search(r'(\d{4}-\d{2}-\d{2})', s)
-                    if m2:
-                        return m2.group(1)
-                    return s
-                self.df['date'] = self.df['date'].apply(_normalize_date)
-
-            # 着順・オッズを数値化
-            self.df['rank'] = pd.to_numeric(self.df['着順'], errors='coerce')
-            self.df['win_odds'] = pd.to_numeric(self.df['単勝'], errors='coerce')
-
-            # 調教ランク数値化
-            training_rank_map = {'S': 5, 'A': 4, 'B': 3, 'C': 2, 'D': 1}
-            self.df['training_rank_numeric'] = self.df['training_rank'].map(training_rank_map)
-            self.df['training_rank_numeric'].fillna(3, inplace=True)
-
-            # ペースカテゴリ
-            self.df['pace_fast'] = (self.df['pace_category'] == 'fast').astype(int)
-            self.df['pace_medium'] = (self.df['pace_category'] == 'medium').astype(int)
-            self.df['pace_slow'] = (self.df['pace_category'] == 'slow').astype(int)
-
-            if BACKTEST_AVAILABLE:
-                # 統計計算
-                self.sire_stats = calculate_sire_stats(self.df)
-                self.trainer_jockey_stats = calculate_trainer_jockey_stats(self.df)
-
-            # V3分析器を初期化
-            if PHASE11_V3_AVAILABLE:
-                self.log("V3分析器を初期化中...")
-                self.pace_predictor = PacePredictor(self.df)
-                self.bias_analyzer = CourseBiasAnalyzer(self.df)
-                self.form_analyzer = FormCycleAnalyzer(self.df)
-                self.log("V3分析器初期化完了")
-            else:
-                self.pace_predictor = None
-                self.bias_analyzer = None
-                self.form_analyzer = None
-
-            # V4分析器を初期化
-            if PHASE12_V4_AVAILABLE:
-                self.log("V4分析器を初期化中...")
-                self.track_bias_analyzer = TrackBiasAnalyzer(self.df)
-                self.weather_analyzer = WeatherImpactAnalyzer(self.df)
-                self.enhanced_pace_predictor = EnhancedPacePredictor(self.df)
-                self.distance_analyzer = DistanceAptitudeAnalyzer(self.df)
-                self.log("V4分析器初期化完了")
-            else:
-                self.track_bias_analyzer = None
-                self.weather_analyzer = None
-                self.enhanced_pace_predictor = None
-                self.distance_analyzer = None
+            # 血統・調教師騎手統計とV3/V4分析器（前回と同じデータならスナップショットから読み込み）
+            self._load_derived_stats()
+
+            # Phase 10特徴量用の走ごとの表（着差・通過順・クラスを解析済み）
+            self.phase10 = self._build_phase10_table(self.df) if PHASE10_AVAILABLE else None
 
             # データ範囲を計算
             self.data_range_text = self._calculate_data_range()
@@ -198,10 +182,135 @@ class KeibaGUIv3:
         except Exception as e:
             self.log(f"データ読み込み失敗: {e}")
             self.df = None
+            self.phase10 = None
 
         # Phase12バックテスト統計を読み込み
         self.phase12_stats = self._load_phase12_stats()
 
+    def _add_load_time_columns(self, df):
+        """読み込み時に追加する列（調教ランク数値化・ペースカテゴリ）を付与"""
+        # 調教ランク数値化
+        training_rank_map = {'S': 5, 'A': 4, 'B': 3, 'C': 2, 'D': 1}
+        if 'training_rank' in df.columns:
+            df['training_rank_numeric'] = df['training_rank'].map(training_rank_map).fillna(3)
+        else:
+            df['training_rank_numeric'] = 3
+
+        # ペースカテゴリ
+        pace = df['pace_category'] if 'pace_category' in df.columns else pd.Series(index=df.index, dtype=object)
+        df['pace_fast'] = (pace == 'fast').astype(int)
+        df['pace_medium'] = (pace == 'medium').astype(int)
+        df['pace_slow'] = (pace == 'slow').astype(int)
+        return df
+
+    def _prepare_new_rows(self, new_rows):
+        """
+        スクレイピングした行を load_data と同じ形にする（日付の正規化・派生列・読み込み時の列）
+
+        self.df に追加する前に通す。日付が 'YYYY-MM-DD' に揃っていないと、
+        過去成績の日付順（文字列のソート）が崩れる。
+        """
+        new_rows = prepare_race_frame(pd.DataFrame(new_rows).copy(), categorical=False)
+        # CSVから読み込んだ場合と同じく、既存の数値列は数値にそろえる（race_id / horse_id の照合用）
+        for col in new_rows.columns.intersection(self.df.columns):
+            if pd.api.types.is_numeric_dtype(self.df[col]) and not pd.api.types.is_numeric_dtype(new_rows[col]):
+                new_rows[col] = pd.to_numeric(new_rows[col], errors='coerce')
+        return self._add_load_time_columns(new_rows)
+
+    def _frame_for_save(self, df, csv_path):
+        """読み込み時に追加した列（元のCSVにない派生列）を除いた、CSVに保存する形の df"""
+        header = set(pd.read_csv(csv_path, nrows=0, encoding='utf-8-sig').columns)
+        added = [c for c in DERIVED_COLUMNS + LOAD_TIME_COLUMNS if c in df.columns and c not in header]
+        return df.drop(columns=added)
+
+    def _data_snapshot(self):
+        """(df, phase10) を1組で取得（予測ジョブは最初に1回呼び、以降はこの組だけを読む）"""
+        with self._data_lock:
+            return self.df, self.phase10
+
+    def _replace_data(self, df):
+        """
+        df と Phase 10 テーブルを組で差し替える（呼び出し側は _update_lock を保持する）
+
+        Phase 10 テーブルはロックの外で作り、差し替えだけをデータロックの中で行う。
+        """
+        phase10 = self._build_phase10_table(df) if PHASE10_AVAILABLE else None
+        with self._data_lock:
+            self.df, self.phase10 = df, phase10
+
+    def _extend_data(self, new_rows):
+        """
+        スクレイピングした行を self.df に追加（ワーカーから呼べる）
+
+        Returns:
+            追加した行数
+        """
+        with self._update_lock:
+            new_rows = self._prepare_new_rows(new_rows)
+            self._replace_data(pd.concat([self.df, new_rows], ignore_index=True))
+        return len(new_rows)
+
+    def _build_derived_stats(self):
+        """血統・調教師騎手統計とV3/V4分析器を self.df から作る"""
+        if BACKTEST_AVAILABLE:
+            # 統計計算
+            self.sire_stats = calculate_sire_stats(self.df)
+            self.trainer_jockey_stats = calculate_trainer_jockey_stats(self.df)
+
+        # V3分析器を初期化
+        if PHASE11_V3_AVAILABLE:
+            self.log("V3分析器を初期化中...")
+            self.pace_predictor = PacePredictor(self.df)
+            self.bias_analyzer = CourseBiasAnalyzer(self.df)
+            self.form_analyzer = FormCycleAnalyzer(self.df)
+            self.log("V3分析器初期化完了")
+        else:
+            self.pace_predictor = None
+            self.bias_analyzer = None
+            self.form_analyzer = None
+
+        # V4分析器を初期化
+        if PHASE12_V4_AVAILABLE:
+            self.log("V4分析器を初期化中...")
+            self.track_bias_analyzer = TrackBiasAnalyzer(self.df)
+            self.weather_analyzer = WeatherImpactAnalyzer(self.df)
+            self.enhanced_pace_predictor = EnhancedPacePredictor(self.df)
+            self.distance_analyzer = DistanceAptitudeAnalyzer(self.df)
+            self.log("V4分析器初期化完了")
+        else:
+            self.track_bias_analyzer = None
+            self.weather_analyzer = None
+            self.enhanced_pace_predictor = None
+            self.distance_analyzer = None
+
+    def _load_derived_stats(self):
+        """
+        血統・調教師騎手統計とV3/V4分析器を用意する
+
+        self.df の指紋が前回保存したスナップショットと同じなら読み込むだけにし、
+        違えば作り直して保存する。分析器は中身を足し合わせられないので、
+        行が追加された場合も作り直す。
+        """
+        available = (BACKTEST_AVAILABLE, PHASE11_V3_AVAILABLE, PHASE12_V4_AVAILABLE)
+        snapshot = StatsSnapshot(os.path.join(BASE_DIR, 'cache', 'gui_stats_snapshot.pkl'),
+                                 version=GUI_STATS_SNAPSHOT_VERSION)
+        try:
+            status, saved, _ = snapshot.match(self.df)
+        except Exception as e:
+            print(f"[WARNING] 統計スナップショットの照合に失敗しました: {e}")
+            status, saved = None, None
+
+        if status == SAME and saved.get('available') == available:
+            for name, value in saved['stats'].items():
+                setattr(self, name, value)
+            self.log("統計・分析器をスナップショットから読み込みました")
+            return
+
+        self._build_derived_stats()
+        if status is not None:
+            names = [name for name in DERIVED_STATS_ATTRS if hasattr(self, name)]
+            snapshot.save({'available': available, 'stats': {name: getattr(self, name) for name in names}})
+
     def _load_phase12_stats(self):
         """phase12_backtest_results.csv を読み込み統計を算出"""
         csv_path = os.path.join(BASE_DIR, 'phase12_backtest_results.csv')
@@ -276,14 +385,15 @@ class KeibaGUIv3:
         # 馬ごとに詳細情報を取得
         horse_data_cache = {}
 
-        for i, horse_id in enumerate(unique_horses, 1):
-            horse_id_str = str(int(horse_id))
+        # 馬ページは共有プールで並行取得（結果は unique_horses の順）
+        horse_id_strs = [str(int(horse_id)) for horse_id in unique_horses]
+        fetched_details = get_default_pool().imap(self._scrape_horse_details, horse_id_strs)
 
+        for i, (horse_id, details) in enumerate(zip(unique_horses, fetched_details), 1):
             if i % 10 == 0:
                 log_widget.insert(tk.END, f"  [{i}/{len(unique_horses)}] 処理中...\n")
                 dialog.update()
 
-            details = self._scrape_horse_details(horse_id_str)
             if details:
                 stats = self._calculate_horse_statistics(details)
                 horse_data_cache[horse_id] = {
@@ -292,46 +402,22 @@ class KeibaGUIv3:
                     **stats
                 }
 
-            time.sleep(1.0)
-
         log_widget.insert(tk.END, f"  馬情報取得完了: {len(horse_data_cache)}頭\n")
         dialog.update()
 
-        # DataFrameに情報を追加
-        for col in ['total_starts', 'total_win_rate', 'turf_win_rate', 'dirt_win_rate',
-                    'avg_passage_position', 'running_style_category']:
-            if col not in df.columns:
-                df[col] = None
-
-        for idx in df.index:
-            horse_id = df.at[idx, 'horse_id']
-
-            if pd.notna(horse_id) and horse_id in horse_data_cache:
-                data = horse_data_cache[horse_id]
-                df.at[idx, 'father'] = data.get('father')
-                df.at[idx, 'mother_father'] = data.get('mother_father')
-                df.at[idx, 'total_starts'] = data.get('total_starts')
-                df.at[idx, 'total_win_rate'] = data.get('total_win_rate')
-                df.at[idx, 'turf_win_rate'] = data.get('turf_win_rate')
-                df.at[idx, 'dirt_win_rate'] = data.get('dirt_win_rate')
-                df.at[idx, 'avg_passage_position'] = data.get('avg_passage_position')
-                df.at[idx, 'running_style_category'] = data.get('running_style_category')
+        # 馬テーブルを作って horse_id で結合（値が変わる行だけ更新）
+        df, num_updated = merge_horse_table(df, build_horse_table(horse_data_cache))
+        log_widget.insert(tk.END, f"  更新した行: {num_updated:,}件\n")
+        dialog.update()
 
         return df
 
     def _scrape_horse_details(self, horse_id):
-        """馬の詳細ページから血統と過去成績を取得（Selenium使用）"""
-        url = f"https://db.netkeiba.com/horse/{horse_id}/"
-
-        driver = None
+        """馬の詳細ページから血統と過去成績を取得（戦績はajax断片を直接取得）"""
         try:
-            # Seleniumでページ取得（動的コンテンツ対応）
-            driver = get_driver()
-            driver.get(url)
-            time.sleep(2)  # ページ読み込み待機
-
-            # BeautifulSoupで解析
-            soup = BeautifulSoup(driver.page_source, 'html.parser')
+            soup = fetch_horse_soup(horse_id)
+            if soup is None:
+                return None
 
             result = {
                 'father': None,
@@ -406,9 +492,6 @@ class KeibaGUIv3:
 
         except Exception as e:
             return None
-        finally:
-            if driver:
-                driver.quit()
 
     def _calculate_horse_statistics(self, horse_details):
         """馬の統計情報を計算"""
@@ -466,49 +549,293 @@ class KeibaGUIv3:
 
         return stats
 
-    def _add_phase10_features(self, features, horse_id, current_date, race_info):
-        """Phase 10新規特徴量を追加（着差、脚質、クラス）"""
+    def _race_histories(self, horses, race_id, df):
+        """
+        出走馬全頭の過去成績を1回の抽出でまとめて取得
+
+        対象レース自体は除外し（リーケージ防止）、馬ごとに日付の古い順に並べる。
+
+        Returns:
+            {horse_id(float): DataFrame}（データのない馬は含まない）
+        """
+        horse_ids = set()
+        for horse in horses:
+            try:
+                horse_ids.add(float(horse.get('horse_id')))
+            except (ValueError, TypeError):
+                pass
+        if not horse_ids:
+            return {}
+
+        mask = df['horse_id'].isin(horse_ids)
         try:
-            # current_dateをdatetimeに変換
-            if isinstance(current_date, str):
-                current_date_dt = pd.to_datetime(current_date, errors='coerce')
-            else:
-                current_date_dt = pd.to_datetime(current_date, errors='coerce')
+            mask &= df['race_id'] != int(race_id)
+        except (ValueError, TypeError):
+            pass
+        history = df[mask].copy()
+        # 日付は読み込み時・行の追加時（_prepare_new_rows）に 'YYYY-MM-DD' へ正規化済みなので文字列のままソートできる
+        history['date_normalized'] = history['date']
+        history = history.sort_values('date_normalized', kind='stable')
+        return {horse_id: group for horse_id, group in history.groupby('horse_id', sort=False)}
+
+    def _race_histories_batch(self, cards, df):
+        """
+        複数レースの出走馬の過去成績を1回の抽出でまとめて取得（開催日一括予想用）
 
-            # 馬の過去レース取得
-            df_dates = pd.to_datetime(self.df['date'], errors='coerce')
-            horse_races = self.df[
-                (self.df['horse_id'] == horse_id) &
-                (df_dates < current_date_dt)
-            ].copy()
+        Args:
+            cards: [(race_id, horses), ...]
+            df: 抽出元のデータ（_data_snapshot() の df）
 
-            # 1. 着差関連
-            if len(horse_races) > 0 and '着差' in horse_races.columns:
-                diffs = horse_races['着差'].apply(parse_diff_to_seconds)
-                features['avg_diff_seconds'] = diffs.mean() if len(diffs) > 0 else 1.0
-                features['min_diff_seconds'] = diffs.min() if len(diffs) > 0 else 1.0
+        Returns:
+            {race_id: {horse_id(float): DataFrame}}（_race_histories と同じ内容をレースごとに）
+        """
+        race_horse_ids = {}
+        for race_id, horses in cards:
+            ids = set()
+            for horse in horses:
+                try:
+                    ids.add(float(horse.get('horse_id')))
+                except (ValueError, TypeError):
+                    pass
+            race_horse_ids[race_id] = ids
+
+        all_ids = set().union(*race_horse_ids.values()) if race_horse_ids else set()
+        if not all_ids:
+            return {race_id: {} for race_id, _ in cards}
+
+        history = df[df['horse_id'].isin(all_ids)].copy()
+        history['date_normalized'] = history['date']
+        history = history.sort_values('date_normalized', kind='stable')
+        by_horse = {horse_id: group for horse_id, group in history.groupby('horse_id', sort=False)}
+
+        result = {}
+        for race_id, ids in race_horse_ids.items():
+            try:
+                race_id_num = int(race_id)
+            except (ValueError, TypeError):
+                race_id_num = None
+            histories = {}
+            for horse_id in ids:
+                group = by_horse.get(horse_id)
+                if group is None:
+                    continue
+                # 対象レース自体は除外（リーケージ防止）
+                if race_id_num is not None:
+                    group = group[group['race_id'] != race_id_num]
+                if len(group) > 0:
+                    histories[horse_id] = group
+            result[race_id] = histories
+        return result
+
+    def _build_race_features(self, horses, race_id, race_info, log_prefix='', on_progress=None,
+                             histories=None, data=None):
+        """
+        出走馬全頭の特徴量を (頭数 × モデル特徴量数) の行列にまとめる
+
+        Args:
+            horses: 出馬表（scrape_shutuba などの戻り値）
+            race_id: 対象レースID（過去成績から除外する）
+            race_info: レース情報（枠番を書き込む）
+            log_prefix: コンソールログの接頭辞
+            on_progress: (完了頭数, 全頭数) を受け取るコールバック
+            histories: 抽出済みの過去成績 {horse_id(float): DataFrame}（省略時は _race_histories で抽出）
+            data: _data_snapshot() の (df, phase10)（histories を抽出した組。省略時はここで取得）
+
+        Returns:
+            (feat_df, horse_histories)
+            feat_df は horses と同じ順の特徴量行列、horse_histories は馬ごとの過去成績（なければ空）
+        """
+        model_features = self.model_features
+        # pd.to_datetime互換のISO形式（'%Y年%m月%d日'はNaTになるため）
+        current_date = datetime.now().strftime('%Y-%m-%d')
+        # 出走馬のhorse_idリスト（V3ペース予測用）
+        race_horses_ids = [h.get('horse_id') for h in horses if h.get('horse_id')]
+        df, phase10 = data if data is not None else self._data_snapshot()
+        if histories is None:
+            histories = self._race_histories(horses, race_id, df)
+
+        rows = []
+        horse_histories = []
+        for i, horse in enumerate(horses):
+            name = horse.get('馬名', '?')
+            horse_id = horse.get('horse_id')
+            features = None
+
+            try:
+                horse_id_num = float(horse_id) if horse_id else None
+            except (ValueError, TypeError):
+                horse_id_num = None
+                print(f"{log_prefix}  NG horse_id変換失敗 [{name}]: {horse_id}")
+            horse_data = histories.get(horse_id_num, pd.DataFrame())
+
+            if not horse_id:
+                print(f"{log_prefix}  NG horse_id取得失敗 [{name}]")
+            elif horse_id_num is not None and len(horse_data) == 0:
+                print(f"{log_prefix}  NG 馬データなし [{name}] (horse_id: {horse_id})")
+            elif horse_id_num is not None:
+                try:
+                    waku_num = int(horse.get('枠番'))
+                except (ValueError, TypeError):
+                    waku_num = None
+                # 枠番をrace_infoに追加（V3特徴量用）
+                race_info['waku'] = waku_num
+
+                # 特徴量計算（horse_dataをprefiltered引数で渡す）
+                # ※ calculate_horse_features_dynamic内部で df を再検索させない
+                try:
+                    features = calculate_horse_features_dynamic(
+                        horse_id, df, current_date, self.sire_stats,
+                        self.trainer_jockey_stats,
+                        horse.get('調教師'), horse.get('騎手'),
+                        race_info.get('track_name'),
+                        race_info.get('distance'),
+                        race_info.get('course_type'),
+                        race_info.get('track_condition'),
+                        waku_num,
+                        race_id=race_id,
+                        horse_races_prefiltered=horse_data
+                    )
+                except Exception as e:
+                    print(f"{log_prefix}特徴量計算エラー [{name}]: {e}")
+                    import traceback
+                    traceback.print_exc()
+                    features = None
+
+                if features:
+                    # Phase 10新規特徴量を追加
+                    if PHASE10_AVAILABLE:
+                        features = self._add_phase10_features(
+                            features, horse_id_num, current_date, race_info, phase10
+                        )
+                    # V3新規特徴量を追加（ペース予測、コースバイアス、フォームサイクル）
+                    if PHASE11_V3_AVAILABLE and self.pace_predictor:
+                        features = self._add_v3_features(
+                            features, horse_id_num, race_horses_ids, race_info
+                        )
+                    # V4新規特徴量を追加（馬場バイアス、天気×血統、展開予測、距離適性）
+                    if PHASE12_V4_AVAILABLE and self.track_bias_analyzer:
+                        features = self._add_v4_features(
+                            features, horse, horse_id_num, race_horses_ids, race_info, df
+                        )
+                    # 特徴量の信頼性チェック
+                    non_zero_count = sum(1 for v in features.values() if v != 0 and v != 0.0)
+                    feature_reliability = non_zero_count / len(features) if features else 0
+                    print(f"{log_prefix}  OK 特徴量計算成功 [{name}]: {len(features)}個 (有効: {non_zero_count}個, 信頼度: {feature_reliability*100:.0f}%)")
+                else:
+                    print(f"{log_prefix}  NG 特徴量がNone [{name}]")
+                    features = None
 
-                sorted_races = horse_races.sort_values('date', ascending=False)
-                features['prev_diff_seconds'] = parse_diff_to_seconds(sorted_races.iloc[0].get('着差', ''))
+            # 特徴量が取得できなかった場合はデフォルト値
+            if features is None:
+                print(f"{log_prefix}  デフォルト値使用 [{name}]")
+                features = {'total_starts': 10, 'total_win_rate': 0.1}
+
+            rows.append(features)
+            horse_histories.append(horse_data)
+            if on_progress:
+                on_progress(i + 1, len(horses))
+
+        # 不足している特徴量は0で埋める
+        feat_df = pd.DataFrame(rows).reindex(columns=model_features).fillna(0)
+
+        # デバッグ: 最初の馬の特徴量を確認
+        if len(feat_df) > 0:
+            print(f"\n{log_prefix}[デバッグ] 最初の馬の特徴量:")
+            print(f"  feat_df shape: {feat_df.shape}")
+            non_zero = (feat_df.iloc[0] != 0).sum()
+            print(f"  非ゼロの特徴量数: {non_zero}/{len(model_features)}")
+            print(f"  主要特徴量:")
+            for key in ['total_starts', 'total_win_rate', 'trainer_win_rate', 'jockey_win_rate']:
+                val = feat_df[key].iloc[0] if key in feat_df.columns else 'N/A'
+                print(f"    {key}: {val}")
+            print()
+
+        return feat_df, horse_histories
+
+    def _score_race(self, feat_df):
+        """
+        特徴量行列を勝率・複勝率モデルでそれぞれ1回ずつ予測
+
+        Returns:
+            (勝率予測の配列, 複勝予測の配列)
+        """
+        if len(feat_df) == 0:
+            return np.zeros(0), np.zeros(0)
+        win_proba = self.model_win.predict_proba(feat_df)[:, 1]
+        top3_proba = self.model_top3.predict_proba(feat_df)[:, 1]
+        print(f"  予測結果（最初の馬）: 勝率 {win_proba[0]*100:.3f}% / 複勝 {top3_proba[0]*100:.3f}%")
+        return win_proba, top3_proba
+
+    def _build_phase10_table(self, df):
+        """
+        Phase 10特徴量用に全走分の着差・通過順・クラスを解析しておく（load_data時に1回）
+
+        行の並びは HorseHistoryIndex と同じ（馬ID -> 日付順）なので、
+        _add_phase10_features では馬ごとの行範囲を切り出すだけで済む。
+        同じ文字列は1回だけ解析する。
+
+        Returns:
+            (HorseHistoryIndex, 解析済みの列の辞書)
+            ※ self.phase10 に組のまま代入する（索引と列を別々に差し替えると、
+              並行して予測中のジョブが新しい索引と古い列を組み合わせて読んでしまう）
+        """
+        index = HorseHistoryIndex(df)
+        runs = df.iloc[index.row_positions]
+
+        def parse_column(col, func):
+            """列のユニーク値ごとに func を適用し、行ごとの結果リストを返す"""
+            if col not in runs.columns:
+                return None
+            codes, uniques = pd.factorize(runs[col])
+            parsed = [func(v) for v in uniques]
+            parsed.append(func(np.nan))  # 欠損（code = -1）
+            return [parsed[c] for c in codes]
+
+        diffs = parse_column('着差', parse_diff_to_seconds)
+        passages = parse_column('通過', parse_passage)
+        classes = parse_column('race_name', extract_race_class)
+
+        columns = {
+            'diff_seconds': None if diffs is None else np.asarray(diffs, dtype=np.float64),
+            'first_corner': None if passages is None else np.array(
+                [p[0] if len(p) > 0 else np.nan for p in passages], dtype=np.float64),
+            'last_corner': None if passages is None else np.array(
+                [p[-1] if len(p) > 0 else np.nan for p in passages], dtype=np.float64),
+            'race_class': None if classes is None else np.asarray(classes, dtype=np.float64),
+        }
+        self.log(f"Phase 10特徴量テーブル作成: {len(runs):,}走")
+        return index, columns
+
+    def _add_phase10_features(self, features, horse_id, current_date, race_info, phase10):
+        """Phase 10新規特徴量を追加（着差、脚質、クラス）。phase10 は _data_snapshot() の組"""
+        try:
+            # 基準日より前の走（新しい順）を解析済みテーブルから切り出す
+            index, runs = phase10
+            positions = index.past_positions(horse_id, current_date, max_results=None)
+
+            # 1. 着差関連
+            if len(positions) > 0 and runs['diff_seconds'] is not None:
+                diffs = runs['diff_seconds'][positions]
+                valid = diffs[~np.isnan(diffs)]
+                features['avg_diff_seconds'] = valid.mean() if len(valid) > 0 else np.nan
+                features['min_diff_seconds'] = valid.min() if len(valid) > 0 else np.nan
+                features['prev_diff_seconds'] = diffs[0]
             else:
                 features['avg_diff_seconds'] = 1.0
                 features['min_diff_seconds'] = 1.0
                 features['prev_diff_seconds'] = 1.0
 
             # 2. 通過順関連（脚質）
-            if len(horse_races) > 0 and '通過' in horse_races.columns:
-                first_corners = []
-                last_corners = []
-                for _, row in horse_races.iterrows():
-                    passage = parse_passage(row.get('通過', ''))
-                    if len(passage) > 0:
-                        first_corners.append(passage[0])
-                        last_corners.append(passage[-1])
-
-                if first_corners:
-                    features['avg_first_corner'] = np.mean(first_corners)
-                    features['avg_last_corner'] = np.mean(last_corners)
-                    features['avg_position_change'] = np.mean([f - l for f, l in zip(first_corners, last_corners)])
+            if len(positions) > 0 and runs['first_corner'] is not None:
+                first_corners = runs['first_corner'][positions]
+                last_corners = runs['last_corner'][positions]
+                has_passage = ~np.isnan(first_corners)
+                if has_passage.any():
+                    first_corners = first_corners[has_passage]
+                    last_corners = last_corners[has_passage]
+                    features['avg_first_corner'] = first_corners.mean()
+                    features['avg_last_corner'] = last_corners.mean()
+                    features['avg_position_change'] = (first_corners - last_corners).mean()
                 else:
                     features['avg_first_corner'] = 5.0
                     features['avg_last_corner'] = 5.0
@@ -519,10 +846,12 @@ class KeibaGUIv3:
                 features['avg_position_change'] = 0.0
 
             # 3. クラス移動
-            if race_info.get('race_name') and len(horse_races) > 0:
+            if race_info.get('race_name') and len(positions) > 0:
                 current_class = extract_race_class(race_info['race_name'])
-                sorted_races = horse_races.sort_values('date', ascending=False)
-                last_class = extract_race_class(sorted_races.iloc[0].get('race_name', ''))
+                if runs['race_class'] is not None:
+                    last_class = runs['race_class'][positions[0]]
+                else:
+                    last_class = extract_race_class('')
                 features['class_change'] = current_class - last_class
                 features['current_class'] = current_class
             else:
@@ -577,7 +906,7 @@ class KeibaGUIv3:
 
         return features
 
-    def _add_v4_features(self, features, horse_info, horse_id, race_horses_ids, race_info):
+    def _add_v4_features(self, features, horse_info, horse_id, race_horses_ids, race_info, df):
         """V4新規特徴量を追加（馬場バイアス、天気×血統、展開予測、距離適性）"""
         try:
             waku = race_info.get('waku', 4)
@@ -592,7 +921,7 @@ class KeibaGUIv3:
             mother_father = ''
             if horse_id:
                 horse_id_num = float(horse_id)
-                horse_rows = self.df[self.df['horse_id'] == horse_id_num]
+                horse_rows = df[df['horse_id'] == horse_id_num]
                 if len(horse_rows) > 0:
                     latest = horse_rows.iloc[-1]
                     father = latest.get('father', '')
@@ -778,7 +1107,7 @@ class KeibaGUIv3:
         self.race_id_entry.grid(row=0, column=1, padx=5, pady=5)
         self.race_id_entry.insert(0, "202510020812")  # データベース最新レース
 
-        tk.Label(input_frame, text="例: 202510020812\n（年月日場所レース番号）\n\n未来のレース: netkeiba出馬表から取得\n過去のレース: データベース使用\n\nDB収録: 2025/01/01～2025/10/02",
+        tk.Label(input_frame, text="例: 202510020812\n（年月日場所レース番号）\n複数レースは空白・カンマ区切りでまとめて予想\n\n未来のレース: netkeiba出馬表から取得\n過去のレース: データベース使用\n\nDB収録: 2025/01/01～2025/10/02",
                 font=("Arial", 8), fg="gray").grid(row=1, column=1, padx=5, sticky=tk.W)
 
         # ボタン
@@ -823,6 +1152,21 @@ class KeibaGUIv3:
                                      width=20, height=1)
         self.win5_button.pack(pady=5)
 
+        self.race_day_button = tk.Button(button_frame, text="📋 開催日一括予想",
+                                         command=self.predict_race_day,
+                                         bg="#3F51B5", fg="white",
+                                         font=("Arial", 10, "bold"),
+                                         width=20, height=1)
+        self.race_day_button.pack(pady=5)
+
+        # 実行中のジョブ（予想・WIN5・開催日一括予想・データ更新）を中止
+        self.cancel_button = tk.Button(button_frame, text="⏹ 実行中の処理を中止",
+                                       command=self.cancel_jobs,
+                                       bg="#757575", fg="white",
+                                       font=("Arial", 10, "bold"),
+                                       width=20, height=1, state=tk.DISABLED)
+        self.cancel_button.pack(pady=5)
+
         # 自動更新チェックボックス
         auto_update_check = tk.Checkbutton(button_frame,
                                            text="予測前に自動データ更新",
@@ -1034,7 +1378,8 @@ class KeibaGUIv3:
         except:
             return None, None
 
-        race_data = self.df[self.df['race_id'] == race_id_int].copy()
+        df, _ = self._data_snapshot()
+        race_data = df[df['race_id'] == race_id_int].copy()
 
         if len(race_data) == 0:
             return None, None
@@ -1093,12 +1438,13 @@ class KeibaGUIv3:
             headers = {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
             }
-            response = requests.get(url, headers=headers, timeout=10)
+            try:
+                # 確定済みの結果ページはHTTPキャッシュから返る
+                response = get_default_pool().get(url, headers=headers)
+            except requests.exceptions.HTTPError as e:
+                return None, {'error': 'http_error', 'status_code': e.response.status_code}
             response.encoding = response.apparent_encoding
 
-            if response.status_code != 200:
-                return None, {'error': 'http_error', 'status_code': response.status_code}
-
             soup = BeautifulSoup(response.text, 'html.parser')
 
             race_info = {}
@@ -1341,423 +1687,388 @@ class KeibaGUIv3:
             return None, {'error': 'exception', 'message': str(e)}
 
     def predict_race(self):
-        """レース予想"""
+        """レース予想（複数のレースIDを空白・カンマ区切りで入力するとまとめてキューに入れる）"""
         if not BACKTEST_AVAILABLE:
             messagebox.showerror("エラー", "バックテストモジュールが読み込まれていません")
             return
 
-        race_id = self.race_id_entry.get().strip()
+        race_ids = [r for r in re.split(r'[\s,、]+', self.race_id_entry.get().strip()) if r]
 
-        if not race_id:
+        if not race_ids:
             messagebox.showerror("エラー", "レースIDを入力してください")
             return
 
-        self.status_label.config(text=f"予想中... レースID: {race_id}")
         # テーブルとレース情報をクリア
         for item in self.result_tree.get_children():
             self.result_tree.delete(item)
         self.race_info_label.config(text="レース情報取得中...")
-        self.predict_button.config(state=tk.DISABLED)
         self.progress['value'] = 0
-        self.root.update()
 
+        # 複数レースは1つのジョブで順に予想する（並行に走らせると、テキスト出力が混ざり、
+        # 表示中の表と last_prediction が別々のレースのものになりうる）
+        # ※ 続けて投入した予想ジョブも _predict_lock で前のジョブの完了を待つ
+        self.jobs.submit(
+            f"予想 {', '.join(race_ids)}", self._predict_races_job, race_ids, self.auto_update.get(),
+            on_progress=self._on_job_progress,
+            on_cancelled=lambda job: self.status_label.config(text=f"予想を中止しました - {', '.join(race_ids)}"),
+            on_finished=self._on_job_finished,
+        )
+        self._update_job_status(f"予想中... レースID: {', '.join(race_ids)}")
+
+    def _predict_races_job(self, job, race_ids, auto_update):
+        """
+        入力されたレースを順に予想するワーカー処理
+
+        結果・エラーの表示はレースごとに job.post でメインスレッドに渡す（出力と同じキューなので、
+        各レースのテキストの後に、そのレースの表が入力順に表示される）。
+        先に投入した予想ジョブが実行中なら、終わるまで待つ。
+        """
+        import traceback
+        while not self._predict_lock.acquire(timeout=0.2):
+            job.check_cancelled()
         try:
-            # 出馬表取得
-            self.insert_text(f"{'='*80}\n", "header")
-            self.insert_text(f" レース予想 - {race_id}\n", "header")
-            self.insert_text(f"{'='*80}\n\n", "header")
+            for race_id in race_ids:
+                job.check_cancelled()
+                try:
+                    result = self._predict_race_job(job, race_id, auto_update)
+                except JobCancelled:
+                    raise
+                except Exception as e:
+                    job.post(self._on_predict_error, race_id, e, traceback.format_exc())
+                    continue
+                job.post(self._show_race_prediction, race_id, result)
+        finally:
+            self._predict_lock.release()
+
+    def _predict_race_job(self, job, race_id, auto_update):
+        """
+        レース予想のワーカー処理（出馬表取得・自動データ更新・特徴量計算・予測）
+
+        GUIには触らず、メッセージは job.post でメインスレッドに渡す。
+        auto_update はメインスレッドで読んだ自動データ更新の設定。
 
-            self.insert_text("[1] レースデータ取得中...\n")
-            self.progress['value'] = 10
-            self.root.update()
+        Returns:
+            dict（df_pred, race_info, has_odds）、レースが見つからなければ None
+        """
+        def insert_text(text, tag=None):
+            job.post(self.insert_text, text, tag)
+
+        # 出馬表取得
+        insert_text(f"{'='*80}\n", "header")
+        insert_text(f" レース予想 - {race_id}\n", "header")
+        insert_text(f"{'='*80}\n\n", "header")
+
+        insert_text("[1] レースデータ取得中...\n")
+        job.progress(10, f"予想中... {race_id} レースデータ取得中")
 
-            # まず出馬表ページを試行
-            horses, race_info = self.scrape_shutuba(race_id)
+        # まず出馬表ページを試行
+        horses, race_info = self.scrape_shutuba(race_id)
+
+        # オッズデータの有無を確認
+        has_odds = False
+        if horses:
+            has_odds = any(h.get('単勝オッズ', 0) > 0 for h in horses)
 
-            # オッズデータの有無を確認
-            has_odds = False
+        # 出馬表失敗時は結果ページを試行（オッズなしは許容）
+        if not horses or (race_info and race_info.get('error')):
+            job.check_cancelled()
+            insert_text("  出馬表なし → 結果ページを確認中...\n", "info")
+            horses, race_info = self.scrape_race_result(race_id)
+            # 結果ページでオッズを再確認
             if horses:
                 has_odds = any(h.get('単勝オッズ', 0) > 0 for h in horses)
 
-            # 出馬表失敗時は結果ページを試行（オッズなしは許容）
-            if not horses or (race_info and race_info.get('error')):
-                self.insert_text("  出馬表なし → 結果ページを確認中...\n", "info")
-                horses, race_info = self.scrape_race_result(race_id)
-                # 結果ページでオッズを再確認
-                if horses:
-                    has_odds = any(h.get('単勝オッズ', 0) > 0 for h in horses)
-
-            # それでも失敗時はデータベースを確認
-            if not horses or (race_info and race_info.get('error')):
-                self.insert_text("  結果ページなし → データベースを確認中...\n", "info")
-                horses, race_info = self.get_race_from_database(race_id)
-
-                if not horses:
-                    self.insert_text("\nレースが見つかりませんでした。\n", "error")
-                    self.insert_text("• 未来のレース: netkeibaで出馬表が公開されているか確認\n", "error")
-                    self.insert_text("• 過去のレース: データベースに存在するレースIDを使用\n", "error")
-                    self.insert_text("\nデータベース内のレース例:\n", "info")
-                    sample_races = self.df.groupby('race_id').first().sample(5)
-                    for rid in sample_races.index:
-                        self.insert_text(f"  {rid}\n", "info")
-                    self.status_label.config(text="エラー: レースが見つかりません")
-                    return
-                else:
-                    self.insert_text("  データベースからレース情報を取得しました\n", "success")
-
-            self.insert_text(f"  {len(horses)}頭の出馬を確認\n", "success")
-            if race_info.get('race_name'):
-                self.insert_text(f"  レース名: {race_info['race_name']}\n")
-            if race_info.get('track_name'):
-                self.insert_text(f"  競馬場: {race_info['track_name']}\n")
-            if race_info.get('course_type') and race_info.get('distance'):
-                self.insert_text(f"  コース: {race_info['course_type']}{race_info['distance']}m\n")
-            if race_info.get('track_condition'):
-                self.insert_text(f"  馬場状態: {race_info['track_condition']}\n")
-            if race_info.get('date'):
-                self.insert_text(f"  日付: {race_info['date']}\n")
-            if race_info.get('from_database'):
-                self.insert_text("  ソース: データベース（過去レース）\n", "info")
-            elif race_info.get('from_result'):
-                self.insert_text("  ソース: netkeiba結果ページ（過去レース・オッズあり）\n", "info")
+        # それでも失敗時はデータベースを確認
+        if not horses or (race_info and race_info.get('error')):
+            insert_text("  結果ページなし → データベースを確認中...\n", "info")
+            horses, race_info = self.get_race_from_database(race_id)
+
+            if not horses:
+                insert_text("\nレースが見つかりませんでした。\n", "error")
+                insert_text("• 未来のレース: netkeibaで出馬表が公開されているか確認\n", "error")
+                insert_text("• 過去のレース: データベースに存在するレースIDを使用\n", "error")
+                insert_text("\nデータベース内のレース例:\n", "info")
+                sample_races = self.df.groupby('race_id').first().sample(5)
+                for rid in sample_races.index:
+                    insert_text(f"  {rid}\n", "info")
+                return None
             else:
-                self.insert_text("  ソース: netkeiba出馬表（未来レース）\n", "info")
+                insert_text("  データベースからレース情報を取得しました\n", "success")
+
+        job.check_cancelled()
+
+        insert_text(f"  {len(horses)}頭の出馬を確認\n", "success")
+        if race_info.get('race_name'):
+            insert_text(f"  レース名: {race_info['race_name']}\n")
+        if race_info.get('track_name'):
+            insert_text(f"  競馬場: {race_info['track_name']}\n")
+        if race_info.get('course_type') and race_info.get('distance'):
+            insert_text(f"  コース: {race_info['course_type']}{race_info['distance']}m\n")
+        if race_info.get('track_condition'):
+            insert_text(f"  馬場状態: {race_info['track_condition']}\n")
+        if race_info.get('date'):
+            insert_text(f"  日付: {race_info['date']}\n")
+        if race_info.get('from_database'):
+            insert_text("  ソース: データベース（過去レース）\n", "info")
+        elif race_info.get('from_result'):
+            insert_text("  ソース: netkeiba結果ページ（過去レース・オッズあり）\n", "info")
+        else:
+            insert_text("  ソース: netkeiba出馬表（未来レース）\n", "info")
 
-            # オッズの有無を表示
-            if not has_odds:
-                self.insert_text("  ⚠ オッズ未発表（予測は可能、期待値計算は不可）\n", "warning")
+        # オッズの有無を表示
+        if not has_odds:
+            insert_text("  ⚠ オッズ未発表（予測は可能、期待値計算は不可）\n", "warning")
 
-            self.insert_text("\n")
+        insert_text("\n")
 
-            self.progress['value'] = 20
-            self.root.update()
+        return self._predict_card(job, race_id, horses, race_info, has_odds, auto_update)
 
-            # 予測実行（ここから先は元のコードと同じ）
-            if self.model_win is None or self.df is None:
-                self.insert_text("モデルまたはデータが読み込まれていません\n", "error")
-                self.status_label.config(text="エラー: モデル未読み込み")
-                return
+    def _predict_card(self, job, race_id, horses, race_info, has_odds, auto_update):
+        """
+        取得済みの出馬表から予測（自動データ更新・特徴量計算・予測）
 
-            # レベル1: クイックチェック（DB未登録馬のみ自動更新）
-            # ※ warn_daysによる「データが古い」判定は誤検知が多い
-            #   （単に出走間隔が空いているだけの馬を更新対象にしてしまう）
-            #   → DB未登録馬(no_data)のみ自動更新対象とする
-            try:
-                from smart_update_system import quick_check_horses
-                check_result = quick_check_horses(horses, self.df, warn_days=180)
-
-                no_data = [w for w in check_result['warnings'] if w['type'] == 'no_data']
-                if no_data:
-                    self.insert_text("[2] データ状態チェック\n")
-                    self.insert_text(f"  ℹ {len(no_data)}頭: DB未登録（予測精度低）\n", "info")
-
-                    # DB未登録馬のみ自動更新
-                    if self.auto_update.get():
-                        no_data_ids = [w['horse_id'] for w in no_data]
-                        no_data_horses = [h for h in horses if h.get('horse_id') in no_data_ids]
-                        self.insert_text(f"  自動データ取得中... ({len(no_data_horses)}頭)\n", "info")
-                        try:
-                            from smart_update_system import batch_update_race_horses
-                            update_result = batch_update_race_horses(no_data_horses, self.df)
-                            if update_result['updated'] > 0:
-                                self.insert_text(f"  {update_result['updated']}頭の新規データを取得\n", "success")
-                            else:
-                                self.insert_text(f"  新規レースなし\n", "info")
-                        except Exception as e:
-                            self.insert_text(f"  自動更新エラー: {e}\n", "warning")
-                    self.insert_text("\n")
-            except ImportError:
-                pass  # スマート更新モジュールがない場合はスキップ
-
-            self.insert_text("[3] AI予測中...\n")
-
-            predictions = []
-            # pd.to_datetime互換のISO形式（'%Y年%m月%d日'はNaTになるため）
-            current_date = datetime.now().strftime('%Y-%m-%d')
-
-            # モデル特徴量リスト（ファイルから読み込み）
-            if self.model_features is None:
-                self.insert_text("モデル特徴量リストが読み込まれていません\n", "error")
-                return
-            model_features = self.model_features
+        予想ジョブと常駐予測サービス（prediction_service）で共通。
 
-            # 出走馬のhorse_idリスト（V3ペース予測用）
-            race_horses_ids = [h.get('horse_id') for h in horses if h.get('horse_id')]
+        Returns:
+            dict（df_pred, race_info, has_odds）
+        """
+        def insert_text(text, tag=None):
+            job.post(self.insert_text, text, tag)
 
-            total_horses = len(horses)
-            for i, horse in enumerate(horses):
-                self.progress['value'] = 20 + (60 * (i+1) / total_horses)
-                self.root.update()
+        job.progress(20, f"予想中... {race_id} データ状態チェック")
 
-                horse_id = horse['horse_id']
+        # 予測実行（ここから先は元のコードと同じ）
+        if self.model_win is None or self.df is None:
+            raise RuntimeError("モデルまたはデータが読み込まれていません")
 
-                if horse_id:
-                    # horse_idを数値に変換（スクレイピングでは文字列）
+        # レベル1: クイックチェック（DB未登録馬のみ自動更新）
+        # ※ warn_daysによる「データが古い」判定は誤検知が多い
+        #   （単に出走間隔が空いているだけの馬を更新対象にしてしまう）
+        #   → DB未登録馬(no_data)のみ自動更新対象とする
+        try:
+            from smart_update_system import quick_check_horses
+            check_result = quick_check_horses(horses, self.df, warn_days=180)
+
+            no_data = [w for w in check_result['warnings'] if w['type'] == 'no_data']
+            if no_data:
+                insert_text("[2] データ状態チェック\n")
+                insert_text(f"  ℹ {len(no_data)}頭: DB未登録（予測精度低）\n", "info")
+
+                # DB未登録馬のみ自動更新
+                if auto_update:
+                    no_data_ids = [w['horse_id'] for w in no_data]
+                    no_data_horses = [h for h in horses if h.get('horse_id') in no_data_ids]
+                    insert_text(f"  自動データ取得中... ({len(no_data_horses)}頭)\n", "info")
                     try:
-                        horse_id_num = float(horse_id)
-                    except:
-                        horse_id_num = None
-                        print(f"  NG horse_id変換失敗 [{horse['馬名']}]: {horse_id}")
+                        from smart_update_system import batch_update_race_horses
+                        update_result = batch_update_race_horses(no_data_horses, self.df)
+                        if update_result['updated'] > 0:
+                            insert_text(f"  {update_result['updated']}頭の新規データを取得\n", "success")
+                        else:
+                            insert_text(f"  新規レースなし\n", "info")
+                    except Exception as e:
+                        insert_text(f"  自動更新エラー: {e}\n", "warning")
+                insert_text("\n")
+        except ImportError:
+            pass  # スマート更新モジュールがない場合はスキップ
 
-                    if horse_id_num:
-                        # 実際の馬データから特徴量を計算
-                        # 常に対象レース自体を除外（リーケージ防止）
-                        try:
-                            race_id_int = int(race_id)
-                            horse_data = self.df[(self.df['horse_id'] == horse_id_num) & (self.df['race_id'] != race_id_int)]
-                        except:
-                            horse_data = self.df[self.df['horse_id'] == horse_id_num]
-
-                        # 日付順にソート（古い順）
-                        # 日付フォーマットが混在しているため、正規化してからソート
-                        if len(horse_data) > 0 and 'date' in horse_data.columns:
-                            def normalize_date(date_str):
-                                """日付を比較可能な形式に正規化"""
-                                import re
-                                s = str(date_str)
-                                # 2025年01月05日 → 2025-01-05
-                                match = re.search(r'(\d{4})年(\d{1,2})月(\d{1,2})日', s)
-                                if match:
-                                    return f"{match.group(1)}-{match.group(2).zfill(2)}-{match.group(3).zfill(2)}"
-                                # 2025-01-05 00:00:00 → 2025-01-05
-                                match = re.search(r'(\d{4}-\d{2}-\d{2})', s)
-                                if match:
-                                    return match.group(1)
-                                return s
-                            horse_data = horse_data.copy()
-                            horse_data['date_normalized'] = horse_data['date'].apply(normalize_date)
-                            horse_data = horse_data.sort_values('date_normalized', ascending=True)
-                    else:
-                        horse_data = pd.DataFrame()  # 空のDataFrame
+        job.check_cancelled()
+        insert_text("[3] AI予測中...\n")
 
-                    if len(horse_data) > 0:
-                        # 枠番を数値化
-                        try:
-                            waku_num = int(horse['枠番'])
-                        except:
-                            waku_num = None
-                        # 枠番をrace_infoに追加（V3特徴量用）
-                        race_info['waku'] = waku_num
-
-                        # 特徴量計算（horse_dataをprefiltered引数で渡す）
-                        # ※ self.dfのdate列が日本語形式('2025年01月05日')のため、
-                        #   calculate_horse_features_dynamic内部のpd.to_datetimeが
-                        #   NaTを返し全レコードが除外される問題を回避
-                        try:
-                            features = calculate_horse_features_dynamic(
-                                horse_id, self.df, current_date, self.sire_stats,
-                                self.trainer_jockey_stats,
-                                horse.get('調教師'), horse.get('騎手'),
-                                race_info.get('track_name'),
-                                race_info.get('distance'),
-                                race_info.get('course_type'),
-                                race_info.get('track_condition'),
-                                waku_num,
-                                race_id=race_id,
-                                horse_races_prefiltered=horse_data
-                            )
-                        except Exception as e:
-                            print(f"特徴量計算エラー [{horse['馬名']}]: {e}")
-                            import traceback
-                            traceback.print_exc()
-                            features = None
-
-                        if features:
-                            # Phase 10新規特徴量を追加
-                            if PHASE10_AVAILABLE:
-                                features = self._add_phase10_features(
-                                    features, horse_id_num, current_date, race_info
-                                )
-                            # V3新規特徴量を追加（ペース予測、コースバイアス、フォームサイクル）
-                            if PHASE11_V3_AVAILABLE and self.pace_predictor:
-                                features = self._add_v3_features(
-                                    features, horse_id_num, race_horses_ids, race_info
-                                )
-                            # V4新規特徴量を追加（馬場バイアス、天気×血統、展開予測、距離適性）
-                            if PHASE12_V4_AVAILABLE and self.track_bias_analyzer:
-                                features = self._add_v4_features(
-                                    features, horse, horse_id_num, race_horses_ids, race_info
-                                )
-                            # 特徴量の信頼性チェック
-                            non_zero_count = sum(1 for v in features.values() if v != 0 and v != 0.0)
-                            feature_reliability = non_zero_count / len(features) if features else 0
-                            print(f"  OK 特徴量計算成功 [{horse['馬名']}]: {len(features)}個 (有効: {non_zero_count}個, 信頼度: {feature_reliability*100:.0f}%)")
-                        else:
-                            print(f"  NG 特徴量がNone [{horse['馬名']}]")
-                            features = None
-                    else:
-                        print(f"  NG 馬データなし [{horse['馬名']}] (horse_id: {horse_id})")
-                        features = None
-                else:
-                    print(f"  NG horse_id取得失敗 [{horse['馬名']}]")
-                    features = None
+        # モデル特徴量リスト（ファイルから読み込み）
+        if self.model_features is None:
+            raise RuntimeError("モデル特徴量リストが読み込まれていません")
 
-                # 特徴量が取得できなかった場合はデフォルト値
-                if features is None:
-                    print(f"  デフォルト値使用 [{horse['馬名']}]")
-                    features = {feat: 0 for feat in model_features}
-                    features['total_starts'] = 10
-                    features['total_win_rate'] = 0.1
-                else:
-                    # 不足している特徴量は0で埋める
-                    for feat in model_features:
-                        if feat not in features:
-                            features[feat] = 0
-
-                feat_df = pd.DataFrame([features])[model_features].fillna(0)
-
-                # デバッグ: 特徴量の状態を確認
-                if i == 0:  # 最初の馬だけ出力
-                    print(f"\n[デバッグ] 最初の馬の特徴量:")
-                    print(f"  features辞書のキー数: {len(features)}")
-                    print(f"  feat_df shape: {feat_df.shape}")
-                    non_zero = (feat_df.iloc[0] != 0).sum()
-                    print(f"  非ゼロの特徴量数: {non_zero}/{len(model_features)}")
-                    print(f"  主要特徴量:")
-                    for key in ['total_starts', 'total_win_rate', 'trainer_win_rate', 'jockey_win_rate']:
-                        val = feat_df[key].iloc[0] if key in feat_df.columns else 'N/A'
-                        print(f"    {key}: {val}")
-                    print()
-
-                # 予測
-                pred_win_proba = self.model_win.predict_proba(feat_df)[0, 1]
-                pred_top3_proba = self.model_top3.predict_proba(feat_df)[0, 1]
-
-                # デバッグ: 予測結果を確認
-                if i == 0:  # 最初の馬だけ出力
-                    print(f"  予測結果:")
-                    print(f"    勝率予測: {pred_win_proba:.6f} ({pred_win_proba*100:.3f}%)")
-                    print(f"    複勝予測: {pred_top3_proba:.6f} ({pred_top3_proba*100:.3f}%)")
-                    print()
-
-                # オッズが存在する場合のみ期待値とバリューを計算
-                odds = horse.get('単勝オッズ', 0)
-                expected_value = pred_win_proba * odds if odds > 0 else 0
-                # バリュー = モデル確率 - オッズ暗示確率（正なら割安）
-                value = pred_win_proba - (1.0 / odds) if odds > 0 else 0
-
-                # 馬の過去成績サマリー
-                stats_summary = ""
-                if horse_id and len(horse_data) > 0:
-                    total_races = len(horse_data)
-                    wins = (horse_data['rank'] == 1).sum()
-                    top3 = (horse_data['rank'] <= 3).sum()
-                    recent_5 = horse_data.tail(5)
-                    # 着順を整数に変換（NaNは除外）、新しい順に並べ替え
-                    recent_ranks = [int(r) for r in recent_5['rank'].tolist() if pd.notna(r)]
-                    recent_ranks = recent_ranks[::-1]  # 新しい順に並べ替え
-                    stats_summary = f"{total_races}戦{wins}勝{top3}着内 直近:{recent_ranks}"
-
-                # 特徴量信頼度を計算（デフォルト値使用時は低い）
-                feat_non_zero = (feat_df.iloc[0] != 0).sum()
-                feat_reliability = feat_non_zero / len(model_features)
-
-                predictions.append({
-                    '馬番': horse['馬番'],
-                    '枠番': horse.get('枠番', ''),
-                    '馬名': horse['馬名'],
-                    'horse_id': horse['horse_id'],
-                    '性齢': horse.get('性齢', ''),
-                    '斤量': horse.get('斤量', ''),
-                    '騎手': horse['騎手'],
-                    '馬体重': horse.get('馬体重', ''),
-                    'オッズ': horse.get('単勝オッズ', 0.0),
-                    '勝率予測': pred_win_proba,
-                    '複勝予測': pred_top3_proba,
-                    '期待値': expected_value,
-                    'バリュー': value,
-                    'データあり': horse_id is not None,
-                    '過去成績': stats_summary,
-                    '実際の着順': horse.get('実際の着順'),
-                    '特徴量信頼度': feat_reliability
-                })
+        def on_progress(done, total):
+            job.check_cancelled()
+            job.progress(20 + (60 * done / total), f"予想中... {race_id} 特徴量計算 {done}/{total}頭")
 
-            self.progress['value'] = 80
-            self.root.update()
+        # 全頭の特徴量を1つの行列にまとめ、各モデル1回の predict で予測
+        feat_df, horse_histories = self._build_race_features(
+            horses, race_id, race_info, on_progress=on_progress
+        )
+        win_proba, top3_proba = self._score_race(feat_df)
 
-            # 予測結果をDataFrameに
-            df_pred = pd.DataFrame(predictions)
-            df_pred = df_pred.sort_values('勝率予測', ascending=False)
+        job.progress(80, f"予想中... {race_id} 結果表示")
+        df_pred = self._prediction_frame(horses, feat_df, horse_histories, win_proba, top3_proba)
 
-            # 結果を保存
-            self.last_prediction = df_pred.copy()
-            self.last_race_id = race_id
-            self.last_race_info = race_info
-            self.last_has_odds = has_odds
-            self.export_button.config(state=tk.NORMAL)
+        return {'df_pred': df_pred, 'race_info': race_info, 'has_odds': has_odds}
 
-            # レース情報をラベルに表示
-            # race_idデコードで補完（スクレイピング時もrace_numなどを補う）
-            decoded = self._decode_race_id(race_id)
-            disp_track = race_info.get('track_name', '')
-            if not disp_track and decoded:
-                disp_track = decoded['track_name']
-            disp_race_num = race_info.get('race_num') or (decoded['race_num'] if decoded else None)
-
-            info_text = f"【{race_id}】"
-            if disp_track:
-                info_text += f"{disp_track}"
-            if disp_race_num:
-                info_text += f" {disp_race_num}R"
-            if race_info.get('race_name'):
-                info_text += f" {race_info['race_name']}"
-            info_text += " |"
-            if decoded:
-                info_text += f" {decoded['kai']}回{decoded['day']}日"
-            if race_info.get('course_type') and race_info.get('distance'):
-                info_text += f" {race_info['course_type']}{race_info['distance']}m"
-            if race_info.get('track_condition'):
-                info_text += f" 馬場:{race_info['track_condition']}"
-            if race_info.get('start_time'):
-                info_text += f" 発走{race_info['start_time']}"
-
-            # 推奨馬券
-            top1 = df_pred.iloc[0]
-            info_text += f"\n\n◎本命: {top1['馬番']}番 {top1['馬名']} (勝率{top1['勝率予測']*100:.1f}%)"
-            if len(df_pred) > 1:
-                top2 = df_pred.iloc[1]
-                info_text += f"  ○対抗: {top2['馬番']}番 {top2['馬名']}"
-            if len(df_pred) > 2:
-                top3 = df_pred.iloc[2]
-                info_text += f"  ▲単穴: {top3['馬番']}番 {top3['馬名']}"
+    def _prediction_frame(self, horses, feat_df, horse_histories, win_proba, top3_proba):
+        """
+        1レース分の予測結果表（馬ごとの勝率・複勝率・期待値・バリュー・過去成績、勝率予測の高い順）
+        """
+        feat_reliability = ((feat_df != 0).sum(axis=1) / len(self.model_features)).to_numpy()
+
+        predictions = []
+        for i, horse in enumerate(horses):
+            pred_win_proba = win_proba[i]
+            pred_top3_proba = top3_proba[i]
+            horse_data = horse_histories[i]
+            horse_id = horse['horse_id']
+
+            # オッズが存在する場合のみ期待値とバリューを計算
+            odds = horse.get('単勝オッズ', 0)
+            expected_value = pred_win_proba * odds if odds > 0 else 0
+            # バリュー = モデル確率 - オッズ暗示確率（正なら割安）
+            value = pred_win_proba - (1.0 / odds) if odds > 0 else 0
+
+            # 馬の過去成績サマリー
+            stats_summary = ""
+            if horse_id and len(horse_data) > 0:
+                total_races = len(horse_data)
+                wins = (horse_data['rank'] == 1).sum()
+                top3 = (horse_data['rank'] <= 3).sum()
+                recent_5 = horse_data.tail(5)
+                # 着順を整数に変換（NaNは除外）、新しい順に並べ替え
+                recent_ranks = [int(r) for r in recent_5['rank'].tolist() if pd.notna(r)]
+                recent_ranks = recent_ranks[::-1]  # 新しい順に並べ替え
+                stats_summary = f"{total_races}戦{wins}勝{top3}着内 直近:{recent_ranks}"
+
+            predictions.append({
+                '馬番': horse['馬番'],
+                '枠番': horse.get('枠番', ''),
+                '馬名': horse['馬名'],
+                'horse_id': horse['horse_id'],
+                '性齢': horse.get('性齢', ''),
+                '斤量': horse.get('斤量', ''),
+                '騎手': horse['騎手'],
+                '馬体重': horse.get('馬体重', ''),
+                'オッズ': horse.get('単勝オッズ', 0.0),
+                '勝率予測': pred_win_proba,
+                '複勝予測': pred_top3_proba,
+                '期待値': expected_value,
+                'バリュー': value,
+                'データあり': horse_id is not None,
+                '過去成績': stats_summary,
+                '実際の着順': horse.get('実際の着順'),
+                '特徴量信頼度': feat_reliability[i]
+            })
 
-            if not has_odds:
-                info_text += "\n⚠ オッズ未発表（期待値計算不可）"
+        # 予測結果をDataFrameに
+        df_pred = pd.DataFrame(predictions)
+        df_pred = df_pred.sort_values('勝率予測', ascending=False)
+        return df_pred
 
-            self.race_info_label.config(text=info_text)
+    def _show_race_prediction(self, race_id, result):
+        """レース予想の結果を表示（メインスレッド）"""
+        if result is None:
+            self.status_label.config(text=f"エラー: レースが見つかりません - {race_id}")
+            return
 
-            # テーブルに結果を表示
-            self.last_sort_column = '勝率予測'
-            self.update_result_tree(df_pred)
+        df_pred = result['df_pred']
+        race_info = result['race_info']
+        has_odds = result['has_odds']
 
-            # 推奨馬券を表示
-            self.update_recommended_bets(df_pred, has_odds)
+        # 結果を保存
+        self.last_prediction = df_pred.copy()
+        self.last_race_id = race_id
+        self.last_race_info = race_info
+        self.last_has_odds = has_odds
+        self.export_button.config(state=tk.NORMAL)
 
-            # 統計・分析ボタンを有効化
-            self.stats_viz_button.config(state=tk.NORMAL)
-            self.detail_analysis_button.config(state=tk.NORMAL)
+        # レース情報をラベルに表示
+        # race_idデコードで補完（スクレイピング時もrace_numなどを補う）
+        decoded = self._decode_race_id(race_id)
+        disp_track = race_info.get('track_name', '')
+        if not disp_track and decoded:
+            disp_track = decoded['track_name']
+        disp_race_num = race_info.get('race_num') or (decoded['race_num'] if decoded else None)
+
+        info_text = f"【{race_id}】"
+        if disp_track:
+            info_text += f"{disp_track}"
+        if disp_race_num:
+            info_text += f" {disp_race_num}R"
+        if race_info.get('race_name'):
+            info_text += f" {race_info['race_name']}"
+        info_text += " |"
+        if decoded:
+            info_text += f" {decoded['kai']}回{decoded['day']}日"
+        if race_info.get('course_type') and race_info.get('distance'):
+            info_text += f" {race_info['course_type']}{race_info['distance']}m"
+        if race_info.get('track_condition'):
+            info_text += f" 馬場:{race_info['track_condition']}"
+        if race_info.get('start_time'):
+            info_text += f" 発走{race_info['start_time']}"
 
-            # 完了
-            self.progress['value'] = 100
-            self.status_label.config(text=f"予想完了 - {race_id} (列ヘッダークリックでソート)")
+        # 推奨馬券
+        top1 = df_pred.iloc[0]
+        info_text += f"\n\n◎本命: {top1['馬番']}番 {top1['馬名']} (勝率{top1['勝率予測']*100:.1f}%)"
+        if len(df_pred) > 1:
+            top2 = df_pred.iloc[1]
+            info_text += f"  ○対抗: {top2['馬番']}番 {top2['馬名']}"
+        if len(df_pred) > 2:
+            top3 = df_pred.iloc[2]
+            info_text += f"  ▲単穴: {top3['馬番']}番 {top3['馬名']}"
 
-        except Exception as e:
-            # エラー発生時
-            import traceback
-            error_msg = f"予想処理中にエラーが発生しました:\n{str(e)}\n\n{traceback.format_exc()}"
-            self.insert_text(f"\n{'='*80}\n", "error")
-            self.insert_text("エラー発生\n", "error")
-            self.insert_text(f"{'='*80}\n", "error")
-            self.insert_text(f"{error_msg}\n", "error")
-            self.status_label.config(text=f"エラー - {race_id}")
-            messagebox.showerror("予想エラー", f"予想処理中にエラーが発生しました:\n\n{str(e)}")
+        if not has_odds:
+            info_text += "\n⚠ オッズ未発表（期待値計算不可）"
 
-        finally:
-            # 必ず実行：ボタンを有効化
-            self.predict_button.config(state=tk.NORMAL)
-            # 進行バーが中途半端な場合は0にリセット
-            if self.progress['value'] < 100 and self.progress['value'] > 0:
-                self.progress['value'] = 0
+        self.race_info_label.config(text=info_text)
+
+        # テーブルに結果を表示
+        self.last_sort_column = '勝率予測'
+        self.update_result_tree(df_pred)
+
+        # 推奨馬券を表示
+        self.update_recommended_bets(df_pred, has_odds)
+
+        # 統計・分析ボタンを有効化
+        self.stats_viz_button.config(state=tk.NORMAL)
+        self.detail_analysis_button.config(state=tk.NORMAL)
+
+        # 完了
+        self.progress['value'] = 100
+        self.status_label.config(text=f"予想完了 - {race_id} (列ヘッダークリックでソート)")
+
+    def _on_predict_error(self, race_id, exc, tb):
+        """レース予想のエラー表示（メインスレッド）"""
+        error_msg = f"予想処理中にエラーが発生しました:\n{str(exc)}\n\n{tb}"
+        self.insert_text(f"\n{'='*80}\n", "error")
+        self.insert_text("エラー発生\n", "error")
+        self.insert_text(f"{'='*80}\n", "error")
+        self.insert_text(f"{error_msg}\n", "error")
+        self.status_label.config(text=f"エラー - {race_id}")
+        messagebox.showerror("予想エラー", f"予想処理中にエラーが発生しました:\n\n{str(exc)}")
+
+    # ================================================================
+    # バックグラウンドジョブの状態表示
+    # ================================================================
+
+    def _on_job_progress(self, job, value, text):
+        """ジョブの進捗をプログレスバー・ステータスに反映"""
+        if value is not None:
+            self.progress['value'] = value
+        if text:
+            self._update_job_status(text)
+
+    def _on_job_finished(self, job):
+        """ジョブ終了時: 残りのジョブ数を表示し、全て終わったら進行バーを戻す"""
+        active = self.jobs.active_jobs()
+        if active:
+            self._update_job_status(self.status_label.cget("text").split(" [")[0])
+        elif 0 < self.progress['value'] < 100:
+            self.progress['value'] = 0
+        self.cancel_button.config(state=tk.NORMAL if active else tk.DISABLED)
+
+    def _update_job_status(self, text):
+        """ステータスに実行中のジョブ数を添えて表示"""
+        num_active = len(self.jobs.active_jobs())
+        if num_active > 1:
+            text = f"{text} [実行中 {num_active}件]"
+        self.status_label.config(text=text)
+        self.cancel_button.config(state=tk.NORMAL if num_active else tk.DISABLED)
+
+    def cancel_jobs(self):
+        """実行中・待機中の全ジョブを中止"""
+        num = self.jobs.cancel_all()
+        self.status_label.config(text=f"中止を要求しました（{num}件）")
+
+    def on_closing(self):
+        """ウィンドウを閉じるときは実行中のジョブに中止を要求してから終了"""
+        self.jobs.shutdown()
+        self.root.destroy()
 
     def _old_display_code_removed(self):
         """旧表示コード（削除済み）"""
@@ -1941,7 +2252,7 @@ class KeibaGUIv3:
         if current == "レース情報: 未取得":
             current = ""
         self.race_info_label.config(text=current + text)
-        self.root.update()
+        self.root.update_idletasks()
 
     def update_race_data(self):
         """レベル2: このレースの出走馬のデータを一括更新"""
@@ -1956,50 +2267,69 @@ class KeibaGUIv3:
         self.insert_text(f"{'='*80}\n\n", "header")
 
         self.update_button.config(state=tk.DISABLED)
-        self.status_label.config(text="データ更新中...")
 
-        try:
-            # レース情報を取得
-            self.insert_text(f"[1] レース情報取得中... (ID: {race_id})\n")
+        def on_done(job, result):
+            if result is not None:
+                messagebox.showinfo("完了", f"データ更新完了\n成功: {result['updated']}頭")
 
-            horses, race_info = self.scrape_shutuba(race_id)
+        def on_error(job, exc, tb):
+            self.insert_text(f"\nエラー: {exc}\n", "error")
+            messagebox.showerror("エラー", f"データ更新に失敗しました:\n{exc}")
 
-            if not horses or (race_info and race_info.get('error')):
-                horses, race_info = self.scrape_race_result(race_id)
+        def on_finished(job):
+            self.update_button.config(state=tk.NORMAL)
+            self.status_label.config(text="待機中")
+            self._on_job_finished(job)
 
-            if not horses or (race_info and race_info.get('error')):
-                horses, race_info = self.get_race_from_database(race_id)
+        self.jobs.submit(f"データ更新 {race_id}", self._update_race_data_job, race_id,
+                         on_progress=self._on_job_progress, on_done=on_done,
+                         on_error=on_error, on_finished=on_finished)
+        self._update_job_status("データ更新中...")
 
-            if not horses:
-                self.insert_text("レースが見つかりませんでした\n", "error")
-                self.update_button.config(state=tk.NORMAL)
-                return
+    def _update_race_data_job(self, job, race_id):
+        """
+        レース単位データ更新のワーカー処理
+
+        Returns:
+            batch_update_race_horses の結果、レースが見つからなければ None
+        """
+        def insert_text(text, tag=None):
+            job.post(self.insert_text, text, tag)
 
-            self.insert_text(f"  {len(horses)}頭の出走馬を確認\n", "success")
-            self.insert_text("\n")
+        # レース情報を取得
+        insert_text(f"[1] レース情報取得中... (ID: {race_id})\n")
 
-            # レベル2更新を実行
-            from smart_update_system import batch_update_race_horses
+        horses, race_info = self.scrape_shutuba(race_id)
 
-            self.insert_text("[2] 一括データ更新開始...\n")
-            result = batch_update_race_horses(horses, self.df)
+        if not horses or (race_info and race_info.get('error')):
+            job.check_cancelled()
+            horses, race_info = self.scrape_race_result(race_id)
 
-            self.insert_text(f"\n更新完了!\n", "success")
-            self.insert_text(f"  成功: {result['updated']}頭\n", "success")
-            self.insert_text(f"  新規なし: {result['failed']}頭\n", "info")
+        if not horses or (race_info and race_info.get('error')):
+            horses, race_info = self.get_race_from_database(race_id)
 
-            if result['updated'] > 0:
-                self.insert_text(f"\n💡 注意: データベースへの反映は手動で行ってください\n", "warning")
+        if not horses:
+            insert_text("レースが見つかりませんでした\n", "error")
+            return None
 
-            messagebox.showinfo("完了", f"データ更新完了\n成功: {result['updated']}頭")
+        insert_text(f"  {len(horses)}頭の出走馬を確認\n", "success")
+        insert_text("\n")
+        job.check_cancelled()
 
-        except Exception as e:
-            self.insert_text(f"\nエラー: {e}\n", "error")
-            messagebox.showerror("エラー", f"データ更新に失敗しました:\n{e}")
+        # レベル2更新を実行
+        from smart_update_system import batch_update_race_horses
 
-        finally:
-            self.update_button.config(state=tk.NORMAL)
-            self.status_label.config(text="待機中")
+        insert_text("[2] 一括データ更新開始...\n")
+        result = batch_update_race_horses(horses, self.df)
+
+        insert_text(f"\n更新完了!\n", "success")
+        insert_text(f"  成功: {result['updated']}頭\n", "success")
+        insert_text(f"  新規なし: {result['failed']}頭\n", "info")
+
+        if result['updated'] > 0:
+            insert_text(f"\n💡 注意: データベースへの反映は手動で行ってください\n", "warning")
+
+        return result
 
     def export_results(self):
         """予測結果をCSVエクスポート"""
@@ -2124,28 +2454,43 @@ class KeibaGUIv3:
             traceback.print_exc()
             return []
 
-    def _predict_race_for_win5(self, race_id):
-        """WIN5用にレース予測を実行（predict_race()と同等の分析品質）
+    def _fetch_race_card(self, race_id):
+        """出馬表を取得（出馬表 -> 結果ページ -> DB の順にフォールバック）
 
-        predict_race()と同じスマートデータ更新 + 特徴量計算パイプラインを使用。
-        GUI テーブル/テキストへの書き込みは行わないが、コンソールにログ出力する。
+        GUIには触らないので、ワーカースレッドから並行して呼び出せる（WIN5・開催日一括予想）。
 
         Returns:
-            (df_pred, race_info) or (None, None)
+            (horses, race_info)
         """
-        print(f"\n[WIN5] ========== 予測開始: {race_id} ==========")
-
-        # 出馬表取得（フォールバック付き）
         horses, race_info = self.scrape_shutuba(race_id)
 
         if not horses or (race_info and race_info.get('error')):
-            print(f"[WIN5] 出馬表なし -> 結果ページ試行: {race_id}")
+            print(f"[INFO] 出馬表なし -> 結果ページ試行: {race_id}")
             horses, race_info = self.scrape_race_result(race_id)
 
         if not horses or (race_info and race_info.get('error')):
-            print(f"[WIN5] 結果ページなし -> DB試行: {race_id}")
+            print(f"[INFO] 結果ページなし -> DB試行: {race_id}")
             horses, race_info = self.get_race_from_database(race_id)
 
+        return horses, race_info
+
+    def _predict_race_for_win5(self, race_id, card=None):
+        """WIN5用にレース予測を実行（predict_race()と同等の分析品質）
+
+        predict_race()と同じ特徴量計算パイプラインを使用。
+        GUI テーブル/テキストへの書き込みは行わないので、5レグをワーカースレッドで並行して実行できる。
+
+        Args:
+            race_id: 対象レースID
+            card: 取得済みの (horses, race_info)（省略時はここで取得）
+
+        Returns:
+            (df_pred, race_info) or (None, None)
+        """
+        print(f"\n[WIN5] ========== 予測開始: {race_id} ==========")
+
+        horses, race_info = card if card is not None else self._fetch_race_card(race_id)
+
         if not horses:
             print(f"[WIN5] レース取得失敗: {race_id}")
             return None, None
@@ -2163,161 +2508,32 @@ class KeibaGUIv3:
         # ============================================================
         # データ状態チェック（警告ログのみ、更新はrun_win5側で一括実行済み）
         # ============================================================
-        no_data_count = 0
+        horse_ids = []
         for horse in horses:
-            horse_id = horse.get('horse_id')
-            if horse_id:
-                try:
-                    horse_id_num = float(horse_id)
-                    horse_data = self.df[self.df['horse_id'] == horse_id_num]
-                    if len(horse_data) == 0:
-                        no_data_count += 1
-                        print(f"[WIN5]   データなし: {horse.get('馬名', '?')} (ID: {horse_id})")
-                except (ValueError, TypeError):
-                    pass
+            try:
+                horse_ids.append((horse.get('馬名', '?'), float(horse.get('horse_id'))))
+            except (ValueError, TypeError):
+                pass
+        df, _ = self._data_snapshot()
+        known_ids = set(df.loc[df['horse_id'].isin([h for _, h in horse_ids]), 'horse_id'])
+        no_data_count = 0
+        for name, horse_id_num in horse_ids:
+            if horse_id_num not in known_ids:
+                no_data_count += 1
+                print(f"[WIN5]   データなし: {name} (ID: {horse_id_num:.0f})")
         if no_data_count > 0:
             print(f"[WIN5] {no_data_count}頭がDB未登録（デフォルト値で予測）")
 
         # ============================================================
-        # AI予測（predict_race() 1366-1562行と同等）
+        # AI予測（predict_race() と同じ特徴量行列 + 一括予測）
         # ============================================================
-        model_features = self.model_features
-        # pd.to_datetime互換のISO形式（'2026年02月01日'形式はNaTになるため）
-        current_date = datetime.now().strftime('%Y-%m-%d')
-        race_horses_ids = [h.get('horse_id') for h in horses if h.get('horse_id')]
+        feat_df, _ = self._build_race_features(horses, race_id, race_info, log_prefix='[WIN5] ')
+        win_proba, top3_proba = self._score_race(feat_df)
 
         predictions = []
-        total_horses = len(horses)
         for i, horse in enumerate(horses):
-            horse_id = horse.get('horse_id')
-            features = None
-
-            if horse_id:
-                try:
-                    horse_id_num = float(horse_id)
-                except (ValueError, TypeError):
-                    horse_id_num = None
-                    print(f"[WIN5]   NG horse_id変換失敗 [{horse.get('馬名', '?')}]: {horse_id}")
-
-                if horse_id_num is not None:
-                    # 対象レース自体を除外（リーケージ防止）
-                    try:
-                        race_id_int = int(race_id)
-                        horse_data = self.df[(self.df['horse_id'] == horse_id_num) & (self.df['race_id'] != race_id_int)]
-                    except (ValueError, TypeError):
-                        horse_data = self.df[self.df['horse_id'] == horse_id_num]
-
-                    # 日付順にソート
-                    if len(horse_data) > 0 and 'date' in horse_data.columns:
-                        def normalize_date(date_str):
-                            s = str(date_str)
-                            match = re.search(r'(\d{4})年(\d{1,2})月(\d{1,2})日', s)
-                            if match:
-                                return f"{match.group(1)}-{match.group(2).zfill(2)}-{match.group(3).zfill(2)}"
-                            match = re.search(r'(\d{4}-\d{2}-\d{2})', s)
-                            if match:
-                                return match.group(1)
-                            return s
-                        horse_data = horse_data.copy()
-                        horse_data['date_normalized'] = horse_data['date'].apply(normalize_date)
-                        horse_data = horse_data.sort_values('date_normalized', ascending=True)
-                    else:
-                        horse_data = pd.DataFrame()
-
-                    if len(horse_data) > 0:
-                        try:
-                            waku_num = int(horse.get('枠番', 0))
-                        except (ValueError, TypeError):
-                            waku_num = None
-                        race_info['waku'] = waku_num
-
-                        # 特徴量計算（horse_dataをprefiltered引数で渡す）
-                        try:
-                            features = calculate_horse_features_dynamic(
-                                horse_id, self.df, current_date, self.sire_stats,
-                                self.trainer_jockey_stats,
-                                horse.get('調教師'), horse.get('騎手'),
-                                race_info.get('track_name'),
-                                race_info.get('distance'),
-                                race_info.get('course_type'),
-                                race_info.get('track_condition'),
-                                waku_num,
-                                race_id=race_id,
-                                horse_races_prefiltered=horse_data
-                            )
-                        except Exception as e:
-                            print(f"[WIN5]   特徴量計算エラー [{horse.get('馬名', '?')}]: {e}")
-                            import traceback
-                            traceback.print_exc()
-                            features = None
-
-                        if features:
-                            # Phase 10新規特徴量
-                            if PHASE10_AVAILABLE:
-                                features = self._add_phase10_features(
-                                    features, horse_id_num, current_date, race_info
-                                )
-                            # V3新規特徴量（ペース予測、コースバイアス、フォームサイクル）
-                            if PHASE11_V3_AVAILABLE and self.pace_predictor:
-                                features = self._add_v3_features(
-                                    features, horse_id_num, race_horses_ids, race_info
-                                )
-                            # V4新規特徴量（馬場バイアス、天気×血統、展開予測、距離適性）
-                            if PHASE12_V4_AVAILABLE and self.track_bias_analyzer:
-                                features = self._add_v4_features(
-                                    features, horse, horse_id_num, race_horses_ids, race_info
-                                )
-                            # 特徴量の信頼性チェック
-                            non_zero_count = sum(1 for v in features.values() if v != 0 and v != 0.0)
-                            feature_reliability = non_zero_count / len(features) if features else 0
-                            print(f"[WIN5]   OK [{horse.get('馬名', '?')}]: {len(features)}個 (有効: {non_zero_count}個, 信頼度: {feature_reliability*100:.0f}%)")
-                        else:
-                            print(f"[WIN5]   NG 特徴量がNone [{horse.get('馬名', '?')}]")
-                    else:
-                        print(f"[WIN5]   NG 馬データなし [{horse.get('馬名', '?')}] (horse_id: {horse_id})")
-                        features = None
-            else:
-                print(f"[WIN5]   NG horse_id取得失敗 [{horse.get('馬名', '?')}]")
-                features = None
-
-            # 特徴量が取得できなかった場合はデフォルト値
-            if features is None:
-                print(f"[WIN5]   デフォルト値使用 [{horse.get('馬名', '?')}]")
-                features = {feat: 0 for feat in model_features}
-                features['total_starts'] = 10
-                features['total_win_rate'] = 0.1
-            else:
-                for feat in model_features:
-                    if feat not in features:
-                        features[feat] = 0
-
-            feat_df = pd.DataFrame([features])[model_features].fillna(0)
-
-            # デバッグ: 最初の馬の特徴量を詳細出力
-            if i == 0:
-                print(f"\n[WIN5] 最初の馬の特徴量:")
-                print(f"  features辞書のキー数: {len(features)}")
-                print(f"  feat_df shape: {feat_df.shape}")
-                non_zero = (feat_df.iloc[0] != 0).sum()
-                print(f"  非ゼロの特徴量数: {non_zero}/{len(model_features)}")
-                for key in ['total_starts', 'total_win_rate', 'trainer_win_rate', 'jockey_win_rate']:
-                    val = feat_df[key].iloc[0] if key in feat_df.columns else 'N/A'
-                    print(f"    {key}: {val}")
-                print()
-
-            # 予測
-            pred_win_proba = self.model_win.predict_proba(feat_df)[0, 1]
-            pred_top3_proba = self.model_top3.predict_proba(feat_df)[0, 1]
-
-            # デバッグ: 最初の馬の予測結果
-            if i == 0:
-                print(f"  予測結果:")
-                print(f"    勝率予測: {pred_win_proba:.6f} ({pred_win_proba*100:.3f}%)")
-                print(f"    複勝予測: {pred_top3_proba:.6f} ({pred_top3_proba*100:.3f}%)")
-                print()
-
             odds = horse.get('単勝オッズ', 0)
-            expected_value = pred_win_proba * odds if odds > 0 else 0
+            expected_value = win_proba[i] * odds if odds > 0 else 0
 
             predictions.append({
                 '馬番': horse.get('馬番', ''),
@@ -2326,8 +2542,8 @@ class KeibaGUIv3:
                 'horse_id': horse.get('horse_id'),
                 '騎手': horse.get('騎手', ''),
                 'オッズ': odds,
-                '勝率予測': pred_win_proba,
-                '複勝予測': pred_top3_proba,
+                '勝率予測': win_proba[i],
+                '複勝予測': top3_proba[i],
                 '期待値': expected_value,
             })
 
@@ -2343,99 +2559,117 @@ class KeibaGUIv3:
     def _calculate_win5_strategy(self, leg_results, budget_points):
         """WIN5購入戦略を計算
 
+        各レグの全出走馬の勝率から、予算点数内の全ての頭数配分を調べて
+        全的中確率が最大の配分（optimal）を求める。オッズが全レグで取れていれば
+        期待払戻（単勝オッズの積を払戻の目安とする） - 購入額 が最大の配分（expected）も求める。
+
         Args:
             leg_results: list of dict with 'df_pred', 'race_info', 'race_id'
             budget_points: 予算点数 (50/100/200/500)
 
         Returns:
-            dict with 'dynamic' and 'fixed' strategies
+            dict with 'optimal' (and 'expected') strategies
         """
-        # 各レグのtop1勝率を取得
+        # 各レグの勝率ベクトル（df_pred は勝率の高い順）とtop1勝率
+        leg_probs = []
+        leg_odds = []
         probas = []
         for leg in leg_results:
-            if leg['df_pred'] is not None and len(leg['df_pred']) > 0:
-                probas.append(leg['df_pred'].iloc[0]['勝率予測'])
+            df_pred = leg['df_pred']
+            if df_pred is not None and len(df_pred) > 0:
+                win_probs = df_pred['勝率予測'].to_numpy(dtype=float)
+                leg_probs.append(win_probs)
+                leg_odds.append(pd.to_numeric(df_pred['オッズ'], errors='coerce').fillna(0).to_numpy(dtype=float))
+                probas.append(float(win_probs[0]))
             else:
+                leg_probs.append(None)
+                leg_odds.append(None)
                 probas.append(0.0)
 
-        n_legs = len(probas)
-
-        # --- 動的配分（analyze_win5_budget.py の dynamic_allocation と同じロジック）---
-        dynamic_picks = [1] * n_legs
-        sorted_indices = sorted(range(n_legs), key=lambda i: probas[i])
-
-        for idx in sorted_indices:
-            current_points = 1
-            for p in dynamic_picks:
-                current_points *= p
-
-            if current_points * 2 <= budget_points:
-                dynamic_picks[idx] = 2
-                current_points = 1
-                for p in dynamic_picks:
-                    current_points *= p
-
-            if dynamic_picks[idx] == 2 and current_points * 1.5 <= budget_points:
-                dynamic_picks[idx] = 3
-                current_points = 1
-                for p in dynamic_picks:
-                    current_points *= p
-
-            if dynamic_picks[idx] == 3 and current_points * (5/3) <= budget_points:
-                dynamic_picks[idx] = 5
-
-        dynamic_total = 1
-        for p in dynamic_picks:
-            dynamic_total *= p
-
-        # --- 固定閾値パターン1: 高(≥0.40)→1頭, 中(≥0.20)→2頭, 低→3頭 ---
-        fixed1_picks = []
-        for p in probas:
-            if p >= 0.40:
-                fixed1_picks.append(1)
-            elif p >= 0.20:
-                fixed1_picks.append(2)
-            else:
-                fixed1_picks.append(3)
-
-        fixed1_total = 1
-        for p in fixed1_picks:
-            fixed1_total *= p
-
-        # --- 固定閾値パターン2: 高(≥0.40)→1頭, 中(≥0.20)→2頭, 低→5頭 ---
-        fixed2_picks = []
-        for p in probas:
-            if p >= 0.40:
-                fixed2_picks.append(1)
-            elif p >= 0.20:
-                fixed2_picks.append(2)
-            else:
-                fixed2_picks.append(5)
+        strategies = {'probas': probas}
 
-        fixed2_total = 1
-        for p in fixed2_picks:
-            fixed2_total *= p
+        optimal = allocate_win5(leg_probs, budget_points, objective='hit')
+        strategies['optimal'] = optimal
 
-        # 推奨: 予算内に収まるパターンの中で最も頭数が多いもの
-        candidates = [
-            ('dynamic', dynamic_picks, dynamic_total),
-            ('fixed_3', fixed1_picks, fixed1_total),
-            ('fixed_5', fixed2_picks, fixed2_total),
-        ]
-        # 予算内のもので点数が最も大きい戦略を推奨
-        within_budget = [c for c in candidates if c[2] <= budget_points]
-        if within_budget:
-            recommended = max(within_budget, key=lambda c: c[2])
+        # 予測できた全レグでオッズが取れていれば期待値でも配分（オッズなしの馬は払戻0として扱う）
+        has_odds = any(o is not None for o in leg_odds) and all(o is None or (o > 0).any() for o in leg_odds)
+        if has_odds:
+            strategies['expected'] = allocate_win5(leg_probs, budget_points, odds=leg_odds, objective='return')
+
+        strategies['recommended'] = 'optimal'
+        return strategies
+
+    def _update_unknown_horses(self, job, horse_lists, auto_update, log_prefix=''):
+        """
+        複数レースの出走馬のうちDB未登録の馬をまとめて取得し、self.df に追加（ワーカー処理）
+
+        Args:
+            horse_lists: レースごとの出馬表（horses）のリスト
+            auto_update: False なら未登録馬の数をログに出すだけ
+        """
+        known_ids = set(self.df['horse_id'].dropna())
+        all_no_data_horses = []
+        for horses_tmp in horse_lists:
+            for h in horses_tmp or []:
+                hid = h.get('horse_id')
+                if hid:
+                    try:
+                        if float(hid) not in known_ids:
+                            all_no_data_horses.append(h)
+                    except (ValueError, TypeError):
+                        pass
+
+        if all_no_data_horses and auto_update:
+            # DB未登録馬のみ一括更新（最終出走日が古いだけの馬はスキップ）
+            seen_ids = set()
+            unique_horses = []
+            for h in all_no_data_horses:
+                hid = h.get('horse_id')
+                if hid not in seen_ids:
+                    seen_ids.add(hid)
+                    unique_horses.append(h)
+
+            print(f"{log_prefix}DB未登録馬: {len(unique_horses)}頭 → 自動データ取得")
+            job.progress(None, f"{log_prefix}未登録馬データ取得中... ({len(unique_horses)}頭)")
+            try:
+                from smart_update_system import batch_update_race_horses
+                update_result = batch_update_race_horses(unique_horses, self.df)
+                if update_result.get('updated', 0) > 0:
+                    new_races = update_result.get('new_races', [])
+                    if new_races:
+                        # 並行して予測中のジョブは差し替え前の (df, phase10) を読み続ける
+                        num_added = self._extend_data(new_races)
+                        print(f"{log_prefix}データ取得完了: +{num_added}行")
+            except Exception as e:
+                print(f"{log_prefix}データ取得エラー: {e}")
+        elif all_no_data_horses:
+            print(f"{log_prefix}DB未登録馬: {len(set(h.get('horse_id') for h in all_no_data_horses))}頭（自動更新OFF）")
         else:
-            recommended = candidates[0]  # 動的配分は常に予算内
+            print(f"{log_prefix}全出走馬のデータがDBに存在")
 
-        return {
-            'probas': probas,
-            'dynamic': {'picks': dynamic_picks, 'total': dynamic_total, 'cost': dynamic_total * 100},
-            'fixed_3': {'picks': fixed1_picks, 'total': fixed1_total, 'cost': fixed1_total * 100},
-            'fixed_5': {'picks': fixed2_picks, 'total': fixed2_total, 'cost': fixed2_total * 100},
-            'recommended': recommended[0],
-        }
+    def _run_win5_legs(self, job, func, race_ids, on_done=None):
+        """5レグ分の func(race_id) をスレッドで並行実行し、race_ids の順に結果を返す（ワーカー処理）
+
+        on_done(レグ番号, race_id, 結果, 完了数) は完了したレグごとに呼ばれる（進捗通知用）。
+        中止が要求されたら残りのレグを待たずに JobCancelled を送出する。
+        """
+        results = [None] * len(race_ids)
+        executor = ThreadPoolExecutor(max_workers=len(race_ids), thread_name_prefix='win5')
+        try:
+            pending = {executor.submit(func, rid): i for i, rid in enumerate(race_ids)}
+            num_done = 0
+            while pending:
+                job.check_cancelled()
+                done, _ = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = pending.pop(future)
+                    results[i] = future.result()
+                    num_done += 1
+                    if on_done:
+                        on_done(i, race_ids[i], results[i], num_done)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return results
 
     def _show_win5_result_dialog(self, date_str, leg_results, strategies, budget_points):
         """WIN5予測結果を専用ダイアログで表示"""
@@ -2514,25 +2748,21 @@ class KeibaGUIv3:
         lines.append(f"  予算: {budget_yen:,}円（{budget_points}点以内）")
         lines.append("")
 
-        # 動的配分
-        d = strategies['dynamic']
-        d_picks_str = ' x '.join(str(p) for p in d['picks'])
-        d_mark = " ★推奨" if rec_key == 'dynamic' else ""
-        lines.append(f"  [動的配分] {d_picks_str} = {d['total']}点 ({d['cost']:,}円){d_mark}")
-
-        # 固定3段階(低→3頭)
-        f3 = strategies['fixed_3']
-        f3_picks_str = ' x '.join(str(p) for p in f3['picks'])
-        f3_over = " ※予算超過" if f3['total'] > budget_points else ""
-        f3_mark = " ★推奨" if rec_key == 'fixed_3' else ""
-        lines.append(f"  [固定3段階] {f3_picks_str} = {f3['total']}点 ({f3['cost']:,}円){f3_over}{f3_mark}")
-
-        # 固定5段階(低→5頭)
-        f5 = strategies['fixed_5']
-        f5_picks_str = ' x '.join(str(p) for p in f5['picks'])
-        f5_over = " ※予算超過" if f5['total'] > budget_points else ""
-        f5_mark = " ★推奨" if rec_key == 'fixed_5' else ""
-        lines.append(f"  [固定5頭]   {f5_picks_str} = {f5['total']}点 ({f5['cost']:,}円){f5_over}{f5_mark}")
+        # 全的中確率が最大の配分
+        o = strategies['optimal']
+        o_picks_str = ' x '.join(str(p) for p in o['picks'])
+        o_mark = " ★推奨" if rec_key == 'optimal' else ""
+        lines.append(f"  [的中率最大] {o_picks_str} = {o['total']}点 ({o['cost']:,}円) "
+                     f"全的中確率 {o['hit_prob']*100:.2f}%{o_mark}")
+
+        # 期待値が最大の配分（オッズ取得時のみ）
+        e = strategies.get('expected')
+        if e is not None:
+            e_picks_str = ' x '.join(str(p) for p in e['picks'])
+            e_mark = " ★推奨" if rec_key == 'expected' else ""
+            lines.append(f"  [期待値最大] {e_picks_str} = {e['total']}点 ({e['cost']:,}円) "
+                         f"全的中確率 {e['hit_prob']*100:.2f}% 期待払戻 {e['expected_return']:,.0f}円{e_mark}")
+            lines.append("    ※期待払戻は各レグの単勝オッズの積を払戻の目安にした概算")
 
         lines.append("")
         lines.append("-" * 60)
@@ -2559,7 +2789,7 @@ class KeibaGUIv3:
 
         # 合計
         lines.append("")
-        lines.append(f"  合計: {rec['total']}点（{rec['cost']:,}円）")
+        lines.append(f"  合計: {rec['total']}点（{rec['cost']:,}円） 全的中確率 {rec['hit_prob']*100:.2f}%")
         lines.append("")
 
         text.insert(tk.END, '\n'.join(lines))
@@ -2572,7 +2802,7 @@ class KeibaGUIv3:
                  width=10).pack()
 
     def predict_win5(self):
-        """Win5予測 - 自信度ベース動的頭数配分"""
+        """Win5予測 - 5レグ並行予測 + 予算内の最適頭数配分"""
         dialog = tk.Toplevel(self.root)
         dialog.title("Win5予測")
         dialog.geometry("420x300")
@@ -2613,130 +2843,354 @@ class KeibaGUIv3:
 
         # 実行ボタン
         def run_win5():
-            try:
-                target_date = f"{year_var.get()}{month_var.get().zfill(2)}{day_var.get().zfill(2)}"
-                budget_points = budget_var.get()
-                dialog.destroy()
+            target_date = f"{year_var.get()}{month_var.get().zfill(2)}{day_var.get().zfill(2)}"
+            date_display = f"{year_var.get()}/{month_var.get().zfill(2)}/{day_var.get().zfill(2)}"
+            budget_points = budget_var.get()
+            auto_update = self.auto_update.get()
+            dialog.destroy()
 
-                self.status_label.config(text=f"WIN5予測中... 対象日: {target_date}")
-                self.progress['value'] = 0
-                self.root.update()
-
-                # 1. WIN5対象レースを自動取得
-                self.progress['value'] = 5
-                self.root.update()
-                race_ids = self._scrape_win5_race_ids(target_date)
-
-                if not race_ids or len(race_ids) < 5:
-                    messagebox.showerror("エラー",
-                        f"WIN5対象レースが5レース見つかりませんでした。\n"
-                        f"取得数: {len(race_ids) if race_ids else 0}\n"
-                        f"対象日: {target_date}\n\n"
-                        f"開催日を確認してください。")
-                    self.status_label.config(text="WIN5: レース取得失敗")
-                    self.progress['value'] = 0
+            self.win5_button.config(state=tk.DISABLED)
+            self.progress['value'] = 0
+
+            def on_done(job, result):
+                if result is None:
                     return
+                leg_results, strategies = result
+                self.progress['value'] = 95
+                self._show_win5_result_dialog(date_display, leg_results, strategies, budget_points)
+                self.progress['value'] = 100
+                self.status_label.config(text=f"WIN5予測完了 - {target_date}")
 
-                # 2. DB未登録馬の事前チェック（5レース一括）
-                self.status_label.config(text="WIN5: 出走馬データ確認中...")
-                self.progress['value'] = 8
-                self.root.update()
-
-                all_no_data_horses = []
-                for rid in race_ids:
-                    horses_tmp, _ = self.scrape_shutuba(rid)
-                    if not horses_tmp:
-                        horses_tmp, _ = self.scrape_race_result(rid)
-                    if horses_tmp:
-                        for h in horses_tmp:
-                            hid = h.get('horse_id')
-                            if hid:
-                                try:
-                                    hid_num = float(hid)
-                                    if len(self.df[self.df['horse_id'] == hid_num]) == 0:
-                                        all_no_data_horses.append(h)
-                                except (ValueError, TypeError):
-                                    pass
-
-                if all_no_data_horses and self.auto_update.get():
-                    # DB未登録馬のみ一括更新（最終出走日が古いだけの馬はスキップ）
-                    seen_ids = set()
-                    unique_horses = []
-                    for h in all_no_data_horses:
-                        hid = h.get('horse_id')
-                        if hid not in seen_ids:
-                            seen_ids.add(hid)
-                            unique_horses.append(h)
-
-                    print(f"[WIN5] DB未登録馬: {len(unique_horses)}頭 → 自動データ取得")
-                    self.status_label.config(text=f"WIN5: 未登録馬データ取得中... ({len(unique_horses)}頭)")
-                    self.root.update()
-                    try:
-                        from smart_update_system import batch_update_race_horses
-                        update_result = batch_update_race_horses(unique_horses, self.df)
-                        if update_result.get('updated', 0) > 0:
-                            new_races = update_result.get('new_races', [])
-                            if new_races:
-                                import pandas as _pd
-                                new_df = _pd.DataFrame(new_races)
-                                self.df = _pd.concat([self.df, new_df], ignore_index=True)
-                                print(f"[WIN5] データ取得完了: +{len(new_races)}行")
-                    except Exception as e:
-                        print(f"[WIN5] データ取得エラー: {e}")
-                elif all_no_data_horses:
-                    print(f"[WIN5] DB未登録馬: {len(set(h.get('horse_id') for h in all_no_data_horses))}頭（自動更新OFF）")
-                else:
-                    print(f"[WIN5] 全出走馬のデータがDBに存在")
+            def on_error(job, exc, tb):
+                print(tb)
+                messagebox.showerror("エラー", f"Win5予測エラー:\n{exc}")
+                self.status_label.config(text="WIN5予測エラー")
+                self.progress['value'] = 0
 
-                # 3. 各レグの予測（通常予想と同等の分析を実行）
-                leg_results = []
-                for i, rid in enumerate(race_ids):
-                    self.status_label.config(text=f"WIN5 Leg{i+1}/5 分析中... ({rid})")
-                    self.progress['value'] = 10 + (i * 16)
-                    self.root.update()
+            def on_finished(job):
+                self.win5_button.config(state=tk.NORMAL)
+                self._on_job_finished(job)
 
-                    df_pred, race_info = self._predict_race_for_win5(rid)
+            self.jobs.submit(f"WIN5 {target_date}", self._win5_job, target_date, budget_points, auto_update,
+                             on_progress=self._on_job_progress, on_done=on_done,
+                             on_error=on_error, on_finished=on_finished)
+            self._update_job_status(f"WIN5予測中... 対象日: {target_date}")
 
-                    race_name = race_info.get('race_name', '?') if race_info else '?'
-                    if df_pred is not None and len(df_pred) > 0:
-                        top_p = df_pred.iloc[0]['勝率予測']
-                        self.status_label.config(text=f"WIN5 Leg{i+1}/5 完了: {race_name} (top P={top_p:.2f})")
-                    else:
-                        self.status_label.config(text=f"WIN5 Leg{i+1}/5 完了: {race_name} (予測失敗)")
-                    self.root.update()
+        tk.Button(dialog, text="WIN5予測開始", command=run_win5,
+                 bg="#4CAF50", fg="white", font=("Arial", 11, "bold"),
+                 width=15).pack(pady=20)
 
-                    leg_results.append({
-                        'race_id': rid,
-                        'df_pred': df_pred,
-                        'race_info': race_info,
-                    })
+    def _win5_job(self, job, target_date, budget_points, auto_update):
+        """
+        WIN5予測のワーカー処理（対象レース取得・出馬表取得・未登録馬更新・5レグ予測・戦略計算）
 
-                self.progress['value'] = 90
-                self.root.update()
+        Returns:
+            (leg_results, strategies)、対象レースが5レース見つからなければ None
+        """
+        # 1. WIN5対象レースを自動取得
+        job.progress(5, f"WIN5予測中... 対象日: {target_date}")
+        race_ids = self._scrape_win5_race_ids(target_date)
+
+        if not race_ids or len(race_ids) < 5:
+            job.post(messagebox.showerror, "エラー",
+                f"WIN5対象レースが5レース見つかりませんでした。\n"
+                f"取得数: {len(race_ids) if race_ids else 0}\n"
+                f"対象日: {target_date}\n\n"
+                f"開催日を確認してください。")
+            job.progress(0, "WIN5: レース取得失敗")
+            return None
 
-                # 4. 戦略計算
-                strategies = self._calculate_win5_strategy(leg_results, budget_points)
+        # 2. DB未登録馬の事前チェック（5レース一括）
+        job.progress(8, "WIN5: 出走馬データ確認中...")
 
-                # 5. 結果表示
-                self.progress['value'] = 95
-                self.root.update()
+        # 5レースの出馬表を並行して取得（予測でもそのまま使う）
+        def on_card(i, rid, card, num_done):
+            job.progress(8 + num_done, f"WIN5: 出馬表取得中... ({num_done}/5)")
 
-                date_display = f"{year_var.get()}/{month_var.get().zfill(2)}/{day_var.get().zfill(2)}"
-                self._show_win5_result_dialog(date_display, leg_results, strategies, budget_points)
+        cards = self._run_win5_legs(job, self._fetch_race_card, race_ids, on_card)
 
-                self.progress['value'] = 100
-                self.status_label.config(text=f"WIN5予測完了 - {target_date}")
+        self._update_unknown_horses(job, [horses for horses, _ in cards], auto_update, log_prefix='[WIN5] ')
 
-            except Exception as e:
-                import traceback
-                traceback.print_exc()
-                messagebox.showerror("エラー", f"Win5予測エラー:\n{e}")
-                self.status_label.config(text="WIN5予測エラー")
+        # 3. 各レグの予測（通常予想と同等の分析を5レグ並行で実行）
+        job.check_cancelled()
+        job.progress(15, "WIN5 5レグ分析中...")
+
+        def on_leg(i, rid, result, num_done):
+            df_pred, race_info = result
+            race_name = race_info.get('race_name', '?') if race_info else '?'
+            if df_pred is not None and len(df_pred) > 0:
+                top_p = df_pred.iloc[0]['勝率予測']
+                text = f"WIN5 Leg{i+1} 完了 ({num_done}/5): {race_name} (top P={top_p:.2f})"
+            else:
+                text = f"WIN5 Leg{i+1} 完了 ({num_done}/5): {race_name} (予測失敗)"
+            job.progress(15 + num_done * 15, text)
+
+        cards_by_race = dict(zip(race_ids, cards))
+        predictions = self._run_win5_legs(
+            job, lambda rid: self._predict_race_for_win5(rid, card=cards_by_race[rid]), race_ids, on_leg)
+
+        leg_results = [
+            {'race_id': rid, 'df_pred': df_pred, 'race_info': race_info}
+            for rid, (df_pred, race_info) in zip(race_ids, predictions)
+        ]
+
+        # 4. 戦略計算
+        job.progress(90, "WIN5: 購入戦略を計算中...")
+        strategies = self._calculate_win5_strategy(leg_results, budget_points)
+        return leg_results, strategies
+
+    # ================================================================
+    # 開催日一括予想
+    # ================================================================
+
+    def predict_race_day(self):
+        """開催日一括予想 - 指定日の全レースを予想して一覧表を保存"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("開催日一括予想")
+        dialog.geometry("380x220")
+        dialog.resizable(False, False)
+
+        tk.Label(dialog, text="開催日一括予想", font=("Arial", 14, "bold"),
+                bg="#3F51B5", fg="white", pady=10).pack(fill=tk.X)
+
+        tk.Label(dialog, text="開催日を指定してください:", font=("Arial", 10)).pack(pady=10)
+
+        date_frame = tk.Frame(dialog)
+        date_frame.pack(pady=5)
+
+        now = datetime.now()
+        tk.Label(date_frame, text="年:").grid(row=0, column=0, padx=5)
+        year_var = tk.StringVar(value=str(now.year))
+        tk.Entry(date_frame, textvariable=year_var, width=6).grid(row=0, column=1, padx=5)
+
+        tk.Label(date_frame, text="月:").grid(row=0, column=2, padx=5)
+        month_var = tk.StringVar(value=f"{now.month:02d}")
+        tk.Entry(date_frame, textvariable=month_var, width=4).grid(row=0, column=3, padx=5)
+
+        tk.Label(date_frame, text="日:").grid(row=0, column=4, padx=5)
+        day_var = tk.StringVar(value=f"{now.day:02d}")
+        tk.Entry(date_frame, textvariable=day_var, width=4).grid(row=0, column=5, padx=5)
+
+        def run_race_day():
+            kaisai_date = f"{year_var.get()}{month_var.get().zfill(2)}{day_var.get().zfill(2)}"
+            auto_update = self.auto_update.get()
+            dialog.destroy()
+
+            self.race_day_button.config(state=tk.DISABLED)
+            self.progress['value'] = 0
+
+            def on_done(job, result):
+                self.progress['value'] = 100
+                self.status_label.config(
+                    text=f"開催日一括予想完了 - {kaisai_date} ({len(result['results'])}レース) 保存: {result['paths']['bets']}")
+                self._show_race_day_dialog(kaisai_date, result)
+
+            def on_error(job, exc, tb):
+                print(tb)
+                messagebox.showerror("エラー", f"開催日一括予想エラー:\n{exc}")
+                self.status_label.config(text="開催日一括予想エラー")
                 self.progress['value'] = 0
 
-        tk.Button(dialog, text="WIN5予測開始", command=run_win5,
+            def on_finished(job):
+                self.race_day_button.config(state=tk.NORMAL)
+                self._on_job_finished(job)
+
+            self.jobs.submit(f"開催日一括予想 {kaisai_date}", self._predict_race_day_job, kaisai_date, auto_update,
+                             on_progress=self._on_job_progress, on_done=on_done,
+                             on_error=on_error, on_finished=on_finished)
+            self._update_job_status(f"開催日一括予想中... {kaisai_date}")
+
+        tk.Button(dialog, text="一括予想開始", command=run_race_day,
                  bg="#4CAF50", fg="white", font=("Arial", 11, "bold"),
-                 width=15).pack(pady=20)
+                 width=15).pack(pady=15)
+
+    def _predict_race_day_job(self, job, kaisai_date, auto_update=False, out_dir=None):
+        """
+        開催日の全レースを一括予想（ワーカー処理）
+
+        出馬表は共有プールの同時実行数の範囲で並行して取得し、全レースの過去成績を1回で抽出、
+        全出走馬の特徴量を1つの行列にまとめて各モデル1回の predict で予測する。
+
+        Args:
+            kaisai_date: 'YYYYMMDD'
+            auto_update: DB未登録馬をまとめて取得するか
+            out_dir: 一覧表の保存先（省略時は BASE_DIR/race_day）
+
+        Returns:
+            dict: results（{race_id: {'df_pred', 'race_info', 'has_odds'}}）, failed（出馬表が取れなかった race_id）,
+                  predictions・bets（_race_day_tables の一覧表）, paths（保存したCSV）
+        """
+        if self.model_win is None or self.df is None or self.model_features is None:
+            raise RuntimeError("モデルまたはデータが読み込まれていません")
+
+        # 1. 開催日のレースIDを取得
+        job.progress(2, f"開催日一括予想: {kaisai_date} レース一覧取得中...")
+        race_ids = fetch_race_ids(kaisai_date)
+        if not race_ids:
+            raise ValueError(f"{kaisai_date} の開催レースが見つかりません")
+        print(f"[開催日] {kaisai_date}: {len(race_ids)}レース")
+
+        # 2. 出馬表を並行取得（同時実行数は共有プールの max_in_flight まで）
+        cards = []
+        failed = []
+        fetched = get_default_pool().imap(self._fetch_race_card, race_ids)
+        for i, (race_id, (horses, race_info)) in enumerate(zip(race_ids, fetched), 1):
+            job.check_cancelled()
+            job.progress(2 + 38 * i / len(race_ids), f"開催日一括予想: 出馬表取得 {i}/{len(race_ids)}")
+            if horses:
+                cards.append((race_id, horses, race_info or {}))
+            else:
+                print(f"[開催日] 出馬表取得失敗: {race_id}")
+                failed.append(race_id)
+
+        self._update_unknown_horses(job, [horses for _, horses, _ in cards], auto_update, log_prefix='[開催日] ')
+
+        # 3. 全レースの過去成績を1回で抽出し、レースごとに特徴量を作成
+        data = self._data_snapshot()
+        histories = self._race_histories_batch([(race_id, horses) for race_id, horses, _ in cards], data[0])
+        feat_dfs = []
+        horse_histories = []
+        for i, (race_id, horses, race_info) in enumerate(cards, 1):
+            job.check_cancelled()
+            feat_df, race_histories = self._build_race_features(
+                horses, race_id, race_info, log_prefix=f'[{race_id}] ', histories=histories[race_id], data=data)
+            feat_dfs.append(feat_df)
+            horse_histories.append(race_histories)
+            job.progress(40 + 50 * i / len(cards), f"開催日一括予想: 特徴量計算 {i}/{len(cards)}レース")
+
+        # 4. 全出走馬を各モデル1回で予測し、レースごとに切り分ける
+        job.progress(92, f"開催日一括予想: {sum(len(f) for f in feat_dfs)}頭を予測中...")
+        if feat_dfs:
+            win_proba, top3_proba = self._score_race(pd.concat(feat_dfs, ignore_index=True))
+        else:
+            win_proba, top3_proba = np.zeros(0), np.zeros(0)
+        bounds = np.r_[0, np.cumsum([len(f) for f in feat_dfs])]
+
+        results = {}
+        for i, (race_id, horses, race_info) in enumerate(cards):
+            lo, hi = bounds[i], bounds[i + 1]
+            results[race_id] = {
+                'df_pred': self._prediction_frame(horses, feat_dfs[i], horse_histories[i],
+                                                  win_proba[lo:hi], top3_proba[lo:hi]),
+                'race_info': race_info,
+                'has_odds': any(h.get('単勝オッズ', 0) > 0 for h in horses),
+            }
+
+        # 5. 一覧表を作成して保存
+        predictions, bets = self._race_day_tables(results)
+        paths = self._save_race_day_tables(kaisai_date, predictions, bets, out_dir)
+        job.progress(98, f"開催日一括予想: 保存 {paths['bets']}")
+
+        return {'results': results, 'failed': failed, 'predictions': predictions, 'bets': bets, 'paths': paths}
+
+    def _race_day_tables(self, results):
+        """
+        一括予想の結果を2つの一覧表にまとめる
+
+        Returns:
+            (predictions, bets)
+            predictions: 全レース・全出走馬の予測（レース情報・予測順位・印つき）
+            bets: 1レース1行の推奨馬券（購入判定・本命・単勝/馬連/3連複・バリュー馬）
+        """
+        marks = ['◎', '○', '▲', '△', '☆']
+        pred_frames = []
+        bet_rows = []
+        for race_id in sorted(results):
+            result = results[race_id]
+            df_pred = result['df_pred'].reset_index(drop=True)
+            race_info = result['race_info']
+            has_odds = result['has_odds']
+            if len(df_pred) == 0:
+                continue
+
+            decoded = self._decode_race_id(race_id)
+            track = race_info.get('track_name') or (decoded['track_name'] if decoded else '')
+            race_num = race_info.get('race_num') or (decoded['race_num'] if decoded else '')
+
+            frame = df_pred.copy()
+            frame.insert(0, '発走', race_info.get('start_time', ''))
+            frame.insert(0, 'レース名', race_info.get('race_name', ''))
+            frame.insert(0, 'R', race_num)
+            frame.insert(0, '競馬場', track)
+            frame.insert(0, 'race_id', race_id)
+            frame.insert(5, '予測順位', np.arange(1, len(frame) + 1))
+            frame.insert(6, '印', [marks[i] if i < len(marks) else '' for i in range(len(frame))])
+            pred_frames.append(frame)
+
+            top1 = df_pred.iloc[0]
+            top1_value = top1.get('バリュー', 0)
+            signal, action = self._bet_signal(top1['勝率予測'], top1_value, has_odds)
+            umabans = [str(u) for u in df_pred['馬番'].head(3)]
+            value_horses = ''
+            if has_odds:
+                value_rows = df_pred[df_pred['バリュー'] >= 0.05].sort_values('バリュー', ascending=False)
+                value_horses = ', '.join(f"{row['馬番']}番(V={row['バリュー']:+.2f})" for _, row in value_rows.head(5).iterrows())
+
+            bet_rows.append({
+                'race_id': race_id,
+                '競馬場': track,
+                'R': race_num,
+                'レース名': race_info.get('race_name', ''),
+                '発走': race_info.get('start_time', ''),
+                '頭数': len(df_pred),
+                '判定': signal,
+                '推奨': action,
+                '本命': f"{top1['馬番']}番 {top1['馬名']}",
+                '本命勝率': top1['勝率予測'],
+                '本命オッズ': top1.get('オッズ', 0),
+                '本命バリュー': top1_value if has_odds else None,
+                '単勝': umabans[0],
+                '馬連': '-'.join(umabans[:2]) if len(umabans) >= 2 else '',
+                '3連複': '-'.join(umabans[:3]) if len(umabans) >= 3 else '',
+                'バリュー馬': value_horses,
+            })
+
+        predictions = pd.concat(pred_frames, ignore_index=True) if pred_frames else pd.DataFrame()
+        bets = pd.DataFrame(bet_rows)
+        return predictions, bets
+
+    def _save_race_day_tables(self, kaisai_date, predictions, bets, out_dir=None):
+        """一覧表をCSVで保存（Excelで開けるよう utf-8-sig）"""
+        out_dir = out_dir or os.path.join(BASE_DIR, 'race_day')
+        os.makedirs(out_dir, exist_ok=True)
+        paths = {
+            'predictions': os.path.join(out_dir, f"race_day_{kaisai_date}_predictions.csv"),
+            'bets': os.path.join(out_dir, f"race_day_{kaisai_date}_bets.csv"),
+        }
+        predictions.to_csv(paths['predictions'], index=False, encoding='utf-8-sig')
+        bets.to_csv(paths['bets'], index=False, encoding='utf-8-sig')
+        print(f"[INFO] 開催日一括予想を保存: {paths['bets']}")
+        return paths
+
+    def _show_race_day_dialog(self, kaisai_date, result):
+        """開催日一括予想の推奨馬券一覧を表示"""
+        win = tk.Toplevel(self.root)
+        win.title(f"開催日一括予想 - {kaisai_date}")
+        win.geometry("1000x700")
+
+        text = scrolledtext.ScrolledText(win, font=("Consolas", 10), wrap=tk.NONE)
+        text.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        lines = [f"開催日一括予想 - {kaisai_date}  ({len(result['results'])}レース)", ""]
+        for _, row in result['bets'].iterrows():
+            odds_str = f" オッズ{row['本命オッズ']:.1f}" if row['本命オッズ'] else ""
+            lines.append(f"{row['競馬場']}{row['R']}R {row['レース名']} {row['発走']}")
+            lines.append(f"  {row['判定']} {row['推奨']}")
+            lines.append(f"  ◎ {row['本命']} 勝率{row['本命勝率']*100:.1f}%{odds_str}")
+            lines.append(f"  単勝 {row['単勝']} / 馬連 {row['馬連']} / 3連複 {row['3連複']}")
+            if row['バリュー馬']:
+                lines.append(f"  バリュー: {row['バリュー馬']}")
+            lines.append("")
+        if result['failed']:
+            lines.append(f"出馬表取得失敗: {', '.join(result['failed'])}")
+        lines.append("")
+        lines.append(f"予測一覧: {result['paths']['predictions']}")
+        lines.append(f"推奨馬券: {result['paths']['bets']}")
+
+        text.insert(tk.END, '\n'.join(lines))
+        text.config(state=tk.DISABLED)
+
+        tk.Button(win, text="閉じる", command=win.destroy, width=10).pack(pady=5)
 
     def open_period_collection_dialog(self):
         """期間指定データ収集ダイアログを開く"""
@@ -2884,7 +3338,8 @@ class KeibaGUIv3:
 
                 try:
                     headers = {'User-Agent': 'Mozilla/5.0'}
-                    response = requests.get(url, headers=headers, timeout=10)
+                    # 待機はプールのレート制限で行う（キャッシュにあれば通信しない）
+                    response = get_default_pool().get(url, headers=headers)
                     response.encoding = response.apparent_encoding
                     soup = BeautifulSoup(response.text, 'html.parser')
 
@@ -2900,9 +3355,6 @@ class KeibaGUIv3:
                             if start <= race_date <= end:
                                 dates.append(race_date_str)
 
-                    # 重要: 待機時間（IPブロック防止）
-                    time.sleep(1.5)
-
                 except Exception as e:
                     log_widget.insert(tk.END, f"エラー ({year}/{month}): {e}\n")
 
@@ -2914,58 +3366,18 @@ class KeibaGUIv3:
 
             return sorted(list(set(dates)))
 
-        # race_listページから実際のrace_idを取得（Selenium版）
+        # race_listページから実際のrace_idを取得（ブラウザなし版）
         def get_race_ids_for_date(kaisai_date):
-            """指定日のrace_listページから実際のrace_idを抽出（Selenium使用）"""
-            race_ids = []
-            url = f"https://race.netkeiba.com/top/race_list.html?kaisai_date={kaisai_date}"
-
-            driver = None
+            """指定日のrace_listが読み込むrace_list_subから実際のrace_idを抽出"""
             try:
-                from selenium import webdriver
-                from selenium.webdriver.chrome.options import Options
-
-                options = Options()
-                options.add_argument('--headless')
-                options.add_argument('--no-sandbox')
-                options.add_argument('--disable-dev-shm-usage')
-                options.add_argument('--disable-gpu')
-                options.add_argument('--log-level=3')  # エラーログのみ表示
-                options.add_argument('user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36')
-                options.add_experimental_option('excludeSwitches', ['enable-logging', 'enable-automation'])
-
-                driver = webdriver.Chrome(options=options)
-                driver.get(url)
-
-                # ページ読み込み待機
-                time.sleep(3)
-
-                # ページソースを取得してBeautifulSoupで解析
-                soup = BeautifulSoup(driver.page_source, 'html.parser')
-
-                # href属性からrace_idを抽出
-                links = soup.find_all('a', href=True)
-                for link in links:
-                    href = link.get('href', '')
-                    match = re.search(r'race_id=(\d{12})', href)
-                    if match:
-                        race_id = match.group(1)
-                        if race_id not in race_ids:
-                            race_ids.append(race_id)
-
-                driver.quit()
+                race_ids = fetch_race_ids(kaisai_date)
 
                 log_widget.insert(tk.END, f"  {kaisai_date}: {len(race_ids)}レース\n")
                 log_widget.update()
 
-                # 重要: 待機時間（IPブロック防止）
-                time.sleep(1.5)
-
-                return sorted(race_ids)
+                return race_ids
 
             except Exception as e:
-                if driver:
-                    driver.quit()
                 log_widget.insert(tk.END, f"  エラー ({kaisai_date}): {e}\n")
                 return []
 
@@ -2976,9 +3388,9 @@ class KeibaGUIv3:
 
             try:
                 headers = {'User-Agent': 'Mozilla/5.0'}
-                response = requests.get(url, headers=headers, timeout=10)
-
-                if response.status_code != 200:
+                try:
+                    response = get_default_pool().get(url, headers=headers)
+                except requests.exceptions.HTTPError:
                     return None
 
                 response.encoding = response.apparent_encoding
@@ -3170,7 +3582,7 @@ class KeibaGUIv3:
                 log_widget.insert(tk.END, "\n  既存データをチェック中...\n")
                 dialog.update()
 
-                existing_df = pd.read_csv(csv_path, low_memory=False)
+                existing_df = load_race_data(csv_path, columns=['race_id'])
                 existing_race_ids = set(existing_df['race_id'].astype(str).unique())
 
                 log_widget.insert(tk.END, f"  既存レース数: {len(existing_race_ids)}\n")
@@ -3221,8 +3633,6 @@ class KeibaGUIv3:
             progress_bar['value'] = progress
             dialog.update()
 
-            time.sleep(2)
-
         log_widget.insert(tk.END, f"\n[4] 収集完了: {success}レース成功, {failed}レース失敗\n")
         dialog.update()
 
@@ -3235,57 +3645,48 @@ class KeibaGUIv3:
             log_widget.insert(tk.END, f"  新規データ: {len(new_df)}件\n")
 
             csv_path = os.path.join(BASE_DIR, 'data/main/netkeiba_data_2020_2025_complete.csv')
-            backup_path = os.path.join(BASE_DIR, 'data/main/netkeiba_data_2020_2025_complete_backup.csv')
-
-            # バックアップ
-            if os.path.exists(csv_path):
-                import shutil
-                shutil.copy2(csv_path, backup_path)
-                log_widget.insert(tk.END, f"  バックアップ作成: 完了\n")
-
-            # 既存データと結合
-            if os.path.exists(csv_path):
-                old_df = pd.read_csv(csv_path, low_memory=False)
-                log_widget.insert(tk.END, f"  既存データ: {len(old_df)}件\n")
-
-                combined_df = pd.concat([old_df, new_df], ignore_index=True)
-                log_widget.insert(tk.END, f"  結合後: {len(combined_df)}件\n")
 
-                # 重複を削除（race_idとhorse_idの組み合わせで判定）
-                before_dedup = len(combined_df)
-                combined_df = combined_df.drop_duplicates(subset=['race_id', 'horse_id'], keep='first')
-                after_dedup = len(combined_df)
+            # 既存と重複しない行（race_idとhorse_idの組み合わせで判定）だけを末尾に追記
+            # ※ 既存行は書き換えないので、全体のバックアップ・読み直しは不要
+            is_new_database = not os.path.exists(csv_path)
+            added_rows = AppendOnlyRaceDataset(csv_path).append_rows(new_df)
+            num_added = len(added_rows)
+            if num_added < len(new_df):
+                log_widget.insert(tk.END, f"  重複削除: {len(new_df) - num_added}件\n")
+            log_widget.insert(tk.END, f"  追記: {num_added}件\n")
 
-                if before_dedup > after_dedup:
-                    log_widget.insert(tk.END, f"  重複削除: {before_dedup - after_dedup}件\n")
-
-                log_widget.insert(tk.END, f"  最終データ: {len(combined_df)}件\n")
-
-                combined_df.to_csv(csv_path, index=False, encoding='utf-8-sig')
-                log_widget.insert(tk.END, f"\n✓ データベース更新完了!\n")
-            else:
-                new_df.to_csv(csv_path, index=False, encoding='utf-8-sig')
+            if is_new_database:
                 log_widget.insert(tk.END, f"\n✓ 新規データベース作成完了!\n")
+            else:
+                log_widget.insert(tk.END, f"\n✓ データベース更新完了!\n")
 
-            # データベースを再読み込み
-            self.df = pd.read_csv(csv_path, low_memory=False)
-            log_widget.insert(tk.END, f"✓ メモリにリロード完了\n")
+            # 拡張情報の追加が終わるまでは別の df で作業し、最後に (df, phase10) を組で差し替える
+            # （merge_horse_table は df をその場で更新するので、予測中のジョブに途中の df を見せない）
+            with self._update_lock:
+                # 追記した行だけを起動時と同じ前処理にかけてメモリ上のデータに足す（CSV全体は読み直さない）
+                if self.df is None:
+                    df = self._add_load_time_columns(load_race_data(csv_path, categorical=False))
+                else:
+                    df = pd.concat([self.df, self._prepare_new_rows(added_rows)], ignore_index=True)
+                log_widget.insert(tk.END, f"✓ メモリ上のデータに追加完了: +{num_added}件\n")
 
-            # 拡張情報を追加（血統、勝率など）
-            log_widget.insert(tk.END, f"\n[6] 拡張情報を追加中...\n")
-            log_widget.insert(tk.END, f"  （血統・勝率・脚質などを取得します。時間がかかります）\n")
-            dialog.update()
+                # 拡張情報を追加（血統、勝率など）
+                log_widget.insert(tk.END, f"\n[6] 拡張情報を追加中...\n")
+                log_widget.insert(tk.END, f"  （血統・勝率・脚質などを取得します。時間がかかります）\n")
+                dialog.update()
 
-            try:
-                self.df = self._add_enhanced_features(self.df, log_widget, dialog)
-                log_widget.insert(tk.END, f"✓ 拡張情報追加完了\n")
+                try:
+                    df = self._add_enhanced_features(df, log_widget, dialog)
+                    log_widget.insert(tk.END, f"✓ 拡張情報追加完了\n")
 
-                # 更新されたデータを保存
-                self.df.to_csv(csv_path, index=False, encoding='utf-8-sig')
-                log_widget.insert(tk.END, f"✓ データベース更新完了\n")
-            except Exception as e:
-                log_widget.insert(tk.END, f"⚠ 拡張情報の追加でエラー: {e}\n")
-                log_widget.insert(tk.END, f"  基本データは正常に保存されています\n")
+                    # 更新されたデータを保存（読み込み時に追加した列は除く）
+                    self._frame_for_save(df, csv_path).to_csv(csv_path, index=False, encoding='utf-8-sig')
+                    log_widget.insert(tk.END, f"✓ データベース更新完了\n")
+                except Exception as e:
+                    log_widget.insert(tk.END, f"⚠ 拡張情報の追加でエラー: {e}\n")
+                    log_widget.insert(tk.END, f"  基本データは正常に保存されています\n")
+
+                self._replace_data(df)
 
             # 統計情報を更新
             self._calculate_data_range()
@@ -3471,29 +3872,14 @@ class KeibaGUIv3:
         self.update_result_tree(df_sorted)
         self.status_label.config(text=f"{sort_by}順で表示中")
 
-    def update_recommended_bets(self, df_pred, has_odds):
-        """推奨馬券を計算して表示（Feature A）"""
-        self.recommend_text.config(state=tk.NORMAL)
-        self.recommend_text.delete('1.0', tk.END)
-
-        if df_pred is None or len(df_pred) == 0:
-            self.recommend_text.insert(tk.END, "予測結果がありません\n")
-            self.recommend_text.config(state=tk.DISABLED)
-            return
-
-        # トップ3を抽出
-        top1 = df_pred.iloc[0]
-        top2 = df_pred.iloc[1] if len(df_pred) > 1 else None
-        top3 = df_pred.iloc[2] if len(df_pred) > 2 else None
-
-        # 推奨馬券を構築
-        recommend_lines = []
-
-        win_proba = top1['勝率予測']
-        top1_value = top1.get('バリュー', 0)
+    def _bet_signal(self, win_proba, top1_value, has_odds):
+        """
+        本命の勝率とバリューから購入判定（バリューベット戦略）
 
-        # === 購入判定（バリューベット戦略） ===
-        if has_odds and 'バリュー' in df_pred.columns:
+        Returns:
+            (判定, 行動) 例: ('【バリュー】単勝40%/ROI361%実績', '単勝購入推奨（回収率重視）')
+        """
+        if has_odds:
             # バリューベット判定
             if win_proba >= 0.50:
                 signal = "【超高確信】単勝65%/複勝83%実績"
@@ -3527,6 +3913,31 @@ class KeibaGUIv3:
             else:
                 signal = "【見送り推奨】"
                 action = "見送り or 押さえ程度"
+        return signal, action
+
+    def update_recommended_bets(self, df_pred, has_odds):
+        """推奨馬券を計算して表示（Feature A）"""
+        self.recommend_text.config(state=tk.NORMAL)
+        self.recommend_text.delete('1.0', tk.END)
+
+        if df_pred is None or len(df_pred) == 0:
+            self.recommend_text.insert(tk.END, "予測結果がありません\n")
+            self.recommend_text.config(state=tk.DISABLED)
+            return
+
+        # トップ3を抽出
+        top1 = df_pred.iloc[0]
+        top2 = df_pred.iloc[1] if len(df_pred) > 1 else None
+        top3 = df_pred.iloc[2] if len(df_pred) > 2 else None
+
+        # 推奨馬券を構築
+        recommend_lines = []
+
+        win_proba = top1['勝率予測']
+        top1_value = top1.get('バリュー', 0)
+
+        # === 購入判定（バリューベット戦略） ===
+        signal, action = self._bet_signal(win_proba, top1_value, has_odds and 'バリュー' in df_pred.columns)
 
         recommend_lines.append(f"{signal}")
         recommend_lines.append(f"  {action}")
@@ -3768,10 +4179,12 @@ class KeibaGUIv3:
                 result_text.insert(tk.END, "【過去成績（直近10レース）】\n")
                 try:
                     horse_id_num = float(horse_id)
-                    horse_history = self.df[self.df['horse_id'] == horse_id_num].sort_values('date', ascending=False).head(10)
+                    df, _ = self._data_snapshot()
+                    all_history = df[df['horse_id'] == horse_id_num]
+                    horse_history = all_history.sort_values('date', ascending=False).head(10)
 
                     if len(horse_history) > 0:
-                        result_text.insert(tk.END, f"  総レース数: {len(self.df[self.df['horse_id'] == horse_id_num])}戦\n")
+                        result_text.insert(tk.END, f"  総レース数: {len(all_history)}戦\n")
                         result_text.insert(tk.END, f"  直近10レース:\n")
 
                         for i, (_, row) in enumerate(horse_history.iterrows(), 1):
@@ -3950,6 +4363,7 @@ class KeibaGUIv3:
 def main():
     root = tk.Tk()
     app = KeibaGUIv3(root)
+    root.protocol("WM_DELETE_WINDOW", app.on_closing)
     root.mainloop()
 
 
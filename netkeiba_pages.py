@@ -0,0 +1,200 @@
+"""
+netkeiba ページのブラウザなし取得
+
+レース一覧・馬ページは、ブラウザが裏で読み込んでいるHTML断片を直接取得すれば
+ヘッドレスChromeを起動しなくても同じ内容が得られる。
+
+- レース一覧: race_list.html が読み込む race_list_sub.html?kaisai_date=YYYYMMDD
+- 馬ページ: db.netkeiba.com/horse/{id}/ 本体（血統・プロフィール）と、
+  戦績テーブルが本体にない場合は ajax_horse_results.html のHTML断片を結合
+
+どうしてもブラウザが必要な場合（断片が取れないなど）は、毎回起動せず
+1つの常駐ドライバー（shared_driver）を使い回す。
+
+使い方:
+    race_ids = fetch_race_ids('20240526')
+    soup = fetch_horse_soup('2019104567')
+    soup.find('table', class_='blood_table')
+"""
+import atexit
+import json
+import re
+import threading
+
+from bs4 import BeautifulSoup
+
+from fetch_pool import FetchPool, DEFAULT_USER_AGENT
+from response_cache import get_default_cache
+
+try:
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    SELENIUM_AVAILABLE = True
+except ImportError:
+    SELENIUM_AVAILABLE = False
+
+RACE_LIST_SUB_URL = 'https://race.netkeiba.com/top/race_list_sub.html?kaisai_date={date}'
+RACE_LIST_URL = 'https://race.netkeiba.com/top/race_list.html?kaisai_date={date}'
+HORSE_URL = 'https://db.netkeiba.com/horse/{horse_id}/'
+HORSE_RESULTS_AJAX_URL = 'https://db.netkeiba.com/horse/ajax_horse_results.html?input=UTF-8&output=json&id={horse_id}'
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_default_pool():
+    """モジュール共通の取得プール（初回呼び出し時に作成、HTTPキャッシュ付き）"""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = FetchPool(rate=1.0, max_in_flight=4, cache=get_default_cache())
+        return _default_pool
+
+
+# ============================================================
+# 常駐ドライバー（ブラウザが必要な場合のみ）
+# ============================================================
+
+_shared_driver = None
+_driver_lock = threading.RLock()
+
+
+def _create_driver():
+    options = Options()
+    options.add_argument('--headless')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    options.add_argument('--disable-gpu')
+    options.add_argument('--log-level=3')
+    options.add_argument(f'user-agent={DEFAULT_USER_AGENT}')
+    options.add_argument('--blink-settings=imagesEnabled=false')
+    options.add_experimental_option('excludeSwitches', ['enable-logging', 'enable-automation'])
+    return webdriver.Chrome(options=options)
+
+
+def get_shared_driver():
+    """
+    プロセス内で1つだけ起動する常駐ドライバーを返す
+
+    利用側では quit() しないこと（終了は quit_shared_driver でまとめて行う）。
+    """
+    global _shared_driver
+    if not SELENIUM_AVAILABLE:
+        raise ImportError("ブラウザ取得には selenium が必要です (pip install selenium)")
+    with _driver_lock:
+        if _shared_driver is None:
+            print("[INFO] 常駐ブラウザを起動します")
+            _shared_driver = _create_driver()
+        return _shared_driver
+
+
+def quit_shared_driver():
+    """常駐ドライバーを終了（プロセス終了時にも自動で呼ばれる）"""
+    global _shared_driver
+    with _driver_lock:
+        if _shared_driver is not None:
+            try:
+                _shared_driver.quit()
+            except Exception:
+                pass
+            _shared_driver = None
+
+
+atexit.register(quit_shared_driver)
+
+
+def _browser_page_source(url):
+    """常駐ドライバーでページを開いてHTMLを返す"""
+    with _driver_lock:
+        driver = get_shared_driver()
+        try:
+            driver.get(url)
+        except Exception:
+            # 落ちたドライバーは作り直して1回だけ再試行
+            quit_shared_driver()
+            driver = get_shared_driver()
+            driver.get(url)
+        return driver.page_source
+
+
+# ============================================================
+# レース一覧
+# ============================================================
+
+def parse_race_ids(html):
+    """レース一覧HTMLから race_id（12桁）を重複なく昇順で抽出"""
+    return sorted(set(re.findall(r'race_id=(\d{12})', html)))
+
+
+def fetch_race_ids(kaisai_date, pool=None, browser_fallback=True):
+    """
+    開催日のレースIDリストを取得
+
+    Args:
+        kaisai_date: 'YYYYMMDD'
+        pool: FetchPool（省略時はモジュール共通のプール）
+        browser_fallback: 断片の取得に失敗した場合に常駐ドライバーで再取得するか
+
+    Returns:
+        race_id 文字列のリスト（昇順）。開催がなければ空リスト
+    """
+    pool = pool or get_default_pool()
+    try:
+        r = pool.get(RACE_LIST_SUB_URL.format(date=kaisai_date))
+        r.encoding = r.apparent_encoding
+        return parse_race_ids(r.text)
+    except Exception as e:
+        if not (browser_fallback and SELENIUM_AVAILABLE):
+            raise
+        print(f"[WARNING] レース一覧の直接取得に失敗、ブラウザで再取得します ({kaisai_date}): {e}")
+        return parse_race_ids(_browser_page_source(RACE_LIST_URL.format(date=kaisai_date)))
+
+
+# ============================================================
+# 馬ページ
+# ============================================================
+
+def _fetch_results_fragment(horse_id, pool):
+    """戦績テーブルのHTML断片（ajax_horse_results）を取得"""
+    r = pool.get(HORSE_RESULTS_AJAX_URL.format(horse_id=horse_id))
+    r.encoding = 'utf-8'
+    try:
+        payload = json.loads(r.text)
+    except ValueError:
+        return r.text
+    return payload.get('data', '') if payload.get('status', 'OK') == 'OK' else ''
+
+
+def fetch_horse_soup(horse_id, pool=None, browser_fallback=True):
+    """
+    馬ページを取得して BeautifulSoup で返す
+
+    本体に戦績テーブル（db_h_race_results）がなければ ajax の断片を取得して末尾に追加するので、
+    従来 Selenium の page_source に対して行っていた解析をそのまま使える。
+
+    Returns:
+        BeautifulSoup（取得できなければ None）
+    """
+    pool = pool or get_default_pool()
+    url = HORSE_URL.format(horse_id=horse_id)
+    try:
+        r = pool.get(url)
+        r.encoding = r.apparent_encoding
+        soup = BeautifulSoup(r.text, 'html.parser')
+
+        if soup.find('table', class_='db_h_race_results') is None:
+            fragment = _fetch_results_fragment(horse_id, pool)
+            if fragment:
+                container = soup.body or soup
+                container.append(BeautifulSoup(fragment, 'html.parser'))
+        return soup
+    except Exception as e:
+        if not (browser_fallback and SELENIUM_AVAILABLE):
+            print(f"[WARNING] 馬ページ取得失敗 ({horse_id}): {e}")
+            return None
+        print(f"[WARNING] 馬ページの直接取得に失敗、ブラウザで再取得します ({horse_id}): {e}")
+        try:
+            return BeautifulSoup(_browser_page_source(url), 'html.parser')
+        except Exception as e_browser:
+            print(f"[WARNING] 馬ページ取得失敗 ({horse_id}): {e_browser}")
+            return None
@@ -14,46 +14,15 @@ import pickle
 sys.path.insert(0, r'C:\Users\bu158\Keiba_Shisaku20250928')
 
 from prediction_integration import get_horse_past_results_from_csv
+from person_stats_engine import PersonStatsEngine
+from feature_builder import FEATURE_SOURCE_COLUMNS
+from race_data_store import load_race_data
 
 def load_payout_data(json_path):
     with open(json_path, 'r', encoding='utf-8') as f:
         payout_list = json.load(f)
     return {str(item.get('race_id', '')): item for item in payout_list}
 
-def calculate_person_stats(df, person_col, reference_date, months_back=12):
-    """騎手・調教師の統計を計算"""
-    person_stats = {}
-
-    reference_date_parsed = pd.to_datetime(reference_date)
-    start_date = reference_date_parsed - pd.DateOffset(months=months_back)
-
-    period_df = df[
-        (df['date_parsed'] >= start_date) &
-        (df['date_parsed'] < reference_date_parsed)
-    ].copy()
-
-    period_df['rank_num'] = pd.to_numeric(period_df['Rank'], errors='coerce')
-    period_df = period_df[period_df['rank_num'].notna()]
-
-    for person in period_df[person_col].unique():
-        if pd.isna(person) or person == '':
-            continue
-
-        person_races = period_df[period_df[person_col] == person]
-        total_races = len(person_races)
-
-        if total_races >= 10:
-            wins = (person_races['rank_num'] == 1).sum()
-            top3 = (person_races['rank_num'] <= 3).sum()
-
-            person_stats[person] = {
-                'win_rate': wins / total_races,
-                'top3_rate': top3 / total_races,
-                'races': total_races
-            }
-
-    return person_stats
-
 print("=" * 80)
 print("ワイド戦略の最適化")
 print("=" * 80)
@@ -70,12 +39,10 @@ print("モデル読み込み完了")
 
 # データ読み込み
 print("\nデータ読み込み中...")
-df = pd.read_csv(r"C:\Users\bu158\HorseRacingAnalyzer\data\netkeiba_data_combined_202001_202508.csv",
-                 encoding='utf-8', low_memory=False)
+df = load_race_data(r"C:\Users\bu158\HorseRacingAnalyzer\data\netkeiba_data_combined_202001_202508.csv",
+                    columns=FEATURE_SOURCE_COLUMNS)
 payout_dict = load_payout_data(r"C:\Users\bu158\HorseRacingAnalyzer\data\netkeiba_data_payouts_202001_202508.json")
 
-df['date_parsed'] = pd.to_datetime(df['date'], errors='coerce')
-
 # 2024年のデータ
 target_races = df[
     (df['date_parsed'] >= '2024-01-01') &
@@ -100,6 +67,10 @@ avg_odds_ranges = [
 # 全組み合わせをテスト
 results_all = []
 
+# 騎手・調教師の累積成績テーブル
+jockey_engine = PersonStatsEngine(df, 'JockeyName')
+trainer_engine = PersonStatsEngine(df, 'TrainerName')
+
 # 統計キャッシュ
 stats_cache = {}
 
@@ -138,8 +109,8 @@ for score_diff_threshold in score_diff_thresholds:
             # 騎手・調教師統計
             if race_date_str not in stats_cache:
                 stats_cache[race_date_str] = {
-                    'jockey': calculate_person_stats(df, 'JockeyName', race_date_str, months_back=12),
-                    'trainer': calculate_person_stats(df, 'TrainerName', race_date_str, months_back=12)
+                    'jockey': jockey_engine.person_stats(race_date_str, months_back=12),
+                    'trainer': trainer_engine.person_stats(race_date_str, months_back=12)
                 }
 
             jockey_stats = stats_cache[race_date_str]['jockey']
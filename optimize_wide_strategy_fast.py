@@ -3,56 +3,20 @@
 - 予測スコア差によるフィルタリング
 - オッズ範囲によるフィルタリング
 - サンプリングで高速化
+- 予測キャッシュでグリッドの条件ごとの再予測を省略
 """
 import pandas as pd
-import json
 import sys
 import numpy as np
-from collections import defaultdict
-from itertools import combinations
 import pickle
 sys.path.insert(0, r'C:\Users\bu158\Keiba_Shisaku20250928')
 
-from prediction_integration import get_horse_past_results_from_csv
-
-def load_payout_data(json_path):
-    with open(json_path, 'r', encoding='utf-8') as f:
-        payout_list = json.load(f)
-    return {str(item.get('race_id', '')): item for item in payout_list}
-
-def calculate_person_stats(df, person_col, reference_date, months_back=12):
-    """騎手・調教師の統計を計算"""
-    person_stats = {}
-
-    reference_date_parsed = pd.to_datetime(reference_date)
-    start_date = reference_date_parsed - pd.DateOffset(months=months_back)
-
-    period_df = df[
-        (df['date_parsed'] >= start_date) &
-        (df['date_parsed'] < reference_date_parsed)
-    ].copy()
-
-    period_df['rank_num'] = pd.to_numeric(period_df['Rank'], errors='coerce')
-    period_df = period_df[period_df['rank_num'].notna()]
-
-    for person in period_df[person_col].unique():
-        if pd.isna(person) or person == '':
-            continue
-
-        person_races = period_df[period_df[person_col] == person]
-        total_races = len(person_races)
-
-        if total_races >= 10:
-            wins = (person_races['rank_num'] == 1).sum()
-            top3 = (person_races['rank_num'] <= 3).sum()
-
-            person_stats[person] = {
-                'win_rate': wins / total_races,
-                'top3_rate': top3 / total_races,
-                'races': total_races
-            }
-
-    return person_stats
+from person_stats_engine import PersonStatsEngine
+from feature_builder import FEATURE_SOURCE_COLUMNS
+from race_data_store import load_race_data
+from bet_settlement import SettlementEngine
+from payout_store import PayoutStore
+from prediction_cache import PredictionCache, predict_and_cache
 
 print("=" * 80)
 print("ワイド戦略の最適化（高速版）")
@@ -70,11 +34,10 @@ print("モデル読み込み完了")
 
 # データ読み込み
 print("\nデータ読み込み中...")
-df = pd.read_csv(r"C:\Users\bu158\HorseRacingAnalyzer\data\netkeiba_data_combined_202001_202508.csv",
-                 encoding='utf-8', low_memory=False)
-payout_dict = load_payout_data(r"C:\Users\bu158\HorseRacingAnalyzer\data\netkeiba_data_payouts_202001_202508.json")
-
-df['date_parsed'] = pd.to_datetime(df['date'], errors='coerce')
+df = load_race_data(r"C:\Users\bu158\HorseRacingAnalyzer\data\netkeiba_data_combined_202001_202508.csv",
+                    columns=FEATURE_SOURCE_COLUMNS)
+payout_store = PayoutStore(r"C:\Users\bu158\HorseRacingAnalyzer\data\payouts.sqlite")
+payout_store.import_json(r"C:\Users\bu158\HorseRacingAnalyzer\data\netkeiba_data_payouts_202001_202508.json")
 
 # 2024年のデータ
 target_races = df[
@@ -84,6 +47,9 @@ target_races = df[
 
 race_ids = target_races.groupby('race_id').filter(lambda x: len(x) >= 8)['race_id'].unique()
 
+# 対象レースの払戻だけをストアから読み込む
+settlement = SettlementEngine.from_store(payout_store, race_ids=race_ids)
+
 # サンプリング（33%）で高速化
 np.random.seed(42)
 sampled_race_ids = np.random.choice(race_ids, size=int(len(race_ids) * 0.33), replace=False)
@@ -102,18 +68,64 @@ avg_odds_ranges = [
 # 全組み合わせをテスト
 results_all = []
 
-# 統計キャッシュ
-stats_cache = {}
+# 騎手・調教師の累積成績テーブル
+jockey_engine = PersonStatsEngine(df, 'JockeyName')
+trainer_engine = PersonStatsEngine(df, 'TrainerName')
+
+# 予測キャッシュ（同じモデルなら2回目以降は特徴量抽出・予測を省略）
+prediction_cache = PredictionCache.for_model(model_path)
+new_races = predict_and_cache(prediction_cache, model, df, sampled_race_ids,
+                              jockey_engine=jockey_engine, trainer_engine=trainer_engine)
+prediction_cache.save()
+print(f"予測: 新規 {new_races}レース / キャッシュ済み {len(sampled_race_ids) - new_races}レース")
+
+# レースごとのスコア差・上位2頭の平均オッズと買い目（ワイド 1軸流し: 1-2, 1-3）
+race_rows = []
+tickets = []
+for race_id in sampled_race_ids:
+    entry = prediction_cache.get(race_id)
+    if entry is None or len(entry['scores']) < 8:
+        continue
+
+    # 予測スコアが低い順にソート
+    order = np.argsort(entry['scores'], kind='stable')
+    pred = entry['umaban'][order]
+    scores = entry['scores'][order]
+    odds = entry['odds'][order]
+
+    race_rows.append({
+        'race_id': race_id,
+        'score_diff': scores[1] - scores[0],  # スコアが低いほど良いので、2位-1位
+        'avg_top2_odds': (odds[0] + odds[1]) / 2,
+    })
+    for pair in [(pred[0], pred[1]), (pred[0], pred[2])]:
+        tickets.append({'race_id': race_id, 'bet_type': 'ワイド', 'numbers': pair, 'stake': 100})
+
+race_table = pd.DataFrame(race_rows, columns=['race_id', 'score_diff', 'avg_top2_odds'])
+
+# 精算は条件に関係なく1回だけ
+race_table['hit'] = False
+race_table['return'] = 0
+if tickets:
+    settled = settlement.settle(pd.DataFrame(tickets))
+    per_race = settled.groupby('race_id', sort=False).agg(hit=('hit', 'any'), ret=('return', 'sum'))
+    race_table['hit'] = per_race['hit'].reindex(race_table['race_id']).fillna(False).to_numpy(dtype=bool)
+    race_table['return'] = per_race['ret'].reindex(race_table['race_id']).fillna(0).to_numpy(dtype=np.int64)
+
+score_diffs = race_table['score_diff'].to_numpy()
+avg_top2_odds = race_table['avg_top2_odds'].to_numpy()
+race_hits = race_table['hit'].to_numpy(dtype=bool)
+race_returns = race_table['return'].to_numpy(dtype=np.int64)
 
 print(f"\nフィルタリング条件の最適化中... ({len(score_diff_thresholds) * len(avg_odds_ranges)}パターン)")
 
-total_combinations = len(score_diff_thresholds) * len(avg_odds_ranges)
-current_combo = 0
-
 for score_diff_threshold in score_diff_thresholds:
     for min_odds, max_odds, odds_label in avg_odds_ranges:
-        current_combo += 1
-        print(f"\r進捗: {current_combo}/{total_combinations} (スコア差>={score_diff_threshold}, {odds_label})", end='', flush=True)
+        # スコア差が小さい（自信がない）・オッズ範囲外のレースは購入しない
+        purchase = (
+            (score_diffs >= score_diff_threshold) &
+            (min_odds <= avg_top2_odds) & (avg_top2_odds < max_odds)
+        )
 
         # この条件での結果
         result = {
@@ -121,202 +133,13 @@ for score_diff_threshold in score_diff_thresholds:
             'odds_range': odds_label,
             'min_odds': min_odds,
             'max_odds': max_odds,
-            'total': 0,
-            'purchased': 0,
-            'hit': 0,
-            'return': 0,
-            'cost': 0
+            'total': len(race_table),
+            'purchased': int(purchase.sum()),
+            'hit': int(race_hits[purchase].sum()),
+            'return': int(race_returns[purchase].sum()),
+            'cost': int(purchase.sum()) * 200  # 2点購入
         }
 
-        for idx, race_id in enumerate(sampled_race_ids):
-            race_horses = df[df['race_id'] == race_id].copy()
-
-            if len(race_horses) < 8:
-                continue
-
-            race_horses = race_horses.sort_values('Umaban')
-
-            race_date = race_horses.iloc[0]['date']
-            if pd.isna(race_date):
-                continue
-
-            race_date_str = str(race_date)[:10]
-
-            # 騎手・調教師統計
-            if race_date_str not in stats_cache:
-                stats_cache[race_date_str] = {
-                    'jockey': calculate_person_stats(df, 'JockeyName', race_date_str, months_back=12),
-                    'trainer': calculate_person_stats(df, 'TrainerName', race_date_str, months_back=12)
-                }
-
-            jockey_stats = stats_cache[race_date_str]['jockey']
-            trainer_stats = stats_cache[race_date_str]['trainer']
-
-            # 特徴量抽出
-            horse_features = []
-            horse_umabans = []
-            horse_odds_list = []
-
-            for _, horse in race_horses.iterrows():
-                horse_id = horse.get('horse_id')
-                past_results = get_horse_past_results_from_csv(horse_id, race_date_str, max_results=10)
-
-                # 過去成績
-                if past_results and len(past_results) > 0:
-                    recent_ranks = []
-                    for race in past_results[:5]:
-                        if isinstance(race, dict):
-                            past_rank = pd.to_numeric(race.get('rank'), errors='coerce')
-                            if pd.notna(past_rank):
-                                recent_ranks.append(past_rank)
-
-                    if recent_ranks:
-                        avg_rank = np.mean(recent_ranks)
-                        std_rank = np.std(recent_ranks) if len(recent_ranks) > 1 else 0
-                        min_rank = np.min(recent_ranks)
-                        max_rank = np.max(recent_ranks)
-                        recent_win_rate = sum(1 for r in recent_ranks if r == 1) / len(recent_ranks)
-                        recent_top3_rate = sum(1 for r in recent_ranks if r <= 3) / len(recent_ranks)
-                    else:
-                        avg_rank, std_rank, min_rank, max_rank = 8, 0, 10, 10
-                        recent_win_rate, recent_top3_rate = 0, 0
-                else:
-                    avg_rank, std_rank, min_rank, max_rank = 8, 0, 10, 10
-                    recent_win_rate, recent_top3_rate = 0, 0
-
-                # 騎手統計
-                jockey_name = horse.get('JockeyName')
-                if jockey_name in jockey_stats:
-                    jockey_win_rate = jockey_stats[jockey_name]['win_rate']
-                    jockey_top3_rate = jockey_stats[jockey_name]['top3_rate']
-                    jockey_races = jockey_stats[jockey_name]['races']
-                else:
-                    jockey_win_rate, jockey_top3_rate, jockey_races = 0, 0, 0
-
-                # 調教師統計
-                trainer_name = horse.get('TrainerName')
-                if trainer_name in trainer_stats:
-                    trainer_win_rate = trainer_stats[trainer_name]['win_rate']
-                    trainer_top3_rate = trainer_stats[trainer_name]['top3_rate']
-                    trainer_races = trainer_stats[trainer_name]['races']
-                else:
-                    trainer_win_rate, trainer_top3_rate, trainer_races = 0, 0, 0
-
-                # その他
-                age = pd.to_numeric(horse.get('Age'), errors='coerce')
-                age = age if pd.notna(age) else 5
-
-                weight_diff = pd.to_numeric(horse.get('WeightDiff'), errors='coerce')
-                weight_diff = weight_diff if pd.notna(weight_diff) else 0
-
-                weight = pd.to_numeric(horse.get('Weight'), errors='coerce')
-                weight = weight if pd.notna(weight) else 480
-
-                ninki = pd.to_numeric(horse.get('Ninki'), errors='coerce')
-                ninki = ninki if pd.notna(ninki) else 10
-
-                odds = pd.to_numeric(horse.get('Odds_x'), errors='coerce')
-                odds = odds if pd.notna(odds) and odds > 0 else 50
-
-                waku = pd.to_numeric(horse.get('Waku'), errors='coerce')
-                waku = waku if pd.notna(waku) else 5
-
-                course_type = horse.get('course_type')
-                course_turf = 1 if course_type == '芝' else 0
-                course_dirt = 1 if course_type == 'ダート' else 0
-
-                track_condition = horse.get('track_condition')
-                track_good = 1 if track_condition == '良' else 0
-
-                distance = pd.to_numeric(horse.get('distance'), errors='coerce')
-                distance = distance if pd.notna(distance) else 1600
-
-                feature_vector = [
-                    avg_rank, std_rank, min_rank, max_rank,
-                    recent_win_rate, recent_top3_rate,
-                    jockey_win_rate, jockey_top3_rate, jockey_races,
-                    trainer_win_rate, trainer_top3_rate, trainer_races,
-                    age, weight_diff, weight, np.log1p(odds), ninki, waku,
-                    course_turf, course_dirt, track_good, distance / 1000
-                ]
-
-                horse_features.append(feature_vector)
-                horse_umabans.append(int(horse.get('Umaban', 0)))
-                horse_odds_list.append(odds)
-
-            if len(horse_features) < 8:
-                continue
-
-            # 予測
-            X = np.array(horse_features)
-            predictions = model.predict(X)
-
-            # 予測スコアが低い順にソート
-            predicted_ranking = sorted(
-                zip(horse_umabans, predictions, horse_odds_list),
-                key=lambda x: x[1]
-            )
-
-            # スコア差を計算
-            score_1st = predicted_ranking[0][1]
-            score_2nd = predicted_ranking[1][1]
-            score_diff = score_2nd - score_1st  # スコアが低いほど良いので、2位-1位
-
-            # 上位2頭の平均オッズ
-            avg_top2_odds = (predicted_ranking[0][2] + predicted_ranking[1][2]) / 2
-
-            # 総レース数をカウント
-            result['total'] += 1
-
-            # フィルタリング条件チェック
-            if score_diff < score_diff_threshold:
-                continue  # スコア差が小さい（自信がない）→ スキップ
-
-            if not (min_odds <= avg_top2_odds < max_odds):
-                continue  # オッズ範囲外 → スキップ
-
-            # 条件を満たしたので購入
-            result['purchased'] += 1
-
-            # ワイド 1軸流し（1-2, 1-3）
-            pred_1st = predicted_ranking[0][0]
-            pred_2nd = predicted_ranking[1][0]
-            pred_3rd = predicted_ranking[2][0]
-
-            result['cost'] += 200  # 2点購入
-
-            # 配当データ取得
-            race_id_str = str(race_id)
-            payout_data = payout_dict.get(race_id_str, {})
-
-            if not payout_data or 'ワイド' not in payout_data:
-                continue
-
-            wide_data = payout_data['ワイド']
-            winning_pairs = wide_data.get('馬番', [])
-            payouts = wide_data.get('払戻金', [])
-
-            if not winning_pairs or not payouts:
-                continue
-
-            try:
-                # 的中判定
-                hit_found = False
-                for pred_pair in [(pred_1st, pred_2nd), (pred_1st, pred_3rd)]:
-                    pair_set = set(pred_pair)
-                    for i in range(0, len(winning_pairs), 2):
-                        if i + 1 < len(winning_pairs):
-                            winning_pair = set([int(winning_pairs[i]), int(winning_pairs[i+1])])
-                            if pair_set == winning_pair:
-                                result['hit'] += 1
-                                result['return'] += payouts[i // 2]
-                                hit_found = True
-                                break
-                    if hit_found:
-                        break
-            except:
-                pass
-
         # 結果を保存
         if result['purchased'] > 0:
             result['recovery'] = result['return'] / result['cost'] * 100 if result['cost'] > 0 else 0
@@ -0,0 +1,119 @@
+"""
+レース単位の並列バックテスト実行
+
+対象レースを連続したチャンクに分け、ワーカープロセスで処理して結果を集約する。
+
+- データ・モデルなどの読み取り専用オブジェクト（shared）はタスクごとにpickleしない。
+  fork が使える環境（Linux）ではプール作成前にモジュール変数へ置き、子プロセスは
+  それをコピーオンライトで共有する。fork がない環境（Windows）ではプールの
+  initializer でワーカーごとに1回だけ渡す。
+- チャンク関数は (race_ids, shared) を受け取り、集計dictを返す。
+  結果はチャンク順に merge_accumulators で足し合わせるため、並列数に関係なく同じ結果になる。
+
+使い方:
+    def run_chunk(race_ids, shared):
+        ...
+        return {'単勝_1位': {'total': 10, 'hit': 2, ...}, 'tickets': [...]}
+
+    if __name__ == '__main__':
+        totals = run_parallel_backtest(race_ids, run_chunk, {'df': df, 'model': model})
+"""
+import multiprocessing
+import os
+import numpy as np
+
+# ワーカーから参照する共有オブジェクト
+_SHARED = {}
+
+
+def merge_accumulators(total, part):
+    """
+    集計dictを再帰的に足し合わせる（数値は加算、リストは連結、dictは再帰）
+
+    Args:
+        total: 集計先（変更される）
+        part: 追加する集計dict
+
+    Returns:
+        total
+    """
+    for key, value in part.items():
+        if isinstance(value, dict):
+            merge_accumulators(total.setdefault(key, {}), value)
+        elif key not in total:
+            total[key] = list(value) if isinstance(value, list) else value
+        elif isinstance(value, list):
+            total[key].extend(value)
+        else:
+            total[key] += value
+    return total
+
+
+def split_races(race_ids, n_chunks):
+    """レースIDを順序を保ったまま n_chunks 個の連続チャンクに分割"""
+    race_ids = list(race_ids)
+    n_chunks = max(1, min(n_chunks, len(race_ids)))
+    return [
+        [race_ids[i] for i in chunk]
+        for chunk in np.array_split(np.arange(len(race_ids)), n_chunks)
+        if len(chunk)
+    ]
+
+
+def _init_worker(shared):
+    """spawn 環境用: ワーカー起動時に共有オブジェクトを1回だけ受け取る"""
+    global _SHARED
+    _SHARED = shared
+
+
+def _run_chunk(args):
+    chunk_func, race_ids = args
+    return chunk_func(race_ids, _SHARED)
+
+
+def run_parallel_backtest(race_ids, chunk_func, shared, workers=None, chunks_per_worker=4):
+    """
+    レースをワーカープロセスに分配してバックテストを実行
+
+    Args:
+        race_ids: 対象レースIDの並び
+        chunk_func: (race_ids, shared) -> 集計dict のモジュールレベル関数
+        shared: 全ワーカーで共有する読み取り専用オブジェクトのdict
+        workers: プロセス数（省略時はCPUコア数、1なら同じプロセスで逐次実行）
+        chunks_per_worker: ワーカーあたりのチャンク数（負荷の偏りを均すため）
+
+    Returns:
+        全チャンクの集計dictをチャンク順に足し合わせたもの
+    """
+    global _SHARED
+    workers = workers or os.cpu_count() or 1
+    chunks = split_races(race_ids, workers * chunks_per_worker if workers > 1 else 1)
+
+    totals = {}
+    if workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            merge_accumulators(totals, chunk_func(chunk, shared))
+        return totals
+
+    if 'fork' in multiprocessing.get_all_start_methods():
+        # 子プロセスはプール作成時点のメモリを共有する
+        _SHARED = shared
+        ctx = multiprocessing.get_context('fork')
+        pool = ctx.Pool(workers)
+    else:
+        ctx = multiprocessing.get_context('spawn')
+        pool = ctx.Pool(workers, initializer=_init_worker, initargs=(shared,))
+
+    print(f"[INFO] 並列バックテスト: {len(race_ids)}レース / {workers}プロセス / {len(chunks)}チャンク")
+    try:
+        # imap はチャンク順に結果を返すので集計順が固定される
+        for done, part in enumerate(pool.imap(_run_chunk, [(chunk_func, c) for c in chunks]), 1):
+            merge_accumulators(totals, part)
+            print(f"\r  {done}/{len(chunks)} チャンク完了", end='', flush=True)
+        print()
+    finally:
+        pool.close()
+        pool.join()
+        _SHARED = {}
+
+    return totals
@@ -0,0 +1,281 @@
+"""
+払戻データの索引付きストア（SQLite）
+
+payout_cache.pkl や netkeiba_data_payouts_*.json は、1レース追加するたびに全体を
+書き直し、使うたびに全レース分を読み込んで {race_id: 払戻} の辞書を作り直していた。
+ここでは払戻を (race_id, 券種, 組番) ごとに1行の表にして SQLite に持つ。
+
+    races    (race_id, race_date, added_at)           レース単位（日付の範囲検索用の索引あり）
+    payouts  (race_id, type_code, combo_key, payout)  券種・組番は bet_settlement と同じコード
+
+- 追記のみ（既に登録済みのレースは書き換えない）。1回の追加は1トランザクションで、
+  WAL + synchronous=FULL なので途中で落ちても書きかけのレースは残らない
+- get(race_id) は fetch_actual_payouts と同じ {券種: [{'馬番': '3-5', '払戻': 1230}]} 形式を返す
+  （bet_settlement.find_payout にそのまま渡せる）
+- table() は SettlementEngine.from_store 用の払戻テーブル（必要なレース・期間だけ読む）
+
+使い方:
+    store = PayoutStore('data/payouts.sqlite')
+    store.import_json(json_path, race_dates=race_dates_from_frame(df))  # 取り込み済みなら何もしない
+    store.add(payout_item, race_date='2024-06-01')
+    item = store.get('202406010101')
+    race_ids = store.race_ids(start_date='2024-01-01', end_date='2024-12-31')
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from bet_settlement import (BET_TYPE_CODES, BET_TYPE_SIZES, encode_combinations,
+                            iter_payout_entries, normalize_bet_type)
+from race_data_store import normalize_date_series
+
+# type_code -> 券種名
+BET_TYPES_BY_CODE = {code: bet_type for bet_type, code in BET_TYPE_CODES.items()}
+
+
+def race_key(race_id):
+    """race_id を文字列キーに統一（202401010101.0 -> '202401010101'）"""
+    if isinstance(race_id, (float, np.floating)) and float(race_id).is_integer():
+        return str(int(race_id))
+    return str(race_id).strip().split('.')[0]
+
+
+def decode_combination(bet_type, combo_key):
+    """組番キーを馬番のリストに戻す（encode_combinations の逆）"""
+    numbers = [combo_key // 10000, combo_key // 100 % 100, combo_key % 100]
+    return numbers[-BET_TYPE_SIZES[bet_type]:]
+
+
+def race_dates_from_frame(df, date_col=None):
+    """レースデータから {race_id: 'YYYY-MM-DD'} を作る（払戻の日付範囲検索用）"""
+    if df is None or df.empty:
+        return {}
+    if date_col is None:
+        date_col = 'date' if 'date' in df.columns else 'race_date'
+    if date_col not in df.columns or 'race_id' not in df.columns:
+        return {}
+    races = df[['race_id', date_col]].drop_duplicates('race_id')
+    dates = pd.to_datetime(normalize_date_series(races[date_col]), errors='coerce')
+    valid = dates.notna().to_numpy()
+    return dict(zip(races['race_id'].map(race_key)[valid], dates[valid].dt.strftime('%Y-%m-%d')))
+
+
+class PayoutStore:
+    """
+    (race_id, 券種, 組番) -> 払戻金 の追記専用ストア
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=FULL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS races ('
+            ' race_id TEXT PRIMARY KEY, race_date TEXT, added_at REAL NOT NULL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS idx_races_date ON races(race_date)')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS payouts ('
+            ' race_id TEXT NOT NULL, type_code INTEGER NOT NULL, combo_key INTEGER NOT NULL,'
+            ' payout INTEGER NOT NULL, PRIMARY KEY (race_id, type_code, combo_key)) WITHOUT ROWID'
+        )
+        # 取り込み済みのJSON（サイズ・更新時刻が同じなら再度読まない）
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS sources ('
+            ' path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, imported_at REAL NOT NULL)'
+        )
+        self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM races').fetchone()[0]
+
+    def __contains__(self, race_id):
+        with self._lock:
+            return self._db.execute('SELECT 1 FROM races WHERE race_id = ?', (race_key(race_id),)).fetchone() is not None
+
+    # --- 書き込み ---
+
+    def _insert(self, payout_item, race_date):
+        """1レース分を挿入（トランザクションは呼び出し側）。新しく登録したら True"""
+        race_id = payout_item.get('race_id')
+        if race_id is None:
+            return False
+        key = race_key(race_id)
+
+        if self._db.execute('SELECT 1 FROM races WHERE race_id = ?', (key,)).fetchone() is not None:
+            # 登録済みのレースは書き換えない（日付が未設定なら補う）
+            if race_date:
+                self._db.execute('UPDATE races SET race_date = ? WHERE race_id = ? AND race_date IS NULL',
+                                 (race_date, key))
+            return False
+
+        entries = list(iter_payout_entries(payout_item))
+        if not entries:
+            return False
+
+        self._db.execute('INSERT INTO races (race_id, race_date, added_at) VALUES (?, ?, ?)',
+                         (key, race_date, time.time()))
+        bet_types = [bet_type for bet_type, _, _ in entries]
+        combo_keys = encode_combinations(bet_types, [numbers for _, numbers, _ in entries])
+        # 同着などで同じ組番が重複した場合は先頭を採用（SettlementEngine と同じ）
+        self._db.executemany(
+            'INSERT OR IGNORE INTO payouts (race_id, type_code, combo_key, payout) VALUES (?, ?, ?, ?)',
+            [(key, BET_TYPE_CODES[bet_type], int(combo), int(payout))
+             for bet_type, combo, (_, _, payout) in zip(bet_types, combo_keys, entries)],
+        )
+        return True
+
+    def add(self, payout_item, race_date=None):
+        """1レース分の払戻を追加（登録済みなら何もしない）。新しく登録したら True"""
+        with self._lock, self._db:
+            return self._insert(payout_item, race_date)
+
+    def add_many(self, payout_items, race_dates=None):
+        """
+        複数レースの払戻を1トランザクションで追加
+
+        Args:
+            payout_items: 払戻データのリスト（各要素に race_id）
+            race_dates: {race_id: 'YYYY-MM-DD'}（省略可）
+
+        Returns:
+            新しく登録したレース数
+        """
+        race_dates = {race_key(k): v for k, v in (race_dates or {}).items()}
+        with self._lock, self._db:
+            return sum(
+                self._insert(item, race_dates.get(race_key(item.get('race_id', ''))))
+                for item in payout_items if isinstance(item, dict)
+            )
+
+    def fill_dates(self, race_dates):
+        """日付が未設定のレースに日付を設定"""
+        with self._lock, self._db:
+            self._db.executemany(
+                'UPDATE races SET race_date = ? WHERE race_id = ? AND race_date IS NULL',
+                [(date, race_key(race_id)) for race_id, date in race_dates.items()],
+            )
+
+    def import_json(self, json_path, race_dates=None):
+        """
+        netkeiba_data_payouts_*.json を取り込む
+
+        同じファイル（サイズ・更新時刻が同じ）を取り込み済みなら読み込まない。
+
+        Returns:
+            新しく登録したレース数
+        """
+        stat = os.stat(json_path)
+        path = os.path.abspath(json_path)
+        with self._lock:
+            row = self._db.execute('SELECT size, mtime_ns FROM sources WHERE path = ?', (path,)).fetchone()
+        if row == (stat.st_size, stat.st_mtime_ns):
+            if race_dates:
+                self.fill_dates(race_dates)
+            return 0
+
+        with open(json_path, 'r', encoding='utf-8') as f:
+            payout_items = json.load(f)
+        num_new = self.add_many(payout_items, race_dates)
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO sources (path, size, mtime_ns, imported_at) VALUES (?, ?, ?, ?)',
+                             (path, stat.st_size, stat.st_mtime_ns, time.time()))
+        print(f"[INFO] 払戻データを取り込みました: {os.path.basename(json_path)} (新規 {num_new}レース)")
+        return num_new
+
+    # --- 読み込み ---
+
+    def race_ids(self, start_date=None, end_date=None):
+        """登録済みの race_id（日付を指定すると race_date がその範囲のレースのみ）"""
+        query, params = 'SELECT race_id FROM races', []
+        conditions = []
+        if start_date is not None:
+            conditions.append('race_date >= ?')
+            params.append(str(pd.Timestamp(start_date).date()))
+        if end_date is not None:
+            conditions.append('race_date <= ?')
+            params.append(str(pd.Timestamp(end_date).date()))
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        with self._lock:
+            return [row[0] for row in self._db.execute(query + ' ORDER BY race_id', params)]
+
+    def get(self, race_id, default=None):
+        """1レース分の払戻を fetch_actual_payouts 形式で返す（未登録なら default）"""
+        key = race_key(race_id)
+        with self._lock:
+            if self._db.execute('SELECT 1 FROM races WHERE race_id = ?', (key,)).fetchone() is None:
+                return default
+            rows = self._db.execute(
+                'SELECT type_code, combo_key, payout FROM payouts WHERE race_id = ? ORDER BY type_code, combo_key',
+                (key,),
+            ).fetchall()
+
+        item = {'race_id': key}
+        for type_code, combo_key, payout in rows:
+            bet_type = BET_TYPES_BY_CODE[type_code]
+            numbers = decode_combination(bet_type, combo_key)
+            item.setdefault(bet_type, []).append({'馬番': '-'.join(str(n) for n in numbers), '払戻': payout})
+        return item
+
+    def lookup(self, race_id, bet_type, numbers):
+        """買い目1点の100円あたりの払戻金（不的中・未登録は0）"""
+        bet_type = normalize_bet_type(bet_type)
+        if bet_type not in BET_TYPE_CODES:
+            return 0
+        combo_key = int(encode_combinations([bet_type], [numbers])[0])
+        with self._lock:
+            row = self._db.execute(
+                'SELECT payout FROM payouts WHERE race_id = ? AND type_code = ? AND combo_key = ?',
+                (race_key(race_id), BET_TYPE_CODES[bet_type], combo_key),
+            ).fetchone()
+        return row[0] if row else 0
+
+    def table(self, race_ids=None, start_date=None, end_date=None):
+        """
+        払戻テーブル（race_key, type_code, combo_key, payout）を必要な分だけ読み込む
+
+        Args:
+            race_ids: 対象レース（省略時は全レース、または日付範囲のレース）
+            start_date, end_date: race_date の範囲
+        """
+        if race_ids is None and (start_date is not None or end_date is not None):
+            race_ids = self.race_ids(start_date, end_date)
+
+        with self._lock:
+            if race_ids is None:
+                rows = self._db.execute('SELECT race_id, type_code, combo_key, payout FROM payouts').fetchall()
+            else:
+                self._db.execute('CREATE TEMP TABLE IF NOT EXISTS wanted (race_id TEXT PRIMARY KEY)')
+                self._db.execute('DELETE FROM wanted')
+                self._db.executemany('INSERT OR IGNORE INTO wanted (race_id) VALUES (?)',
+                                     [(race_key(r),) for r in race_ids])
+                rows = self._db.execute(
+                    'SELECT p.race_id, p.type_code, p.combo_key, p.payout'
+                    ' FROM wanted w JOIN payouts p ON p.race_id = w.race_id'
+                ).fetchall()
+                self._db.execute('DELETE FROM wanted')
+                self._db.commit()
+
+        return pd.DataFrame({
+            'race_key': np.array([r[0] for r in rows], dtype=object),
+            'type_code': np.array([r[1] for r in rows], dtype=np.int64),
+            'combo_key': np.array([r[2] for r in rows], dtype=np.int64),
+            'payout': np.array([r[3] for r in rows], dtype=np.int64),
+        })
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,131 @@
+"""
+騎手・調教師の統計エンジン
+
+各スクリプトにコピーされていた calculate_person_stats の共通実装。
+人物ごとに日付順の累積（勝利数・3着内数・出走数）を一度だけ作っておき、
+任意の基準日の「直近Nヶ月」の成績を累積和の差分で O(log n) で求める。
+
+使い方:
+    jockey_engine = PersonStatsEngine(df, 'JockeyName')
+    jockey_stats = jockey_engine.person_stats('2024-05-26', months_back=12)
+    stats = jockey_engine.stats_for(['ルメール', '川田将雅'], '2024-05-26')
+"""
+import numpy as np
+import pandas as pd
+
+# 統計に含める最低出走数（従来の calculate_person_stats と同じ）
+MIN_RACES = 10
+
+# 人物コードと日付（エポックからの日数）を1つのキーにまとめるためのシフト幅
+_DAY_BITS = 32
+
+
+class PersonStatsEngine:
+    """
+    人物（騎手・調教師など）ごとの累積成績テーブル
+
+    行は (人物コード, 日付) 順に並べ、キー = コード << 32 | 日数 の
+    単調増加配列に対する searchsorted で期間の行範囲を求める。
+    """
+
+    def __init__(self, df, person_col, min_races=MIN_RACES):
+        self.person_col = person_col
+        self.min_races = min_races
+
+        if 'date_parsed' in df.columns:
+            dates = pd.to_datetime(df['date_parsed'], errors='coerce')
+        else:
+            dates = pd.to_datetime(df['date'], errors='coerce')
+        rank_num = pd.to_numeric(df['Rank'], errors='coerce')
+        persons = df[person_col].astype(object)  # カテゴリ型でも名前で引けるように
+
+        valid = (
+            dates.notna() & rank_num.notna() & persons.notna() &
+            (persons.astype(str) != '')
+        ).to_numpy()
+
+        codes, uniques = pd.factorize(persons[valid])
+        self.persons = pd.Index(uniques)
+
+        days = dates[valid].to_numpy(dtype='datetime64[D]').astype(np.int64)
+        keys = (codes.astype(np.int64) << _DAY_BITS) | days
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+
+        ranks = rank_num[valid].to_numpy()[order]
+        # 先頭に0を置いた累積和（区間 [lo, hi) の合計 = cum[hi] - cum[lo]）
+        self.cum_wins = np.r_[0, np.cumsum(ranks == 1)]
+        self.cum_top3 = np.r_[0, np.cumsum(ranks <= 3)]
+
+    @staticmethod
+    def _window_days(reference_date, months_back):
+        """基準日と集計開始日をエポックからの日数で返す"""
+        reference_date_parsed = pd.to_datetime(reference_date)
+        start_date = reference_date_parsed - pd.DateOffset(months=months_back)
+        to_days = lambda d: int(np.datetime64(pd.Timestamp(d).normalize(), 'D').astype(np.int64))
+        return to_days(start_date), to_days(reference_date_parsed)
+
+    def _window_counts(self, codes, reference_date, months_back):
+        """人物コード配列ごとの期間内 (出走数, 勝利数, 3着内数)"""
+        start_day, ref_day = self._window_days(reference_date, months_back)
+        base = codes.astype(np.int64) << _DAY_BITS
+        lo = np.searchsorted(self.keys, base | start_day, side='left')
+        hi = np.searchsorted(self.keys, base | ref_day, side='left')
+        runs = hi - lo
+        wins = self.cum_wins[hi] - self.cum_wins[lo]
+        top3 = self.cum_top3[hi] - self.cum_top3[lo]
+        return runs, wins, top3
+
+    def stats_for(self, people, reference_date, months_back=12):
+        """
+        指定した人物リストの基準日時点の成績をまとめて計算
+
+        Args:
+            people: 騎手名・調教師名のリスト
+            reference_date: 基準日（この日は含まない）
+            months_back: 集計期間（月数）
+
+        Returns:
+            {'win_rate', 'top3_rate', 'races'} の配列dict（people と同じ順）。
+            出走数が min_races 未満・未登録の人物は 0。
+        """
+        codes = self.persons.get_indexer(pd.Index(people))
+        known = codes >= 0
+        runs, wins, top3 = self._window_counts(np.where(known, codes, 0), reference_date, months_back)
+
+        enough = known & (runs >= self.min_races)
+        safe_runs = np.where(enough, runs, 1)
+        return {
+            'win_rate': np.where(enough, wins / safe_runs, 0.0),
+            'top3_rate': np.where(enough, top3 / safe_runs, 0.0),
+            'races': np.where(enough, runs, 0),
+        }
+
+    def person_stats(self, reference_date, months_back=12):
+        """
+        基準日時点の全人物の成績dict（従来の calculate_person_stats と同じ形式）
+
+        Returns:
+            {人物名: {'win_rate', 'top3_rate', 'races'}}（出走数 min_races 以上のみ）
+        """
+        codes = np.arange(len(self.persons))
+        runs, wins, top3 = self._window_counts(codes, reference_date, months_back)
+
+        person_stats = {}
+        for code in np.flatnonzero(runs >= self.min_races):
+            total_races = int(runs[code])
+            person_stats[self.persons[code]] = {
+                'win_rate': wins[code] / total_races,
+                'top3_rate': top3[code] / total_races,
+                'races': total_races
+            }
+        return person_stats
+
+
+def calculate_person_stats(df, person_col, reference_date, months_back=12):
+    """
+    騎手・調教師の統計を計算（1回限りの呼び出し用）
+
+    同じデータで何度も呼ぶ場合は PersonStatsEngine を1度作って使い回すこと。
+    """
+    return PersonStatsEngine(df, person_col).person_stats(reference_date, months_back)
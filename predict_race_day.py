@@ -0,0 +1,54 @@
+"""
+開催日一括予想（コマンドライン）
+
+指定した開催日の全レースの出馬表を並行して取得し、全出走馬を1回の特徴量作成・
+各モデル1回の予測でまとめて予想して、予測一覧と推奨馬券の一覧をCSVに保存する。
+（GUIの「開催日一括予想」と同じ処理。GUIを起動せずに実行する）
+
+使い方:
+    python predict_race_day.py 20250601
+    python predict_race_day.py 20250601 --auto-update   # DB未登録馬のデータも取得
+"""
+import sys
+import time
+
+from prediction_service import HeadlessPredictor, RequestJob
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    if not args:
+        print("使い方: python predict_race_day.py YYYYMMDD [--auto-update]")
+        sys.exit(1)
+    kaisai_date = args[0].replace('-', '').replace('/', '')
+    auto_update = '--auto-update' in sys.argv[1:]
+
+    print("=" * 80)
+    print(f"開催日一括予想: {kaisai_date}")
+    print("=" * 80)
+
+    predictor = HeadlessPredictor()
+
+    start = time.monotonic()
+    result = predictor._predict_race_day_job(RequestJob(f"開催日一括予想 {kaisai_date}"), kaisai_date, auto_update)
+    elapsed = time.monotonic() - start
+
+    print("\n" + "=" * 80)
+    print(f"【推奨馬券】{kaisai_date} {len(result['results'])}レース ({elapsed:.1f}秒)")
+    print("=" * 80)
+    for _, row in result['bets'].iterrows():
+        print(f"\n{row['競馬場']}{row['R']}R {row['レース名']} {row['発走']}")
+        print(f"  {row['判定']} {row['推奨']}")
+        print(f"  ◎ {row['本命']} 勝率{row['本命勝率']*100:.1f}%")
+        print(f"  単勝 {row['単勝']} / 馬連 {row['馬連']} / 3連複 {row['3連複']}")
+        if row['バリュー馬']:
+            print(f"  バリュー: {row['バリュー馬']}")
+
+    if result['failed']:
+        print(f"\n出馬表取得失敗: {', '.join(result['failed'])}")
+    print(f"\n予測一覧: {result['paths']['predictions']}")
+    print(f"推奨馬券: {result['paths']['bets']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+レースごとの予測結果キャッシュ
+
+(モデルファイルのハッシュ, race_id) をキーに、各レースの馬番・特徴量・予測スコア・
+単勝オッズを保存しておく。戦略のグリッドサーチでは条件ごとに特徴量抽出と
+model.predict をやり直さず、キャッシュ済みのスコアに対して絞り込みと精算だけを行う。
+
+モデルファイルが変わればハッシュが変わり、別のキャッシュファイルが使われる。
+
+使い方:
+    cache = PredictionCache.for_model(model_path)
+    predict_and_cache(cache, model, df, race_ids, jockey_engine=..., trainer_engine=...)
+    cache.save()
+    entry = cache.get(race_id)   # {'umaban', 'features', 'scores', 'odds'}
+"""
+import hashlib
+import os
+import pickle
+import numpy as np
+import pandas as pd
+
+from feature_builder import build_feature_matrix
+
+CACHE_VERSION = 2
+
+
+def model_file_hash(model_path, length=16):
+    """モデルファイルの内容ハッシュ（SHA-256の先頭 length 文字）"""
+    digest = hashlib.sha256()
+    with open(model_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:length]
+
+
+def _race_key(race_id):
+    """race_id を文字列キーに統一（202401010101.0 -> '202401010101'）"""
+    if isinstance(race_id, (float, np.floating)) and float(race_id).is_integer():
+        return str(int(race_id))
+    return str(race_id).split('.')[0]
+
+
+class PredictionCache:
+    """
+    race_id -> {'umaban', 'features', 'scores', 'odds'} の永続キャッシュ
+    """
+
+    def __init__(self, model_hash, cache_path):
+        self.model_hash = model_hash
+        self.cache_path = cache_path
+        self.entries = {}
+        self._dirty = False
+
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'rb') as f:
+                    data = pickle.load(f)
+                if data.get('version') == CACHE_VERSION and data.get('model_hash') == model_hash:
+                    self.entries = data.get('entries', {})
+                    print(f"[INFO] 予測キャッシュ読み込み: {len(self.entries)}レース")
+                else:
+                    print("[INFO] 予測キャッシュのモデルが異なるため作り直します")
+            except Exception as e:
+                print(f"[WARNING] 予測キャッシュ読み込み失敗: {e}")
+
+    @classmethod
+    def for_model(cls, model_path, cache_dir=None):
+        """モデルファイルに対応するキャッシュ（既定はモデルと同じフォルダ）"""
+        model_hash = model_file_hash(model_path)
+        cache_dir = cache_dir or os.path.dirname(os.path.abspath(model_path))
+        cache_path = os.path.join(cache_dir, f"prediction_cache_{model_hash}.pkl")
+        return cls(model_hash, cache_path)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, race_id):
+        return _race_key(race_id) in self.entries
+
+    def get(self, race_id):
+        return self.entries.get(_race_key(race_id))
+
+    def put(self, race_id, umaban, features, scores, odds):
+        self.entries[_race_key(race_id)] = {
+            'umaban': np.asarray(umaban, dtype=np.int64),
+            'features': np.asarray(features, dtype=np.float32),
+            'scores': np.asarray(scores, dtype=np.float64),
+            'odds': np.asarray(odds, dtype=np.float64),
+        }
+        self._dirty = True
+
+    def missing(self, race_ids):
+        """キャッシュにない race_id のリスト"""
+        return [race_id for race_id in race_ids if _race_key(race_id) not in self.entries]
+
+    def save(self):
+        """変更があればキャッシュファイルに保存"""
+        if not self._dirty:
+            return
+        tmp_path = self.cache_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({
+                'version': CACHE_VERSION,
+                'model_hash': self.model_hash,
+                'entries': self.entries,
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.cache_path)
+        self._dirty = False
+        print(f"[INFO] 予測キャッシュ保存: {len(self.entries)}レース")
+
+
+def predict_and_cache(cache, model, df, race_ids, history_df=None,
+                      jockey_engine=None, trainer_engine=None, min_horses=8):
+    """
+    キャッシュにないレースだけ特徴量を作って予測し、キャッシュに追加
+
+    特徴量は着順の有無に関係なく全出走馬について作る（バックテストと同じ条件）。
+
+    Returns:
+        新たに予測したレース数
+    """
+    missing = cache.missing(race_ids)
+    if not missing:
+        return 0
+
+    X, _, groups, meta = build_feature_matrix(
+        df, history_df=history_df, jockey_engine=jockey_engine, trainer_engine=trainer_engine,
+        race_ids=missing, min_horses=min_horses, require_rank=False
+    )
+    if len(X) == 0:
+        return 0
+
+    scores = model.predict(X)
+    # float32 の log_odds から戻すと 5.0 -> 4.9999996 のようにずれて戦略のオッズ境界をまたぐので、元の値を使う
+    odds = meta['odds'].to_numpy(dtype=np.float64)
+    umaban = pd.to_numeric(meta['Umaban'], errors='coerce').fillna(0).to_numpy(dtype=np.int64)
+
+    bounds = np.r_[0, np.cumsum(groups)]
+    for g in range(len(groups)):
+        lo, hi = bounds[g], bounds[g + 1]
+        cache.put(meta['race_id'].iloc[lo], umaban[lo:hi], X[lo:hi], scores[lo:hi], odds[lo:hi])
+
+    return len(groups)
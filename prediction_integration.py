@@ -11,9 +11,12 @@ import tkinter as tk
 import threading
 import os
 from improved_analyzer import ImprovedHorseAnalyzer
+from horse_history_index import HorseHistoryIndex, HISTORY_COLUMNS
+from race_data_store import load_race_data
 
 # CSV データのグローバルキャッシュ
 _csv_race_data = None
+_horse_history_index = None
 
 def load_csv_race_data():
     """CSVから全レースデータを読み込む（初回のみ）"""
@@ -28,13 +31,29 @@ def load_csv_race_data():
     if csv_files:
         csv_path = os.path.join(data_dir, csv_files[0])
         print(f"[INFO] CSVデータ読み込み中: {csv_files[0]}")
-        _csv_race_data = pd.read_csv(csv_path, encoding='utf-8', low_memory=False)
+        _csv_race_data = load_race_data(csv_path, columns=HISTORY_COLUMNS)
         print(f"[INFO] CSVデータ読み込み完了: {len(_csv_race_data)}件")
         return _csv_race_data
     else:
         print(f"[WARNING] CSVファイルが見つかりません: {data_dir}")
         return None
 
+def get_horse_history_index():
+    """CSVデータから馬ごとの過去成績インデックスを構築（初回のみ）"""
+    global _horse_history_index
+
+    if _horse_history_index is not None:
+        return _horse_history_index
+
+    df = load_csv_race_data()
+    if df is None:
+        return None
+
+    print("[INFO] 過去成績インデックス構築中...")
+    _horse_history_index = HorseHistoryIndex(df)
+    print(f"[INFO] 過去成績インデックス構築完了: {len(_horse_history_index)}頭")
+    return _horse_history_index
+
 def get_horse_past_results_from_csv(horse_id, race_date, max_results=5):
     """
     CSVから指定した馬の過去成績を取得
@@ -47,50 +66,32 @@ def get_horse_past_results_from_csv(horse_id, race_date, max_results=5):
     Returns:
         過去成績のリスト（新しい順）
     """
-    df = load_csv_race_data()
-    if df is None or pd.isna(horse_id) or pd.isna(race_date):
+    if pd.isna(horse_id) or pd.isna(race_date):
         return []
 
-    # この馬の全成績を取得
-    horse_races = df[df['horse_id'] == horse_id].copy()
+    index = get_horse_history_index()
+    if index is None:
+        return []
 
-    if len(horse_races) == 0:
-        # 型変換を試みる
-        try:
-            horse_id_int = int(horse_id)
-            horse_races = df[df['horse_id'] == horse_id_int].copy()
-        except:
-            pass
+    return index.get_past_results(horse_id, race_date, max_results)
 
-    if len(horse_races) == 0:
-        return []
+def get_race_past_results_from_csv(horse_ids, race_date, max_results=5):
+    """
+    CSVから1レース分の出走馬の過去成績をまとめて取得
+
+    Args:
+        horse_ids: 馬IDのリスト
+        race_date: 基準となるレース日付
+        max_results: 最大取得件数
+
+    Returns:
+        horse_ids と同じ順の過去成績リストのリスト
+    """
+    index = get_horse_history_index()
+    if index is None or pd.isna(race_date):
+        return [[] for _ in horse_ids]
 
-    # 日付でフィルタ
-    horse_races['date_parsed'] = pd.to_datetime(horse_races['date'], errors='coerce')
-    race_date_parsed = pd.to_datetime(race_date, errors='coerce')
-
-    past_races = horse_races[horse_races['date_parsed'] < race_date_parsed]
-    past_races = past_races.sort_values('date_parsed', ascending=False)
-
-    # 過去成績リストを作成
-    results = []
-    for _, race in past_races.head(max_results).iterrows():
-        result = {
-            'date': race.get('date'),
-            'place': race.get('track_name'),
-            'distance': pd.to_numeric(race.get('distance'), errors='coerce'),
-            'rank': pd.to_numeric(race.get('Rank'), errors='coerce'),
-            'course_type': race.get('course_type'),
-            'baba': race.get('track_condition'),
-            'time': race.get('Time'),
-            'agari': race.get('Agari'),
-            'passage': race.get('Passage'),
-            'weight': pd.to_numeric(race.get('Weight'), errors='coerce'),
-            'weight_diff': pd.to_numeric(race.get('WeightDiff'), errors='coerce'),
-        }
-        results.append(result)
-
-    return results
+    return index.get_past_results_batch(horse_ids, race_date, max_results)
 
 
 def enhanced_fetch_race_info_thread(self, race_id):
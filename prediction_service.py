@@ -0,0 +1,274 @@
+"""
+常駐予測サービス（ローカルHTTP）
+
+GUIの外で予測するたびに KeibaGUIv3 を作ると、CSV読み込み・血統/調教師騎手統計・
+V3/V4分析器の構築・モデル読み込みで最初の予測まで数十秒かかる。
+このサービスは起動時に1回だけそれらを読み込んでメモリに保持し、
+KeibaGUIv3 と同じ予測処理（_predict_card）をHTTPで呼び出せるようにする。
+
+エンドポイント（JSON、127.0.0.1 のみで待ち受け）:
+    GET  /health          読み込み状態（データ件数・モデル特徴量数・起動にかかった秒数）
+    POST /predict_race    {"race_id": "202505021211",
+                           "horses": [...],       省略時は出馬表を取得（出馬表 -> 結果ページ -> DB）
+                           "race_info": {...},    horses を渡す場合のレース情報（競馬場・距離・馬場など）
+                           "auto_update": false}  DB未登録馬の自動データ取得（既定は行わない）
+    POST /predict_batch   {"races": [{...}, {...}]}  predict_race の要求を複数まとめて
+    POST /predict_day     {"date": "20250601", "auto_update": false}
+                          開催日の全レースを一括予想（KeibaGUIv3._predict_race_day_job、一覧表CSVも保存）
+
+horses は scrape_shutuba と同じ形式（馬番・枠番・馬名・horse_id・騎手・調教師・単勝オッズ など）。
+出馬表とオッズを呼び出し側で取得して渡せば、スクレイピングなしで特徴量計算と予測だけを行う。
+
+起動:
+    python prediction_service.py --port 8765
+
+呼び出し例:
+    requests.post('http://127.0.0.1:8765/predict_race', json={'race_id': '202505021211', 'horses': horses})
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from keiba_prediction_gui_v3 import KeibaGUIv3
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# 1回の要求の最大サイズ（バイト）
+MAX_REQUEST_BYTES = 16 * 1024 * 1024
+
+# horses を渡す場合に各馬に必要な項目
+REQUIRED_HORSE_KEYS = ('馬番', '馬名', 'horse_id', '騎手')
+
+
+class RequestJob:
+    """
+    予測処理に渡すジョブ（gui_jobs.Job と同じ呼び出し方、GUIなし・中止なし）
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def progress(self, value=None, text=None):
+        pass
+
+    def post(self, func, *args):
+        func(*args)
+
+    def check_cancelled(self):
+        pass
+
+
+class HeadlessPredictor(KeibaGUIv3):
+    """
+    ウィンドウを作らない KeibaGUIv3（モデル・データ・統計・分析器の読み込みと予測処理のみ）
+    """
+
+    def __init__(self):
+        self.root = None
+        self.last_prediction = None
+        self.last_race_id = None
+        self.last_race_info = None
+        self.last_has_odds = False
+        self.data_range_text = "未取得"
+        self.data_stats = {}
+
+        self.load_models()
+        self.load_data()
+
+    def insert_text(self, text, tag=None):
+        """GUIの代わりにコンソールへ出力"""
+        if tag == 'error':
+            print(f"[WARNING] {text.strip()}")
+
+
+class PredictionService:
+    """
+    予測に必要なデータ・モデルを常駐させ、要求ごとに予測する
+    """
+
+    def __init__(self):
+        start = time.monotonic()
+        self.predictor = HeadlessPredictor()
+        self.load_seconds = time.monotonic() - start
+        self.started_at = time.time()
+        self.num_requests = 0
+        self._count_lock = threading.Lock()
+        print(f"[INFO] 予測サービス準備完了 ({self.load_seconds:.1f}秒)")
+
+    def health(self):
+        predictor = self.predictor
+        return {
+            'status': 'ok' if predictor.model_win is not None and predictor.df is not None else 'not_ready',
+            'records': 0 if predictor.df is None else int(len(predictor.df)),
+            'model_features': 0 if predictor.model_features is None else len(predictor.model_features),
+            'data_range': predictor.data_range_text,
+            'load_seconds': round(self.load_seconds, 1),
+            'uptime_seconds': round(time.time() - self.started_at, 1),
+            'requests': self.num_requests,
+        }
+
+    def predict_race(self, request):
+        """
+        1レース分の予測
+
+        Returns:
+            {'race_id', 'race_info', 'has_odds', 'predictions': [馬ごとのdict（勝率予測の高い順）], 'elapsed_ms'}
+            レースが見つからなければ 'error'
+        """
+        with self._count_lock:
+            self.num_requests += 1
+
+        start = time.perf_counter()
+        race_id = str(request.get('race_id', '')).strip()
+        if not race_id:
+            raise ValueError("race_id を指定してください")
+        auto_update = bool(request.get('auto_update', False))
+        job = RequestJob(f"予想 {race_id}")
+
+        horses = request.get('horses')
+        if horses:
+            for h in horses:
+                missing = [k for k in REQUIRED_HORSE_KEYS if k not in h]
+                if missing:
+                    raise ValueError(f"horses の項目が不足しています: {', '.join(missing)} ({h.get('馬名', '?')})")
+            race_info = dict(request.get('race_info') or {})
+            has_odds = any(_to_float(h.get('単勝オッズ')) > 0 for h in horses)
+            for h in horses:
+                h['単勝オッズ'] = _to_float(h.get('単勝オッズ'))
+            result = self.predictor._predict_card(job, race_id, horses, race_info, has_odds, auto_update)
+        else:
+            result = self.predictor._predict_race_job(job, race_id, auto_update)
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if result is None:
+            return {'race_id': race_id, 'error': 'レースが見つかりません', 'elapsed_ms': round(elapsed_ms, 1)}
+
+        df_pred = result['df_pred']
+        return {
+            'race_id': race_id,
+            'race_info': result['race_info'],
+            'has_odds': bool(result['has_odds']),
+            'predictions': json.loads(df_pred.to_json(orient='records', force_ascii=False)),
+            'elapsed_ms': round(elapsed_ms, 1),
+        }
+
+    def predict_day(self, request):
+        """開催日の全レースを一括予想（出馬表の並行取得・特徴量の一括作成・各モデル1回の予測）"""
+        with self._count_lock:
+            self.num_requests += 1
+
+        start = time.perf_counter()
+        kaisai_date = str(request.get('date', '')).replace('-', '').replace('/', '').strip()
+        if len(kaisai_date) != 8 or not kaisai_date.isdigit():
+            raise ValueError("date は YYYYMMDD で指定してください")
+        result = self.predictor._predict_race_day_job(
+            RequestJob(f"開催日一括予想 {kaisai_date}"), kaisai_date, bool(request.get('auto_update', False)))
+        return {
+            'date': kaisai_date,
+            'bets': json.loads(result['bets'].to_json(orient='records', force_ascii=False)),
+            'predictions': json.loads(result['predictions'].to_json(orient='records', force_ascii=False)),
+            'failed': result['failed'],
+            'paths': result['paths'],
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 1),
+        }
+
+    def predict_batch(self, request):
+        """複数レースの予測（1レースの失敗で全体を止めない）"""
+        start = time.perf_counter()
+        results = []
+        for race_request in request.get('races') or []:
+            try:
+                results.append(self.predict_race(race_request))
+            except Exception as e:
+                results.append({'race_id': str(race_request.get('race_id', '')), 'error': str(e)})
+        return {'results': results, 'elapsed_ms': round((time.perf_counter() - start) * 1000, 1)}
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def make_handler(service):
+    """PredictionService を呼び出すリクエストハンドラのクラスを作る"""
+
+    routes = {
+        '/predict_race': service.predict_race,
+        '/predict_batch': service.predict_batch,
+        '/predict_day': service.predict_day,
+    }
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send_json(self, status, obj):
+            body = json.dumps(obj, ensure_ascii=False, default=str).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip('/') == '/health':
+                self._send_json(200, service.health())
+            else:
+                self._send_json(404, {'error': f'不明なパス: {self.path}'})
+
+        def do_POST(self):
+            handler = routes.get(self.path.rstrip('/'))
+            if handler is None:
+                self._send_json(404, {'error': f'不明なパス: {self.path}'})
+                return
+
+            length = int(self.headers.get('Content-Length') or 0)
+            if length > MAX_REQUEST_BYTES:
+                self._send_json(413, {'error': '要求が大きすぎます'})
+                return
+            try:
+                request = json.loads(self.rfile.read(length).decode('utf-8') or '{}')
+            except (UnicodeDecodeError, json.JSONDecodeError) as e:
+                self._send_json(400, {'error': f'JSONを解析できません: {e}'})
+                return
+
+            try:
+                self._send_json(200, handler(request))
+            except ValueError as e:
+                self._send_json(400, {'error': str(e)})
+            except Exception as e:
+                import traceback
+                traceback.print_exc()
+                self._send_json(500, {'error': f'{type(e).__name__}: {e}'})
+
+        def log_message(self, format, *args):
+            print(f"[INFO] {self.address_string()} {format % args}")
+
+    return Handler
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """データ・モデルを読み込んでからHTTPサーバーを起動（Ctrl+Cで終了）"""
+    service = PredictionService()
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    print(f"[INFO] 予測サービス待ち受け中: http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("[INFO] 予測サービスを終了します")
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='常駐予測サービス（ローカルHTTP）')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+    serve(args.host, args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""
+netkeiba レースデータの列指向ストア（Parquet）
+
+数百MBのCSVを毎回 pd.read_csv して日付正規化・数値変換をやり直す代わりに、
+一度だけ型付きのParquetに変換しておき、以降は必要な列だけを読み込む。
+
+- date: 'YYYY-MM-DD' 形式に正規化済み（'2025年01月05日' なども変換）
+- date_parsed: datetime64 に変換済みの日付
+- rank / win_odds: 着順・単勝オッズの数値列
+  （元のCSVに同名の列がある場合は派生させず、元の列をそのまま残す）
+- 競馬場・騎手・調教師・種牡馬名などはカテゴリ型
+
+使い方:
+    df = load_race_data(csv_path, columns=['race_id', 'horse_id', 'date', 'Rank'])
+
+    # 事前変換（コマンドライン）
+    python race_data_store.py <csv_path>
+"""
+import os
+import sys
+import pandas as pd
+
+try:
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+STORE_SUFFIX = '.parquet'
+
+# カテゴリ型にする列（存在するもののみ）
+CATEGORICAL_COLUMNS = [
+    'track_name', 'course_type', 'track_condition', 'weather',
+    'JockeyName', 'TrainerName', 'father', 'mother_father', 'Sex',
+]
+
+# 派生する数値列 -> 元の列の候補（先に見つかった列を使用）
+NUMERIC_SOURCES = {
+    'rank': ('着順', 'Rank'),
+    'win_odds': ('単勝', 'Odds_x', 'Odds'),
+}
+
+# 読み込み後に追加されうる派生列（実際に追加されたかは derived_columns() で確認）
+DERIVED_COLUMNS = ['date_parsed'] + list(NUMERIC_SOURCES)
+
+
+def store_path_for(csv_path):
+    """CSVに対応するストアのパス"""
+    return os.path.splitext(csv_path)[0] + STORE_SUFFIX
+
+
+def normalize_date_series(dates):
+    """
+    日付列を 'YYYY-MM-DD' 形式に正規化（'2025年1月5日' -> '2025-01-05'）
+
+    どちらの形式にも当てはまらない値はそのまま、欠損は欠損のまま。
+    """
+    s = dates.astype(str)
+    jp = s.str.extract(r'(\d{4})年(\d{1,2})月(\d{1,2})日')
+    iso = jp[0] + '-' + jp[1].str.zfill(2) + '-' + jp[2].str.zfill(2)
+    iso = iso.fillna(s.str.extract(r'(\d{4}-\d{2}-\d{2})')[0])
+    return iso.fillna(s).where(dates.notna(), None)
+
+
+def prepare_race_frame(df, categorical=True):
+    """
+    読み込んだレースデータに正規化済み日付・数値列・カテゴリ型を付与
+
+    Args:
+        df: CSVから読み込んだDataFrame
+        categorical: 名前系の列をカテゴリ型にするか
+    """
+    # 元のデータに同名の列があれば上書きしない（保存時に派生列と一緒に消さないため）
+    if 'date' in df.columns:
+        df['date'] = normalize_date_series(df['date'])
+        if 'date_parsed' not in df.columns:
+            df['date_parsed'] = pd.to_datetime(df['date'], errors='coerce')
+
+    for target, sources in NUMERIC_SOURCES.items():
+        if target in df.columns:
+            continue
+        for source in sources:
+            if source in df.columns:
+                df[target] = pd.to_numeric(df[source], errors='coerce')
+                break
+
+    if categorical:
+        for col in CATEGORICAL_COLUMNS:
+            if col in df.columns and df[col].dtype == object:
+                df[col] = df[col].astype('category')
+
+    return df
+
+
+def convert_csv_to_store(csv_path, store_path=None):
+    """
+    CSVを読み込んで型付きのParquetストアに変換
+
+    Returns:
+        作成したストアのパス
+    """
+    if not PARQUET_AVAILABLE:
+        raise ImportError("Parquetストアには pyarrow が必要です (pip install pyarrow)")
+
+    store_path = store_path or store_path_for(csv_path)
+    print(f"[INFO] ストア変換中: {os.path.basename(csv_path)} -> {os.path.basename(store_path)}")
+
+    df = pd.read_csv(csv_path, encoding='utf-8', low_memory=False)
+    df = prepare_race_frame(df, categorical=True)
+
+    # 途中で落ちても壊れたストアを残さないよう一時ファイル経由で置き換える
+    tmp_path = store_path + '.tmp'
+    df.to_parquet(tmp_path, index=False, compression='zstd')
+    os.replace(tmp_path, store_path)
+
+    print(f"[INFO] ストア変換完了: {len(df):,}件")
+    return store_path
+
+
+def derived_columns(csv_path):
+    """
+    load_race_data が csv_path のデータに追加した派生列（元のCSVにない DERIVED_COLUMNS）
+
+    読み込んだデータをCSVに保存し直すときは、この列だけを落とす。
+    """
+    source_columns = set(pd.read_csv(csv_path, encoding='utf-8', nrows=0).columns)
+    return [c for c in DERIVED_COLUMNS if c not in source_columns]
+
+
+def is_store_fresh(csv_path, store_path=None):
+    """ストアが存在し、CSVより新しいか"""
+    store_path = store_path or store_path_for(csv_path)
+    if not os.path.exists(store_path):
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    return os.path.getmtime(store_path) >= os.path.getmtime(csv_path)
+
+
+def _decategorize(df):
+    """カテゴリ列を通常のobject列に戻す（値を書き換えるGUI向け）"""
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(object)
+    return df
+
+
+def load_race_data(csv_path, columns=None, categorical=True, auto_convert=True):
+    """
+    レースデータを読み込む（ストアがあればストアから、なければCSVから）
+
+    Args:
+        csv_path: 元のCSVパス
+        columns: 読み込む列（Noneで全列）。存在しない列は無視する
+        categorical: 名前系の列をカテゴリ型のまま返すか
+        auto_convert: ストアがない・古い場合にその場で変換するか
+
+    Returns:
+        正規化済みのDataFrame
+    """
+    store_path = store_path_for(csv_path)
+
+    if PARQUET_AVAILABLE:
+        if not is_store_fresh(csv_path, store_path) and auto_convert and os.path.exists(csv_path):
+            try:
+                convert_csv_to_store(csv_path, store_path)
+            except Exception as e:
+                print(f"[WARNING] ストア変換失敗（CSVから読み込みます）: {e}")
+
+        if is_store_fresh(csv_path, store_path):
+            if columns is not None:
+                available = set(pq.read_schema(store_path).names)
+                columns = [c for c in columns if c in available]
+            df = pd.read_parquet(store_path, columns=columns)
+            return df if categorical else _decategorize(df)
+
+    # ストアが使えない場合はCSVから読み込んで同じ正規化を行う
+    usecols = None
+    if columns is not None:
+        needed = set(columns)
+        if 'date_parsed' in needed:
+            needed.add('date')
+        for target, sources in NUMERIC_SOURCES.items():
+            if target in needed:
+                needed.update(sources)
+        usecols = lambda c: c in needed
+
+    df = pd.read_csv(csv_path, encoding='utf-8', low_memory=False, usecols=usecols)
+    df = prepare_race_frame(df, categorical=categorical)
+    if columns is not None:
+        df = df[[c for c in columns if c in df.columns]]
+    return df
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("使い方: python race_data_store.py <csv_path> [store_path]")
+        sys.exit(1)
+    convert_csv_to_store(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
@@ -0,0 +1,177 @@
+"""
+(race_id, horse_id) キー索引と追記専用のレースデータセット
+
+増分更新のたびに既存データ全体をコピーして文字列キーを作り、全件を結合し直すと、
+データが増えるほど更新が遅くなる。ここでは各行のキーを64bitハッシュにして
+ソート済み配列で持ち、新しい行の判定は二分探索だけで行う。
+
+- KeyIndex: ソート済みのキーハッシュ配列（contains / add）
+- AppendOnlyRaceDataset: CSVの末尾に新しい行だけを追記し、索引を CSV の隣
+  （<csv>.keys.npz）に保存する。CSVが外部で書き換えられていれば索引を作り直す
+
+使い方:
+    dataset = AppendOnlyRaceDataset(csv_path)
+    num_new = dataset.append(new_df)      # 既存と重複しない行だけを追記
+    added = dataset.append_rows(new_df)   # 追記した行そのもの（メモリ上のデータに足す用）
+
+    index = KeyIndex.from_frame(df)
+    new_only = new_df[~index.contains(row_keys(new_df))]
+"""
+import os
+import numpy as np
+import pandas as pd
+
+from horse_history_index import normalize_horse_id_series
+
+KEY_COLUMNS = ['race_id', 'horse_id']
+INDEX_SUFFIX = '.keys.npz'
+
+
+def row_keys(df):
+    """(race_id, horse_id) ごとの64bitハッシュ（202401010101.0 と '202401010101' は同じキー）"""
+    race_ids = normalize_horse_id_series(df['race_id']).fillna('')
+    horse_ids = normalize_horse_id_series(df['horse_id']).fillna('')
+    keys = (race_ids + '_' + horse_ids).to_numpy(dtype=object)
+    return pd.util.hash_array(keys)
+
+
+class KeyIndex:
+    """ソート済みのキーハッシュ配列"""
+
+    def __init__(self, keys=None):
+        self.keys = np.unique(np.asarray(keys, dtype=np.uint64)) if keys is not None else np.zeros(0, dtype=np.uint64)
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls(row_keys(df))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def contains(self, keys):
+        """各キーが索引にあるか（bool配列）"""
+        keys = np.asarray(keys, dtype=np.uint64)
+        if len(self.keys) == 0:
+            return np.zeros(len(keys), dtype=bool)
+        pos = np.searchsorted(self.keys, keys)
+        pos = np.minimum(pos, len(self.keys) - 1)
+        return self.keys[pos] == keys
+
+    def add(self, keys):
+        """キーを追加（ソート済み配列同士の併合）"""
+        self.keys = np.union1d(self.keys, np.asarray(keys, dtype=np.uint64))
+
+
+def select_new_rows(index, new_df):
+    """
+    索引にない行だけを返す（new_df 内の重複は最初の行を残す）
+
+    Returns:
+        (新しい行のDataFrame, そのキー配列)
+    """
+    keys = row_keys(new_df)
+    is_new = ~index.contains(keys) & ~pd.Series(keys).duplicated().to_numpy()
+    return new_df[is_new], keys[is_new]
+
+
+class AppendOnlyRaceDataset:
+    """
+    CSVに新しいレース行だけを追記するデータセット
+    """
+
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self.index_path = csv_path + INDEX_SUFFIX
+        self._index = None
+
+    def _file_signature(self):
+        stat = os.stat(self.csv_path)
+        return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+    def _load_index(self):
+        """保存済みの索引を読み込む（CSVが変わっていれば作り直す）"""
+        if not os.path.exists(self.csv_path):
+            return KeyIndex()
+        if os.path.exists(self.index_path):
+            try:
+                with np.load(self.index_path) as data:
+                    if np.array_equal(data['signature'], self._file_signature()):
+                        index = KeyIndex()
+                        index.keys = data['keys']
+                        return index
+            except (OSError, KeyError, ValueError):
+                pass
+
+        print(f"[INFO] キー索引を作成中: {os.path.basename(self.csv_path)}")
+        keys = pd.read_csv(self.csv_path, usecols=KEY_COLUMNS, dtype=str, encoding='utf-8-sig')
+        index = KeyIndex.from_frame(keys)
+        self._save_index(index)
+        return index
+
+    def _save_index(self, index):
+        tmp_path = self.index_path + '.tmp.npz'
+        np.savez(tmp_path, keys=index.keys, signature=self._file_signature())
+        os.replace(tmp_path, self.index_path)
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = self._load_index()
+        return self._index
+
+    def append(self, new_df):
+        """
+        既存と重複しない行だけをCSVの末尾に追記
+
+        Returns:
+            追記した行数
+        """
+        return len(self.append_rows(new_df))
+
+    def append_rows(self, new_df):
+        """
+        既存と重複しない行だけをCSVの末尾に追記し、追記した行を返す
+
+        列は既存CSVのヘッダーに合わせる（ない列は空欄）。既存にない列が含まれる場合は
+        追記できないので、全体を読み込んで書き直す。
+
+        Returns:
+            追記した行の DataFrame（new_df の行のうち新しいもの、列は new_df のまま）
+        """
+        if new_df is None or new_df.empty:
+            return new_df.iloc[:0] if new_df is not None else pd.DataFrame()
+
+        if not os.path.exists(self.csv_path):
+            new_only, keys = select_new_rows(KeyIndex(), new_df)
+            new_only.to_csv(self.csv_path, index=False, encoding='utf-8-sig')
+            self._index = KeyIndex(keys)
+            self._save_index(self._index)
+            return new_only
+
+        new_only, keys = select_new_rows(self.index, new_df)
+        if new_only.empty:
+            return new_only
+
+        header = pd.read_csv(self.csv_path, nrows=0, encoding='utf-8-sig').columns
+        extra = [c for c in new_only.columns if c not in header]
+        if extra:
+            print(f"[WARNING] 既存CSVにない列があるため全体を書き直します: {extra[:5]}")
+            existing = pd.read_csv(self.csv_path, low_memory=False, encoding='utf-8-sig')
+            merged = pd.concat([existing, new_only], ignore_index=True)
+            tmp_path = self.csv_path + '.tmp'
+            merged.to_csv(tmp_path, index=False, encoding='utf-8-sig')
+            os.replace(tmp_path, self.csv_path)
+        else:
+            original_size = os.path.getsize(self.csv_path)
+            try:
+                with open(self.csv_path, 'a', encoding='utf-8', newline='') as f:
+                    new_only.reindex(columns=header).to_csv(f, index=False, header=False)
+            except Exception:
+                # 途中まで書いた行を取り除いて元の状態に戻す
+                with open(self.csv_path, 'r+b') as f:
+                    f.truncate(original_size)
+                raise
+
+        self.index.add(keys)
+        self._save_index(self.index)
+        return new_only
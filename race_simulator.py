@@ -0,0 +1,199 @@
+"""
+着順シミュレーション（Plackett–Luce モデル）
+
+各馬の勝率 p_i から、1着を p に比例して選び、残りの馬から再び p に比例して2着、3着…と
+選ぶ Plackett–Luce モデルで上位3頭の並びの確率を求める。
+
+- simulate_top3: Gumbel-top-k で全試行の着順を (試行数 × 頭数) の行列から一度に引き、
+  上位3頭の組み合わせキーを bincount で集計する
+- exact_top3: 同じモデルの確率を解析的に計算（1着 i・2着 j・3着 k の確率を (n, n, n) 配列で）
+
+どちらも結果は馬番順のインデックスを持つ密な配列
+（exacta[i, j] = i→j の馬単確率、trifecta[i, j, k] = i→j→k の3連単確率）。
+
+使い方:
+    probs = exotic_probabilities(umabans, win_probas)                 # 頭数に応じて自動選択
+    probs = exotic_probabilities(umabans, win_probas, method='simulate', n_simulations=100000)
+    probs['trifecta'][(3, 7, 1)]
+
+    # 厳密計算との一致と速度を確認
+    python race_simulator.py
+"""
+import numpy as np
+
+# この頭数以下なら厳密計算（n^3 の配列なのでフルゲート18頭でも 5,832 要素）
+EXACT_MAX_HORSES = 18
+
+# シミュレーションで一度に生成する試行数（メモリ使用量の上限）
+SIMULATION_CHUNK = 50000
+
+
+def _normalize(win_probs):
+    """勝率を合計1に正規化（負値・欠損は0）"""
+    p = np.nan_to_num(np.asarray(win_probs, dtype=np.float64), nan=0.0)
+    p = np.clip(p, 0.0, None)
+    total = p.sum()
+    return p / total if total > 0 else p
+
+
+def simulate_top3(win_probs, n_simulations=100000, seed=None):
+    """
+    Gumbel-top-k で着順をまとめて引き、上位3頭の並びの頻度を求める
+
+    log(p_i) + Gumbel ノイズの大きい順に並べた順位は、Plackett–Luce モデルから
+    非復元抽出した着順と同じ分布になる。
+
+    Args:
+        win_probs: 各馬の勝率（3頭以上）
+        n_simulations: 試行回数
+        seed: 乱数シード
+
+    Returns:
+        (exacta, trifecta) の密な確率配列
+    """
+    p = _normalize(win_probs)
+    n = len(p)
+    rng = np.random.default_rng(seed)
+    with np.errstate(divide='ignore'):
+        log_p = np.log(p)
+
+    counts = np.zeros(n ** 3, dtype=np.int64)
+    done = 0
+    while done < n_simulations:
+        m = min(SIMULATION_CHUNK, n_simulations - done)
+        keys = log_p + rng.gumbel(size=(m, n))
+        # 上位3頭を取り出してから、その3頭だけを並べ替える
+        top = np.argpartition(-keys, 2, axis=1)[:, :3]
+        order = np.argsort(-np.take_along_axis(keys, top, axis=1), axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        counts += np.bincount((top[:, 0] * n + top[:, 1]) * n + top[:, 2], minlength=n ** 3)
+        done += m
+
+    trifecta = counts.reshape(n, n, n) / float(n_simulations)
+    return trifecta.sum(axis=2), trifecta
+
+
+def exact_top3(win_probs):
+    """
+    Plackett–Luce モデルの上位3頭の並びの確率を厳密に計算
+
+    P(i→j) = p_i * p_j / (1 - p_i)
+    P(i→j→k) = P(i→j) * p_k / (1 - p_i - p_j)
+
+    Returns:
+        (exacta, trifecta) の密な確率配列
+    """
+    p = _normalize(win_probs)
+    n = len(p)
+    same = np.eye(n, dtype=bool)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        exacta = p[:, None] * p[None, :] / (1.0 - p)[:, None]
+        remaining = 1.0 - p[:, None] - p[None, :]
+        trifecta = exacta[:, :, None] * p[None, None, :] / remaining[:, :, None]
+
+    exacta = np.where(same, 0.0, np.nan_to_num(exacta, nan=0.0, posinf=0.0))
+    distinct = ~(same[:, :, None] | same[:, None, :] | same[None, :, :])
+    trifecta = np.where(distinct, np.nan_to_num(trifecta, nan=0.0, posinf=0.0), 0.0)
+    return exacta, trifecta
+
+
+def top3_distribution(win_probs, method='auto', n_simulations=100000, seed=None):
+    """
+    上位3頭の並びの確率を密な配列で返す
+
+    Args:
+        win_probs: 各馬の勝率（並び順がそのまま配列のインデックスになる）
+        method: 'exact' / 'simulate' / 'auto'（EXACT_MAX_HORSES 頭以下なら厳密計算）
+        n_simulations: シミュレーション時の試行回数
+        seed: シミュレーション時の乱数シード
+
+    Returns:
+        (exacta, trifecta)
+    """
+    if method == 'auto':
+        method = 'exact' if len(win_probs) <= EXACT_MAX_HORSES else 'simulate'
+    if method == 'exact':
+        return exact_top3(win_probs)
+    if method == 'simulate':
+        return simulate_top3(win_probs, n_simulations=n_simulations, seed=seed)
+    raise ValueError(f"未対応のmethod: {method}")
+
+
+def _nonzero_dict(umabans, probs, mask):
+    """密な確率配列から {馬番タプル: 確率} を作成（確率0の組み合わせは含めない）"""
+    positions = np.argwhere(mask & (probs > 0))
+    return {
+        tuple(int(umabans[i]) for i in pos): float(probs[tuple(pos)])
+        for pos in positions
+    }
+
+
+def exotic_probabilities(umabans, win_probs, method='auto', n_simulations=100000, seed=None):
+    """
+    馬連・馬単・3連複・3連単の確率を {馬番タプル: 確率} で返す
+
+    馬連・3連複のキーは馬番の昇順。3頭未満のレースは空のdictを返す。
+
+    Returns:
+        {'exacta': {...}, 'quinella': {...}, 'trio': {...}, 'trifecta': {...}}
+    """
+    empty = {'exacta': {}, 'quinella': {}, 'trio': {}, 'trifecta': {}}
+    umabans = np.asarray(umabans)
+    win_probs = np.asarray(win_probs, dtype=np.float64)
+    if len(umabans) < 3 or _normalize(win_probs).sum() <= 0:
+        return empty
+
+    # 馬番順に並べておくと、インデックスの大小がそのまま馬番の大小になる
+    order = np.argsort(umabans, kind='stable')
+    umabans = umabans[order]
+    exacta, trifecta = top3_distribution(win_probs[order], method, n_simulations, seed)
+
+    n = len(umabans)
+    idx = np.arange(n)
+    upper = idx[:, None] < idx[None, :]
+    ascending = upper[:, :, None] & upper[None, :, :]
+
+    quinella = exacta + exacta.T
+    trio = sum(trifecta.transpose(axes) for axes in
+               [(0, 1, 2), (0, 2, 1), (1, 0, 2), (1, 2, 0), (2, 0, 1), (2, 1, 0)])
+
+    return {
+        'exacta': _nonzero_dict(umabans, exacta, np.ones_like(upper)),
+        'quinella': _nonzero_dict(umabans, quinella, upper),
+        'trio': _nonzero_dict(umabans, trio, ascending),
+        'trifecta': _nonzero_dict(umabans, trifecta, np.ones_like(ascending)),
+    }
+
+
+def _self_check():
+    """厳密計算とシミュレーションの一致・速度を確認"""
+    import time
+
+    rng = np.random.default_rng(0)
+    win_probs = rng.dirichlet(np.ones(16) * 0.8)
+    umabans = np.arange(1, 17)
+
+    start = time.perf_counter()
+    exact_exacta, exact_trifecta = exact_top3(win_probs)
+    exact_time = time.perf_counter() - start
+    assert abs(exact_trifecta.sum() - 1.0) < 1e-9, '3連単確率の合計が1でない'
+    assert np.allclose(exact_exacta.sum(axis=1), win_probs / win_probs.sum()), '1着確率が勝率と一致しない'
+    print(f"[OK] 厳密計算 16頭: {exact_time * 1000:.2f}ms（3連単の合計 {exact_trifecta.sum():.6f}）")
+
+    start = time.perf_counter()
+    sim_exacta, sim_trifecta = simulate_top3(win_probs, n_simulations=200000, seed=1)
+    sim_time = time.perf_counter() - start
+    max_err = np.abs(sim_exacta - exact_exacta).max()
+    assert max_err < 0.01, f'シミュレーションが厳密値と一致しない (最大誤差 {max_err:.4f})'
+    print(f"[OK] シミュレーション 16頭 × 20万回: {sim_time:.3f}秒（馬単の最大誤差 {max_err:.4f}）")
+
+    probs = exotic_probabilities(umabans, win_probs)
+    assert abs(sum(probs['trio'].values()) - 1.0) < 1e-9 and all(k[0] < k[1] < k[2] for k in probs['trio'])
+    assert abs(sum(probs['quinella'].values()) - 1.0) < 1e-9 and all(k[0] < k[1] for k in probs['quinella'])
+    print(f"[OK] 組み合わせ数: 馬連{len(probs['quinella'])} 馬単{len(probs['exacta'])} "
+          f"3連複{len(probs['trio'])} 3連単{len(probs['trifecta'])}")
+
+
+if __name__ == '__main__':
+    _self_check()
@@ -0,0 +1,301 @@
+"""
+HTTPレスポンスのディスクキャッシュ
+
+URLごとに取得したHTMLをそのまま（zlib圧縮で）保存しておき、パーサーを直した後の
+再解析などでネットワークに出ずに済むようにする。FetchPool(cache=...) で使う。
+
+- 本文は SHA-256 をファイル名にした圧縮ファイル（同じ内容は1つだけ保存）
+- URL -> (本文ハッシュ, 有効期限, ETag/Last-Modified, 最終アクセス) は SQLite の索引
+- 有効期限は URL ごとのポリシーで決める。払戻が載っている確定済みのレース結果は無期限、
+  出馬表・レース一覧などは短時間、馬ページは数日
+- 期限切れでも ETag / Last-Modified があれば条件付きリクエストで再検証（304 なら本文を再利用）
+- 合計サイズが上限を超えたら最終アクセスの古い順に削除（LRU）。合計は保存・削除のたびに
+  差分で更新し、索引全体の集計は上限を超えたときだけ行う
+- 保存先はどのスクリプトからも DEFAULT_CACHE_DIR（リポジトリ直下の cache/http）を共有する
+
+使い方:
+    cache = get_default_cache()          # ResponseCache(DEFAULT_CACHE_DIR) をプロセスで1つ
+    pool = FetchPool(rate=1.0, cache=cache)
+    r = pool.get(url)   # 有効なキャッシュがあれば通信しない
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# 既定の保存先（作業ディレクトリによらずリポジトリ直下の cache/http）と合計サイズ上限
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'http')
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+# 有効期限なし
+IMMUTABLE = None
+
+# 結果ページが確定済み（払戻あり）かどうかの目印
+FINISHED_MARKERS = (b'Payout_Detail_Table', b'pay_table_01')
+
+RESULT_PAGE_PATTERN = re.compile(r'race\.netkeiba\.com/race/result\.html|db\.netkeiba\.com/race/\d+')
+
+# (URLパターン, 有効期限秒) 先に一致したものを使う
+TTL_RULES = [
+    (re.compile(r'db\.netkeiba\.com/horse/'), 7 * 24 * 3600),
+    (re.compile(r'/top/calendar\.html'), 24 * 3600),
+    (re.compile(r'/top/race_list'), 10 * 60),
+    (re.compile(r'shutuba|odds'), 5 * 60),
+]
+DEFAULT_TTL = 3600
+
+# 確定前の結果ページの有効期限
+UNFINISHED_RESULT_TTL = 10 * 60
+
+# レスポンスヘッダーのうち保存するもの
+_KEPT_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+
+def default_ttl(url, body):
+    """
+    URLと本文から有効期限（秒、IMMUTABLE は無期限）を決める
+    """
+    if RESULT_PAGE_PATTERN.search(url):
+        return IMMUTABLE if any(m in body for m in FINISHED_MARKERS) else UNFINISHED_RESULT_TTL
+    for pattern, ttl in TTL_RULES:
+        if pattern.search(url):
+            return ttl
+    return DEFAULT_TTL
+
+
+class CachedEntry:
+    """キャッシュの1件分"""
+
+    def __init__(self, url, digest, expires_at, etag, last_modified, content_type, body):
+        self.url = url
+        self.digest = digest
+        self.expires_at = expires_at
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_type = content_type
+        self.body = body
+
+    @property
+    def fresh(self):
+        return self.expires_at is None or self.expires_at > time.time()
+
+    def conditional_headers(self):
+        """再検証用のリクエストヘッダー"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def to_response(self):
+        """requests.Response として返す（呼び出し側は通常のレスポンスと同じに扱える）"""
+        r = requests.Response()
+        r.status_code = 200
+        r.url = self.url
+        r._content = self.body
+        r.headers = CaseInsensitiveDict({'Content-Type': self.content_type or 'text/html'})
+        r.encoding = requests.utils.get_encoding_from_headers(r.headers)
+        r.from_cache = True
+        return r
+
+
+class ResponseCache:
+    """
+    URL -> 圧縮本文 のディスクキャッシュ（SQLite索引 + 内容アドレスのファイル）
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, ttl_policy=default_ttl):
+        """
+        Args:
+            cache_dir: 保存先フォルダ（既定は DEFAULT_CACHE_DIR）
+            max_bytes: 圧縮後の合計サイズ上限
+            ttl_policy: (url, body) -> 有効期限秒（IMMUTABLE で無期限）
+        """
+        self.cache_dir = cache_dir
+        self.blob_dir = os.path.join(cache_dir, 'blobs')
+        self.max_bytes = max_bytes
+        self.ttl_policy = ttl_policy
+        os.makedirs(self.blob_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(cache_dir, 'index.sqlite'), check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            ' url TEXT PRIMARY KEY, digest TEXT NOT NULL, size INTEGER NOT NULL,'
+            ' fetched_at REAL NOT NULL, expires_at REAL, last_access REAL NOT NULL,'
+            ' etag TEXT, last_modified TEXT, content_type TEXT)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS idx_last_access ON entries(last_access)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS idx_digest ON entries(digest)')
+        self._db.commit()
+        # 本文の合計サイズ（保存・削除で差分更新、上限を超えたら索引から数え直す）
+        self._total_bytes = self._count_total_bytes()
+
+    def _blob_path(self, digest):
+        return os.path.join(self.blob_dir, digest[:2], digest + '.z')
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def lookup(self, url):
+        """
+        キャッシュを引く（期限切れでも返すので fresh を確認すること）
+
+        Returns:
+            CachedEntry（なければ None）
+        """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT digest, expires_at, etag, last_modified, content_type FROM entries WHERE url = ?',
+                (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            digest, expires_at, etag, last_modified, content_type = row
+            try:
+                with open(self._blob_path(digest), 'rb') as f:
+                    body = zlib.decompress(f.read())
+            except (OSError, zlib.error):
+                # 本文ファイルが壊れている・消えている場合は索引ごと捨てる
+                self._db.execute('DELETE FROM entries WHERE url = ?', (url,))
+                self._db.commit()
+                return None
+            self._db.execute('UPDATE entries SET last_access = ? WHERE url = ?', (time.time(), url))
+            self._db.commit()
+        return CachedEntry(url, digest, expires_at, etag, last_modified, content_type, body)
+
+    def store(self, url, response):
+        """200 レスポンスを保存"""
+        if response.status_code != 200:
+            return
+        body = response.content
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._blob_path(digest)
+        ttl = self.ttl_policy(url, body)
+        now = time.time()
+
+        with self._lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(zlib.compress(body, 6))
+                os.replace(tmp_path, path)
+            previous = self._db.execute('SELECT digest FROM entries WHERE url = ?', (url,)).fetchone()
+            new_blob = self._db.execute('SELECT 1 FROM entries WHERE digest = ? LIMIT 1', (digest,)).fetchone() is None
+            size = os.path.getsize(path)
+            headers = {h: response.headers.get(h) for h in _KEPT_HEADERS}
+            self._db.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (url, digest, size, now, None if ttl is IMMUTABLE else now + ttl, now,
+                 headers['ETag'], headers['Last-Modified'], headers['Content-Type'])
+            )
+            self._db.commit()
+            if new_blob:
+                self._total_bytes += size
+            if previous and previous[0] != digest:
+                self._remove_orphans([previous[0]])
+            self._evict()
+
+    def revalidated(self, url, response):
+        """304 を受けたエントリの有効期限を延長"""
+        with self._lock:
+            entry_row = self._db.execute('SELECT digest FROM entries WHERE url = ?', (url,)).fetchone()
+            if entry_row is None:
+                return
+            try:
+                with open(self._blob_path(entry_row[0]), 'rb') as f:
+                    body = zlib.decompress(f.read())
+            except (OSError, zlib.error):
+                return
+            ttl = self.ttl_policy(url, body)
+            now = time.time()
+            self._db.execute(
+                'UPDATE entries SET expires_at = ?, last_access = ?,'
+                ' etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified) WHERE url = ?',
+                (None if ttl is IMMUTABLE else now + ttl, now,
+                 response.headers.get('ETag'), response.headers.get('Last-Modified'), url)
+            )
+            self._db.commit()
+
+    def invalidate(self, url):
+        """URLのキャッシュを削除"""
+        with self._lock:
+            row = self._db.execute('SELECT digest FROM entries WHERE url = ?', (url,)).fetchone()
+            if row is None:
+                return
+            self._db.execute('DELETE FROM entries WHERE url = ?', (url,))
+            self._db.commit()
+            self._remove_orphans([row[0]])
+
+    def total_bytes(self):
+        """保存している本文の合計サイズ（重複は1回分、差分更新している値）"""
+        return self._total_bytes
+
+    def _count_total_bytes(self):
+        """索引全体から本文の合計サイズを数える（ロック取得済みか初期化時に呼ぶ）"""
+        return self._db.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM entries)'
+        ).fetchone()[0]
+
+    def _evict(self):
+        """上限を超えていれば最終アクセスの古い順に削除（ロック取得済みで呼ぶ）"""
+        if self._total_bytes <= self.max_bytes:
+            return
+        # 他のプロセスの書き込みなどでずれている可能性があるので、超えたときだけ数え直す
+        total = self._total_bytes = self._count_total_bytes()
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute('SELECT url, digest, size FROM entries ORDER BY last_access').fetchall()
+        refs = {}
+        for _, digest, _ in rows:
+            refs[digest] = refs.get(digest, 0) + 1
+
+        removed, freed = [], []
+        for url, digest, size in rows:
+            if total <= self.max_bytes:
+                break
+            removed.append(url)
+            refs[digest] -= 1
+            if refs[digest] == 0:
+                total -= size
+                freed.append(digest)
+
+        self._db.executemany('DELETE FROM entries WHERE url = ?', [(u,) for u in removed])
+        self._db.commit()
+        self._remove_orphans(freed)
+        print(f"[INFO] HTTPキャッシュ: {len(removed)}件を削除（上限 {self.max_bytes / 1024 ** 2:.0f}MB）")
+
+    def _remove_orphans(self, digests):
+        """どのURLからも参照されなくなった本文ファイルを削除（ロック取得済みで呼ぶ）"""
+        for digest in digests:
+            in_use = self._db.execute('SELECT 1 FROM entries WHERE digest = ? LIMIT 1', (digest,)).fetchone()
+            if in_use is None:
+                try:
+                    path = self._blob_path(digest)
+                    size = os.path.getsize(path)
+                    os.remove(path)
+                    self._total_bytes = max(0, self._total_bytes - size)
+                except OSError:
+                    pass
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    """プロセス共通のキャッシュ（DEFAULT_CACHE_DIR、上限 DEFAULT_MAX_BYTES、初回呼び出し時に作成）"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache(DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES)
+        return _default_cache
@@ -0,0 +1,159 @@
+"""
+派生統計テーブルのスナップショット（元データの指紋つき）
+
+データを読み込むたびに種牡馬・騎手・枠番・タイム統計や分析器を全件から作り直すと、
+データが変わっていなくても起動のたびに数十秒かかる。ここでは作った表を
+元データの指紋（行ごとの64bitハッシュ）と一緒に pickle で保存し、次回の読み込み時に
+
+- 'same'     : 元データが前回と同じ（行の順序も同じ） -> 保存した表をそのまま使う
+- 'appended' : 前回の行が全て残っていて、行が追加されただけ（並べ替えも可）
+               -> 保存した表と追加された行を返す（呼び出し側で追加行だけ集計して併合）
+- 'changed'  : それ以外（行の削除・書き換え・列の増減、スナップショットなし） -> 全件から作り直す
+
+と判定する。追加行だけで更新できるのは、件数・合計など足し合わせられる集計
+（merge_additive で併合）を保存している表に限る。
+
+使い方:
+    snapshot = StatsSnapshot(path, version=1)
+    status, tables, new_rows = snapshot.match(df, columns=['track_name', 'Rank', ...])
+    if status == 'same':
+        stats = tables['stats']
+    else:
+        ...  # 作り直す（'appended' なら new_rows だけ集計して tables の集計と併合）
+        snapshot.save({'stats': stats, ...})
+"""
+import hashlib
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+SNAPSHOT_FORMAT = 1
+
+SAME = 'same'
+APPENDED = 'appended'
+CHANGED = 'changed'
+
+
+def row_hashes(df, columns=None):
+    """
+    指定列（省略時は全列）の行ごとの64bitハッシュ
+
+    Returns:
+        (ハッシュ配列, 実際に使った列のリスト)  ※ columns のうち df にない列は除く
+    """
+    cols = [c for c in columns if c in df.columns] if columns is not None else list(df.columns)
+    if not cols or len(df) == 0:
+        return np.zeros(len(df), dtype=np.uint64), cols
+    hashes = pd.util.hash_pandas_object(df[cols], index=False).to_numpy(dtype=np.uint64)
+    return hashes, cols
+
+
+def _digest(hashes, cols):
+    digest = hashlib.sha256('|'.join(map(str, cols)).encode('utf-8'))
+    digest.update(np.ascontiguousarray(hashes).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def merge_additive(old, new):
+    """
+    グループ（index）ごとの件数・合計の表を併合（同じグループは足し合わせる）
+
+    どちらかが None ならもう一方を返す。
+    """
+    if old is None or len(old) == 0:
+        return new
+    if new is None or len(new) == 0:
+        return old
+    merged = pd.concat([old, new])
+    return merged.groupby(level=list(range(merged.index.nlevels)), sort=False).sum()
+
+
+class StatsSnapshot:
+    """
+    派生テーブルを元データの指紋と一緒に保存・読み込みする
+    """
+
+    def __init__(self, path, version=1):
+        """
+        Args:
+            path: スナップショットのファイル（pickle）
+            version: 表の作り方を変えたら上げる（違えば 'changed' 扱い）
+        """
+        self.path = path
+        self.version = version
+        self._hashes = None
+        self._cols = None
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, 'rb') as f:
+                data = pickle.load(f)
+        except Exception as e:
+            print(f"[WARNING] 統計スナップショット読み込み失敗: {e}")
+            return None
+        if data.get('format') != SNAPSHOT_FORMAT or data.get('version') != self.version:
+            return None
+        return data
+
+    def match(self, df, columns=None):
+        """
+        df と保存済みスナップショットを照合
+
+        Args:
+            df: 元データ
+            columns: 指紋に使う列（表の計算に使う列。省略時は全列）
+
+        Returns:
+            (status, tables, new_rows)
+            status が 'same' / 'appended' なら tables は保存した表の辞書、
+            'appended' の new_rows は前回になかった行（元の並び順）。'changed' なら (status, None, None)
+        """
+        self._hashes, self._cols = row_hashes(df, columns)
+        data = self._load()
+        if data is None or data['columns'] != self._cols:
+            return CHANGED, None, None
+
+        if data['n_rows'] == len(df) and data['digest'] == _digest(self._hashes, self._cols):
+            return SAME, data['tables'], None
+
+        # 前回の行（重複も件数ごと）が全て残っているか
+        old_keys, old_counts = data['keys'], data['counts']
+        if len(df) < data['n_rows']:
+            return CHANGED, None, None
+        new_keys, new_counts = np.unique(self._hashes, return_counts=True)
+        pos = np.minimum(np.searchsorted(new_keys, old_keys), max(len(new_keys) - 1, 0))
+        if len(new_keys) == 0 or not np.array_equal(new_keys[pos], old_keys) or \
+                not np.array_equal(new_counts[pos], old_counts):
+            return CHANGED, None, None
+
+        is_new = ~np.isin(self._hashes, old_keys)
+        return APPENDED, data['tables'], df[is_new]
+
+    def save(self, tables):
+        """直前に match() した df の指紋と一緒に表を保存（失敗しても例外は出さない）"""
+        if self._hashes is None:
+            raise RuntimeError("save() の前に match() を呼んでください")
+        keys, counts = np.unique(self._hashes, return_counts=True)
+        data = {
+            'format': SNAPSHOT_FORMAT,
+            'version': self.version,
+            'columns': self._cols,
+            'n_rows': len(self._hashes),
+            'digest': _digest(self._hashes, self._cols),
+            'keys': keys,
+            'counts': counts,
+            'tables': tables,
+        }
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+            print(f"[INFO] 統計スナップショット保存: {len(self._hashes):,}行分 ({os.path.basename(self.path)})")
+        except Exception as e:
+            print(f"[WARNING] 統計スナップショット保存失敗: {e}")
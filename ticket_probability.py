@@ -0,0 +1,194 @@
+"""
+全組み合わせの的中確率テーブル
+
+1レースの各馬の勝率（較正済み）から、Plackett–Luce モデル（race_simulator）で
+単勝・複勝・馬連・ワイド・馬単・3連複・3連単の全組み合わせの確率を求め、
+馬番をそのままインデックスにした密な配列で持つ。
+
+- 馬単・3連単は arrays[券種][1着, 2着(, 3着)]
+- 馬連・ワイド・3連複は対称な配列（どの並びで引いても同じ値）
+- オッズも同じ形の配列にすれば、期待値は配列同士の掛け算1回で全組み合わせ分求まる
+
+使い方:
+    table = TicketProbabilityTable(umabans, win_probas)
+    table.probability('3連単', (3, 7, 1))
+    ranked = table.rank('ワイド', odds={(3, 7): 5.2, ...})   # 期待値の高い順
+    ranked = table.rank('3連単', top=12)                      # オッズなしなら確率の高い順
+
+    # 組み合わせごとのオッズがないときは、単勝オッズから市場の確率表を作って推定オッズを使う
+    market = TicketProbabilityTable.from_win_odds(umabans, win_odds)
+    ranked = table.rank('3連単', odds=market.estimated_odds('3連単'), top=12)
+"""
+import numpy as np
+import pandas as pd
+
+from bet_settlement import BET_TYPE_SIZES, ORDERED_BET_TYPES, normalize_bet_type
+from race_simulator import top3_distribution
+
+# このテーブルで扱う券種
+TICKET_TYPES = ['単勝', '複勝', '馬連', 'ワイド', '馬単', '3連複', '3連単']
+
+# JRA の券種ごとの払戻率（推定オッズ = 払戻率 / 市場の的中確率）
+PAYOUT_RATES = {
+    '単勝': 0.80, '複勝': 0.80, '馬連': 0.775, 'ワイド': 0.775,
+    '馬単': 0.75, '3連複': 0.75, '3連単': 0.725,
+}
+
+
+def _symmetrize3(trifecta):
+    """3連単の確率を3頭の並びについて足し合わせる（3連複の確率、対称）"""
+    return sum(trifecta.transpose(axes) for axes in
+               [(0, 1, 2), (0, 2, 1), (1, 0, 2), (1, 2, 0), (2, 0, 1), (2, 1, 0)])
+
+
+class TicketProbabilityTable:
+    """
+    1レース分の 券種 -> 馬番インデックスの確率配列
+    """
+
+    def __init__(self, umabans, win_probs, method='auto', n_simulations=100000, seed=None):
+        """
+        Args:
+            umabans: 馬番のリスト（0以下の馬番の馬は除外する）
+            win_probs: umabans と同じ順の勝率（除外後に合計1に正規化して使う）
+            method, n_simulations, seed: race_simulator.top3_distribution に渡す
+        """
+        umabans = np.asarray(umabans, dtype=np.int64)
+        win_probs = np.nan_to_num(np.asarray(win_probs, dtype=np.float64), nan=0.0)
+        # 馬番不明（0）などの馬は組み合わせに含めない
+        valid = umabans > 0
+        umabans, win_probs = umabans[valid], win_probs[valid]
+        self.umabans = np.sort(umabans)
+        size = int(umabans.max()) + 1 if len(umabans) else 1
+
+        # 出走馬のみ True（馬番0と欠番は False のまま）
+        self.runners = np.zeros(size, dtype=bool)
+        self.runners[umabans] = True
+
+        self.arrays = {}
+        win = np.zeros(size)
+        total = np.clip(win_probs, 0.0, None).sum()
+        if total > 0:
+            win[umabans] = np.clip(win_probs, 0.0, None) / total
+        self.arrays['単勝'] = win
+
+        exacta = np.zeros((size, size))
+        trifecta = np.zeros((size, size, size))
+        if len(umabans) >= 3 and total > 0:
+            exacta_idx, trifecta_idx = top3_distribution(win_probs, method, n_simulations, seed)
+            exacta[np.ix_(umabans, umabans)] = exacta_idx
+            trifecta[np.ix_(umabans, umabans, umabans)] = trifecta_idx
+
+        trio = _symmetrize3(trifecta)
+        self.arrays['馬単'] = exacta
+        self.arrays['馬連'] = exacta + exacta.T
+        self.arrays['3連単'] = trifecta
+        self.arrays['3連複'] = trio
+        # ワイド: 2頭がともに3着以内（残り1頭について3連複を足す）
+        self.arrays['ワイド'] = trio.sum(axis=2)
+        # 複勝: 3着以内（1着・2着・3着の確率の和）
+        self.arrays['複勝'] = trifecta.sum(axis=(1, 2)) + trifecta.sum(axis=(0, 2)) + trifecta.sum(axis=(0, 1))
+
+    @classmethod
+    def from_win_odds(cls, umabans, win_odds, **kwargs):
+        """
+        単勝オッズから逆算した勝率（1/オッズを合計1に正規化）で作る市場の確率表
+
+        オッズが0以下・NaN の馬は勝率0として扱う。kwargs は __init__ に渡す。
+        """
+        win_odds = np.asarray(win_odds, dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            implied = np.where(win_odds > 0, 1.0 / win_odds, 0.0)
+        return cls(umabans, implied, **kwargs)
+
+    def estimated_odds(self, bet_type):
+        """
+        この表を市場の確率とみなしたときの推定オッズ配列（払戻率 / 的中確率、確率0の組み合わせは NaN）
+
+        rank(bet_type, odds=...) にそのまま渡せる。
+        """
+        bet_type = normalize_bet_type(bet_type)
+        probs = self.arrays[bet_type]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(probs > 0, PAYOUT_RATES[bet_type] / probs, np.nan)
+
+    def probability(self, bet_type, numbers):
+        """1つの組み合わせの的中確率（出走していない馬番を含む場合は0）"""
+        bet_type = normalize_bet_type(bet_type)
+        numbers = tuple(int(n) for n in numbers)
+        arr = self.arrays[bet_type]
+        if len(numbers) != arr.ndim or any(n < 0 or n >= len(self.runners) for n in numbers):
+            return 0.0
+        return float(arr[numbers])
+
+    def _combination_mask(self, bet_type):
+        """券種ごとの有効な組み合わせ（出走馬同士、馬番が重複しない。順不同の券種は昇順のみ）"""
+        ndim = BET_TYPE_SIZES[bet_type]
+        size = len(self.runners)
+        idx = np.arange(size)
+        axes = [idx.reshape([-1 if d == k else 1 for d in range(ndim)]) for k in range(ndim)]
+
+        mask = np.ones((size,) * ndim, dtype=bool)
+        for k in range(ndim):
+            mask &= self.runners[axes[k]]
+        for a in range(ndim):
+            for b in range(a + 1, ndim):
+                if bet_type in ORDERED_BET_TYPES:
+                    mask &= axes[a] != axes[b]
+                else:
+                    mask &= axes[a] < axes[b]
+        return mask
+
+    def odds_array(self, bet_type, odds):
+        """{組番: オッズ} を確率配列と同じ形の配列に変換（オッズがない組み合わせは NaN）"""
+        bet_type = normalize_bet_type(bet_type)
+        arr = np.full(self.arrays[bet_type].shape, np.nan)
+        ordered = bet_type in ORDERED_BET_TYPES
+        for numbers, value in odds.items():
+            numbers = tuple(int(n) for n in (numbers if isinstance(numbers, (tuple, list)) else (numbers,)))
+            if not ordered:
+                numbers = tuple(sorted(numbers))
+            if len(numbers) == arr.ndim and all(0 <= n < len(self.runners) for n in numbers):
+                arr[numbers] = value
+        return arr
+
+    def rank(self, bet_type, odds=None, top=None):
+        """
+        券種の全組み合わせを期待値（オッズなしなら確率）の高い順に並べる
+
+        Args:
+            bet_type: 券種
+            odds: {組番: オッズ} または確率配列と同じ形のオッズ配列（省略可）
+            top: 上位何件を返すか（省略時は全件）
+
+        Returns:
+            DataFrame（numbers, probability, fair_odds, odds, expected_value）
+        """
+        bet_type = normalize_bet_type(bet_type)
+        probs = self.arrays[bet_type]
+        positions = np.nonzero(self._combination_mask(bet_type))
+        p = probs[positions]
+
+        if odds is None:
+            o = np.full(len(p), np.nan)
+        else:
+            odds_arr = odds if isinstance(odds, np.ndarray) else self.odds_array(bet_type, odds)
+            o = odds_arr[positions]
+        ev = p * o
+
+        # 期待値（オッズなしなら確率）の降順、同値は確率の高い順
+        sort_key = np.where(np.isnan(ev), -np.inf, ev) if odds is not None else p
+        order = np.lexsort((-p, -sort_key))
+        if top is not None:
+            order = order[:top]
+
+        combos = np.stack(positions, axis=1)[order]
+        with np.errstate(divide='ignore'):
+            fair_odds = np.where(p[order] > 0, 1.0 / p[order], np.inf)
+        return pd.DataFrame({
+            'numbers': [tuple(int(n) for n in c) for c in combos],
+            'probability': p[order],
+            'fair_odds': fair_odds,
+            'odds': o[order],
+            'expected_value': ev[order],
+        })
@@ -3,50 +3,16 @@
 - チューニング結果: num_leaves=63, learning_rate=0.05
 - 2020-2022年データで訓練
 """
-import pandas as pd
 import json
 import sys
-import numpy as np
 from collections import defaultdict
 import lightgbm as lgb
 import pickle
 sys.path.insert(0, r'C:\Users\bu158\Keiba_Shisaku20250928')
 
-from prediction_integration import get_horse_past_results_from_csv
-
-def calculate_person_stats(df, person_col, reference_date, months_back=12):
-    """騎手・調教師の統計を計算"""
-    person_stats = {}
-
-    reference_date_parsed = pd.to_datetime(reference_date)
-    start_date = reference_date_parsed - pd.DateOffset(months=months_back)
-
-    period_df = df[
-        (df['date_parsed'] >= start_date) &
-        (df['date_parsed'] < reference_date_parsed)
-    ].copy()
-
-    period_df['rank_num'] = pd.to_numeric(period_df['Rank'], errors='coerce')
-    period_df = period_df[period_df['rank_num'].notna()]
-
-    for person in period_df[person_col].unique():
-        if pd.isna(person) or person == '':
-            continue
-
-        person_races = period_df[period_df[person_col] == person]
-        total_races = len(person_races)
-
-        if total_races >= 10:
-            wins = (person_races['rank_num'] == 1).sum()
-            top3 = (person_races['rank_num'] <= 3).sum()
-
-            person_stats[person] = {
-                'win_rate': wins / total_races,
-                'top3_rate': top3 / total_races,
-                'races': total_races
-            }
-
-    return person_stats
+from person_stats_engine import PersonStatsEngine
+from feature_builder import build_feature_matrix, FEATURE_NAMES, FEATURE_SOURCE_COLUMNS
+from race_data_store import load_race_data
 
 print("=" * 80)
 print("チューニング済みパラメータでLightGBM訓練")
@@ -54,10 +20,8 @@ print("=" * 80)
 
 # データ読み込み
 print("\nデータ読み込み中...")
-df = pd.read_csv(r"C:\Users\bu158\HorseRacingAnalyzer\data\netkeiba_data_combined_202001_202508.csv",
-                 encoding='utf-8', low_memory=False)
-
-df['date_parsed'] = pd.to_datetime(df['date'], errors='coerce')
+df = load_race_data(r"C:\Users\bu158\HorseRacingAnalyzer\data\netkeiba_data_combined_202001_202508.csv",
+                    columns=FEATURE_SOURCE_COLUMNS)
 
 # 訓練データ: 2020-2022年
 train_df = df[
@@ -73,149 +37,20 @@ train_races = train_df.groupby('race_id').filter(lambda x: len(x) >= 8)['race_id
 
 print(f"訓練レース数: {len(train_races)}レース")
 
-# 統計キャッシュ
-jockey_stats_cache = {}
-trainer_stats_cache = {}
-
-features_list = []
-labels_list = []
-groups_list = []
-
-for idx, race_id in enumerate(train_races):
-    if (idx + 1) % 1000 == 0:
-        print(f"  {idx + 1}/{len(train_races)} レース処理中...")
-
-    race_horses = train_df[train_df['race_id'] == race_id].copy()
-
-    if len(race_horses) < 8:
-        continue
-
-    race_date = race_horses.iloc[0]['date']
-    if pd.isna(race_date):
-        continue
-
-    race_date_str = str(race_date)[:10]
-
-    if race_date_str not in jockey_stats_cache:
-        jockey_stats_cache[race_date_str] = calculate_person_stats(
-            train_df, 'JockeyName', race_date_str, months_back=12
-        )
-        trainer_stats_cache[race_date_str] = calculate_person_stats(
-            train_df, 'TrainerName', race_date_str, months_back=12
-        )
-
-    jockey_stats = jockey_stats_cache[race_date_str]
-    trainer_stats = trainer_stats_cache[race_date_str]
-
-    race_features = []
-    race_labels = []
+# 騎手・調教師の累積成績テーブル
+jockey_engine = PersonStatsEngine(train_df, 'JockeyName')
+trainer_engine = PersonStatsEngine(train_df, 'TrainerName')
 
-    for _, horse in race_horses.iterrows():
-        rank = pd.to_numeric(horse.get('Rank'), errors='coerce')
-        if pd.isna(rank):
-            continue
-
-        horse_id = horse.get('horse_id')
-        past_results = get_horse_past_results_from_csv(horse_id, race_date_str, max_results=10)
-
-        if past_results and len(past_results) > 0:
-            recent_ranks = []
-            for race in past_results[:5]:
-                if isinstance(race, dict):
-                    past_rank = pd.to_numeric(race.get('rank'), errors='coerce')
-                    if pd.notna(past_rank):
-                        recent_ranks.append(past_rank)
-
-            if recent_ranks:
-                avg_rank = np.mean(recent_ranks)
-                std_rank = np.std(recent_ranks) if len(recent_ranks) > 1 else 0
-                min_rank = np.min(recent_ranks)
-                max_rank = np.max(recent_ranks)
-                recent_win_rate = sum(1 for r in recent_ranks if r == 1) / len(recent_ranks)
-                recent_top3_rate = sum(1 for r in recent_ranks if r <= 3) / len(recent_ranks)
-            else:
-                avg_rank, std_rank, min_rank, max_rank = 8, 0, 10, 10
-                recent_win_rate, recent_top3_rate = 0, 0
-        else:
-            avg_rank, std_rank, min_rank, max_rank = 8, 0, 10, 10
-            recent_win_rate, recent_top3_rate = 0, 0
-
-        jockey_name = horse.get('JockeyName')
-        if jockey_name in jockey_stats:
-            jockey_win_rate = jockey_stats[jockey_name]['win_rate']
-            jockey_top3_rate = jockey_stats[jockey_name]['top3_rate']
-            jockey_races = jockey_stats[jockey_name]['races']
-        else:
-            jockey_win_rate, jockey_top3_rate, jockey_races = 0, 0, 0
-
-        trainer_name = horse.get('TrainerName')
-        if trainer_name in trainer_stats:
-            trainer_win_rate = trainer_stats[trainer_name]['win_rate']
-            trainer_top3_rate = trainer_stats[trainer_name]['top3_rate']
-            trainer_races = trainer_stats[trainer_name]['races']
-        else:
-            trainer_win_rate, trainer_top3_rate, trainer_races = 0, 0, 0
-
-        age = pd.to_numeric(horse.get('Age'), errors='coerce')
-        age = age if pd.notna(age) else 5
-
-        weight_diff = pd.to_numeric(horse.get('WeightDiff'), errors='coerce')
-        weight_diff = weight_diff if pd.notna(weight_diff) else 0
-
-        weight = pd.to_numeric(horse.get('Weight'), errors='coerce')
-        weight = weight if pd.notna(weight) else 480
-
-        ninki = pd.to_numeric(horse.get('Ninki'), errors='coerce')
-        ninki = ninki if pd.notna(ninki) else 10
-
-        odds = pd.to_numeric(horse.get('Odds_x'), errors='coerce')
-        odds = odds if pd.notna(odds) and odds > 0 else 50
-
-        waku = pd.to_numeric(horse.get('Waku'), errors='coerce')
-        waku = waku if pd.notna(waku) else 5
-
-        course_type = horse.get('course_type')
-        course_turf = 1 if course_type == '芝' else 0
-        course_dirt = 1 if course_type == 'ダート' else 0
-
-        track_condition = horse.get('track_condition')
-        track_good = 1 if track_condition == '良' else 0
-
-        distance = pd.to_numeric(horse.get('distance'), errors='coerce')
-        distance = distance if pd.notna(distance) else 1600
-
-        feature_vector = [
-            avg_rank, std_rank, min_rank, max_rank,
-            recent_win_rate, recent_top3_rate,
-            jockey_win_rate, jockey_top3_rate, jockey_races,
-            trainer_win_rate, trainer_top3_rate, trainer_races,
-            age, weight_diff, weight, np.log1p(odds), ninki, waku,
-            course_turf, course_dirt, track_good, distance / 1000
-        ]
-
-        race_features.append(feature_vector)
-        race_labels.append(rank)
-
-    if len(race_features) >= 8:
-        features_list.extend(race_features)
-        labels_list.extend(race_labels)
-        groups_list.append(len(race_features))
+X_train, y_train, groups_train, _ = build_feature_matrix(
+    train_df, history_df=df,
+    jockey_engine=jockey_engine, trainer_engine=trainer_engine,
+    race_ids=train_races
+)
 
-print(f"\n抽出完了: {len(features_list)}頭のデータ, {len(groups_list)}レース")
+print(f"\n抽出完了: {len(X_train)}頭のデータ, {len(groups_train)}レース")
 
 # 特徴量名
-feature_names = [
-    'avg_rank', 'std_rank', 'min_rank', 'max_rank',
-    'recent_win_rate', 'recent_top3_rate',
-    'jockey_win_rate', 'jockey_top3_rate', 'jockey_races',
-    'trainer_win_rate', 'trainer_top3_rate', 'trainer_races',
-    'age', 'weight_diff', 'weight', 'log_odds', 'ninki', 'waku',
-    'course_turf', 'course_dirt', 'track_good', 'distance_km'
-]
-
-X_train = np.array(features_list)
-y_train = np.array(labels_list)
-groups_train = np.array(groups_list)
+feature_names = FEATURE_NAMES
 
 train_data = lgb.Dataset(X_train, label=y_train, group=groups_train, feature_name=feature_names)
 
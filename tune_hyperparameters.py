@@ -4,51 +4,15 @@ LightGBMハイパーパラメータチューニング
 - 2020-2023年データで訓練・検証
 - 複数のパラメータセットを比較
 """
-import pandas as pd
-import json
 import sys
 import numpy as np
-from collections import defaultdict
 import lightgbm as lgb
 import pickle
-from itertools import product
 sys.path.insert(0, r'C:\Users\bu158\Keiba_Shisaku20250928')
 
-from prediction_integration import get_horse_past_results_from_csv
-
-def calculate_person_stats(df, person_col, reference_date, months_back=12):
-    """騎手・調教師の統計を計算"""
-    person_stats = {}
-
-    reference_date_parsed = pd.to_datetime(reference_date)
-    start_date = reference_date_parsed - pd.DateOffset(months=months_back)
-
-    period_df = df[
-        (df['date_parsed'] >= start_date) &
-        (df['date_parsed'] < reference_date_parsed)
-    ].copy()
-
-    period_df['rank_num'] = pd.to_numeric(period_df['Rank'], errors='coerce')
-    period_df = period_df[period_df['rank_num'].notna()]
-
-    for person in period_df[person_col].unique():
-        if pd.isna(person) or person == '':
-            continue
-
-        person_races = period_df[period_df[person_col] == person]
-        total_races = len(person_races)
-
-        if total_races >= 10:
-            wins = (person_races['rank_num'] == 1).sum()
-            top3 = (person_races['rank_num'] <= 3).sum()
-
-            person_stats[person] = {
-                'win_rate': wins / total_races,
-                'top3_rate': top3 / total_races,
-                'races': total_races
-            }
-
-    return person_stats
+from feature_builder import FEATURE_NAMES, FEATURE_SOURCE_COLUMNS
+from walk_forward import FeatureTable
+from race_data_store import load_race_data
 
 print("=" * 80)
 print("LightGBM ハイパーパラメータチューニング")
@@ -56,183 +20,32 @@ print("=" * 80)
 
 # データ読み込み
 print("\nデータ読み込み中...")
-df = pd.read_csv(r"C:\Users\bu158\HorseRacingAnalyzer\data\netkeiba_data_combined_202001_202508.csv",
-                 encoding='utf-8', low_memory=False)
+csv_path = r"C:\Users\bu158\HorseRacingAnalyzer\data\netkeiba_data_combined_202001_202508.csv"
+df = load_race_data(csv_path, columns=FEATURE_SOURCE_COLUMNS)
 
-df['date_parsed'] = pd.to_datetime(df['date'], errors='coerce')
+# 全レースの特徴量は一度だけ作って保存し、訓練期間のレースを切り出す（walk_forward と共通）
+print("\n特徴量を準備中（作成済みならキャッシュから読み込み）...")
+table = FeatureTable.load_or_build(df, csv_path)
 
 # 訓練データ: 2020-2022年（検証用に2023年を別にする）
-train_df = df[
-    (df['date_parsed'] >= '2020-01-01') &
-    (df['date_parsed'] <= '2022-12-31')
-].copy()
-
+train_period = table.race_mask('2020-01-01', '2023-01-01')
 # 検証データ: 2023年
-val_df = df[
-    (df['date_parsed'] >= '2023-01-01') &
-    (df['date_parsed'] <= '2023-12-31')
-].copy()
-
-print(f"訓練データ: {len(train_df):,}件 (2020-2022年)")
-print(f"検証データ: {len(val_df):,}件 (2023年)")
-
-# 訓練データから特徴量抽出（20%サンプリングで高速化）
-print("\n訓練データから特徴量抽出中（20%サンプリング）...")
-train_races = train_df.groupby('race_id').filter(lambda x: len(x) >= 8)['race_id'].unique()
-train_races_sampled = np.random.choice(train_races, size=int(len(train_races) * 0.2), replace=False)
-
-print(f"訓練レース数: {len(train_races_sampled)}レース")
-
-# 統計キャッシュ
-jockey_stats_cache = {}
-trainer_stats_cache = {}
-
-features_list = []
-labels_list = []
-groups_list = []
-
-for idx, race_id in enumerate(train_races_sampled):
-    if (idx + 1) % 500 == 0:
-        print(f"  {idx + 1}/{len(train_races_sampled)} レース処理中...")
-
-    race_horses = train_df[train_df['race_id'] == race_id].copy()
-
-    if len(race_horses) < 8:
-        continue
-
-    race_date = race_horses.iloc[0]['date']
-    if pd.isna(race_date):
-        continue
-
-    race_date_str = str(race_date)[:10]
-
-    # 騎手・調教師統計
-    if race_date_str not in jockey_stats_cache:
-        jockey_stats_cache[race_date_str] = calculate_person_stats(
-            train_df, 'JockeyName', race_date_str, months_back=12
-        )
-        trainer_stats_cache[race_date_str] = calculate_person_stats(
-            train_df, 'TrainerName', race_date_str, months_back=12
-        )
-
-    jockey_stats = jockey_stats_cache[race_date_str]
-    trainer_stats = trainer_stats_cache[race_date_str]
-
-    race_features = []
-    race_labels = []
-
-    for _, horse in race_horses.iterrows():
-        # ラベル（着順）
-        rank = pd.to_numeric(horse.get('Rank'), errors='coerce')
-        if pd.isna(rank):
-            continue
-
-        # 特徴量抽出
-        horse_id = horse.get('horse_id')
-        past_results = get_horse_past_results_from_csv(horse_id, race_date_str, max_results=10)
-
-        # 過去成績
-        if past_results and len(past_results) > 0:
-            recent_ranks = []
-            for race in past_results[:5]:
-                if isinstance(race, dict):
-                    past_rank = pd.to_numeric(race.get('rank'), errors='coerce')
-                    if pd.notna(past_rank):
-                        recent_ranks.append(past_rank)
-
-            if recent_ranks:
-                avg_rank = np.mean(recent_ranks)
-                std_rank = np.std(recent_ranks) if len(recent_ranks) > 1 else 0
-                min_rank = np.min(recent_ranks)
-                max_rank = np.max(recent_ranks)
-                recent_win_rate = sum(1 for r in recent_ranks if r == 1) / len(recent_ranks)
-                recent_top3_rate = sum(1 for r in recent_ranks if r <= 3) / len(recent_ranks)
-            else:
-                avg_rank, std_rank, min_rank, max_rank = 8, 0, 10, 10
-                recent_win_rate, recent_top3_rate = 0, 0
-        else:
-            avg_rank, std_rank, min_rank, max_rank = 8, 0, 10, 10
-            recent_win_rate, recent_top3_rate = 0, 0
-
-        # 騎手統計
-        jockey_name = horse.get('JockeyName')
-        if jockey_name in jockey_stats:
-            jockey_win_rate = jockey_stats[jockey_name]['win_rate']
-            jockey_top3_rate = jockey_stats[jockey_name]['top3_rate']
-            jockey_races = jockey_stats[jockey_name]['races']
-        else:
-            jockey_win_rate, jockey_top3_rate, jockey_races = 0, 0, 0
-
-        # 調教師統計
-        trainer_name = horse.get('TrainerName')
-        if trainer_name in trainer_stats:
-            trainer_win_rate = trainer_stats[trainer_name]['win_rate']
-            trainer_top3_rate = trainer_stats[trainer_name]['top3_rate']
-            trainer_races = trainer_stats[trainer_name]['races']
-        else:
-            trainer_win_rate, trainer_top3_rate, trainer_races = 0, 0, 0
-
-        # その他の特徴量
-        age = pd.to_numeric(horse.get('Age'), errors='coerce')
-        age = age if pd.notna(age) else 5
-
-        weight_diff = pd.to_numeric(horse.get('WeightDiff'), errors='coerce')
-        weight_diff = weight_diff if pd.notna(weight_diff) else 0
-
-        weight = pd.to_numeric(horse.get('Weight'), errors='coerce')
-        weight = weight if pd.notna(weight) else 480
-
-        ninki = pd.to_numeric(horse.get('Ninki'), errors='coerce')
-        ninki = ninki if pd.notna(ninki) else 10
-
-        odds = pd.to_numeric(horse.get('Odds_x'), errors='coerce')
-        odds = odds if pd.notna(odds) and odds > 0 else 50
-
-        waku = pd.to_numeric(horse.get('Waku'), errors='coerce')
-        waku = waku if pd.notna(waku) else 5
-
-        course_type = horse.get('course_type')
-        course_turf = 1 if course_type == '芝' else 0
-        course_dirt = 1 if course_type == 'ダート' else 0
-
-        track_condition = horse.get('track_condition')
-        track_good = 1 if track_condition == '良' else 0
-
-        distance = pd.to_numeric(horse.get('distance'), errors='coerce')
-        distance = distance if pd.notna(distance) else 1600
-
-        feature_vector = [
-            avg_rank, std_rank, min_rank, max_rank,
-            recent_win_rate, recent_top3_rate,
-            jockey_win_rate, jockey_top3_rate, jockey_races,
-            trainer_win_rate, trainer_top3_rate, trainer_races,
-            age, weight_diff, weight, np.log1p(odds), ninki, waku,
-            course_turf, course_dirt, track_good, distance / 1000
-        ]
-
-        race_features.append(feature_vector)
-        race_labels.append(rank)
-
-    if len(race_features) >= 8:
-        features_list.extend(race_features)
-        labels_list.extend(race_labels)
-        groups_list.append(len(race_features))
-
-print(f"抽出完了: {len(features_list)}頭のデータ, {len(groups_list)}レース")
+val_period = table.race_mask('2023-01-01', '2024-01-01')
 
-# 特徴量名
-feature_names = [
-    'avg_rank', 'std_rank', 'min_rank', 'max_rank',
-    'recent_win_rate', 'recent_top3_rate',
-    'jockey_win_rate', 'jockey_top3_rate', 'jockey_races',
-    'trainer_win_rate', 'trainer_top3_rate', 'trainer_races',
-    'age', 'weight_diff', 'weight', 'log_odds', 'ninki', 'waku',
-    'course_turf', 'course_dirt', 'track_good', 'distance_km'
-]
+print(f"訓練データ: {int(table.groups[train_period].sum()):,}件 (2020-2022年)")
+print(f"検証データ: {int(table.groups[val_period].sum()):,}件 (2023年)")
+
+# 訓練データ（20%サンプリングで高速化）
+train_mask = train_period & (np.random.rand(len(train_period)) < 0.2)
+
+print(f"訓練レース数: {int(train_mask.sum())}レース")
+
+X_train, y_train, groups_train, _ = table.subset(train_mask, ranked_only=True)
 
-X_train = np.array(features_list)
-y_train = np.array(labels_list)
-groups_train = np.array(groups_list)
+print(f"抽出完了: {len(X_train)}頭のデータ, {len(groups_train)}レース")
+
+# 特徴量名
+feature_names = FEATURE_NAMES
 
 train_data = lgb.Dataset(X_train, label=y_train, group=groups_train, feature_name=feature_names)
 
@@ -354,139 +167,12 @@ print("\n" + "=" * 80)
 print("ベストパラメータで全データ訓練中...")
 print("=" * 80)
 
-# 全訓練データで特徴量抽出（サンプリングなし）
-print("\n全訓練データから特徴量抽出中...")
-all_train_races = train_df.groupby('race_id').filter(lambda x: len(x) >= 8)['race_id'].unique()
-
-print(f"訓練レース数: {len(all_train_races)}レース")
-
-features_list_full = []
-labels_list_full = []
-groups_list_full = []
-
-for idx, race_id in enumerate(all_train_races):
-    if (idx + 1) % 1000 == 0:
-        print(f"  {idx + 1}/{len(all_train_races)} レース処理中...")
-
-    race_horses = train_df[train_df['race_id'] == race_id].copy()
-
-    if len(race_horses) < 8:
-        continue
-
-    race_date = race_horses.iloc[0]['date']
-    if pd.isna(race_date):
-        continue
-
-    race_date_str = str(race_date)[:10]
-
-    if race_date_str not in jockey_stats_cache:
-        jockey_stats_cache[race_date_str] = calculate_person_stats(
-            train_df, 'JockeyName', race_date_str, months_back=12
-        )
-        trainer_stats_cache[race_date_str] = calculate_person_stats(
-            train_df, 'TrainerName', race_date_str, months_back=12
-        )
-
-    jockey_stats = jockey_stats_cache[race_date_str]
-    trainer_stats = trainer_stats_cache[race_date_str]
-
-    race_features = []
-    race_labels = []
-
-    for _, horse in race_horses.iterrows():
-        rank = pd.to_numeric(horse.get('Rank'), errors='coerce')
-        if pd.isna(rank):
-            continue
-
-        horse_id = horse.get('horse_id')
-        past_results = get_horse_past_results_from_csv(horse_id, race_date_str, max_results=10)
-
-        if past_results and len(past_results) > 0:
-            recent_ranks = []
-            for race in past_results[:5]:
-                if isinstance(race, dict):
-                    past_rank = pd.to_numeric(race.get('rank'), errors='coerce')
-                    if pd.notna(past_rank):
-                        recent_ranks.append(past_rank)
-
-            if recent_ranks:
-                avg_rank = np.mean(recent_ranks)
-                std_rank = np.std(recent_ranks) if len(recent_ranks) > 1 else 0
-                min_rank = np.min(recent_ranks)
-                max_rank = np.max(recent_ranks)
-                recent_win_rate = sum(1 for r in recent_ranks if r == 1) / len(recent_ranks)
-                recent_top3_rate = sum(1 for r in recent_ranks if r <= 3) / len(recent_ranks)
-            else:
-                avg_rank, std_rank, min_rank, max_rank = 8, 0, 10, 10
-                recent_win_rate, recent_top3_rate = 0, 0
-        else:
-            avg_rank, std_rank, min_rank, max_rank = 8, 0, 10, 10
-            recent_win_rate, recent_top3_rate = 0, 0
-
-        jockey_name = horse.get('JockeyName')
-        if jockey_name in jockey_stats:
-            jockey_win_rate = jockey_stats[jockey_name]['win_rate']
-            jockey_top3_rate = jockey_stats[jockey_name]['top3_rate']
-            jockey_races = jockey_stats[jockey_name]['races']
-        else:
-            jockey_win_rate, jockey_top3_rate, jockey_races = 0, 0, 0
-
-        trainer_name = horse.get('TrainerName')
-        if trainer_name in trainer_stats:
-            trainer_win_rate = trainer_stats[trainer_name]['win_rate']
-            trainer_top3_rate = trainer_stats[trainer_name]['top3_rate']
-            trainer_races = trainer_stats[trainer_name]['races']
-        else:
-            trainer_win_rate, trainer_top3_rate, trainer_races = 0, 0, 0
-
-        age = pd.to_numeric(horse.get('Age'), errors='coerce')
-        age = age if pd.notna(age) else 5
-
-        weight_diff = pd.to_numeric(horse.get('WeightDiff'), errors='coerce')
-        weight_diff = weight_diff if pd.notna(weight_diff) else 0
-
-        weight = pd.to_numeric(horse.get('Weight'), errors='coerce')
-        weight = weight if pd.notna(weight) else 480
-
-        ninki = pd.to_numeric(horse.get('Ninki'), errors='coerce')
-        ninki = ninki if pd.notna(ninki) else 10
-
-        odds = pd.to_numeric(horse.get('Odds_x'), errors='coerce')
-        odds = odds if pd.notna(odds) and odds > 0 else 50
-
-        waku = pd.to_numeric(horse.get('Waku'), errors='coerce')
-        waku = waku if pd.notna(waku) else 5
-
-        course_type = horse.get('course_type')
-        course_turf = 1 if course_type == '芝' else 0
-        course_dirt = 1 if course_type == 'ダート' else 0
-
-        track_condition = horse.get('track_condition')
-        track_good = 1 if track_condition == '良' else 0
-
-        distance = pd.to_numeric(horse.get('distance'), errors='coerce')
-        distance = distance if pd.notna(distance) else 1600
-
-        feature_vector = [
-            avg_rank, std_rank, min_rank, max_rank,
-            recent_win_rate, recent_top3_rate,
-            jockey_win_rate, jockey_top3_rate, jockey_races,
-            trainer_win_rate, trainer_top3_rate, trainer_races,
-            age, weight_diff, weight, np.log1p(odds), ninki, waku,
-            course_turf, course_dirt, track_good, distance / 1000
-        ]
-
-        race_features.append(feature_vector)
-        race_labels.append(rank)
-
-    if len(race_features) >= 8:
-        features_list_full.extend(race_features)
-        labels_list_full.extend(race_labels)
-        groups_list_full.append(len(race_features))
-
-X_train_full = np.array(features_list_full)
-y_train_full = np.array(labels_list_full)
-groups_train_full = np.array(groups_list_full)
+# 全訓練データ（サンプリングなし）を特徴量テーブルから切り出す
+full_mask = table.race_mask('2020-01-01', '2023-01-01')
+
+print(f"訓練レース数: {int(full_mask.sum())}レース")
+
+X_train_full, y_train_full, groups_train_full, _ = table.subset(full_mask, ranked_only=True)
 
 train_data_full = lgb.Dataset(X_train_full, label=y_train_full, group=groups_train_full, feature_name=feature_names)
 
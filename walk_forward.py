@@ -0,0 +1,324 @@
+"""
+ウォークフォワード再学習（ローリング期間で学習し、翌月で検証）
+
+train_lightgbm_model.py は2020-2023年で1回学習して2024年で検証するだけで、
+tune_hyperparameters.py も分割ごとに特徴量抽出をやり直していた。
+ここでは全レースの特徴量マトリクスを一度だけ作って保存し、各フォールド
+（直近 train_months ヶ月で学習 → 次の test_months ヶ月で検証）はその行を切り出すだけにする。
+
+- 特徴量は as-of（過去成績・騎手/調教師成績とも基準日より前のみ）なので、全期間で
+  一度に作っても各フォールドの学習・検証に未来の情報は入らない
+- フォールドは parallel_backtest でワーカープロセスに分配して並列に学習する
+- 検証期間の予測から戦略ごとの月別回収率（アウトオブサンプルのROI曲線）を出す
+
+使い方:
+    table = FeatureTable.load_or_build(df, csv_path)
+    folds = make_folds(table, train_months=36, test_months=1, first_test='2024-01-01')
+    summary, predictions = run_walk_forward(table, folds, workers=4)
+
+    # 2024年1月以降を月ごとに検証してROI曲線を出力
+    python walk_forward.py
+"""
+import hashlib
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from feature_builder import FEATURE_NAMES, FEATURE_SOURCE_COLUMNS, build_feature_matrix
+from parallel_backtest import run_parallel_backtest
+
+try:
+    import lightgbm as lgb
+    LIGHTGBM_AVAILABLE = True
+except ImportError:
+    LIGHTGBM_AVAILABLE = False
+
+CACHE_VERSION = 1
+
+# train_lightgbm_model.py と同じ学習パラメータ（ワーカー内では1スレッドで学習）
+DEFAULT_PARAMS = {
+    'objective': 'lambdarank',
+    'metric': 'ndcg',
+    'ndcg_eval_at': [1, 3, 5],
+    'num_leaves': 31,
+    'learning_rate': 0.05,
+    'feature_fraction': 0.9,
+    'bagging_fraction': 0.8,
+    'bagging_freq': 5,
+    'verbose': -1,
+}
+DEFAULT_NUM_BOOST_ROUND = 200
+
+
+def feature_cache_key(csv_path, n_past=5, min_horses=8):
+    """CSVの内容（サイズ・更新時刻）と特徴量定義から特徴量キャッシュのキーを作る"""
+    stat = os.stat(csv_path)
+    source = '|'.join([
+        os.path.abspath(csv_path), str(stat.st_size), str(stat.st_mtime_ns),
+        ','.join(FEATURE_NAMES), str(n_past), str(min_horses), str(CACHE_VERSION),
+    ])
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()[:16]
+
+
+class FeatureTable:
+    """
+    全レースの特徴量マトリクス（レース順・レース内は元の行順）
+
+    X / y / meta は行単位、groups はレースごとの頭数。race_days はレースごとの開催日。
+    着順のない行（取消・除外など）も含めて作り、学習時だけ除外する。
+    """
+
+    def __init__(self, X, y, groups, meta):
+        self.X = X
+        self.y = y
+        self.groups = np.asarray(groups, dtype=np.int64)
+        self.meta = meta.reset_index(drop=True)
+        self.bounds = np.r_[0, np.cumsum(self.groups)]
+        first_rows = self.bounds[:-1]
+        self.race_days = pd.to_datetime(self.meta['date'].to_numpy()[first_rows]).to_numpy(dtype='datetime64[D]')
+
+    @classmethod
+    def build(cls, df, n_past=5, min_horses=8):
+        """レースデータ全体から特徴量を一括で作成"""
+        X, y, groups, meta = build_feature_matrix(df, min_horses=min_horses, require_rank=False, n_past=n_past)
+        return cls(X, y, groups, meta)
+
+    @classmethod
+    def load_or_build(cls, df, csv_path, cache_dir=None, n_past=5, min_horses=8):
+        """
+        CSVに対応する特徴量キャッシュがあれば読み込み、なければ作って保存
+
+        Args:
+            df: csv_path から読み込んだレースデータ（FEATURE_SOURCE_COLUMNS を含む）
+            csv_path: キャッシュのキーにするCSV
+            cache_dir: 保存先（既定はCSVと同じフォルダの cache）
+        """
+        cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(csv_path)), 'cache')
+        cache_path = os.path.join(cache_dir, f"walk_forward_features_{feature_cache_key(csv_path, n_past, min_horses)}.pkl")
+
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'rb') as f:
+                    data = pickle.load(f)
+                print(f"[INFO] 特徴量キャッシュ読み込み: {len(data['groups'])}レース ({os.path.basename(cache_path)})")
+                return cls(data['X'], data['y'], data['groups'], data['meta'])
+            except Exception as e:
+                print(f"[WARNING] 特徴量キャッシュ読み込み失敗: {e}")
+
+        print("[INFO] 全レースの特徴量を作成中...")
+        table = cls.build(df, n_past=n_past, min_horses=min_horses)
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = cache_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'X': table.X, 'y': table.y, 'groups': table.groups, 'meta': table.meta},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+        print(f"[INFO] 特徴量キャッシュ保存: {len(table.groups)}レース ({os.path.basename(cache_path)})")
+        return table
+
+    def __len__(self):
+        return len(self.groups)
+
+    def race_mask(self, start, end):
+        """開催日が [start, end) のレース"""
+        start = np.datetime64(pd.Timestamp(start).date(), 'D')
+        end = np.datetime64(pd.Timestamp(end).date(), 'D')
+        return (self.race_days >= start) & (self.race_days < end)
+
+    def subset(self, race_mask, ranked_only=False, min_horses=8):
+        """
+        レースを選んで行を切り出す
+
+        Args:
+            race_mask: レースごとの bool 配列
+            ranked_only: 着順のない行を除く（学習用）
+            min_horses: 切り出した後の頭数がこれ未満のレースは除く
+
+        Returns:
+            X, y, groups, meta
+        """
+        rows = np.repeat(race_mask, self.groups)
+        if ranked_only:
+            rows &= ~np.isnan(self.y)
+
+        race_of_row = np.repeat(np.arange(len(self.groups)), self.groups)
+        counts = np.bincount(race_of_row[rows], minlength=len(self.groups))
+        rows &= np.repeat(counts >= min_horses, self.groups)
+
+        groups = counts[counts >= min_horses]
+        return self.X[rows], self.y[rows], groups, self.meta[rows].reset_index(drop=True)
+
+
+def make_folds(table, train_months=36, test_months=1, first_test=None, last_test=None):
+    """
+    ローリング期間のフォールドを作成
+
+    Args:
+        table: FeatureTable
+        train_months: 学習期間の月数（検証開始の直前まで）
+        test_months: 検証期間の月数（次のフォールドはこの月数だけ進める）
+        first_test: 最初の検証開始月（省略時はデータ先頭 + train_months）
+        last_test: 最後の検証開始月（省略時はデータの最終月まで）
+
+    Returns:
+        [{'fold', 'train_start', 'test_start', 'test_end'}]（学習は [train_start, test_start)）
+    """
+    data_start = pd.Timestamp(table.race_days.min()).to_period('M').to_timestamp()
+    data_end = pd.Timestamp(table.race_days.max())
+
+    test_start = pd.Timestamp(first_test).to_period('M').to_timestamp() if first_test is not None \
+        else data_start + pd.DateOffset(months=train_months)
+    last_test = pd.Timestamp(last_test) if last_test is not None else data_end
+
+    folds = []
+    while test_start <= min(last_test, data_end):
+        folds.append({
+            'fold': len(folds),
+            'train_start': test_start - pd.DateOffset(months=train_months),
+            'test_start': test_start,
+            'test_end': test_start + pd.DateOffset(months=test_months),
+        })
+        test_start = test_start + pd.DateOffset(months=test_months)
+    return folds
+
+
+def _top1_accuracy(scores, y, groups):
+    """予測1位（スコア最小）の馬が1着だったレースの割合"""
+    bounds = np.r_[0, np.cumsum(groups)]
+    hits = [y[lo + np.argmin(scores[lo:hi])] == 1 for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+    return float(np.mean(hits)) if hits else np.nan
+
+
+def run_fold_chunk(folds, shared):
+    """
+    ワーカー処理: フォールドごとに学習期間を切り出して学習し、検証期間を予測
+    """
+    table = shared['table']
+    params = {**shared['params'], 'num_threads': 1}
+    summaries, predictions = [], []
+
+    for fold in folds:
+        X_train, y_train, groups_train, _ = table.subset(
+            table.race_mask(fold['train_start'], fold['test_start']), ranked_only=True)
+        X_test, y_test, groups_test, meta_test = table.subset(
+            table.race_mask(fold['test_start'], fold['test_end']))
+        if len(groups_train) == 0 or len(groups_test) == 0:
+            continue
+
+        train_data = lgb.Dataset(X_train, label=y_train, group=groups_train, feature_name=FEATURE_NAMES)
+        model = lgb.train(params, train_data, num_boost_round=shared['num_boost_round'])
+        scores = model.predict(X_test, num_threads=1)
+
+        summaries.append({
+            'fold': fold['fold'],
+            'train_start': fold['train_start'],
+            'test_start': fold['test_start'],
+            'train_races': len(groups_train),
+            'test_races': len(groups_test),
+            'top1_accuracy': _top1_accuracy(scores, y_test, groups_test),
+        })
+        predictions.append(meta_test.assign(fold=fold['fold'], score=scores, rank=y_test))
+
+    return {'folds': summaries, 'predictions': predictions}
+
+
+def run_walk_forward(table, folds, params=None, num_boost_round=DEFAULT_NUM_BOOST_ROUND, workers=None):
+    """
+    全フォールドを並列に学習・予測
+
+    Returns:
+        (フォールドごとの集計 DataFrame, 検証期間の予測 DataFrame
+         [race_id, horse_id, Umaban, date, fold, score, rank])
+    """
+    if not LIGHTGBM_AVAILABLE:
+        raise ImportError("ウォークフォワードには lightgbm が必要です")
+
+    shared = {'table': table, 'params': params or DEFAULT_PARAMS, 'num_boost_round': num_boost_round}
+    # 学習時間はフォールドでほぼ同じなので、1チャンク = 1フォールド程度に分ける
+    totals = run_parallel_backtest(folds, run_fold_chunk, shared, workers=workers, chunks_per_worker=1)
+
+    summary = pd.DataFrame(totals.get('folds', []))
+    frames = totals.get('predictions', [])
+    predictions = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    return summary, predictions
+
+
+def roi_curve(predictions, settlement, strategy_func):
+    """
+    検証期間の予測から戦略ごとの月別回収率を計算
+
+    Args:
+        predictions: run_walk_forward の予測
+        settlement: bet_settlement.SettlementEngine
+        strategy_func: 予測順位の馬番リスト -> {戦略: (券種, 組番リスト)}
+
+    Returns:
+        DataFrame（strategy, month, races, cost, return, recovery, cumulative_recovery）
+    """
+    tickets = []
+    for race_id, race in predictions.groupby('race_id', sort=False):
+        order = np.argsort(race['score'].to_numpy(), kind='stable')
+        ranked = [int(u) for u in pd.to_numeric(race['Umaban'], errors='coerce').fillna(0).to_numpy()[order]]
+        if len(ranked) < 3:
+            continue
+        month = str(race['date'].iloc[0])[:7]
+        for name, (bet_type, combos) in strategy_func(ranked).items():
+            for combo in combos:
+                tickets.append({'strategy': name, 'month': month, 'race_id': race_id,
+                                'bet_type': bet_type, 'numbers': combo, 'stake': 100})
+    if not tickets:
+        return pd.DataFrame()
+
+    settled = settlement.settle(pd.DataFrame(tickets))
+    settled = settled[settled['available']]
+    curve = settled.groupby(['strategy', 'month']).agg(
+        races=('race_id', 'nunique'), cost=('stake', 'sum'), ret=('return', 'sum')
+    ).reset_index().rename(columns={'ret': 'return'})
+    curve['recovery'] = curve['return'] / curve['cost'] * 100
+    cumulative = curve.groupby('strategy')[['cost', 'return']].cumsum()
+    curve['cumulative_recovery'] = cumulative['return'] / cumulative['cost'] * 100
+    return curve
+
+
+def main():
+    from backtest_lightgbm_all_tickets import strategy_tickets
+    from bet_settlement import SettlementEngine
+    from payout_store import PayoutStore
+    from race_data_store import load_race_data
+
+    print("=" * 80)
+    print("ウォークフォワード再学習（36ヶ月学習 → 翌1ヶ月検証）")
+    print("=" * 80)
+
+    csv_path = r"C:\Users\bu158\HorseRacingAnalyzer\data\netkeiba_data_combined_202001_202508.csv"
+    df = load_race_data(csv_path, columns=FEATURE_SOURCE_COLUMNS)
+    table = FeatureTable.load_or_build(df, csv_path)
+
+    folds = make_folds(table, train_months=36, test_months=1, first_test='2024-01-01')
+    print(f"\nフォールド数: {len(folds)}（{folds[0]['test_start']:%Y-%m} 〜 {folds[-1]['test_start']:%Y-%m}）")
+
+    summary, predictions = run_walk_forward(table, folds)
+    print("\n【フォールドごとの結果】")
+    for r in summary.itertuples():
+        print(f"  {r.test_start:%Y-%m} | 学習 {r.train_races:5d}R | 検証 {r.test_races:4d}R | 1位的中率 {r.top1_accuracy * 100:5.1f}%")
+
+    payout_store = PayoutStore(r"C:\Users\bu158\HorseRacingAnalyzer\data\payouts.sqlite")
+    payout_store.import_json(r"C:\Users\bu158\HorseRacingAnalyzer\data\netkeiba_data_payouts_202001_202508.json")
+    settlement = SettlementEngine.from_store(payout_store, race_ids=predictions['race_id'].unique())
+
+    curve = roi_curve(predictions, settlement, strategy_tickets)
+    output_path = r"C:\Users\bu158\Keiba_Shisaku20250928\walk_forward_roi.csv"
+    curve.to_csv(output_path, index=False, encoding='utf-8-sig')
+
+    print("\n【戦略ごとの通算回収率】")
+    totals = curve.groupby('strategy')[['cost', 'return']].sum()
+    totals['recovery'] = totals['return'] / totals['cost'] * 100
+    for name, r in totals.sort_values('recovery', ascending=False).iterrows():
+        print(f"  {name:15s} | 投資 {int(r['cost']):10,}円 | 払戻 {int(r['return']):10,}円 | 回収率 {r['recovery']:6.1f}%")
+    print(f"\n月別の回収率を保存: {output_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+WIN5 の予算内の最適な頭数配分
+
+各レグの勝率ベクトル（全出走馬分）から、レグごとに何頭買うか (k1, ..., k5) を
+k1 × ... × k5 <= 予算点数 の範囲で全通り調べ、目的の値が最大になる配分を返す。
+
+- 各レグは勝率の高い順に k 頭を買う（k 頭の的中確率 = 上位 k 頭の勝率の和）
+- objective='hit'    : 5レグ全的中の確率（各レグの的中確率の積）を最大化
+- objective='return' : 期待払戻 - 購入額 を最大化（払戻の目安は各レグの単勝オッズの積）
+
+5レグ × 最大18頭でも予算点数以下の組み合わせは数千通りなので、全探索で厳密に求まる。
+
+使い方:
+    result = allocate_win5([leg1_probs, ..., leg5_probs], budget_points=100)
+    result['picks']      # [2, 1, 5, 3, 3]
+    result['hit_prob']   # 全的中の確率
+    result = allocate_win5(probs, 100, odds=[leg1_odds, ...], objective='return')
+"""
+import numpy as np
+
+OBJECTIVES = ('hit', 'return')
+
+
+def normalize_probs(win_probs):
+    """勝率ベクトルを合計1に正規化（負値・NaNは0、全て0なら空配列扱いで None）"""
+    probs = np.clip(np.nan_to_num(np.asarray(win_probs, dtype=np.float64), nan=0.0), 0.0, None)
+    total = probs.sum()
+    if len(probs) == 0 or total <= 0:
+        return None
+    return probs / total
+
+
+def leg_value_table(win_probs, odds=None, objective='hit'):
+    """
+    1レグで上位 k 頭を買ったときの値（k = 1..頭数）と、勝率順の並び
+
+    Returns:
+        (values, order)
+        values[k-1] は objective='hit' なら上位 k 頭の勝率の和、
+        'return' なら上位 k 頭の 勝率 × 単勝オッズ の和
+    """
+    probs = normalize_probs(win_probs)
+    if probs is None:
+        return None, None
+    order = np.argsort(-probs, kind='stable')
+    if objective == 'return':
+        leg_odds = np.nan_to_num(np.asarray(odds, dtype=np.float64), nan=0.0)
+        return np.cumsum(probs[order] * leg_odds[order]), order
+    return np.cumsum(probs[order]), order
+
+
+def allocate_win5(leg_probs, budget_points, odds=None, objective='hit', max_picks=None):
+    """
+    予算点数内で目的の値が最大になる各レグの購入頭数を全探索で求める
+
+    Args:
+        leg_probs: レグごとの勝率ベクトルのリスト（予測できなかったレグは None）
+        budget_points: 予算点数（1点100円）
+        odds: objective='return' のときのレグごとの単勝オッズ（leg_probs と同じ並び）
+        objective: 'hit'（全的中確率）または 'return'（期待払戻 - 購入額）
+        max_picks: 1レグあたりの最大頭数（省略時は出走頭数まで）
+
+    Returns:
+        dict: picks（レグごとの頭数）, total（点数）, cost（円）, hit_prob（全的中確率）,
+              expected_return（objective='return' のときの期待払戻、円）, orders（レグごとの勝率順の行番号）
+        予測できなかったレグは1頭（orders は None）とし、目的の値の計算からは除く
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"objective は {OBJECTIVES} のいずれか: {objective}")
+    if objective == 'return' and odds is None:
+        raise ValueError("objective='return' には odds が必要です")
+
+    n_legs = len(leg_probs)
+    hit_tables, value_tables, orders = [], [], []
+    for i, probs in enumerate(leg_probs):
+        hit_values, order = leg_value_table(probs) if probs is not None else (None, None)
+        hit_tables.append(hit_values)
+        orders.append(order)
+        if objective == 'return' and hit_values is not None:
+            value_tables.append(leg_value_table(probs, odds[i], 'return')[0])
+        else:
+            value_tables.append(hit_values)
+
+    limits = []
+    for values in value_tables:
+        n = 1 if values is None else len(values)
+        limits.append(min(n, max_picks) if max_picks else n)
+
+    def leg_value(i, k):
+        return 1.0 if value_tables[i] is None else float(value_tables[i][k - 1])
+
+    # 予算内の全配分を深さ優先で列挙（値が同じなら点数の少ない配分を優先）
+    best = {'score': -np.inf, 'total': 0, 'picks': [1] * n_legs}
+    picks = [1] * n_legs
+
+    def search(i, points, value):
+        if i == n_legs:
+            score = value if objective == 'hit' else value * 100 - points * 100
+            if score > best['score'] + 1e-12 or (abs(score - best['score']) <= 1e-12 and points < best['total']):
+                best.update(score=score, total=points, picks=list(picks))
+            return
+        for k in range(1, limits[i] + 1):
+            if points * k > budget_points:
+                break
+            picks[i] = k
+            search(i + 1, points * k, value * leg_value(i, k))
+        picks[i] = 1
+
+    search(0, 1, 1.0)
+
+    hit_prob = 1.0
+    for i, k in enumerate(best['picks']):
+        if hit_tables[i] is not None:
+            hit_prob *= float(hit_tables[i][k - 1])
+
+    result = {
+        'picks': best['picks'],
+        'total': best['total'],
+        'cost': best['total'] * 100,
+        'hit_prob': hit_prob,
+        'orders': orders,
+    }
+    if objective == 'return':
+        result['expected_return'] = best['score'] + best['total'] * 100
+    return result